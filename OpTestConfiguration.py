@@ -167,6 +167,10 @@ def get_parser():
                         help="Run individual tests")
     tgroup.add_argument("-f", "--failfast", action='store_true',
                         help="Stop on first failure")
+    tgroup.add_argument("--shards", type=int, default=1,
+                        help="[QEMU/Mambo Only] Split the tests between this many op-test"
+                        " processes run at once, each with its own simulator, and merge"
+                        " their reports")
     tgroup.add_argument("--quiet", action='store_true', default=False,
                         help="Don't splat lots of things to the console")
 
@@ -174,10 +178,25 @@ def get_parser():
                         choices=['UNKNOWN', 'UNKNOWN_BAD', 'OFF', 'PETITBOOT',
                                  'PETITBOOT_SHELL', 'OS'])
 
+    parser.add_argument("--single-round-trip", action='store_true', default=False,
+                        help="Run console commands and collect their exit code in one"
+                        " expect round trip instead of a separate 'echo $?'")
+    parser.add_argument("--ipmi-persistent-session", action='store_true', default=False,
+                        help="Run out of band ipmitool commands through one long lived"
+                        " 'ipmitool shell' per BMC instead of a new ipmitool each")
+    parser.add_argument("--ipmi-backend", choices=['ipmitool', 'native'], default='ipmitool',
+                        help="Send out of band IPMI power, raw, sel clear, mc reset, bootdev and"
+                        " dcmi power (de)activate commands with ipmitool (default) or over a"
+                        " reused RMCP+ session of op-test's own, the rest always use ipmitool")
+
     # Options to set the output directory and suffix on the output
     parser.add_argument("-o", "--output", help="Output directory for test reports.  Can also be set via OP_TEST_OUTPUT env variable.")
     parser.add_argument("-l", "--logdir", help="Output directory for log files.  Can also be set via OP_TEST_LOGDIR env variable.")
     parser.add_argument("--suffix", help="Suffix to add to all reports.  Default is current time.")
+    parser.add_argument("--console-log-max-bytes", type=int, default=0,
+                        help="Rotate console log files once they reach this size, 0 (default) never rotates")
+    parser.add_argument("--console-log-backups", type=int, default=10,
+                        help="Number of rotated console log files to keep")
 
     lockgroup = parser.add_mutually_exclusive_group()
     lockgroup.add_argument("--hostlocker", metavar="HOST_NAME", help="Hostlocker host name to checkout, see HOSTLOCKER GROUP below for more options")
@@ -228,6 +247,12 @@ def get_parser():
     bmcgroup.add_argument("--smc-presshipmicmd")
     bmcgroup.add_argument("--qemu-binary", default=qemu_default,
                           help="[QEMU Only] qemu simulator binary")
+    bmcgroup.add_argument("--qemu-snapshot-cache", default=None,
+                          help="[QEMU Only] directory to save qemu at the petitboot shell in and restore it from, e.g. ~/.cache/op-test/qemu")
+    bmcgroup.add_argument("--qemu-fast-power", action='store_true', default=False,
+                          help="[QEMU Only] Power off by pausing qemu and power on by resetting it (over QMP) rather than killing and starting it again")
+    bmcgroup.add_argument("--qemu-snapshot-cache-size", type=float, default=10,
+                          help="[QEMU Only] GB the qemu snapshot cache is trimmed to")
     bmcgroup.add_argument("--mambo-binary", default=mambo_default,
                           help="[Mambo Only] mambo simulator binary, defaults to /opt/ibm/systemsim-p9/run/p9/power9")
     bmcgroup.add_argument("--mambo-initial-run-script", default=mambo_initial_run_script,
@@ -244,6 +269,12 @@ def get_parser():
     hostgroup.add_argument("--host-lspci", help="Known 'lspci -n -m' for host")
     hostgroup.add_argument("--host-scratch-disk", help="A block device we can erase", default="")
     hostgroup.add_argument("--qemu-scratch-disk", help="A block device for qemu", default=None)
+    hostgroup.add_argument("--qemu-base-image", default=None,
+                           help="A disk image for qemu's scratch disk to be a copy on write overlay of, e.g. one installed to with --qemu-scratch-disk")
+    hostgroup.add_argument("--qemu-overlay-pool", default=None,
+                           help="Directory to keep --qemu-base-image overlays in between runs rather than making temporary ones")
+    hostgroup.add_argument("--qemu-overlay-keep", action='store_true', default=False,
+                           help="Keep what the guest wrote to a pooled overlay for the next run instead of discarding it")
     hostgroup.add_argument("--host-prompt", default="#",
                            help="Prompt for Host SSH session")
 
@@ -259,6 +290,9 @@ def get_parser():
                                default="")
     hostinstgroup.add_argument("--proxy", default="", help="proxy for the Host to access the internet. "
                                "Only needed for tests that install an OS")
+    hostinstgroup.add_argument("--install-hosts", nargs='+', default=[], metavar="CONFIG",
+                               help="op-test configuration files of more hosts for"
+                               " testcases.InstallHosts to install at the same time as this one")
 
     hostcmdgroup = parser.add_argument_group('Host Run Commands', 'Options for Running custom commands on the Host')
     hostcmdgroup.add_argument("--host-cmd", help="Command to run", default="")
@@ -273,6 +307,12 @@ def get_parser():
     osgroup = parser.add_argument_group('OS Images', 'OS Images to boot/install')
     osgroup.add_argument("--os-cdrom", help="OS CD/DVD install image", default=None)
     osgroup.add_argument("--os-repo", help="OS repo", default="")
+    osgroup.add_argument("--os-cdrom-cache",
+                         help="Where --os-cdrom images are extracted and kept, default ~/.cache/op-test/iso",
+                         default=None)
+    osgroup.add_argument("--os-cdrom-cache-size", type=float,
+                         help="GB of extracted --os-cdrom images to keep, least recently used go first",
+                         default=20)
     osgroup.add_argument("--no-os-reinstall",
                          help="If set, don't run OS Install test",
                          action='store_true', default=False)
@@ -418,6 +458,9 @@ class OpTestConfiguration():
                                 help="Check remote host keys when using SSH (auto-yes on new)")
         parser.add_argument("--known-hosts-file",
                                 help="Specify a custom known_hosts file")
+        parser.add_argument("--ssh-control-master", action='store_true', default=False,
+                                help="Share one SSH ControlMaster connection per host for"
+                                " all Host SSH sessions (see OpTestSSH.SSHControlMasterPool)")
 
         self.args , self.remaining_args = parser.parse_known_args(remaining_args)
 
@@ -486,16 +529,16 @@ class OpTestConfiguration():
         # set up where all the logs go
         logfile = os.path.join(self.output, "%s.log" % self.outsuffix)
 
-        logcmd = "tee %s" % (logfile)
-        # we use 'cat -v' to convert control characters
-        # to something that won't affect the user's terminal
+        # the console log gets the raw console traffic, unless quiet we also
+        # echo it (CR stripped, 'cat -v' escaped so control characters
+        # won't affect the user's terminal) to stdout
         if self.args.quiet:
-            logcmd = logcmd + "> /dev/null"
+            echo = None
             # save sh_level for later refresh loggers
             OpTestLogger.optest_logger_glob.sh_level = logging.ERROR
             OpTestLogger.optest_logger_glob.sh.setLevel(logging.ERROR)
         else:
-            logcmd = logcmd + "| sed -u -e 's/\\r$//g'|cat -v"
+            echo = sys.stdout
             # save sh_level for later refresh loggers
             OpTestLogger.optest_logger_glob.sh_level = logging.INFO
             OpTestLogger.optest_logger_glob.sh.setLevel(logging.INFO)
@@ -505,12 +548,9 @@ class OpTestConfiguration():
         OpTestLogger.optest_logger_glob.optest_logger.info('TestCase Log files: {}/*'.format(self.output))
         OpTestLogger.optest_logger_glob.optest_logger.info('StreamHandler setup {}'.format('quiet' if self.args.quiet else 'normal'))
 
-        self.logfile_proc = subprocess.Popen(logcmd,
-                                             stdin=subprocess.PIPE,
-                                             stderr=sys.stderr,
-                                             stdout=sys.stdout,
-                                             shell=True)
-        self.logfile = self.logfile_proc.stdin
+        self.logfile = OpTestLogger.ConsoleLogSink(logfile, echo=echo,
+                                                   max_bytes=self.args.console_log_max_bytes,
+                                                   backup_count=self.args.console_log_backups)
 
         # we have enough setup to allow
         # signal handler cleanup to run
@@ -621,7 +661,8 @@ class OpTestConfiguration():
                           logfile=self.logfile,
                           check_ssh_keys=self.args.check_ssh_keys,
                           known_hosts_file=self.args.known_hosts_file,
-                          conf=self)
+                          conf=self,
+                          use_control_master=self.args.ssh_control_master)
             if self.args.bmc_type in ['AMI', 'SMC']:
                 web = OpTestWeb(self.args.bmc_ip,
                             self.args.bmc_usernameipmi,
@@ -793,6 +834,21 @@ class OpTestConfiguration():
                                 "version_mappings)".format(self.args.bmc_type))
 
             host.set_system(self.op_system)
+            if self.args.single_round_trip:
+                host.get_ssh_connection().set_single_round_trip(True)
+                # HMC and addon consoles do not go through OpTestUtil.run_command
+                if hasattr(self.op_system.console, 'set_single_round_trip'):
+                    self.op_system.console.set_single_round_trip(True)
+            if self.args.ipmi_backend != 'ipmitool':
+                # only ipmitool based BMCs, others ignore it
+                ipmi = getattr(self.op_system, 'cv_IPMI', None)
+                if hasattr(ipmi, 'set_backend'):
+                    ipmi.set_backend(self.args.ipmi_backend)
+            if self.args.ipmi_persistent_session:
+                # only ipmitool based BMCs, others ignore it
+                ipmitool = getattr(self.op_system.cv_IPMI, 'ipmitool', None)
+                if hasattr(ipmitool, 'set_persistent'):
+                    ipmitool.set_persistent(True)
             return
         except Exception as e:
             traceback.print_exc()
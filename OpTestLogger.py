@@ -21,7 +21,10 @@
 # This implements all the python logger setup for op-test
 
 import os
+import re
 import sys
+import atexit
+import threading
 from datetime import datetime
 import logging
 from logging.handlers import RotatingFileHandler
@@ -39,6 +42,200 @@ class FileLikeLogger():
     def flush(self):
         pass
 
+def cat_v_table():
+    '''
+    Build the byte translation used by `cat -v`, keeping tab and newline.
+    '''
+    table = {}
+    for c in range(256):
+        ch = chr(c)
+        prefix = ''
+        if c >= 128:
+            prefix = 'M-'
+            c = c & 0x7f
+        if c == 127:
+            esc = '^?'
+        elif c < 32:
+            esc = '^' + chr(c + 64)
+        else:
+            esc = chr(c)
+        if prefix or esc != chr(c):
+            table[ch] = prefix + esc
+    del table['\t']
+    del table['\n']
+    return table
+
+cat_v_escapes = cat_v_table()
+cat_v_re = re.compile('[' + ''.join(re.escape(c) for c in sorted(cat_v_escapes)) + ']')
+
+def cat_v(data):
+    '''
+    Strip CR before LF (sed 's/\\r$//') and escape control characters like
+    `cat -v` so the console traffic can't mess with the user's terminal.
+    '''
+    data = data.replace('\r\n', '\n')
+    return cat_v_re.sub(lambda m: cat_v_escapes[m.group(0)], data)
+
+
+class ConsoleLogSink():
+    '''
+    In-process replacement for the ``tee logfile | sed -u -e 's/\\r$//g' | cat -v``
+    pipeline we used to hang off every console.
+
+    It is file-like enough to be passed as ``logfile=`` to `OPexpect.spawn`.
+    `write` only queues the data, a background thread writes the raw bytes to
+    the log file (rotating it once it reaches `max_bytes`, if set) and, if
+    `echo` is a stream, a CR-stripped `cat -v` escaped copy to it.
+
+    `flush` only wakes the writer (pexpect calls it after every write), use
+    `sync` to wait for everything queued so far to hit the disk. All sinks are
+    closed, and so drained, at exit.
+
+    Writers block while more than `max_pending` bytes are queued, so a slow
+    disk or echo slows the console down rather than growing the queue. As
+    with RotatingFileHandler, a `backup_count` of 0 never rotates.
+    '''
+    sinks = []
+    sinks_lock = threading.Lock()
+    high_water = 1 << 20 # wake the writer early once this much is queued
+    max_pending = 16 << 20 # and block writers once this much is
+
+    def __init__(self, filename, echo=None, max_bytes=0, backup_count=10,
+                 flush_interval=0.2):
+        self.filename = filename
+        self.echo = echo
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.name = filename
+        self.closed = False
+        self.pending = []
+        self.queued = 0 # bytes handed to write()
+        self.written = 0 # bytes the writer thread is done with
+        self.held_cr = False # echo copy ended in CR, may be a CRLF split in two
+        self.cond = threading.Condition(threading.Lock())
+        dirname = os.path.dirname(filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self.fd = open(filename, 'ab')
+        self.size = self.fd.tell()
+        self.thread = threading.Thread(target=self.writer,
+                                       name="ConsoleLogSink-{}".format(os.path.basename(filename)))
+        self.thread.daemon = True
+        self.thread.start()
+        with ConsoleLogSink.sinks_lock:
+            ConsoleLogSink.sinks.append(self)
+
+    def write(self, data):
+        if not data:
+            return
+        if isinstance(data, unicode):
+            data = data.encode('utf-8', 'replace')
+        with self.cond:
+            if self.closed:
+                raise ValueError("I/O operation on closed ConsoleLogSink {}".format(self.filename))
+            while (self.queued - self.written > self.max_pending and not self.closed
+                   and self.thread.is_alive()):
+                self.cond.notify_all()
+                self.cond.wait(self.flush_interval)
+            self.pending.append(data)
+            self.queued += len(data)
+            if self.queued - self.written > self.high_water:
+                self.cond.notify_all()
+
+    def flush(self):
+        with self.cond:
+            self.cond.notify()
+
+    def sync(self):
+        '''
+        Block until everything written so far is in the log file (and echo).
+        '''
+        with self.cond:
+            target = self.queued
+            self.cond.notify_all()
+            while self.written < target and self.thread.is_alive():
+                self.cond.wait(self.flush_interval)
+
+    def close(self):
+        with self.cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join()
+        with ConsoleLogSink.sinks_lock:
+            if self in ConsoleLogSink.sinks:
+                ConsoleLogSink.sinks.remove(self)
+
+    def fileno(self):
+        return self.fd.fileno()
+
+    def writer(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait(self.flush_interval)
+                chunks = self.pending
+                self.pending = []
+                closed = self.closed
+            if chunks:
+                data = ''.join(chunks)
+                try:
+                    self.write_file(data)
+                    self.write_echo(data)
+                except Exception as e:
+                    # never let the log sink take down the console
+                    logging.getLogger('op-test').debug(
+                        "ConsoleLogSink {} write failed: {}".format(self.filename, e))
+                with self.cond:
+                    self.written += len(data)
+                    self.cond.notify_all()
+            if closed and not chunks:
+                break
+        # like sed, a CR ending the last (unterminated) line is dropped
+        self.fd.close()
+        if self.echo is not None:
+            self.echo.flush()
+
+    def write_file(self, data):
+        if (self.max_bytes and self.backup_count > 0 and self.size
+                and self.size + len(data) > self.max_bytes):
+            self.rotate()
+        self.fd.write(data)
+        self.fd.flush()
+        self.size += len(data)
+
+    def write_echo(self, data):
+        if self.echo is None:
+            return
+        if self.held_cr:
+            data = '\r' + data
+        self.held_cr = data.endswith('\r')
+        if self.held_cr:
+            data = data[:-1]
+        self.echo.write(cat_v(data))
+        self.echo.flush()
+
+    def rotate(self):
+        self.fd.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            src = "{}.{}".format(self.filename, i)
+            if os.path.exists(src):
+                os.rename(src, "{}.{}".format(self.filename, i + 1))
+        os.rename(self.filename, self.filename + ".1")
+        self.fd = open(self.filename, 'wb')
+        self.size = 0
+
+    @staticmethod
+    def close_all():
+        with ConsoleLogSink.sinks_lock:
+            sinks = list(ConsoleLogSink.sinks)
+        for sink in sinks:
+            sink.close()
+
+atexit.register(ConsoleLogSink.close_all)
+
 class OpTestLogger():
     '''
     This class is used as the main global logger and handler initialization module.
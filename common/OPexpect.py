@@ -34,10 +34,100 @@ certain error conditions to occur, you can catch the exceptions that OPexpect
 throws.
 """
 
+import re
 import pexpect
 from Exceptions import *
 import OpTestSystem
 
+# Failure conditions we *always* look for, the index into this list is what
+# spawn.expect uses to classify the failure, so only ever append to it.
+op_patterns = ["qemu: could find kernel",
+               "INFO: rcu_sched self-detected stall on CPU",
+               "kernel BUG at",
+               "Kernel panic",
+               "Watchdog .* Hard LOCKUP",
+               "Oops: Kernel access of bad area",
+               "watchdog: .* detected hard LOCKUP on other CPUs",
+               "Watchdog .* detected Hard LOCKUP other CPUS",
+               "watchdog: BUG: soft lockup",
+               "\[[0-9. ]+,0\] Assert fail:",
+               "\[[0-9. ]+,[0-9]\] Unexpected exception",
+               "OPAL exiting with locks held",
+               "LOCK ERROR: Releasing lock we don't hold",
+               "OPAL: Reboot requested due to Platform error."
+]
+
+# All the failure patterns as one alternation, each alternative is a named
+# group so we can tell which one matched. Alternation order gives the same
+# "earliest match, then lowest index" result as checking them one by one.
+op_failure_re = re.compile("|".join("(?P<op{}>{})".format(i, p)
+                                    for i, p in enumerate(op_patterns)),
+                           re.DOTALL)
+
+# Failure messages are a single console line, so we only need to look back
+# this far into already scanned output to catch one split across reads.
+op_failure_window = 1024
+
+# compiled caller pattern lists keyed by (tuple(patterns), ignorecase)
+op_pattern_cache = {}
+op_pattern_cache_max = 256
+
+class searcher_op(object):
+    '''
+    Searcher for pexpect's expect_loop() which checks the failure alternation
+    against only the newly read bytes (plus op_failure_window of context) and
+    the caller's precompiled patterns the same way pexpect.searcher_re does.
+
+    Returned indexes are into op_patterns + caller patterns, like before.
+    '''
+    def __init__(self, compiled, eof_index, timeout_index):
+        self.compiled = compiled
+        self.eof_index = eof_index
+        self.timeout_index = timeout_index
+        self.start = None
+        self.end = None
+        self.match = None
+
+    def __str__(self):
+        ss = ['searcher_op:',
+              '    failures: {}'.format(op_failure_re.pattern)]
+        for index, s in self.compiled:
+            ss.append('    {}: re.compile({!r})'.format(index, s.pattern))
+        if self.eof_index >= 0:
+            ss.append('    {}: EOF'.format(self.eof_index))
+        if self.timeout_index >= 0:
+            ss.append('    {}: TIMEOUT'.format(self.timeout_index))
+        return '\n'.join(ss)
+
+    def search(self, buffer, freshlen, searchwindowsize=None):
+        first_match = None
+        # failures only need the fresh data plus a bounded look back
+        failure_start = max(0, len(buffer) - freshlen - op_failure_window)
+        match = op_failure_re.search(buffer, failure_start)
+        if match is not None:
+            first_match = match.start()
+            the_match = match
+            best_index = int(match.lastgroup[2:])
+        if searchwindowsize is None:
+            searchstart = 0
+        else:
+            searchstart = max(0, len(buffer) - searchwindowsize)
+        for index, s in self.compiled:
+            match = s.search(buffer, searchstart)
+            if match is None:
+                continue
+            n = match.start()
+            if first_match is None or n < first_match:
+                first_match = n
+                the_match = match
+                best_index = index
+        if first_match is None:
+            return -1
+        self.start = first_match
+        self.match = the_match
+        self.end = self.match.end()
+        return best_index
+
 class spawn(pexpect.spawn):
     def __init__(self, command, args=[], maxread=8000,
                  searchwindowsize=None, logfile=None, cwd=None, env=None,
@@ -58,32 +148,41 @@ class spawn(pexpect.spawn):
         self.op_test_system = system
         return
 
-    def expect(self, pattern, timeout=-1, searchwindowsize=-1, async=False):
-        op_patterns = ["qemu: could find kernel",
-                       "INFO: rcu_sched self-detected stall on CPU",
-                       "kernel BUG at",
-                       "Kernel panic",
-                       "Watchdog .* Hard LOCKUP",
-                       "Oops: Kernel access of bad area",
-                       "watchdog: .* detected hard LOCKUP on other CPUs",
-                       "Watchdog .* detected Hard LOCKUP other CPUS",
-                       "watchdog: BUG: soft lockup",
-                       "\[[0-9. ]+,0\] Assert fail:",
-                       "\[[0-9. ]+,[0-9]\] Unexpected exception",
-                       "OPAL exiting with locks held",
-                       "LOCK ERROR: Releasing lock we don't hold",
-                       "OPAL: Reboot requested due to Platform error."
-        ]
-
-        patterns = list(op_patterns) # we want a *copy*
+    def get_searcher(self, pattern):
         if isinstance(pattern, list):
-            patterns = patterns + pattern
+            pattern = tuple(pattern)
         else:
-            patterns.append(pattern)
+            pattern = (pattern,)
+        key = (pattern, self.ignorecase)
+        try:
+            compiled_list = op_pattern_cache[key]
+        except (KeyError, TypeError):
+            compiled_list = self.compile_pattern_list(list(pattern))
+            try:
+                if len(op_pattern_cache) >= op_pattern_cache_max:
+                    op_pattern_cache.clear()
+                op_pattern_cache[key] = compiled_list
+            except TypeError:
+                pass # unhashable pattern, just don't cache it
+        offset = len(op_patterns)
+        compiled = []
+        eof_index = timeout_index = -1
+        for index, s in enumerate(compiled_list):
+            if s is pexpect.EOF:
+                eof_index = index + offset
+            elif s is pexpect.TIMEOUT:
+                timeout_index = index + offset
+            else:
+                compiled.append((index + offset, s))
+        return searcher_op(compiled, eof_index, timeout_index)
 
-        r = super(spawn,self).expect(patterns,
-                                     timeout=timeout,
-                                     searchwindowsize=searchwindowsize)
+    def expect(self, pattern, timeout=-1, searchwindowsize=-1, async=False):
+        patterns = op_patterns # only used to report which failure matched
+        if timeout == -1:
+            timeout = self.timeout
+        r = self.expect_loop(self.get_searcher(pattern),
+                             timeout=timeout,
+                             searchwindowsize=searchwindowsize)
 
         if r in [pexpect.EOF, pexpect.TIMEOUT]:
             return r
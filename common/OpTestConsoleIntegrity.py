@@ -0,0 +1,237 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+'''
+Console integrity
+-----------------
+
+Streams ``hexdump -C -v`` of a known pattern over the host console and
+checks it as it arrives, a line at a time, so megabytes (or hundreds of
+them) can go through without the output being kept.
+
+Byte ``n`` of the pattern is ``n % 251``. The target builds a 64256 byte
+block of it once (its md5sum is checked against ours) and repeats it
+into ``head -c size``. 251 being prime, every line of the dump differs
+from its neighbours, so a line that is repeated, misplaced or mangled
+is caught, not just a short count. The offset column gives where any
+bytes were dropped.
+'''
+
+import hashlib
+import time
+
+import pexpect
+
+from Exceptions import UnexpectedCase
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+PRIME = 251
+BLOCK = PRIME * 256
+PATTERN_FILE = "/tmp/op-test-pattern"
+
+
+def pattern(offset, length):
+    return "".join(chr((offset + i) % PRIME) for i in range(length))
+
+
+def dump_line(offset, data):
+    '''
+    The ``hexdump -C`` line for 16 bytes at offset, without the offset
+    '''
+    hexes = ["%02x" % ord(c) for c in data]
+    text = "".join(c if 32 <= ord(c) < 127 else "." for c in data)
+    return "  %s  %s  |%s|" % (" ".join(hexes[:8]), " ".join(hexes[8:]), text)
+
+
+def setup_commands():
+    '''
+    Commands building PATTERN_FILE on the target, from nothing but the
+    shell and cat
+    '''
+    p = PATTERN_FILE
+    return ['i=0; while [ $i -lt %d ]; do printf "\\\\$(printf %%o $i)"; i=$((i+1)); done > %s.1'
+            % (PRIME, p),
+            "cat %s > %s.2" % (" ".join(["%s.1" % p] * 16), p),
+            "cat %s > %s" % (" ".join(["%s.2" % p] * 16), p),
+            "rm -f %s.1 %s.2" % (p, p)]
+
+
+def block_md5():
+    return hashlib.md5(pattern(0, BLOCK)).hexdigest()
+
+
+def stream_command(size):
+    return "(while cat %s; do :; done) | head -c %d | hexdump -C -v" % (PATTERN_FILE, size)
+
+
+class HexdumpVerifier(object):
+    '''
+    Checks ``hexdump -C -v`` output of the pattern fed to it in any sized
+    pieces, keeping nothing but the current partial line.
+
+    Lines that don't start with an offset (the command echo, a prompt,
+    a line mangled beyond recognition) are not counted, a missing line
+    shows up as dropped bytes when the next offset skips ahead.
+    '''
+    def __init__(self, size):
+        self.size = size
+        self.expected = 0
+        self.verified = 0
+        self.dropped = 0
+        self.corrupted = 0
+        self.first_corrupt = None
+        self.first_dropped = None
+        self.bad_lines = 0
+        self.received = 0
+        self.end = None
+        self.partial = ""
+        self.trailer = ""
+        # the dump repeats every PRIME lines
+        self.lines = [dump_line(n * 16, pattern(n * 16, 16)) for n in range(PRIME)]
+
+    @property
+    def done(self):
+        return self.end is not None
+
+    def feed(self, data):
+        self.received += len(data)
+        if self.done:
+            self.trailer += data
+            return
+        lines = (self.partial + data).split("\n")
+        self.partial = lines.pop()
+        table = self.lines
+        expected = self.expected
+        for i, line in enumerate(lines):
+            # the usual case, the very line we're waiting for
+            if line[8:].rstrip("\r") == table[(expected >> 4) % PRIME] and \
+                    line[:8] == "%08x" % expected:
+                expected += 16
+                continue
+            self.verified += expected - self.expected
+            self.expected = expected
+            self.line(line.rstrip("\r"))
+            expected = self.expected
+            if self.done:
+                self.trailer = "\n".join(lines[i + 1:] + [self.partial])
+                self.partial = ""
+                return
+        self.verified += expected - self.expected
+        self.expected = expected
+
+    def corrupt(self, offset, count):
+        self.corrupted += count
+        if self.first_corrupt is None:
+            self.first_corrupt = offset
+            log.debug("Console integrity: first corruption at offset {}".format(offset))
+
+    def line(self, line):
+        space = line.find("  ")
+        token = line if space < 0 else line[:space]
+        if len(token) < 8:
+            return
+        try:
+            offset = int(token, 16)
+        except ValueError:
+            return
+        if space < 0:
+            # the last line, just the size
+            if offset > self.expected:
+                self.drop(offset - self.expected)
+            self.end = offset
+            return
+        if offset < self.expected or offset % 16:
+            # repeated or mangled offset
+            self.bad_lines += 1
+            self.corrupt(offset, 0)
+            return
+        if offset > self.expected:
+            self.drop(offset - self.expected)
+            self.expected = offset
+        body = line[space:]
+        want = self.lines[(offset / 16) % PRIME]
+        if body == want:
+            self.verified += 16
+        else:
+            self.bad_lines += 1
+            hexes = body.split("|")[0].split()
+            wanted = want.split("|")[0].split()
+            bad = [i for i in range(16) if i >= len(hexes) or hexes[i] != wanted[i]]
+            if bad:
+                self.corrupt(offset + bad[0], len(bad))
+                self.verified += 16 - len(bad)
+            else:
+                # the ascii column
+                self.corrupt(offset, 0)
+                self.verified += 16
+        self.expected = offset + 16
+
+    def drop(self, count):
+        if self.first_dropped is None:
+            self.first_dropped = self.expected
+        self.dropped += count
+
+    def ok(self):
+        return (self.end == self.size and self.verified == self.size
+                and not self.dropped and not self.bad_lines)
+
+    def report(self, seconds):
+        return ("{} of {} bytes verified in {:.2f}s ({:.0f} bytes/s, {:.0f} console bytes/s),"
+                " end {}, dropped {} (first at {}), corrupted {} in {} lines (first at {})"
+                .format(self.verified, self.size, seconds,
+                        self.verified / seconds if seconds else 0,
+                        self.received / seconds if seconds else 0,
+                        self.end, self.dropped, self.first_dropped,
+                        self.corrupted, self.bad_lines, self.first_corrupt))
+
+
+def stream_check(console, size, prompt, idle_timeout=60):
+    '''
+    Dump size bytes of the pattern on the console (a host console with
+    run_command/get_console, at a shell) and verify it as it comes.
+
+    :returns: (HexdumpVerifier, seconds) check ``verifier.ok()``
+    '''
+    if size % 16:
+        raise ValueError("size {} must be a multiple of 16".format(size))
+    for command in setup_commands():
+        console.run_command(command, timeout=120)
+    md5 = console.run_command("md5sum {}".format(PATTERN_FILE))
+    if not md5 or md5[-1].split()[0] != block_md5():
+        raise UnexpectedCase(state="console integrity",
+                             message="Pattern built on the target is wrong: {}".format(md5))
+
+    raw_pty = console.get_console()
+    verifier = HexdumpVerifier(size)
+    raw_pty.sendline(stream_command(size))
+    start = time.time()
+    try:
+        while not verifier.done:
+            verifier.feed(raw_pty.read_nonblocking(size=65536, timeout=idle_timeout))
+    except pexpect.TIMEOUT:
+        log.warning("Console integrity: nothing for {}s after {} bytes"
+                    .format(idle_timeout, verifier.expected))
+    seconds = time.time() - start
+    log.info("Console integrity: {}".format(verifier.report(seconds)))
+    # give back what came after the dump, the prompt is in it
+    raw_pty.buffer = verifier.trailer + verifier.partial + raw_pty.buffer
+    raw_pty.expect(prompt, timeout=idle_timeout)
+    return verifier, seconds
@@ -0,0 +1,190 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+'''
+Device tree snapshots
+---------------------
+
+Pulls (parts of) ``/proc/device-tree`` off the target in one command, as
+a gzipped tar stream in base64, and keeps it as a `DeviceTree` to query
+locally. Snapshots are kept per boot (``/proc/sys/kernel/random/boot_id``)
+so skiroot and the host, or one boot and the next, are never mixed up.
+
+tar, gzip and base64 are in petitboot's busybox as well as any distro,
+where dtc often isn't.
+'''
+
+import base64
+import binascii
+import re
+import struct
+import tarfile
+import StringIO
+
+from Exceptions import CommandFailed
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+PROC_DT = "/proc/device-tree"
+BEGIN_MARKER = "@@op-test-dt-begin@@"
+END_MARKER = "@@op-test-dt-end@@"
+
+# (boot_id, paths) : DeviceTree
+snapshots = {}
+
+
+def node_path(path):
+    '''
+    "/proc/device-tree/ibm,opal/", "ibm,opal" and "/ibm,opal" are all
+    "/ibm,opal", the root is "/"
+    '''
+    if path.startswith(PROC_DT):
+        path = path[len(PROC_DT):]
+    return "/" + path.strip("/")
+
+
+class DeviceTree(object):
+    '''
+    A device tree in memory: nodes by path, each a dict of property
+    name : raw (big endian) value.
+
+    :param paths: the subtrees that were taken, a path outside them
+                  isn't known to be missing, see `covers`
+    '''
+    def __init__(self, nodes, paths=("/",)):
+        self.nodes = nodes
+        self.paths = [node_path(p) for p in paths]
+
+    @classmethod
+    def from_tar(cls, data, paths=("/",)):
+        nodes = {}
+        archive = tarfile.open(fileobj=StringIO.StringIO(data), mode="r:*")
+        for member in archive:
+            name = node_path(re.sub(r"^\./?", "", member.name))
+            if member.isdir():
+                nodes.setdefault(name, {})
+            elif member.isfile():
+                parent, prop = name.rsplit("/", 1)
+                nodes.setdefault(parent or "/", {})[prop] = archive.extractfile(member).read()
+        return cls(nodes, paths)
+
+    def covers(self, path):
+        path = node_path(path)
+        return any(p == "/" or path == p or path.startswith(p + "/") for p in self.paths)
+
+    def has_node(self, path):
+        return node_path(path) in self.nodes
+
+    def has(self, path):
+        node, prop = node_path(path).rsplit("/", 1)
+        return prop in self.nodes.get(node or "/", {})
+
+    def prop(self, path):
+        '''
+        Raw value of the property at path, KeyError if there is none
+        '''
+        node, prop = node_path(path).rsplit("/", 1)
+        return self.nodes[node or "/"][prop]
+
+    def props(self, node):
+        return self.nodes[node_path(node)]
+
+    def children(self, node="/"):
+        '''
+        node and every node below it, sorted
+        '''
+        node = node_path(node)
+        prefix = node.rstrip("/") + "/"
+        return sorted(n for n in self.nodes if n == node or n.startswith(prefix))
+
+    def str_arr(self, path):
+        value = self.prop(path)
+        if value.endswith("\0"):
+            value = value[:-1]
+        return value.split("\0") if value else []
+
+    def u32_arr(self, path):
+        value = self.prop(path)
+        return list(struct.unpack(">%dI" % (len(value) / 4), value[:len(value) / 4 * 4]))
+
+    def u64_arr(self, path):
+        value = self.prop(path)
+        return list(struct.unpack(">%dQ" % (len(value) / 8), value[:len(value) / 8 * 8]))
+
+    def u32(self, path):
+        return self.u32_arr(path)[0]
+
+    def lines(self, node):
+        '''
+        A line per property of node, strings as strings, anything else as
+        32 bit hex cells (and the remaining bytes), for diffing trees.
+        '''
+        result = []
+        for name, value in sorted(self.props(node).items()):
+            strings = value[:-1].split("\0") if value.endswith("\0") else None
+            if strings and all(s and re.match(r"^[\x20-\x7e]*$", s) for s in strings):
+                text = " ".join('"{}"'.format(s) for s in strings)
+            else:
+                cells = len(value) / 4 * 4
+                text = " ".join("%08x" % c for c in struct.unpack(">%dI" % (cells / 4), value[:cells]))
+                if value[cells:]:
+                    text = (text + " " + binascii.hexlify(value[cells:])).strip()
+            result.append("{}: {}".format(name, text))
+        return result
+
+
+def snapshot_command(paths):
+    '''
+    Prints the subtrees (relative to /proc/device-tree, the ones that
+    exist) as a base64 gzipped tar between markers
+    '''
+    names = " ".join("'{}'".format(node_path(p).lstrip("/") or ".") for p in paths)
+    return ("p=; for d in {names}; do [ -e {dt}/\"$d\" ] && p=\"$p $d\"; done; "
+            "echo {begin}; [ -n \"$p\" ] && tar -C {dt} -cf - $p | gzip -c | base64; "
+            "echo {end}".format(names=names, dt=PROC_DT, begin=BEGIN_MARKER, end=END_MARKER))
+
+
+def snapshot(term_obj, paths=("/",), timeout=300):
+    '''
+    The device tree of whatever term_obj (a console or OpTestSSH) is
+    logged in to, fetched once per boot.
+
+    :returns: DeviceTree, or None if the target can't make a snapshot
+              (no tar, gzip or base64) so callers can read it piecemeal
+    '''
+    paths = tuple(node_path(p) for p in paths)
+    try:
+        boot_id = term_obj.run_command("cat /proc/sys/kernel/random/boot_id")[-1].strip()
+    except (CommandFailed, IndexError) as e:
+        log.debug("No boot_id to key a device tree snapshot on: {}".format(e))
+        return None
+    if (boot_id, paths) in snapshots:
+        return snapshots[(boot_id, paths)]
+    try:
+        output = term_obj.run_command(snapshot_command(paths), timeout=timeout)
+        encoded = "".join(output[output.index(BEGIN_MARKER) + 1:output.index(END_MARKER)])
+        tree = DeviceTree.from_tar(base64.b64decode(encoded), paths)
+    except (CommandFailed, ValueError, TypeError, tarfile.TarError) as e:
+        log.warning("Could not snapshot the device tree: {}".format(e))
+        return None
+    log.debug("Device tree snapshot of {} for boot {}: {} nodes, {} bytes"
+              .format(paths, boot_id, len(tree.nodes), len(encoded)))
+    snapshots[(boot_id, paths)] = tree
+    return tree
@@ -0,0 +1,93 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+'''
+File hashes and shared indexes
+------------------------------
+
+The on disk caches (`OpTestISO.ISOCache`, `OpTestQemuSnapshot`) key their
+entries by the sha256 of large input files and remember those hashes so
+a file is only read again when it changes.
+
+`file_hash` streams a file through sha256. `source_id` names a local
+file as it is now (path, size and mtime). `JSONIndex` is a small JSON
+file several op-test runs share: `JSONIndex.update` holds an flock on a
+lock file beside it while it reads, changes and replaces the index, so
+concurrent updates are not lost, and readers see the old or new index
+whole.
+'''
+
+import os
+import fcntl
+import hashlib
+import json
+import tempfile
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_id(path):
+    '''
+    "path:size:mtime" of a local file, changes whenever the file does
+    '''
+    st = os.stat(path)
+    return "{}:{}:{!r}".format(os.path.abspath(path), st.st_size, st.st_mtime)
+
+
+class JSONIndex(object):
+    '''
+    A JSON dict at path, updated under an flock on path + ".lock"
+    '''
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def update(self, change):
+        '''
+        Call change(index) on the current index and save what it leaves,
+        returns what change returned
+        '''
+        directory, name = os.path.split(self.path)
+        with open(self.path + ".lock", 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            index = self.load()
+            result = change(index)
+            fd, tmp = tempfile.mkstemp(dir=directory or os.curdir, prefix="." + name + "-")
+            with os.fdopen(fd, 'w') as f:
+                json.dump(index, f, sort_keys=True, indent=1)
+            os.rename(tmp, self.path)
+        return result
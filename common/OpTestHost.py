@@ -66,7 +66,8 @@ class OpTestHost():
     '''
     def __init__(self, i_hostip, i_hostuser, i_hostpasswd, i_bmcip, i_results_dir,
                  scratch_disk="", proxy="", logfile=sys.stdout,
-                 check_ssh_keys=False, known_hosts_file=None, conf=None):
+                 check_ssh_keys=False, known_hosts_file=None, conf=None,
+                 use_control_master=False):
         self.conf = conf
         self.util = conf.util
         self.ip = i_hostip
@@ -77,12 +78,14 @@ class OpTestHost():
         self.logfile = logfile
         self.ssh = OpTestSSH(i_hostip, i_hostuser, i_hostpasswd,
                 logfile=self.logfile, check_ssh_keys=check_ssh_keys,
-                known_hosts_file=known_hosts_file)
+                known_hosts_file=known_hosts_file,
+                use_control_master=use_control_master)
         self.scratch_disk = scratch_disk
         self.proxy = proxy
         self.scratch_disk_size = None
         self.check_ssh_keys = check_ssh_keys
         self.known_hosts_file = known_hosts_file
+        self.use_control_master = use_control_master
 
     def hostname(self):
         return self.ip
@@ -123,21 +126,15 @@ class OpTestHost():
         filename = "%s-%s.log" % (outsuffix, name)
         logfile = os.path.join(self.results_dir,filename)
         print "Log file: %s" % logfile
-        logcmd = "tee %s" % (logfile)
-        logcmd = logcmd + "| sed -u -e 's/\\r$//g'|cat -v"
-        print "logcmd: %s" % logcmd
-        logfile_proc = subprocess.Popen(logcmd,
-                                             stdin=subprocess.PIPE,
-                                             stderr=subprocess.PIPE,
-                                             stdout=subprocess.PIPE,
-                                             shell=True)
-        print repr(logfile_proc)
-        logfile = logfile_proc.stdin
-        print "Log file: %s" % logfile
+        logfile = OpTestLogger.ConsoleLogSink(logfile,
+                                              max_bytes=self.conf.args.console_log_max_bytes,
+                                              backup_count=self.conf.args.console_log_backups)
         OpTestLogger.optest_logger_glob.setUpCustomLoggerDebugFile(name, filename)
         ssh = OpTestSSH(self.ip, self.user, self.passwd,
                         logfile=logfile, check_ssh_keys=self.check_ssh_keys,
-                        known_hosts_file=self.known_hosts_file, use_parent_logger=False)
+                        known_hosts_file=self.known_hosts_file, use_parent_logger=False,
+                        single_round_trip=self.ssh.get_single_round_trip(),
+                        use_control_master=self.use_control_master)
         ssh.set_system(self.conf.op_system)
         return ssh
 
@@ -203,6 +200,19 @@ class OpTestHost():
         else:
           return self.ssh.run_command(i_cmd, timeout, retry)
 
+    def host_read_files(self, patterns, timeout=60, retry=0, console=0):
+        '''
+        Read a snapshot of many sysfs/procfs files in one command,
+        see OpTestUtil.read_files
+
+        :returns: dict of path : contents
+        '''
+        if isinstance(patterns, basestring):
+            patterns = [patterns]
+        return self.util.parse_read_files(
+            self.host_run_command(self.util.read_files_command(patterns),
+                                  timeout, retry, console=console))
+
     def host_gather_opal_msg_log(self, console=0):
         '''
         Gather OPAL logs (from the host) and store in a file
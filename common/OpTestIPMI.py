@@ -41,12 +41,15 @@ import os
 import pexpect
 import sys
 import re
+import threading
+import hashlib
 import commands
 
 from OpTestConstants import OpTestConstants as BMC_CONST
 from OpTestError import OpTestError
 from OpTestUtil import OpTestUtil
 import OpTestSystem
+import OpTestRMCP
 from Exceptions import CommandFailed
 from Exceptions import BMCDisconnected
 import OPexpect
@@ -55,27 +58,131 @@ import logging
 import OpTestLogger
 log = OpTestLogger.optest_logger_glob.get_logger(__name__)
 
+class IPMIShell():
+    '''
+    A long lived ``ipmitool ... shell`` process for one BMC.
+
+    Commands are pipelined through it one at a time, the output of each is
+    framed by the ``ipmitool> `` prompt, so the fork/exec and the RMCP+
+    session handshake are paid once rather than on every command.  If the
+    process dies, hangs or loses its session it is respawned and the
+    command retried once.
+    '''
+    prompt = "ipmitool> "
+    # ipmitool reports these when the session went away under it
+    session_errors = ["Unable to establish", "Error: no response from RAKP",
+                      "Insufficient privilege level", "Activate Session error"]
+
+    def __init__(self, binary='ipmitool', args=None, timeout=60):
+        self.binary = binary
+        self.args = args
+        self.timeout = timeout
+        self.pty = None
+        self.spawns = 0
+        self.lock = threading.Lock()
+
+    def spawn(self):
+        self.close()
+        self.spawns += 1
+        log.debug("IPMIShell spawn #{} {} shell".format(self.spawns, self.binary))
+        self.pty = pexpect.spawn(self.binary, self.args + ['shell'],
+                                 timeout=self.timeout)
+        self.pty.expect_exact(self.prompt)
+
+    def close(self):
+        if self.pty is not None:
+            try:
+                self.pty.close(force=True)
+            except Exception as e:
+                log.debug("IPMIShell close Exception={}".format(e))
+            self.pty = None
+
+    def run_once(self, cmd, timeout):
+        if self.pty is None or not self.pty.isalive():
+            self.spawn()
+        self.pty.sendline(cmd)
+        self.pty.expect_exact(self.prompt, timeout=timeout)
+        lines = self.pty.before.replace('\r\n', '\n').split('\n')
+        # drop the terminal echo of the command
+        if lines and lines[0].strip() == cmd.strip():
+            lines = lines[1:]
+        return '\n'.join(lines)
+
+    def run(self, cmd, timeout=None):
+        '''
+        Output of cmd (stdout and stderr, like the forked ipmitool)
+        '''
+        if timeout is None:
+            timeout = self.timeout
+        with self.lock:
+            try:
+                output = self.run_once(cmd, timeout)
+                if not any(error in output for error in self.session_errors):
+                    return output
+                log.debug("IPMIShell session problem, respawning, output={}".format(output))
+            except (pexpect.EOF, pexpect.TIMEOUT) as e:
+                log.debug("IPMIShell \"{}\" failed, respawning, Exception={}".format(cmd, e))
+            self.close()
+            try:
+                return self.run_once(cmd, timeout)
+            except (pexpect.EOF, pexpect.TIMEOUT) as e:
+                self.close()
+                raise CommandFailed(cmd, "IPMIShell failed, Exception={}".format(e), -1)
+
 class IPMITool():
     '''
     Run (locally) some command using ipmitool.
 
     This wrapper class takes care of all the login/method details for
     the caller.
+
+    With persistent set, commands go through an IPMIShell rather than a
+    fork of ipmitool each, except background commands, commands with a
+    cmdprefix or shell syntax (pipes, ``; echo $?``) and interactive ones
+    like ``sol activate`` which still fork.
     '''
+    # commands which have to run in their own process
+    fork_pattern = re.compile(r"[|;&<>$`\\'\"]|\bsol\s+activate\b|^\s*(shell|exec)\b")
+
     def __init__(self, method='lanplus', binary='ipmitool',
-                 ip=None, username=None, password=None, logfile=sys.stdout):
+                 ip=None, username=None, password=None, logfile=sys.stdout,
+                 port=None, persistent=False):
         self.method = 'lanplus'
         self.ip = ip
         self.username = username
         self.password = password
         self.binary = binary
         self.logfile = logfile
+        self.port = port
+        self.persistent = persistent
+        self.shell = None
 
     def binary_name(self):
         return self.binary
 
+    def set_persistent(self, flag):
+        self.persistent = flag
+        if not flag and self.shell is not None:
+            self.shell.close()
+            self.shell = None
+
+    def get_persistent(self):
+        return self.persistent
+
+    def argument_list(self):
+        args = ['-H', str(self.ip), '-I', self.method]
+        if self.port:
+            args += ['-p', str(self.port)]
+        if self.username:
+            args += ['-U', self.username]
+        if self.password:
+            args += ['-P', self.password]
+        return args
+
     def arguments(self):
         s = ' -H %s -I %s' % (self.ip, self.method)
+        if self.port:
+            s += ' -p %s' % (self.port)
         if self.username:
             s += ' -U %s' % (self.username)
         if self.password:
@@ -89,6 +196,12 @@ class IPMITool():
 
         :throws: :class:`common.Execptions.CommandFailed`
         '''
+        if self.persistent and not background and not cmdprefix \
+                and not self.fork_pattern.search(cmd):
+            if self.shell is None:
+                self.shell = IPMIShell(binary=self.binary, args=self.argument_list())
+            log.debug("ipmitool shell: {}".format(cmd))
+            return self.shell.run(cmd)
         if cmdprefix:
             cmd = cmdprefix + self.binary + self.arguments() + cmd
         else:
@@ -111,6 +224,306 @@ class IPMITool():
             output = cmd.communicate()[0]
             return output
 
+    def close(self):
+        if self.shell is not None:
+            self.shell.close()
+
+class SDRCache():
+    '''
+    On disk copy of a BMC's SDR repository, one per BMC firmware level.
+
+    The repository is dumped (``sdr dump``) the first time a sensor is
+    looked up on a firmware level not seen before, after that every read
+    hands the file to ipmitool with ``-S`` so it finds the sensor record
+    locally and sends a single Get Sensor Reading, rather than walking
+    the whole SDR and reading every sensor as ``sdr elist | grep`` does.
+
+    The firmware level comes from ``mc info`` and is asked for once, the
+    cache must be invalidated when the BMC is flashed.
+    '''
+    # the mc info fields which identify a firmware level
+    version_fields = ["Device ID", "Device Revision", "Firmware Revision",
+                      "Manufacturer ID", "Product ID"]
+
+    def __init__(self, ipmitool, cache_dir=None):
+        self.ipmitool = ipmitool
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.expanduser("~"), ".cache",
+                                     "op-test", "sdr")
+        self.cache_dir = cache_dir
+        self.file = None
+        self.lock = threading.Lock()
+
+    def version_key(self, mc_info):
+        '''
+        Firmware level of the BMC from the mc info output, None if it
+        doesn't look like mc info output
+        '''
+        fields = []
+        aux = False
+        for line in mc_info.splitlines():
+            if aux:
+                if line.startswith(" "):
+                    fields.append(line.strip())
+                    continue
+                aux = False
+            name = line.split(":", 1)[0].strip()
+            if name in self.version_fields:
+                fields.append(line.strip())
+            elif name == "Aux Firmware Rev Info":
+                aux = True
+        if not any(f.startswith("Firmware Revision") and f.split(":", 1)[1].strip()
+                   for f in fields):
+            return None
+        return hashlib.sha1("\n".join([str(self.ipmitool.ip)] + fields)).hexdigest()
+
+    def path(self):
+        '''
+        The SDR file for the current firmware level, dumping it if need be.
+        None if the SDR can't be cached, callers then read without it.
+        '''
+        with self.lock:
+            if self.file is not None:
+                return self.file
+            key = self.version_key(self.ipmitool.run(BMC_CONST.IPMI_MC_INFO))
+            if key is None:
+                log.debug("SDRCache unable to get the BMC firmware level, not caching")
+                return None
+            path = os.path.join(self.cache_dir, "{}-{}.sdr".format(self.ipmitool.ip, key[:16]))
+            if not os.path.exists(path):
+                try:
+                    if not os.path.isdir(self.cache_dir):
+                        os.makedirs(self.cache_dir)
+                except OSError as e:
+                    log.debug("SDRCache unable to create {}, Exception={}".format(self.cache_dir, e))
+                    return None
+                tmp = "{}.{}".format(path, os.getpid())
+                output = self.ipmitool.run("sdr dump {}".format(tmp))
+                if not os.path.exists(tmp) or os.path.getsize(tmp) == 0:
+                    log.debug("SDRCache sdr dump failed, not caching, output={}".format(output))
+                    return None
+                os.rename(tmp, path)
+                log.debug("SDRCache dumped the SDR to {}".format(path))
+            self.file = path
+            return path
+
+    def invalidate(self):
+        '''
+        Forget the SDR, the BMC firmware has changed (or is about to)
+        '''
+        with self.lock:
+            if self.file is not None and os.path.exists(self.file):
+                os.remove(self.file)
+            self.file = None
+
+    def sensor_output(self, name):
+        '''
+        ``sdr get`` output for the sensor, '' if there is no such sensor and
+        None if the SDR can't be cached
+        '''
+        path = self.path()
+        if path is None:
+            return None
+        output = self.ipmitool.run("-S {} sdr get '{}'".format(path, name))
+        if "Sensor ID" not in output:
+            return ''
+        return output
+
+def parse_sensor(output):
+    '''
+    Parse ``sdr get`` output into a dict of name, number, type, reading,
+    status and states (the asserted states), with every other field
+    under fields. None if output isn't about a sensor.
+    '''
+    sensor = {'name' : None, 'number' : None, 'type' : None, 'reading' : None,
+              'status' : None, 'states' : [], 'fields' : {}}
+    key = None
+    for line in output.splitlines():
+        if ":" in line and not line.strip().startswith("["):
+            key, value = [s.strip() for s in line.split(":", 1)]
+            sensor['fields'][key] = value
+            if key == "Sensor ID":
+                m = re.match(r"(.*?)\s*\((0x[0-9a-fA-F]+)\)$", value)
+                if m:
+                    sensor['name'] = m.group(1)
+                    sensor['number'] = int(m.group(2), 16)
+                else:
+                    sensor['name'] = value
+            elif key.startswith("Sensor Type"):
+                sensor['type'] = re.sub(r"\s*\(0x[0-9a-fA-F]+\)$", "", value)
+            elif key == "Sensor Reading":
+                sensor['reading'] = value
+            elif key == "Status":
+                sensor['status'] = value
+        elif key == "States Asserted" and line.strip().startswith("["):
+            sensor['states'].append(line.strip().strip("[]"))
+    if sensor['name'] is None:
+        return None
+    return sensor
+
+class IPMINative():
+    '''
+    Drop in for IPMITool which sends some commands itself over one reused
+    RMCP+ session (`OpTestRMCP.Session`), with output worded like
+    ipmitool's so callers don't notice. This is a fast path for the
+    commands op-test sends most, not a full ipmitool replacement:
+
+    - chassis power control and status
+    - raw commands, which covers the OEM ones for LEDs, PNOR partition
+      sizes and golden side version, fan control and BMC boot completion
+    - sel clear, mc reset cold/warm, chassis bootdev and dcmi power
+      activate/deactivate
+
+    Everything else is handed to the wrapped IPMITool: SOL, SEL and SDR
+    listings, sensor and sdr get (so the PNOR active side lookup),
+    dcmi power set_limit/get_limit/reading, mc info, shell syntax and
+    background commands. Structured replies for device ID, chassis status,
+    sensor readings and the SEL are available from session directly.
+    '''
+    power_pattern = re.compile(r"^\s*(chassis\s+)?power\s+(status|on|off|cycle|reset|diag|soft)\s*$")
+    raw_pattern = re.compile(r"^\s*raw\s+(.*)$")
+    mc_reset_pattern = re.compile(r"^\s*mc\s+reset\s+(cold|warm)\s*$")
+    bootdev_pattern = re.compile(r"^\s*chassis\s+bootdev\s+({})\s*$"
+                                 .format("|".join(OpTestRMCP.BOOT_DEVICES)))
+    dcmi_pattern = re.compile(r"^\s*dcmi\s+power\s+(activate|deactivate)\s*$")
+    sel_clear_pattern = re.compile(r"^\s*sel\s+clear\s*$")
+    power_messages = {'on' : 'Up/On', 'off' : 'Down/Off', 'cycle' : 'Cycle',
+                      'reset' : 'Reset', 'diag' : 'Diag', 'soft' : 'Soft'}
+
+    def __init__(self, ipmitool, cipher_suite=None):
+        self.ipmitool = ipmitool
+        self.ip = ipmitool.ip
+        self.username = ipmitool.username
+        self.password = ipmitool.password
+        self.session = OpTestRMCP.Session(ipmitool.ip, ipmitool.username,
+                                          ipmitool.password, port=ipmitool.port,
+                                          cipher_suite=cipher_suite)
+
+    def binary_name(self):
+        return self.ipmitool.binary_name()
+
+    def arguments(self):
+        return self.ipmitool.arguments()
+
+    def set_persistent(self, flag):
+        self.ipmitool.set_persistent(flag)
+
+    def get_persistent(self):
+        return self.ipmitool.get_persistent()
+
+    def power(self, action):
+        try:
+            if action == 'status':
+                status = self.session.chassis_status()
+                return "Chassis Power is {}\n".format("on" if status['power_on'] else "off")
+            self.session.chassis_control(action)
+            return "Chassis Power Control: {}\n".format(self.power_messages[action])
+        except CommandFailed as e:
+            if action == 'status':
+                return "Unable to get Chassis Power Status: {}\n".format(e.output)
+            return "Set Chassis Power Control to {} failed: {}\n".format(
+                self.power_messages[action], e.output)
+        except BMCDisconnected as e:
+            if action == 'status':
+                return "Unable to get Chassis Power Status\n"
+            return "Unable to set Chassis Power Control to {}\n".format(
+                self.power_messages[action])
+
+    def raw(self, values):
+        netfn, cmd, data = values[0], values[1], values[2:]
+        try:
+            completion, response = self.session.raw(netfn, cmd, data)
+        except BMCDisconnected:
+            return "Unable to send RAW command (channel=0x0 netfn=0x{:x} lun=0x0 cmd=0x{:x})\n" \
+                .format(netfn, cmd)
+        if completion != 0:
+            return "Unable to send RAW command (channel=0x0 netfn=0x{:x} lun=0x0 cmd=0x{:x}" \
+                " rsp=0x{:x}): {}\n".format(netfn, cmd, completion,
+                                            OpTestRMCP.completion_string(completion))
+        response = bytearray(response)
+        lines = [response[i:i + 16] for i in range(0, len(response), 16)] or [[]]
+        return "\n".join("".join(" {:02x}".format(b) for b in line) for line in lines) + "\n"
+
+    def mc_reset(self, kind):
+        try:
+            self.session.mc_reset(kind)
+        except (CommandFailed, BMCDisconnected) as e:
+            return "MC reset command failed: {}\n".format(getattr(e, 'output', e))
+        return "Sent {} reset command to MC\n".format(kind)
+
+    def bootdev(self, device):
+        try:
+            self.session.set_boot_device(device)
+        except CommandFailed as e:
+            return "Set Chassis Boot Parameter 5 failed: {}\n".format(e.output)
+        except BMCDisconnected:
+            return "Error setting Chassis Boot Parameter 5\n"
+        return "Set Boot Device to {}\n".format(device)
+
+    def dcmi_power(self, action):
+        try:
+            self.session.dcmi_power_limit(action == 'activate')
+        except CommandFailed as e:
+            return "DCMI request failed because: {} ({:x})\n".format(e.output, e.exitcode)
+        except BMCDisconnected:
+            return "Error in power {}\n".format(action)
+        return "\n    Power limit successfully {}d\n".format(action)
+
+    def sel_clear(self):
+        try:
+            self.session.sel_clear()
+        except CommandFailed as e:
+            return "Unable to clear SEL: {}\n".format(e.output)
+        except BMCDisconnected:
+            return "Unable to reserve SEL\n"
+        return "Clearing SEL.  Please allow a few seconds to erase.\n"
+
+    def native(self, cmd):
+        '''
+        Output of cmd if it can be sent natively, None otherwise
+        '''
+        m = self.power_pattern.match(cmd)
+        if m:
+            log.debug("RMCP+ {}: {}".format(self.ip, cmd))
+            return self.power(m.group(2))
+        for pattern, method in [(self.mc_reset_pattern, self.mc_reset),
+                                (self.bootdev_pattern, self.bootdev),
+                                (self.dcmi_pattern, self.dcmi_power)]:
+            m = pattern.match(cmd)
+            if m:
+                log.debug("RMCP+ {}: {}".format(self.ip, cmd))
+                return method(m.group(1))
+        if self.sel_clear_pattern.match(cmd):
+            log.debug("RMCP+ {}: {}".format(self.ip, cmd))
+            return self.sel_clear()
+        m = self.raw_pattern.match(cmd)
+        if m:
+            try:
+                values = [int(v, 0) for v in m.group(1).split()]
+            except ValueError:
+                return None
+            if len(values) < 2 or any(v < 0 or v > 0xff for v in values):
+                return None
+            log.debug("RMCP+ {}: {}".format(self.ip, cmd))
+            return self.raw(values)
+        return None
+
+    def run(self, cmd, background=False, cmdprefix=None):
+        '''
+        Run a ipmitool cmd, natively if possible.
+
+        :throws: :class:`common.Execptions.CommandFailed`
+        '''
+        if not background and not cmdprefix:
+            output = self.native(cmd)
+            if output is not None:
+                return output
+        return self.ipmitool.run(cmd, background=background, cmdprefix=cmdprefix)
+
+    def close(self):
+        self.session.close()
+        self.ipmitool.close()
+
 class pUpdate():
     def __init__(self, method='lan', binary='pUpdate',
                  ip=None, username=None, password=None):
@@ -174,7 +587,7 @@ def set_system_to_UNKNOWN_BAD(system):
 
 class IPMIConsole():
     def __init__(self, ipmitool=None, logfile=sys.stdout, prompt=None,
-            block_setup_term=None, delaybeforesend=None):
+            block_setup_term=None, delaybeforesend=None, single_round_trip=False):
         self.logfile = logfile
         self.ipmitool = ipmitool
         self.state = IPMIConsoleState.DISCONNECTED
@@ -189,6 +602,7 @@ class IPMIConsole():
         self.block_setup_term = block_setup_term # allows caller specific control of when to block setup_term
         self.setup_term_quiet = 0 # tells setup_term to not throw exceptions, like when system off
         self.setup_term_disable = 0 # flags the object to abandon setup_term operations, like when system off
+        self.single_round_trip = single_round_trip # run_command gets output and exit code in one expect
 
         # FUTURE - System Console currently tracked in System Object
         # state tracking, reset on boot and state changes
@@ -211,6 +625,12 @@ class IPMIConsole():
     def get_block_setup_term(self):
         return self.block_setup_term
 
+    def set_single_round_trip(self, flag):
+        self.single_round_trip = flag
+
+    def get_single_round_trip(self):
+        return self.single_round_trip
+
     def enable_setup_term_quiet(self):
         self.setup_term_quiet = 1
         self.setup_term_disable = 0
@@ -341,6 +761,7 @@ class OpTestIPMI():
         self.console = IPMIConsole(ipmitool=self.ipmitool,
                                    logfile=self.logfile,
                                    delaybeforesend=delaybeforesend)
+        self.sdr = SDRCache(self.ipmitool)
         # OpTestUtil instance is NOT conf's
         self.util = OpTestUtil()
         self.host = host
@@ -348,6 +769,51 @@ class OpTestIPMI():
     def set_system(self, system):
         self.console.set_system(system)
 
+    def sensor_output(self, name):
+        '''
+        ``sdr get`` output for one sensor, '' if there is no such sensor.
+
+        Read against the SDR cache, or with ipmitool walking the SDR on the
+        BMC if it can't be cached.
+        '''
+        output = self.sdr.sensor_output(name)
+        if output is None:
+            output = self.ipmitool.run("sdr get '{}'".format(name))
+            if "Sensor ID" not in output:
+                output = ''
+        return output
+
+    def get_sensor(self, name):
+        '''
+        Read one sensor, returns a dict of name, number, type, reading,
+        status and the asserted states (see :func:`parse_sensor`), None if
+        the BMC has no such sensor.
+        '''
+        return parse_sensor(self.sensor_output(name))
+
+    def sdr_invalidate(self):
+        '''
+        Drop the cached SDR, call after flashing the BMC.
+        '''
+        self.sdr.invalidate()
+
+    def set_backend(self, backend, cipher_suite=None):
+        '''
+        Send out of band commands through 'ipmitool' (the default) or
+        'native', an :class:`IPMINative` RMCP+ session of our own. The SOL
+        console always uses ipmitool.
+        '''
+        ipmitool = getattr(self.ipmitool, 'ipmitool', self.ipmitool)
+        if backend == 'native':
+            self.ipmitool = IPMINative(ipmitool, cipher_suite=cipher_suite)
+        elif backend == 'ipmitool':
+            if self.ipmitool is not ipmitool:
+                self.ipmitool.session.close()
+            self.ipmitool = ipmitool
+        else:
+            raise ValueError("Unknown IPMI backend {}".format(backend))
+        self.sdr.ipmitool = self.ipmitool
+
     def get_host_console(self):
         '''
         Get the IPMIConsole object, to run commands on the host etc.
@@ -465,12 +931,11 @@ class OpTestIPMI():
         :type timeout: int
         '''
         timeout = time.time() + 60*timeout
-        cmd = 'sdr elist |grep \'Host Status\''
-        output = self.ipmitool.run(cmd)
+        output = self.sensor_output('Host Status')
         if not "Host Status" in output:
             return BMC_CONST.FW_PARAMETER
         while True:
-            output = self.ipmitool.run(cmd)
+            output = self.sensor_output('Host Status')
             if 'S0/G0: working' in output:
                 log.debug("Host Status is S0/G0: working, IPL finished")
                 break
@@ -502,8 +967,7 @@ class OpTestIPMI():
         :type timeout: int
         '''
         timeout = time.time() + 60*timeout
-        cmd = 'sdr elist |grep \'Host Status\''
-        output = self.ipmitool.run(cmd)
+        output = self.sensor_output('Host Status')
         if not "Host Status" in output:
             return BMC_CONST.FW_PARAMETER
 
@@ -516,7 +980,7 @@ class OpTestIPMI():
                 log.error(l_msg)
                 raise OpTestError(l_msg)
             time.sleep(5)
-            output = self.ipmitool.run(cmd)
+            output = self.sensor_output('Host Status')
         return BMC_CONST.FW_SUCCESS
 
     def ipmi_wait_for_standby_state(self, i_timeout=120):
@@ -562,12 +1026,11 @@ class OpTestIPMI():
         :type i_timeout: int
         '''
         l_timeout = time.time() + 60*i_timeout
-        l_cmd = 'sdr elist |grep \'OS Boot\''
-        output = self.ipmitool.run(l_cmd)
+        output = self.sensor_output('OS Boot')
         if not "OS Boot" in output:
             return BMC_CONST.FW_PARAMETER
         while True:
-            l_output = self.ipmitool.run(l_cmd)
+            l_output = self.sensor_output('OS Boot')
             if BMC_CONST.OS_BOOT_COMPLETE in l_output:
                 log.debug("Host OS is booted")
                 break
@@ -591,8 +1054,7 @@ class OpTestIPMI():
         :type i_timeout: int
         '''
         l_timeout = time.time() + 60*i_timeout
-        l_cmd = 'sdr elist |grep \'OS Boot\''
-        l_output = self.ipmitool.run(l_cmd)
+        l_output = self.sensor_output('OS Boot')
         if not "OS Boot" in l_output:
             return BMC_CONST.FW_PARAMETER
 
@@ -605,7 +1067,7 @@ class OpTestIPMI():
                 log.error(l_msg)
                 raise OpTestError(l_msg)
             time.sleep(BMC_CONST.SHORT_WAIT_IPL)
-            l_output = self.ipmitool.run(l_cmd)
+            l_output = self.sensor_output('OS Boot')
 
         return BMC_CONST.FW_SUCCESS
 
@@ -762,6 +1224,8 @@ class OpTestIPMI():
                                  BMC_CONST.BMC_FW_IMAGE_UPDATE
                                  or BMC_CONST.BMC_PNOR_IMAGE
         '''
+        # the new BMC firmware may come with a different SDR
+        self.sdr_invalidate()
         self.ipmi_cold_reset()
         time.sleep(5)
         l_cmd = BMC_CONST.BMC_HPM_UPDATE + i_image + " " + i_imagecomponent
@@ -1343,8 +1807,7 @@ class OpTestIPMI():
         pass
 
     def ipmi_get_golden_side_sensor_id(self):
-        cmd = "sdr elist -v | grep -i 'BIOS Golden'"
-        output = self.ipmitool.run(cmd)
+        output = self.sensor_output('BIOS Golden Side')
         matchObj = re.search( "BIOS Golden Side \((.*)\)", output)
         id = None
         if matchObj:
@@ -1352,8 +1815,7 @@ class OpTestIPMI():
         return id
 
     def ipmi_get_boot_count_sensor_id(self):
-        cmd = "sdr elist -v | grep -i 'Boot Count'"
-        output = self.ipmitool.run(cmd)
+        output = self.sensor_output('Boot Count')
         matchObj = re.search( "Boot Count \((.*)\)", output)
         id = None
         if matchObj:
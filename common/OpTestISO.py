@@ -0,0 +1,507 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+'''
+OS install image cache
+----------------------
+
+Installing from ``--os-cdrom`` used to loop mount the image (needing
+root) on every run. `ISOCache` instead extracts the image once, reading
+the ISO9660 file system directly, into a directory named for the sha256
+of the image and reuses it for every later install of the same media.
+
+An index remembers the hash of each local image (by path, size and
+mtime) and remote one (by URL, Content-Length and Last-Modified) so a
+cached image is neither hashed nor downloaded again. Runs sharing the
+cache update it under a lock, see `OpTestFileIndex.JSONIndex`.
+
+Every entry has a lock file: extraction holds it exclusively, users of
+an entry hold it shared until `ISOCache.release` (or they exit), and
+the least recently used entries are only evicted, once the cache is
+over ``max_bytes``, when nobody holds them.
+'''
+
+import os
+import errno
+import fcntl
+import hashlib
+import json
+import shutil
+import struct
+import tempfile
+import time
+import urllib2
+
+import OpTestFileIndex
+from OpTestFileIndex import CHUNK_SIZE, JSONIndex, file_hash
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+SECTOR = 2048
+
+
+class ISOError(Exception):
+    pass
+
+
+class ISO9660(object):
+    '''
+    Read only ISO9660 image, with the Rock Ridge names, symlinks, file
+    modes and relocated directories (or failing that, the Joliet names)
+    where the image has them.
+    '''
+    def __init__(self, path):
+        self.f = open(path, 'rb')
+        self.block_size = SECTOR
+        self.root = None
+        self.joliet_root = None
+        sector = 16
+        while True:
+            desc = self.read_at(sector * SECTOR, SECTOR)
+            if len(desc) < SECTOR or desc[1:6] != "CD001":
+                break
+            kind = ord(desc[0])
+            if kind == 255:
+                break
+            if kind == 1 and self.root is None:
+                self.block_size = struct.unpack("<H", desc[128:130])[0]
+                self.root = self.record(desc[156:190])
+            elif kind == 2 and desc[88:91] in ["%/@", "%/C", "%/E"]:
+                self.joliet_root = self.record(desc[156:190])
+            sector += 1
+        if self.root is None:
+            self.f.close()
+            raise ISOError("{} has no ISO9660 primary volume descriptor".format(path))
+        self.susp_skip = None
+        self.joliet = False
+        first = next(self.records(self.root), None)
+        if first is not None and first['system_use'][:2] == "SP":
+            self.susp_skip = ord(first['system_use'][6])
+        if self.susp_skip is None and self.joliet_root is not None:
+            self.root = self.joliet_root
+            self.joliet = True
+
+    def close(self):
+        self.f.close()
+
+    def read_at(self, offset, length):
+        self.f.seek(offset)
+        return self.f.read(length)
+
+    def record(self, data):
+        name_len = ord(data[32])
+        name = data[33:33 + name_len]
+        su = 33 + name_len + (1 - name_len % 2)
+        return {'extent': struct.unpack("<I", data[2:6])[0],
+                'size': struct.unpack("<I", data[10:14])[0],
+                'flags': ord(data[25]),
+                'name': name,
+                'system_use': data[su:]}
+
+    def records(self, directory):
+        '''
+        The raw records of a directory, "." and ".." included
+        '''
+        data = self.read_at(directory['extent'] * self.block_size, directory['size'])
+        pos = 0
+        while pos < len(data):
+            length = ord(data[pos])
+            if length == 0:
+                # records don't cross sectors, the rest of this one is padding
+                pos = (pos / SECTOR + 1) * SECTOR
+                continue
+            yield self.record(data[pos:pos + length])
+            pos += length
+
+    def susp(self, system_use):
+        '''
+        (signature, data) of the SUSP entries, following CE continuations
+        '''
+        area = system_use[self.susp_skip:]
+        while area:
+            pos = 0
+            next_area = ""
+            while pos + 4 <= len(area):
+                sig = area[pos:pos + 2]
+                length = ord(area[pos + 2])
+                if length < 4:
+                    break
+                data = area[pos + 4:pos + length]
+                if sig == "CE":
+                    block, offset, size = struct.unpack("<I4xI4xI", data[:20])
+                    next_area = self.read_at(block * self.block_size + offset, size)
+                elif sig == "ST":
+                    break
+                else:
+                    yield sig, data
+                pos += length
+            area = next_area
+
+    def rock_ridge(self, record):
+        '''
+        The Rock Ridge entries of a record extraction needs: a dict of the
+        name (NM, "" if none), symlink target (SL), mode (PX), child (the
+        extent of a directory relocated elsewhere, CL) and relocated (RE,
+        this is that directory, in the relocation directory)
+        '''
+        rr = {'name': "", 'symlink': None, 'mode': None, 'child': None,
+              'relocated': False}
+        if self.susp_skip is None:
+            return rr
+        components = []
+        component = None
+        for sig, data in self.susp(record['system_use']):
+            if sig == "NM" and not ord(data[0]) & 0x06:
+                rr['name'] += data[1:]
+            elif sig == "PX":
+                rr['mode'] = struct.unpack("<I", data[:4])[0]
+            elif sig == "CL":
+                rr['child'] = struct.unpack("<I", data[:4])[0]
+            elif sig == "RE":
+                rr['relocated'] = True
+            elif sig == "SL":
+                pos = 1
+                while pos + 2 <= len(data):
+                    flags = ord(data[pos])
+                    content = data[pos + 2:pos + 2 + ord(data[pos + 1])]
+                    pos += 2 + ord(data[pos + 1])
+                    if flags & 0x30:
+                        raise ISOError("{}: symlink to the volume or host root"
+                                       .format(record['name']))
+                    if flags & 0x08:
+                        content = ""
+                    elif flags & 0x04:
+                        content = ".."
+                    elif flags & 0x02:
+                        content = "."
+                    component = (component or "") + content
+                    if not flags & 0x01:
+                        # the component doesn't continue in the next record
+                        components.append(component)
+                        component = None
+        if components:
+            rr['symlink'] = "/".join(components) or "/"
+        return rr
+
+    def name(self, record, rr=None):
+        if rr is None:
+            rr = self.rock_ridge(record)
+        if rr['name']:
+            return rr['name']
+        if self.joliet:
+            return record['name'].decode('utf-16-be').encode('utf-8').split(';')[0]
+        name = record['name'].split(';')[0]
+        if name.endswith('.'):
+            name = name[:-1]
+        return name
+
+    def directory_at(self, extent):
+        '''
+        The "." record of the directory at extent, which stands for a
+        relocated directory in its real parent
+        '''
+        data = self.read_at(extent * self.block_size, 255)
+        if not data or not ord(data[0]):
+            raise ISOError("no relocated directory at sector {}".format(extent))
+        record = self.record(data[:ord(data[0])])
+        if not record['flags'] & 0x02:
+            raise ISOError("sector {} is not a directory".format(extent))
+        return record
+
+    def walk(self, directory=None, path="", depth=0):
+        '''
+        Yields (path, kind, value, mode) for every directory (kind "dir",
+        value None), file ("file", its records, several for a multi-extent
+        file) and symlink ("symlink", its target). mode is the Rock Ridge
+        one, None without Rock Ridge.
+
+        Relocated directories are walked where they belong rather than in
+        the relocation directory.
+        '''
+        if directory is None:
+            directory = self.root
+        if depth > 255:
+            raise ISOError("{} is too deep, a relocation loop?".format(path))
+        pending = None
+        for record in self.records(directory):
+            if record['name'] in ["\x00", "\x01"]:
+                continue
+            rr = self.rock_ridge(record)
+            if rr['relocated']:
+                # walked from its CL entry
+                continue
+            name = os.path.join(path, self.name(record, rr))
+            if rr['symlink'] is not None:
+                yield name, "symlink", rr['symlink'], rr['mode']
+                continue
+            if rr['child'] is not None:
+                record = self.directory_at(rr['child'])
+            if record['flags'] & 0x02:
+                yield name, "dir", None, rr['mode']
+                for entry in self.walk(record, name, depth + 1):
+                    yield entry
+                continue
+            if pending is None:
+                pending = (name, "file", [], rr['mode'])
+            pending[2].append(record)
+            if not record['flags'] & 0x80:
+                # the last (or only) extent of the file
+                yield pending
+                pending = None
+
+    def copy(self, records, dest):
+        with open(dest, 'wb') as out:
+            for record in records:
+                self.f.seek(record['extent'] * self.block_size)
+                remaining = record['size']
+                while remaining > 0:
+                    chunk = self.f.read(min(remaining, CHUNK_SIZE))
+                    if not chunk:
+                        raise ISOError("{} is truncated".format(dest))
+                    out.write(chunk)
+                    remaining -= len(chunk)
+
+    def extract(self, dest):
+        '''
+        Extract everything into dest. Files get their Rock Ridge
+        permissions, directories are left writable so the cache can
+        remove them.
+
+        :returns: bytes extracted
+        '''
+        total = 0
+        real_dest = os.path.realpath(dest)
+        for path, kind, value, mode in self.walk():
+            target = os.path.join(dest, path)
+            parent = os.path.realpath(os.path.dirname(target))
+            if os.path.relpath(target, dest).startswith(os.pardir) or \
+                    os.path.relpath(parent, real_dest).startswith(os.pardir):
+                raise ISOError("{} escapes the image".format(path))
+            if kind == "dir":
+                if not os.path.isdir(target):
+                    os.makedirs(target)
+            elif kind == "symlink":
+                os.symlink(value, target)
+            else:
+                self.copy(value, target)
+                if mode is not None:
+                    os.chmod(target, mode & 0o777)
+                total += sum(record['size'] for record in value)
+        return total
+
+
+class ISOCache(object):
+    '''
+    Content addressed cache of extracted install images, see the module
+    documentation.
+
+    :param cache_dir: defaults to ~/.cache/op-test/iso
+    :param max_bytes: size the extracted images are trimmed to
+    '''
+    def __init__(self, cache_dir=None, max_bytes=20 * 1024 ** 3):
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.expanduser("~"), ".cache",
+                                     "op-test", "iso")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index = JSONIndex(os.path.join(cache_dir, "index.json"))
+        # key : shared lock file held while we use the entry
+        self.held = {}
+
+    def entry(self, key, suffix=""):
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def remember(self, source_id, key):
+        def add(index):
+            index[source_id] = key
+        self.index.update(add)
+
+    def lookup(self, source_id):
+        key = self.index.load().get(source_id)
+        if key and os.path.isdir(self.entry(key)):
+            return key
+        return None
+
+    def key(self, source):
+        '''
+        (key, local image path or None if the image is cached and
+        wasn't needed, downloaded temporary file or None)
+        '''
+        if os.path.isfile(source):
+            source_id = OpTestFileIndex.source_id(source)
+            key = self.lookup(source_id)
+            if key:
+                return key, None, None
+            start = time.time()
+            key = file_hash(source)
+            log.debug("ISOCache hashed {} in {:.1f}s".format(source, time.time() - start))
+            self.remember(source_id, key)
+            return key, source, None
+        response = urllib2.urlopen(source)
+        source_id = "{}:{}:{}".format(source, response.info().getheader('Content-Length'),
+                                      response.info().getheader('Last-Modified'))
+        key = self.lookup(source_id)
+        if key:
+            response.close()
+            return key, None, None
+        digest = hashlib.sha256()
+        fd, download = tempfile.mkstemp(dir=self.cache_dir, prefix=".download-")
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = response.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+        response.close()
+        key = digest.hexdigest()
+        self.remember(source_id, key)
+        return key, download, download
+
+    def get(self, source):
+        '''
+        Directory holding the extracted contents of the image at source
+        (a path or URL), extracted now if it isn't cached. The entry is
+        held (not evicted) until release().
+        '''
+        if not os.path.isdir(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        key, image, download = self.key(source)
+        path = self.entry(key)
+        lock = open(self.entry(key, ".lock"), 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_SH)
+            if not os.path.isdir(path) and image is not None:
+                # only one of us extracts, the others wait for it
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                if not os.path.isdir(path):
+                    self.extract(image, key)
+                # downgrade, other users may share it but nobody may evict it
+                fcntl.flock(lock, fcntl.LOCK_SH)
+        except Exception:
+            lock.close()
+            raise
+        finally:
+            if download:
+                os.remove(download)
+        if not os.path.isdir(path):
+            # evicted since we looked it up, fetch the image again
+            lock.close()
+            self.forget(key)
+            return self.get(source)
+        if key in self.held:
+            self.held[key].close()
+        self.held[key] = lock
+        self.touch(key)
+        self.evict()
+        return path
+
+    def extract(self, image, key):
+        start = time.time()
+        tmp = tempfile.mkdtemp(dir=self.cache_dir, prefix=".extract-")
+        try:
+            iso = ISO9660(image)
+            try:
+                size = iso.extract(tmp)
+            finally:
+                iso.close()
+            # the .json first, so entries() (and evict) see every
+            # directory that is there, even if we die before the rename
+            with open(self.entry(key, ".json"), 'w') as f:
+                json.dump({'size': size, 'source': image}, f)
+            os.rename(tmp, self.entry(key))
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if os.path.exists(self.entry(key, ".json")):
+                os.remove(self.entry(key, ".json"))
+            raise
+        log.info("ISOCache extracted {} ({}MB) in {:.1f}s"
+                 .format(image, size >> 20, time.time() - start))
+
+    def forget(self, key):
+        def remove(index):
+            for source_id in [s for s, k in index.items() if k == key]:
+                del index[source_id]
+        self.index.update(remove)
+
+    def touch(self, key):
+        '''
+        Mark the entry as just used, the last use is the .json mtime
+        '''
+        try:
+            os.utime(self.entry(key, ".json"), None)
+        except OSError:
+            pass
+
+    def release(self, key=None):
+        '''
+        Stop holding an entry (by default all of them) so it may be evicted
+        '''
+        for k in [key] if key else self.held.keys():
+            lock = self.held.pop(k, None)
+            if lock:
+                lock.close()
+
+    def entries(self):
+        '''
+        (last used, size, key) of the cached images, least recent first
+        '''
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json") or name == "index.json":
+                continue
+            key = name[:-len(".json")]
+            try:
+                with open(self.entry(key, ".json"), 'r') as f:
+                    size = json.load(f)['size']
+                used = os.path.getmtime(self.entry(key, ".json"))
+            except (IOError, OSError, ValueError, KeyError):
+                continue
+            entries.append((used, size, key))
+        return sorted(entries)
+
+    def evict(self):
+        '''
+        Remove the least recently used images nobody holds until the
+        cache fits in max_bytes
+        '''
+        entries = self.entries()
+        total = sum(size for used, size, key in entries)
+        for used, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key in self.held:
+                continue
+            with open(self.entry(key, ".lock"), 'a') as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except IOError:
+                    log.debug("ISOCache not evicting {}, it is in use".format(key))
+                    continue
+                os.remove(self.entry(key, ".json"))
+                shutil.rmtree(self.entry(key), ignore_errors=True)
+                self.forget(key)
+            log.info("ISOCache evicted {} ({}MB)".format(key, size >> 20))
+            total -= size
+        return total
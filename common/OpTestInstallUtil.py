@@ -20,17 +20,22 @@
 #
 
 import shutil
+import urllib
 import urllib2
 import os
 import threading
 import SocketServer
 import BaseHTTPServer
 import SimpleHTTPServer
-import cgi
 import commands
 import time
+import re
+import socket
+import tempfile
 from Exceptions import CommandFailed, UnexpectedCase
 import OpTestConfiguration
+import OpTestTiming
+import OpTestISO
 
 from common.OpTestSystem import OpSystemState
 
@@ -47,12 +52,139 @@ USERNAME = ""
 PASSWORD = ""
 REPO = ""
 BOOTPATH = ""
+PROXY = ""
 
+# uploaded file name : path of the upload on disk
 uploaded_files = {}
+UPLOAD_PATH = None
+# bytes read or written at a time when streaming files
+CHUNK_SIZE = 64 * 1024
+# see iso_cache()
+ISO_CACHE = None
+
+
+def save_uploaded_file(name, dest):
+    """
+    Move an uploaded file to dest, without reading it into memory
+
+    :returns: False if nothing by that name was uploaded
+    """
+    path = uploaded_files.pop(name, None)
+    if path is None:
+        return False
+    shutil.move(path, dest)
+    return True
+
+def iso_cache():
+    """
+    The ISO cache setup_repo extracts images into, see OpTestISO
+    """
+    global ISO_CACHE
+    if ISO_CACHE is None:
+        ISO_CACHE = OpTestISO.ISOCache()
+    return ISO_CACHE
+
+def setup_repo(cdrom, cache=None, base_path=None):
+    """
+    Sets up repo from given cdrom.
+    Check if given cdrom is url or file, extract it (only the
+    first time, see OpTestISO) into the ISO cache and
+    link the repo folder in base_path (BASE_PATH by default) to it
+
+    :params cdrom: OS cdrom path local or remote
+    """
+    base_path = base_path or BASE_PATH
+    repo_path = os.path.join(base_path, 'repo')
+    abs_repo_path = os.path.abspath(repo_path)
+    # Clear already mount, copied or linked repo
+    if os.path.islink(repo_path):
+        os.remove(repo_path)
+    elif os.path.ismount(repo_path):
+        status, output = commands.getstatusoutput("umount %s" % abs_repo_path)
+        if status != 0:
+            print("failed to unmount", abs_repo_path)
+            return ""
+        os.rmdir(abs_repo_path)
+    elif os.path.isdir(repo_path):
+        shutil.rmtree(repo_path)
+    if not os.path.isdir(base_path):
+        os.makedirs(base_path)
+
+    try:
+        cached = (cache or iso_cache()).get(cdrom)
+    except (OpTestISO.ISOError, IOError, OSError, urllib2.URLError) as e:
+        print("Unable to extract cdrom %s: %s" % (cdrom, e))
+        return ""
+    os.symlink(cached, abs_repo_path)
+    return abs_repo_path
+
+def extract_install_files(repo_path, base_path=None, boot_path=None,
+                          vmlinux=None, initrd=None):
+    """
+    extract the install file from given repo path
+
+    :params repo_path: os repo path either local or remote
+    :params base_path, boot_path, vmlinux, initrd: where to put the files
+            and what they are, BASE_PATH, BOOTPATH, VMLINUX and INITRD
+            by default
+    """
+    base_path = base_path or BASE_PATH
+    boot_path = BOOTPATH if boot_path is None else boot_path
+    vmlinux = vmlinux or VMLINUX
+    initrd = initrd or INITRD
+    vmlinux_src = os.path.join(repo_path, boot_path, vmlinux)
+    initrd_src = os.path.join(repo_path, boot_path, initrd)
+    vmlinux_dst = os.path.join(base_path, vmlinux)
+    initrd_dst = os.path.join(base_path, initrd)
+    # let us make sure, no old vmlinux, initrd
+    if os.path.isfile(vmlinux_dst):
+        os.remove(vmlinux_dst)
+    if os.path.isfile(initrd_dst):
+        os.remove(initrd_dst)
+
+    if os.path.isdir(repo_path):
+        try:
+            shutil.copyfile(vmlinux_src, vmlinux_dst)
+            shutil.copyfile(initrd_src, initrd_dst)
+        except Exception:
+            return False
+    else:
+        vmlinux_file = urllib2.urlopen(vmlinux_src)
+        initrd_file = urllib2.urlopen(initrd_src)
+        if not (vmlinux_file and initrd_file):
+            print("Unknown repo path %s, %s" % (vmlinux_src, initrd_src))
+            return False
+        try:
+            with open(vmlinux_dst, 'wb') as f:
+                f.write(vmlinux_file.read())
+            with open(initrd_dst, 'wb') as f:
+                f.write(initrd_file.read())
+        except Exception:
+            return False
+    return True
+
+def set_bootable_disk(system, disk, settle=60):
+    """
+    Sets the given disk as default bootable entry in petitboot
+    """
+    system.sys_set_bootdev_no_override()
+    # FIXME: wait till the device(disk) discovery in petitboot
+    time.sleep(settle)
+    cmd = 'blkid %s*' % disk
+    output = system.console.run_command(cmd)
+    uuid = output[0].split(':')[1].split('=')[1].replace("\"", "")
+    cmd = 'nvram --update-config "auto-boot?=true"'
+    output = system.console.run_command(cmd)
+    cmd = 'nvram --update-config petitboot,bootdevs=uuid:%s' % uuid
+    output = system.console.run_command(cmd)
+    cmd = 'nvram --print-config'
+    output = system.console.run_command(cmd)
+    return
+
 
 class InstallUtil():
     def __init__(self, base_path="", initrd="", vmlinux="",
-                 ks="", boot_path="", repo=""):
+                 ks="", boot_path="", repo="", conf=None):
         global BASE_PATH
         global INITRD
         global VMLINUX
@@ -63,7 +195,8 @@ class InstallUtil():
         global BOOTPATH
         global REPO
         global PROXY
-        self.conf = OpTestConfiguration.conf
+        global ISO_CACHE
+        self.conf = conf or OpTestConfiguration.conf
         self.cv_HOST = self.conf.host()
         self.cv_SYSTEM = self.conf.system()
         self.server = ""
@@ -78,6 +211,9 @@ class InstallUtil():
         VMLINUX = vmlinux
         PROXY = self.cv_HOST.get_proxy()
         KS = ks
+        if ISO_CACHE is None:
+            ISO_CACHE = OpTestISO.ISOCache(self.conf.args.os_cdrom_cache,
+                                           max_bytes=int(self.conf.args.os_cdrom_cache_size * 1024 ** 3))
 
     def wait_for_network(self):
         retry = 6
@@ -212,7 +348,14 @@ class InstallUtil():
         return my_ip
 
     def get_uploaded_file(self, name):
-        return uploaded_files.get(name)
+        path = uploaded_files.get(name)
+        if path is None:
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def save_uploaded_file(self, name, dest):
+        return save_uploaded_file(name, dest)
 
     def start_server(self, server_ip):
         """
@@ -240,101 +383,13 @@ class InstallUtil():
         return
 
     def setup_repo(self, cdrom):
-        """
-        Sets up repo from given cdrom.
-        Check if given cdrom is url or file
-        if url, download in the BASE_PATH and
-        mount to repo folder
-
-        :params cdrom: OS cdrom path local or remote
-        """
-        repo_path = os.path.join(BASE_PATH, 'repo')
-        abs_repo_path = os.path.abspath(repo_path)
-        # Clear already mount repo
-        if os.path.ismount(repo_path):
-            status, output = commands.getstatusoutput("umount %s" % abs_repo_path)
-            if status != 0:
-                print("failed to unmount", abs_repo_path)
-                return ""
-        elif os.path.isdir(repo_path):
-            shutil.rmtree(repo_path)
-        else:
-            pass
-        if not os.path.isdir(repo_path):
-            os.makedirs(abs_repo_path)
-
-        if os.path.isfile(cdrom):
-            cdrom_path = cdrom
-        else:
-            cdrom_url = urllib2.urlopen(cdrom)
-            if not cdrom_url:
-                print("Unknown cdrom path %s" % cdrom)
-                return ""
-            with open(os.path.join(BASE_PATH, "iso"), 'wb') as f:
-                f.write(cdrom_url.read())
-            cdrom_path = os.path.join(BASE_PATH, "iso")
-        cmd = "mount -t iso9660 -o loop %s %s" % (cdrom_path, abs_repo_path)
-        status, output = commands.getstatusoutput(cmd)
-        if status != 0:
-            print("Failed to mount iso %s on %s\n %s", (cdrom, abs_repo_path,
-                                                        output))
-            return ""
-        return abs_repo_path
+        return setup_repo(cdrom)
 
     def extract_install_files(self, repo_path):
-        """
-        extract the install file from given repo path
-
-        :params repo_path: os repo path either local or remote
-        """
-        vmlinux_src = os.path.join(repo_path, BOOTPATH, VMLINUX)
-        initrd_src = os.path.join(repo_path, BOOTPATH, INITRD)
-        vmlinux_dst = os.path.join(BASE_PATH, VMLINUX)
-        initrd_dst = os.path.join(BASE_PATH, INITRD)
-        # let us make sure, no old vmlinux, initrd
-        if os.path.isfile(vmlinux_dst):
-            os.remove(vmlinux_dst)
-        if os.path.isfile(initrd_dst):
-            os.remove(initrd_dst)
-
-        if os.path.isdir(repo_path):
-            try:
-                shutil.copyfile(vmlinux_src, vmlinux_dst)
-                shutil.copyfile(initrd_src, initrd_dst)
-            except Exception:
-                return False
-        else:
-            vmlinux_file = urllib2.urlopen(vmlinux_src)
-            initrd_file = urllib2.urlopen(initrd_src)
-            if not (vmlinux_file and initrd_file):
-                print("Unknown repo path %s, %s" % (vmlinux_src, initrd_src))
-                return False
-            try:
-                with open(vmlinux_dst, 'wb') as f:
-                    f.write(vmlinux_file.read())
-                with open(initrd_dst, 'wb') as f:
-                    f.write(initrd_file.read())
-            except Exception:
-                return False
-        return True
+        return extract_install_files(repo_path)
 
     def set_bootable_disk(self, disk):
-        """
-        Sets the given disk as default bootable entry in petitboot
-        """
-        self.cv_SYSTEM.sys_set_bootdev_no_override()
-        # FIXME: wait till the device(disk) discovery in petitboot
-        time.sleep(60)
-        cmd = 'blkid %s*' % disk
-        output = self.cv_SYSTEM.console.run_command(cmd)
-        uuid = output[0].split(':')[1].split('=')[1].replace("\"", "")
-        cmd = 'nvram --update-config "auto-boot?=true"'
-        output = self.cv_SYSTEM.console.run_command(cmd)
-        cmd = 'nvram --update-config petitboot,bootdevs=uuid:%s' % uuid
-        output = self.cv_SYSTEM.console.run_command(cmd)
-        cmd = 'nvram --print-config'
-        output = self.cv_SYSTEM.console.run_command(cmd)
-        return
+        return set_bootable_disk(self.cv_SYSTEM, disk)
 
     def get_boot_cfg(self):
         """
@@ -460,13 +515,544 @@ class InstallUtil():
         return True
 
 
+def kernel_args(distro, ks_url, mac, ip, gateway, submask, dns, hostname,
+                disk=None, proxy=None):
+    """
+    The kernel command line of the distro (hostos, rhel or ubuntu)
+    installer for a host, with the kickstart (or preseed) at ks_url.
+    For ubuntu disk is the disk to install to, and with no mac the
+    installer picks the interface itself.
+    """
+    if distro == "ubuntu":
+        args = ('auto console=hvc0 '
+                'interface=auto '
+                'localechooser/languagelist=en '
+                'debian-installer/country=US '
+                'debian-installer/locale=en_US '
+                'console-setup/ask_detect=false '
+                'console-setup/layoutcode=us '
+                'netcfg/get_hostname=%s '
+                'netcfg/get_domain=example.com '
+                'netcfg/link_wait_timeout=60 '
+                'partman-auto/disk=%s '
+                'locale=en_US '
+                'url=%s ' % (hostname, disk, ks_url))
+        if dns:
+            args += ('netcfg/disable_autoconfig=true '
+                     'netcfg/get_nameservers=%s '
+                     'netcfg/get_ipaddress=%s '
+                     'netcfg/get_netmask=%s '
+                     'netcfg/get_gateway=%s ' % (dns, ip, submask, gateway))
+        if proxy:
+            args += 'mirror/http/proxy=%s ' % proxy
+        if not mac:
+            return args + 'netcfg/choose_interface=auto'
+        return args + 'netcfg/choose_interface=%s BOOTIF=01-%s' % (mac, '-'.join(mac.split(':')))
+    return "ifname=net0:%s ip=%s::%s:%s:%s:net0:none nameserver=%s inst.ks=%s" % (
+        mac, ip, gateway, submask, hostname, dns, ks_url)
+
+
+# boot path in the repo, vmlinux, initrd and kickstart (or preseed) per distro
+INSTALL_FILES = {
+    "hostos": ("ppc/ppc64", "vmlinuz", "initrd.img", "hostos.ks"),
+    "rhel": ("ppc/ppc64", "vmlinuz", "initrd.img", "rhel.ks"),
+    "ubuntu": ("ubuntu-installer/ppc64el", "vmlinux", "initrd.gz", "preseed.cfg"),
+}
+
+# kernel boot, installer progress and installer finished patterns per distro
+INSTALLERS = {
+    "hostos": (['opal: OPAL detected'],
+               ['Starting installer',
+                'Setting up the installation environment',
+                'Starting package installation process',
+                'Performing post-installation setup tasks',
+                'Configuring installed system'],
+               'reboot: Restarting system'),
+    "rhel": (['Sent SIGKILL to all processes', 'Starting new kernel'],
+             ['Starting installer',
+              'Setting up the installation environment',
+              'Starting package installation process',
+              'Performing post-installation setup tasks',
+              'Configuring installed system'],
+             ' Restarting system'),
+    "ubuntu": (['Sent SIGKILL to all processes', 'Starting new kernel'],
+               ['Loading additional components',
+                'Detecting hardware',
+                'Partitions formatting',
+                'Installing the base system',
+                'Select and install software',
+                'Finishing the installation'],
+               'Requesting system reboot'),
+}
+
+
+class InstallTarget(object):
+    """
+    A system for InstallOrchestrator to install, with the network and
+    kickstart details InstallUtil takes from the configuration.
+
+    :param system: the OpTestSystem, its console is driven from the
+                   petitboot shell
+    """
+    def __init__(self, name, system, ip, mac, gateway, submask, dns, disk,
+                 hostname=None, username="root", password="", proxy=""):
+        self.name = name
+        self.system = system
+        self.ip = ip
+        self.mac = mac
+        self.gateway = gateway
+        self.submask = submask
+        self.dns = dns
+        self.disk = disk
+        self.hostname = hostname or name
+        self.username = username
+        self.password = password
+        self.proxy = proxy
+
+    @staticmethod
+    def from_conf(conf, name=None):
+        """
+        The system of an op-test configuration as an InstallTarget
+        """
+        host = conf.host()
+        return InstallTarget(name or conf.args.host_name or host.ip, conf.system(),
+                             host.ip, conf.args.host_mac, conf.args.host_gateway,
+                             conf.args.host_submask, conf.args.host_dns,
+                             host.get_scratch_disk(), hostname=conf.args.host_name,
+                             username=host.username(), password=host.password(),
+                             proxy=host.get_proxy())
+
+
+class InstallOrchestrator(object):
+    """
+    Install the same OS on a number of systems at once.
+
+    The install files are extracted (and a cdrom mounted) once, one web
+    server serves them and each host's kickstart (or preseed), rendered
+    with its disk and password, from /ks/<host>/<ks>. Every target is then
+    driven in its own thread from the petitboot shell: wget and kexec the
+    installer, follow it to the reboot and, with boot_os, make the disk
+    bootable and boot the new OS.
+
+    Each step is logged as it completes and recorded (as ``install``
+    events) in an OpTestTiming.TransitionLog, see report().
+
+    Only the wget/kexec path is driven, not the qemu petitboot menu
+    install of InstallUbuntu. testcases.InstallHosts runs it for the
+    host and those of ``--install-hosts``.
+    """
+    def __init__(self, base_path, vmlinux, initrd, ks, boot_path,
+                 repo=None, cdrom=None, boot_os=True, timing=None,
+                 settle=60):
+        self.base_path = base_path
+        self.vmlinux = vmlinux
+        self.initrd = initrd
+        self.ks = ks
+        self.boot_path = boot_path
+        self.repo = repo
+        self.cdrom = cdrom
+        self.boot_os = boot_os
+        self.timing = timing or OpTestTiming.TransitionLog()
+        self.settle = settle
+        self.distro = None
+        for distro in ["hostos", "rhel", "ubuntu"]:
+            if distro in base_path:
+                self.distro = distro
+                break
+        if self.distro is None:
+            raise UnexpectedCase(state="InstallOrchestrator",
+                                 message="unknown distro for {}".format(base_path))
+        self.targets = []
+        self.results = {}
+        self.server = None
+        self.server_ip = None
+        self.port = None
+        self.repo_url = None
+        self.lock = threading.Lock()
+
+    def add_target(self, target):
+        self.targets.append(target)
+        self.results[target.name] = {'state': "waiting", 'steps': [],
+                                     'seconds': None, 'error': None}
+
+    def prepare(self, server_ip):
+        """
+        Extract the install files and start the shared server
+
+        :returns: the server port
+        """
+        repo = self.repo
+        if self.cdrom and not self.repo:
+            repo = setup_repo(self.cdrom, base_path=self.base_path)
+        if not repo:
+            raise UnexpectedCase(state="InstallOrchestrator",
+                                 message="No valid repo to start installation")
+        start = time.time()
+        if not extract_install_files(repo, base_path=self.base_path, boot_path=self.boot_path,
+                                     vmlinux=self.vmlinux, initrd=self.initrd):
+            raise UnexpectedCase(state="InstallOrchestrator",
+                                 message="Unable to download install files from {}".format(repo))
+        self.timing.event('install', host="server", step="extract",
+                          seconds=time.time() - start)
+        hosts = {}
+        self.server = ThreadedHTTPServer(("0.0.0.0", 0), ThreadedHTTPHandler,
+                                         install=dict(base_path=self.base_path,
+                                                      vmlinux=self.vmlinux,
+                                                      initrd=self.initrd, ks=self.ks,
+                                                      default=None, hosts=hosts))
+        self.server_ip = server_ip
+        self.port = self.server.server_address[1]
+        self.repo_url = self.repo or "http://%s:%s/repo" % (server_ip, self.port)
+        for target in self.targets:
+            hosts[target.name] = dict(repo=self.repo_url, proxy=target.proxy,
+                                      username=target.username, password=target.password,
+                                      disk=target.disk)
+        server_thread = threading.Thread(target=self.server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+        log.info("InstallOrchestrator serving {} hosts on {}:{}"
+                 .format(len(self.targets), server_ip, self.port))
+        return self.port
+
+    def stop_server(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def url(self, path):
+        return "http://%s:%s/%s" % (self.server_ip, self.port, path)
+
+    def ks_url(self, target):
+        return self.url("ks/%s/%s" % (urllib.quote(target.name), self.ks))
+
+    def kernel_args(self, target):
+        return kernel_args(self.distro, self.ks_url(target), target.mac, target.ip,
+                           target.gateway, target.submask, target.dns, target.hostname,
+                           disk=target.disk, proxy=target.proxy)
+
+    def step(self, target, name, start):
+        """
+        Record that target finished step name, begun at start
+        """
+        now = time.time()
+        with self.lock:
+            result = self.results[target.name]
+            result['steps'].append((name, now - start))
+            result['state'] = name
+        self.timing.event('install', host=target.name, step=name, seconds=now - start)
+        log.info("InstallOrchestrator {}: {} done in {:.1f}s".format(target.name, name,
+                                                                      now - start))
+        return now
+
+    def install(self, target):
+        """
+        Drive one target through the install, see run()
+        """
+        system = target.system
+        begin = start = time.time()
+        with self.lock:
+            self.results[target.name]['state'] = "starting"
+        system.goto_state(OpSystemState.PETITBOOT_SHELL)
+        start = self.step(target, "petitboot", start)
+        c = system.console
+        c.run_command("[ -f %s ]&& rm -f %s;[ -f %s ] && rm -f %s;true" % (
+            self.vmlinux, self.vmlinux, self.initrd, self.initrd))
+        c.run_command("wget %s" % self.url(self.vmlinux), timeout=300)
+        c.run_command("wget %s" % self.url(self.initrd), timeout=300)
+        start = self.step(target, "download", start)
+        c.run_command("kexec -i %s -c \"%s\" %s -l" % (self.initrd,
+                                                         self.kernel_args(target),
+                                                         self.vmlinux), timeout=300)
+        raw_pty = c.get_console()
+        raw_pty.sendline("kexec -e")
+        kernel, progress, done = INSTALLERS[self.distro]
+        raw_pty.expect(kernel, timeout=60)
+        start = self.step(target, "kexec", start)
+        r = None
+        while r != 0:
+            r = raw_pty.expect([done] + progress, timeout=3000)
+            if r != 0:
+                with self.lock:
+                    self.results[target.name]['state'] = progress[r - 1]
+                log.info("InstallOrchestrator {}: {}".format(target.name, progress[r - 1]))
+        start = self.step(target, "installer", start)
+        if self.boot_os:
+            system.set_state(OpSystemState.IPLing)
+            system.goto_state(OpSystemState.PETITBOOT_SHELL)
+            set_bootable_disk(system, target.disk, settle=self.settle)
+            start = self.step(target, "bootable", start)
+            system.goto_state(OpSystemState.OFF)
+            system.goto_state(OpSystemState.OS)
+            system.console.run_command("uname -a", retry=5)
+            start = self.step(target, "os", start)
+        with self.lock:
+            self.results[target.name]['state'] = "installed"
+            self.results[target.name]['seconds'] = time.time() - begin
+        self.timing.event('install', host=target.name, step="total",
+                          seconds=time.time() - begin)
+
+    def run_target(self, target, slots):
+        with slots:
+            try:
+                self.install(target)
+            except Exception as e:
+                log.error("InstallOrchestrator {} failed in {}, Exception={}"
+                          .format(target.name, self.results[target.name]['state'], e))
+                with self.lock:
+                    self.results[target.name]['error'] = e
+
+    def run(self, server_ip, parallel=None):
+        """
+        Install all the targets, at most parallel at a time (all of them
+        by default)
+
+        :returns: the results, host name : dict of 'state' (the last step
+                  or installer milestone), 'steps' [(step, seconds)],
+                  'seconds' for the whole install and 'error' (None, or
+                  the exception a failed install raised)
+        """
+        self.prepare(server_ip)
+        slots = threading.Semaphore(parallel or len(self.targets))
+        threads = [threading.Thread(target=self.run_target, args=(target, slots),
+                                    name="install-{}".format(target.name))
+                   for target in self.targets]
+        try:
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            self.stop_server()
+        return self.results
+
+    def failed(self):
+        return [name for name, result in self.results.items()
+                if result['error'] is not None]
+
+    def report(self):
+        """
+        Per host state and step timings, then the step percentiles
+        """
+        lines = []
+        for target in self.targets:
+            result = self.results[target.name]
+            steps = " ".join("{}={:.1f}s".format(name, seconds)
+                             for name, seconds in result['steps'])
+            if result['error'] is not None:
+                state = "FAILED in {} ({})".format(result['state'], result['error'])
+            else:
+                state = result['state']
+            lines.append("{}: {} {}".format(target.name, state, steps))
+        lines.append(self.timing.summary())
+        return "\n".join(lines)
+
+
+def render_ks(base_path, ks, repo, proxy, username, password, disk):
+    """
+    The kickstart (or preseed) ks from base_path filled in for a host
+    """
+    f = open("%s/%s" % (base_path, ks), "r")
+    d = f.read()
+    f.close()
+    if "hostos" in base_path:
+        ps = d.format(repo, proxy, password, disk, disk, disk)
+    elif "rhel" in base_path:
+        ps = d.format(repo, proxy, password, disk, disk, disk)
+    elif "ubuntu" in base_path:
+        user = username
+        if user == 'root':
+            user = 'ubuntu'
+
+        packages = "openssh-server build-essential lvm2 ethtool "
+        packages+= "nfs-common ssh ksh lsvpd nfs-kernel-server iprutils procinfo "
+        packages+= "sg3-utils lsscsi libaio-dev libtime-hires-perl "
+        packages+= "acpid tgt openjdk-8* zip git automake python "
+        packages+= "expect gcc g++ gdb "
+        packages+= "python-dev p7zip python-stevedore python-setuptools "
+        packages+= "libvirt-dev numactl libosinfo-1.0-0 python-pip "
+        packages+= "linux-tools-common linux-tools-generic lm-sensors "
+        packages+= "ipmitool i2c-tools pciutils opal-prd opal-utils "
+        packages+= "device-tree-compiler fwts stress"
+
+        ps = d.format("openpower", "example.com",
+                      proxy, password, password, user, password, password, disk, packages)
+    else:
+        print("unknown distro")
+        ps = ""
+    return ps
+
+
+def parse_range(header, size):
+    """
+    (first, last) byte of a single "bytes=" Range header, None to send the
+    whole file (no header, several ranges or one we don't understand)
+
+    :throws: ValueError if the range can't be satisfied
+    """
+    m = re.match(r"^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$", header or "")
+    if not m or not (m.group(1) or m.group(2)):
+        return None
+    if not m.group(1):
+        # the last N bytes
+        suffix = int(m.group(2))
+        if suffix == 0 or size == 0:
+            raise ValueError("unsatisfiable range {}".format(header))
+        return max(0, size - suffix), size - 1
+    first = int(m.group(1))
+    last = int(m.group(2)) if m.group(2) else size - 1
+    if first >= size or last < first:
+        raise ValueError("unsatisfiable range {}".format(header))
+    return first, min(last, size - 1)
+
+
+def read_part(rfile, boundary, out, remaining):
+    """
+    Copy a multipart body part from rfile to out (a file, or None to drop
+    it) up to the next boundary, a line at a time like cgi.FieldStorage so
+    clients sending LF rather than CRLF line endings, or no usable
+    Content-Length, still work.
+
+    :returns: (done, remaining) done is True after the closing boundary
+              or the end of the body
+    """
+    separator = "--" + boundary
+    delim = ""
+    last_line_lfend = True
+    while True:
+        limit = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+        line = rfile.readline(limit) if limit > 0 else ""
+        if not line:
+            return True, remaining
+        if remaining is not None:
+            remaining -= len(line)
+        if delim == "\r":
+            line = delim + line
+            delim = ""
+        if line[:2] == "--" and last_line_lfend:
+            stripped = line.strip()
+            if stripped == separator:
+                return False, remaining
+            if stripped == separator + "--":
+                return True, remaining
+        odelim = delim
+        if line[-2:] == "\r\n":
+            delim = "\r\n"
+            line = line[:-2]
+            last_line_lfend = True
+        elif line[-1:] == "\n":
+            delim = "\n"
+            line = line[:-1]
+            last_line_lfend = True
+        elif line[-1:] == "\r":
+            delim = "\r"
+            line = line[:-1]
+            last_line_lfend = False
+        else:
+            delim = ""
+            last_line_lfend = False
+        if out is not None:
+            out.write(odelim + line)
+
+
 class ThreadedHTTPHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    def install(self):
+        """
+        What the server installs, see ThreadedHTTPServer
+        """
+        if self.server.install is not None:
+            return self.server.install
+        return dict(base_path=BASE_PATH, vmlinux=VMLINUX, initrd=INITRD, ks=KS,
+                    default=dict(repo=REPO, proxy=PROXY, username=USERNAME,
+                                 password=PASSWORD, disk=DISK),
+                    hosts={})
+
+    def send_file(self, path, content_type=None):
+        """
+        Send path for a GET or HEAD, honouring a single byte Range, with the
+        body streamed (by sendfile where the os module has it) rather than
+        read into memory
+        """
+        try:
+            f = open(path, 'rb')
+        except IOError:
+            self.send_error(404, "File not found")
+            return
+        try:
+            fs = os.fstat(f.fileno())
+            size = fs.st_size
+            try:
+                byte_range = parse_range(self.headers.get('Range'), size)
+            except ValueError:
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */{}".format(size))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if byte_range:
+                first, last = byte_range
+                self.send_response(206)
+                self.send_header("Content-Range", "bytes {}-{}/{}".format(first, last, size))
+            else:
+                first, last = 0, size - 1
+                self.send_response(200)
+            self.send_header("Content-type", content_type or self.guess_type(path))
+            self.send_header("Content-Length", str(last - first + 1))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Last-Modified", self.date_time_string(fs.st_mtime))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.stream(f, first, last - first + 1)
+        except socket.error as e:
+            log.debug("Webserver client went away during {}, Exception={}".format(path, e))
+        finally:
+            f.close()
+
+    def stream(self, f, offset, count):
+        self.wfile.flush()
+        if hasattr(os, 'sendfile'):
+            sock = self.connection.fileno()
+            while count > 0:
+                sent = os.sendfile(sock, f.fileno(), offset, min(count, 1 << 30))
+                if sent == 0:
+                    break
+                offset += sent
+                count -= sent
+            return
+        f.seek(offset)
+        while count > 0:
+            chunk = f.read(min(count, CHUNK_SIZE))
+            if not chunk:
+                break
+            self.wfile.write(chunk)
+            count -= len(chunk)
+
+    def install_file(self):
+        """
+        Path of the vmlinux, initrd or repo file asked for, None otherwise
+        """
+        install = self.install()
+        if "repo" in self.path:
+            # translate_path drops any query and .. but is relative to the cwd
+            path = os.path.relpath(self.translate_path(self.path), os.getcwd())
+            path = os.path.join(install['base_path'], path)
+            if os.path.isfile(path):
+                return path
+            return None
+        if self.path in ["/%s" % install['vmlinux'], "/%s" % install['initrd']]:
+            return os.path.join(install['base_path'], self.path[1:])
+        return None
+
     def do_HEAD(self):
         # FIXME: Local repo unable to handle http request while installation
         # Avoid using cdrom if your kickstart file needs repo, if installation
         # just needs vmlinx and initrd from cdrom, cdrom still can be used.
-        if "repo" in self.path:
-            self.path = BASE_PATH + self.path
+        path = self.install_file()
+        if path:
+            self.send_file(path, content_type=None if "repo" in self.path else "text/plain")
+        elif "repo" in self.path:
+            self.path = self.install()['base_path'] + self.path
             f = self.send_head()
             if f:
                 f.close()
@@ -476,8 +1062,13 @@ class ThreadedHTTPHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
             self.end_headers()
 
     def do_GET(self):
-        if "repo" in self.path:
-            self.path = BASE_PATH + self.path
+        path = self.install_file()
+        if path:
+            print("# Webserver was asked for: ", self.path)
+            self.send_file(path, content_type=None if "repo" in self.path else "text/plain")
+        elif "repo" in self.path:
+            # directory listings
+            self.path = self.install()['base_path'] + self.path
             f = self.send_head()
             if f:
                 try:
@@ -485,56 +1076,38 @@ class ThreadedHTTPHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
                 finally:
                     f.close()
         else:
-            self.send_response(200)
-            self.send_header("Content-type", "text/plain")
-            self.end_headers()
             print("# Webserver was asked for: ", self.path)
-            if self.path == "/%s" % VMLINUX:
-                f = open("%s/%s" % (BASE_PATH, VMLINUX), "r")
-                d = f.read()
-                self.wfile.write(d)
-                f.close()
-                return
-            elif self.path == "/%s" % INITRD:
-                f = open("%s/%s" % (BASE_PATH, INITRD), "r")
-                d = f.read()
-                self.wfile.write(d)
-                f.close()
-                return
-            elif self.path == "/%s" % KS:
-                f = open("%s/%s" % (BASE_PATH, KS), "r")
-                d = f.read()
-                if "hostos" in BASE_PATH:
-                    ps = d.format(REPO, PROXY, PASSWORD, DISK, DISK, DISK)
-                elif "rhel" in BASE_PATH:
-                    ps = d.format(REPO, PROXY, PASSWORD, DISK, DISK, DISK)
-                elif "ubuntu" in BASE_PATH:
-                    user = USERNAME
-                    if user == 'root':
-                        user = 'ubuntu'
-
-                    packages = "openssh-server build-essential lvm2 ethtool "
-                    packages+= "nfs-common ssh ksh lsvpd nfs-kernel-server iprutils procinfo "
-                    packages+= "sg3-utils lsscsi libaio-dev libtime-hires-perl "
-                    packages+= "acpid tgt openjdk-8* zip git automake python "
-                    packages+= "expect gcc g++ gdb "
-                    packages+= "python-dev p7zip python-stevedore python-setuptools "
-                    packages+= "libvirt-dev numactl libosinfo-1.0-0 python-pip "
-                    packages+= "linux-tools-common linux-tools-generic lm-sensors "
-                    packages+= "ipmitool i2c-tools pciutils opal-prd opal-utils "
-                    packages+= "device-tree-compiler fwts stress"
-
-                    ps = d.format("openpower", "example.com",
-                                  PROXY, PASSWORD, PASSWORD, user, PASSWORD, PASSWORD, DISK, packages)
-                else:
-                    print("unknown distro")
-                self.wfile.write(ps)
-                return
+            install = self.install()
+            host = self.host_ks()
+            if self.path == "/%s" % install['ks'] and install['default'] is not None:
+                ps = render_ks(install['base_path'], install['ks'], **install['default'])
+            elif host is not None:
+                ps = render_ks(install['base_path'], install['ks'], **host)
             else:
-                self.send_response(404)
+                self.send_error(404, "File not found")
                 return
+            self.send_response(200)
+            self.send_header("Content-type", "text/plain")
+            self.send_header("Content-Length", str(len(ps)))
+            self.end_headers()
+            self.wfile.write(ps)
+
+    def host_ks(self):
+        """
+        The render_ks() values of a /ks/<host>/<ks> request, None otherwise
+        """
+        install = self.install()
+        path_elements = self.path.split('/')
+        if len(path_elements) != 4 or path_elements[1] != "ks" or path_elements[3] != install['ks']:
+            return None
+        return install['hosts'].get(urllib.unquote(path_elements[2]))
 
     def do_POST(self):
+        """
+        Save the files of a multipart/form-data POST to /upload/... to disk
+        as they arrive, see InstallUtil.save_uploaded_file
+        """
+        global UPLOAD_PATH
         path = os.path.normpath(self.path)
         path = path[1:]
         path_elements = path.split('/')
@@ -546,16 +1119,59 @@ class ThreadedHTTPHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
         if path_elements[0] != "upload":
             return
 
-        form = cgi.FieldStorage(
-            fp = self.rfile,
-            headers = self.headers,
-            environ={ "REQUEST_METHOD": "POST",
-                      "CONTENT_TYPE": self.headers['Content-Type']})
+        m = re.search(r'boundary="?([^";]+)"?', self.headers.get('Content-Type', ""))
+        if not m:
+            self.send_error(400, "Expected multipart/form-data")
+            return
+        boundary = m.group(1)
+        try:
+            remaining = int(self.headers.get('Content-Length'))
+        except (TypeError, ValueError):
+            # gcov can't work out the length of what it sends
+            remaining = None
 
-        uploaded_files[form["file"].filename] = form["file"].value
+        if UPLOAD_PATH is None:
+            UPLOAD_PATH = tempfile.mkdtemp(prefix="op-test-upload-")
+        # skip the preamble, then a part (headers, blank line, body) per boundary
+        done, remaining = read_part(self.rfile, boundary, None, remaining)
+        while not done:
+            filename = None
+            while True:
+                line = self.rfile.readline(CHUNK_SIZE)
+                if remaining is not None:
+                    remaining -= len(line)
+                if not line.strip():
+                    break
+                fm = re.search(r'filename="([^"]*)"', line)
+                if fm and line.lower().startswith("content-disposition"):
+                    filename = os.path.basename(fm.group(1))
+            if not filename:
+                done, remaining = read_part(self.rfile, boundary, None, remaining)
+                continue
+            fd, upload = tempfile.mkstemp(prefix=filename + "-", dir=UPLOAD_PATH)
+            with os.fdopen(fd, 'wb') as out:
+                done, remaining = read_part(self.rfile, boundary, out, remaining)
+            log.debug("Webserver saved upload {} to {} ({} bytes)"
+                      .format(filename, upload, os.path.getsize(upload)))
+            uploaded_files[filename] = upload
 
+        self.send_response(200)
+        self.send_header("Content-type", "text/plain")
+        self.send_header("Content-Length", str(len("Success")))
+        self.end_headers()
         self.wfile.write("Success")
 
 
 class ThreadedHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
-    pass
+    """
+    The install web server.
+
+    :param install: what it serves, a dict of base_path, vmlinux, initrd,
+                    ks and the render_ks() values of the kickstart at /<ks>
+                    ('default', None for none) and of each host's at
+                    /ks/<host>/<ks> ('hosts'). None (InstallUtil) for the
+                    module globals
+    """
+    def __init__(self, server_address, handler, install=None):
+        BaseHTTPServer.HTTPServer.__init__(self, server_address, handler)
+        self.install = install
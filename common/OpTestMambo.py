@@ -55,7 +55,8 @@ class MamboConsole():
             block_setup_term=None,
             delaybeforesend=None,
             timeout_factor=1,
-            logfile=sys.stdout):
+            logfile=sys.stdout,
+            single_round_trip=False):
         self.mambo_binary = mambo_binary
         self.mambo_initial_run_script = mambo_initial_run_script
         self.mambo_autorun = mambo_autorun
@@ -74,6 +75,7 @@ class MamboConsole():
         self.block_setup_term = block_setup_term # allows caller specific control of when to block setup_term
         self.setup_term_quiet = 0 # tells setup_term to not throw exceptions, like when system off
         self.setup_term_disable = 0 # flags the object to abandon setup_term operations, like when system off
+        self.single_round_trip = single_round_trip # run_command gets output and exit code in one expect
         self.timeout_factor = timeout_factor # functional simulators are notoriously slow, so multiply all default timeouts by this factor
 
         # state tracking, reset on boot and state changes
@@ -97,6 +99,12 @@ class MamboConsole():
     def get_block_setup_term(self):
         return self.block_setup_term
 
+    def set_single_round_trip(self, flag):
+        self.single_round_trip = flag
+
+    def get_single_round_trip(self):
+        return self.single_round_trip
+
     def enable_setup_term_quiet(self):
         self.setup_term_quiet = 1
         self.setup_term_disable = 0
@@ -197,6 +205,23 @@ class MamboConsole():
     def mambo_run_command(self, command, timeout=60, retry=0):
         return self.util.mambo_run_command(self, command, timeout*self.timeout_factor, retry)
 
+    def mambo_run_commands(self, commands, timeout=60, script=None):
+        return self.util.mambo_run_commands(self, commands, timeout*self.timeout_factor, script)
+
+    def mambo_batch(self, commands, timeout=60, script=None):
+        '''
+        Switch from the target OS to the simulator, run the mysim/TCL
+        commands (see OpTestUtil.mambo_run_commands) and switch back, one
+        enter/exit for the lot
+
+        :returns: list of output lists, one per command
+        '''
+        self.mambo_enter()
+        try:
+            return self.mambo_run_commands(commands, timeout, script)
+        finally:
+            self.mambo_exit()
+
     def mambo_exit(self):
         return self.util.mambo_exit(self)
 
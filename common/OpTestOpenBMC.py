@@ -59,6 +59,36 @@ class HostManagement():
         r = self.conf.util_bmc_server.login()
         self.wait_for_bmc_runtime()
 
+    def rest_batch(self, calls, minutes=BMC_CONST.HTTP_RETRY):
+        '''
+        Concurrent REST calls, see Server.batch
+
+        calls without their own 'minutes' get the one passed here.
+        Every call runs to completion, then the first exception (in call
+        order) is raised, otherwise the list of responses is returned in
+        call order.
+        '''
+        calls = [dict({'minutes' : minutes}, **call) for call in calls]
+        results = self.conf.util_bmc_server.batch(calls)
+        errors = [e for r, e in results if e is not None]
+        if errors:
+            log.debug("rest_batch {} of {} calls failed, Exceptions={}"
+                .format(len(errors), len(calls), errors))
+            raise errors[0]
+        return [r for r, e in results]
+
+    def images_data(self, ids, minutes=BMC_CONST.HTTP_RETRY):
+        '''
+        Get Image Info for several IDs concurrently, same order as ids
+        GET
+        https://bmcip/xyz/openbmc_project/software/id
+        '''
+        calls = [{'cmd' : 'get', 'uri' : "/xyz/openbmc_project/software/{}".format(id)}
+                 for id in ids]
+        data = [r.json() for r in self.rest_batch(calls, minutes=minutes)]
+        log.debug("Image IDs={} Data={}".format(ids, data))
+        return data
+
     def get_inventory(self, minutes=BMC_CONST.HTTP_RETRY):
         '''
         Inventory Enumerate
@@ -266,10 +296,11 @@ class HostManagement():
         list, dict_list = self.get_sel_ids(minutes=minutes)
         log.debug("list={}".format(list))
         log.debug("dict_list={}".format(dict_list))
-        for id in list:
-            uri = "/xyz/openbmc_project/logging/entry/{}/action/Delete".format(id)
-            payload = {"data" : []}
-            r = self.conf.util_bmc_server.post(uri=uri, json=payload, minutes=minutes)
+        calls = [{'cmd' : 'post',
+                  'uri' : "/xyz/openbmc_project/logging/entry/{}/action/Delete".format(id),
+                  'json' : {"data" : []}}
+                 for id in list]
+        self.rest_batch(calls, minutes=minutes)
 
     def verify_clear_sel(self, minutes=BMC_CONST.HTTP_RETRY):
         '''
@@ -456,7 +487,7 @@ class HostManagement():
         uri = "/xyz/openbmc_project/software/"
         r = self.conf.util_bmc_server.get(uri=uri, minutes=minutes)
         log.debug("Image IDs={}".format(r.json()))
-        ids = []
+        candidates = []
         for k in r.json().get('data'):
             m = re.match(r'/xyz/openbmc_project/software/(.*)', k)
             # According to the OpenBMC docs, Image ID can be
@@ -474,9 +505,9 @@ class HostManagement():
             # like the 'active' or (new) 'functional'.
             # Adriana has promised me that this is safe into the future.
             if m:
-                i = self.image_data(m.group(1))
-                if i['data'].get('Purpose') is not None:
-                    ids.append(m.group(1))
+                candidates.append(m.group(1))
+        ids = [id for id, i in zip(candidates, self.images_data(candidates, minutes=minutes))
+               if i['data'].get('Purpose') is not None]
 
         log.debug("List of images id's: {}".format(ids))
         return ids
@@ -616,8 +647,7 @@ class HostManagement():
         Get List of Image IDs
         '''
         l = self.get_list_of_image_ids(minutes=minutes)
-        for id in l[:]:
-            i = self.image_data(id, minutes=minutes)
+        for id, i in zip(l[:], self.images_data(l, minutes=minutes)):
             # Here, we assume that if we don't have 'Purpose' it's something special
             # like the 'active' or (new) 'functional'.
             # Adriana has promised me that this is safe.
@@ -683,9 +713,12 @@ class HostManagement():
         Delete all Dumps
         '''
         ids = self.get_dump_ids()
-        for id in ids:
-            self.delete_dump(id, minutes=BMC_CONST.HTTP_RETRY)
-            log.debug("Deleting Dump ID={}".format(id))
+        log.debug("Deleting Dump IDs={}".format(ids))
+        calls = [{'cmd' : 'post',
+                  'uri' : "/xyz/openbmc_project/dump/entry/{}/action/Delete".format(id),
+                  'json' : {"data" : []}}
+                 for id in ids]
+        self.rest_batch(calls, minutes=BMC_CONST.HTTP_RETRY)
 
     def create_new_dump(self, minutes=None):
         '''
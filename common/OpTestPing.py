@@ -0,0 +1,221 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+'''
+In-process reachability prober
+------------------------------
+
+`Prober` checks whether addresses answer without forking ``ping``.
+It sends ICMP echo requests over a raw socket (or the unprivileged
+ICMP datagram socket Linux allows via ``net.ipv4.ping_group_range``) when
+permitted, otherwise it falls back to a TCP connect to port 22 or 443,
+where a refused connection still means the address is up.
+
+Several addresses can be watched at once with `Prober.wait_until_up` and
+`Prober.wait_until_down`, polling every ``interval`` seconds.
+'''
+
+import os
+import errno
+import select
+import socket
+import struct
+import threading
+import time
+
+import logging
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+
+
+def checksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack("!{}H".format(len(data) // 2), data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+class Prober(object):
+    '''
+    ICMP echo (raw or datagram socket) or TCP connect reachability checks.
+
+    :param timeout: seconds to wait for each probe
+    :param ports: TCP ports tried when ICMP is not permitted
+    :param icmp: set to False to only use TCP connects
+    :param refused_is_up: a refused TCP connect counts as reachable
+    '''
+    def __init__(self, timeout=1, ports=(22, 443), icmp=True, refused_is_up=True):
+        self.timeout = timeout
+        self.ports = ports
+        self.refused_is_up = refused_is_up
+        self.icmp_type = None
+        if icmp:
+            self.icmp_type = self.icmp_permitted()
+        self.lock = threading.Lock()
+        self.sequence = 0
+        log.debug("Prober using {}".format({socket.SOCK_RAW : "raw ICMP",
+                  socket.SOCK_DGRAM : "datagram ICMP"}.get(self.icmp_type,
+                  "TCP connect to ports {}".format(list(self.ports)))))
+
+    def icmp_permitted(self):
+        for sock_type in [socket.SOCK_RAW, socket.SOCK_DGRAM]:
+            try:
+                s = socket.socket(socket.AF_INET, sock_type,
+                                  socket.getprotobyname("icmp"))
+                s.close()
+                return sock_type
+            except socket.error as e:
+                log.debug("Prober ICMP socket type {} not permitted, Exception={}"
+                          .format(sock_type, e))
+        return None
+
+    def next_sequence(self):
+        with self.lock:
+            self.sequence = (self.sequence + 1) & 0xffff
+            return self.sequence
+
+    def probe(self, ip, timeout=None):
+        '''
+        True if ip answers within timeout seconds
+        '''
+        if timeout is None:
+            timeout = self.timeout
+        try:
+            addr = socket.gethostbyname(ip)
+        except socket.error as e:
+            log.debug("Prober unable to resolve {}, Exception={}".format(ip, e))
+            return False
+        if self.icmp_type is not None:
+            return self.probe_icmp(addr, timeout)
+        return self.probe_tcp(addr, timeout)
+
+    def probe_icmp(self, addr, timeout):
+        ident = (os.getpid() ^ id(threading.current_thread())) & 0xffff
+        sequence = self.next_sequence()
+        header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, ident, sequence)
+        payload = struct.pack("!d", time.time())
+        packet = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0,
+                             checksum(header + payload), ident, sequence) + payload
+        s = socket.socket(socket.AF_INET, self.icmp_type, socket.getprotobyname("icmp"))
+        try:
+            s.sendto(packet, (addr, 0))
+            deadline = time.time() + timeout
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                readable, _, _ = select.select([s], [], [], remaining)
+                if not readable:
+                    return False
+                data, source = s.recvfrom(1024)
+                if source[0] != addr:
+                    continue
+                if self.icmp_type == socket.SOCK_RAW:
+                    # raw sockets see the IP header, and every ICMP packet
+                    data = data[(ord(data[0:1]) & 0x0f) * 4:]
+                if len(data) < 8:
+                    continue
+                reply_type, code, _, reply_ident, reply_sequence = struct.unpack("!BBHHH", data[:8])
+                # the kernel owns the id of datagram ICMP sockets
+                if reply_type == ICMP_ECHO_REPLY and reply_sequence == sequence \
+                    and (self.icmp_type == socket.SOCK_DGRAM or reply_ident == ident):
+                    return True
+        except socket.error as e:
+            log.debug("Prober ICMP {} Exception={}".format(addr, e))
+            return False
+        finally:
+            s.close()
+
+    def probe_tcp(self, addr, timeout):
+        for port in self.ports:
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.settimeout(timeout)
+            try:
+                s.connect((addr, port))
+                return True
+            except socket.timeout:
+                continue
+            except socket.error as e:
+                if e.errno == errno.ECONNREFUSED and self.refused_is_up:
+                    # something answered, so the address is up
+                    return True
+                continue
+            finally:
+                s.close()
+        return False
+
+    def probe_all(self, ips, timeout=None):
+        '''
+        Probe several addresses concurrently, returns {ip : True/False}
+        '''
+        results = {}
+        def worker(ip):
+            results[ip] = self.probe(ip, timeout=timeout)
+        threads = [threading.Thread(target=worker, args=(ip,)) for ip in ips]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def wait_for(self, ips, up, timeout, interval=0.2, stable=1):
+        '''
+        Wait until each of ips has answered (up=True) or not answered
+        (up=False) stable probes in a row.
+
+        Returns {ip : seconds it took} for the addresses that got there,
+        addresses still missing at the timeout are left out.
+        '''
+        if isinstance(ips, basestring):
+            ips = [ips]
+        start = time.time()
+        deadline = start + timeout
+        streak = dict((ip, 0) for ip in ips)
+        reached = {}
+        while True:
+            pending = [ip for ip in ips if ip not in reached]
+            if not pending:
+                break
+            probe_start = time.time()
+            results = self.probe_all(pending,
+                timeout=min(self.timeout, max(deadline - probe_start, 0.01)))
+            for ip in pending:
+                if results[ip] == up:
+                    streak[ip] += 1
+                    if streak[ip] >= stable:
+                        reached[ip] = time.time() - start
+                else:
+                    streak[ip] = 0
+            if time.time() >= deadline:
+                break
+            time.sleep(max(0, min(interval - (time.time() - probe_start),
+                                  deadline - time.time())))
+        return reached
+
+    def wait_until_up(self, ips, timeout, interval=0.2, stable=1):
+        return self.wait_for(ips, True, timeout, interval=interval, stable=stable)
+
+    def wait_until_down(self, ips, timeout, interval=0.2, stable=1):
+        return self.wait_for(ips, False, timeout, interval=interval, stable=stable)
@@ -29,9 +29,13 @@ import pexpect
 import subprocess
 import tempfile
 import os
+import pipes
+import shutil
 
 from common.Exceptions import CommandFailed
 import OPexpect
+from OpTestQemuSnapshot import QMPMonitor, QemuSnapshotCache
+from OpTestQemuDisk import OverlayPool, create_overlay
 from OpTestUtil import OpTestUtil
 import OpTestConfiguration
 
@@ -47,17 +51,36 @@ class QemuConsole():
     """
     A 'connection' to the Qemu Console involves *launching* qemu.
     Closing a connection will *terminate* the qemu process.
+
+    Qemu is launched with a QMP monitor, through which the machine can
+    be reset, powered down, paused and have devices hot plugged without
+    relaunching it. With fast_power, power_off pauses qemu and power_on
+    resets it, which takes milliseconds rather than a qemu start.
+
+    A snapshot holds what the guest saw of hda at the petitboot shell, so
+    with an hda snapshots are only saved and restored while it is fresh:
+    the caller says it started blank or a new overlay of hda_base
+    (hda_fresh) and nothing has written to it since.
     """
     def __init__(self, qemu_binary=None, pnor=None, skiboot=None,
             prompt=None, kernel=None, initramfs=None,
             block_setup_term=None, delaybeforesend=None,
-            logfile=sys.stdout, hda=None, cdrom=None):
+            logfile=sys.stdout, hda=None, cdrom=None, single_round_trip=False,
+            snapshot_cache=None, hda_base=None, fast_power=False, hda_fresh=False):
         self.qemu_binary = qemu_binary
         self.pnor = pnor
         self.skiboot = skiboot
         self.kernel = kernel
         self.initramfs = initramfs
         self.hda = hda
+        self.hda_base = hda_base # hda is a qcow2 overlay of this image
+        self.hda_fresh = None # (size, mtime) of hda while it is fresh, see snapshot_usable
+        if hda is not None and hda_fresh:
+            try:
+                st = os.stat(hda)
+                self.hda_fresh = (st.st_size, st.st_mtime)
+            except OSError as e:
+                log.warning("Qemu can't use snapshots with hda={}: {}".format(hda, e))
         self.state = ConsoleState.DISCONNECTED
         self.logfile = logfile
         self.delaybeforesend = delaybeforesend
@@ -71,6 +94,16 @@ class QemuConsole():
         self.block_setup_term = block_setup_term # allows caller specific control of when to block setup_term
         self.setup_term_quiet = 0 # tells setup_term to not throw exceptions, like when system off
         self.setup_term_disable = 0 # flags the object to abandon setup_term operations, like when system off
+        self.single_round_trip = single_round_trip # run_command gets output and exit code in one expect
+        self.snapshot_cache = snapshot_cache # OpTestQemuSnapshot.QemuSnapshotCache or None
+        self.snapshot_restore = False # the system sets this when a restored petitboot shell will do
+        self.restored = False # this qemu started from a snapshot
+        self.saved = False # or this one has been saved
+        self.run_dir = None
+        self.qmp = None
+        self.fast_power = fast_power # power off pauses and power on resets, over QMP
+        self.paused = False
+        self.connect_time = None
 
         # state tracking, reset on boot and state changes
         # console tracking done on System object for the system console
@@ -93,6 +126,12 @@ class QemuConsole():
     def get_block_setup_term(self):
         return self.block_setup_term
 
+    def set_single_round_trip(self, flag):
+        self.single_round_trip = flag
+
+    def get_single_round_trip(self):
+        return self.single_round_trip
+
     def enable_setup_term_quiet(self):
         self.setup_term_quiet = 1
         self.setup_term_disable = 0
@@ -118,6 +157,12 @@ class QemuConsole():
         except Exception as e:
             self.state = ConsoleState.DISCONNECTED
             pass
+        if self.qmp:
+            self.qmp.close()
+            self.qmp = None
+        if self.run_dir:
+            shutil.rmtree(self.run_dir, ignore_errors=True)
+            self.run_dir = None
         log.debug("Qemu close -> TERMINATE")
 
     def connect(self):
@@ -128,12 +173,73 @@ class QemuConsole():
 
         log.debug("#Qemu Console CONNECT")
 
+        cmd = self.qemu_command(self.pnor)
+        self.restored = self.saved = self.paused = False
+        entry = None
+        if self.snapshot_cache:
+            self.run_dir = self.snapshot_cache.run_dir()
+            if self.snapshot_restore and self.snapshot_usable():
+                entry = self.snapshot_cache.lookup(self.snapshot_key(cmd))
+            if entry:
+                vmstate, pnor = self.snapshot_cache.checkout(entry, self.run_dir)
+                log.info("Qemu restoring the petitboot shell from {}".format(entry))
+                cmd = (self.qemu_command(pnor)
+                       + " -incoming " + pipes.quote("exec:cat " + pipes.quote(vmstate)))
+                self.restored = True
+        else:
+            self.run_dir = tempfile.mkdtemp(prefix="op-test-qemu-")
+        self.snapshot_restore = False # only for the power on that asked
+        cmd = cmd + " -qmp unix:{},server,nowait".format(os.path.join(self.run_dir, "qmp.sock"))
+        print(cmd)
+        try:
+          self.pty = OPexpect.spawn(cmd,logfile=self.logfile)
+        except Exception as e:
+          self.state = ConsoleState.DISCONNECTED
+          raise CommandFailed('OPexpect.spawn',
+                  'OPexpect.spawn encountered a problem: ' + str(e), -1)
+
+        self.state = ConsoleState.CONNECTED
+        self.pty.setwinsize(1000,1000)
+        if self.delaybeforesend:
+          self.pty.delaybeforesend = self.delaybeforesend
+        self.connect_time = time.time()
+
+        try:
+            self.qmp = QMPMonitor(os.path.join(self.run_dir, "qmp.sock"), alive=self.pty.isalive)
+            if self.restored:
+                self.qmp.wait_for_status(["running"])
+                log.info("Qemu restored in {:.1f}s".format(time.time() - self.connect_time))
+        except CommandFailed as e:
+            if self.restored:
+                # a snapshot this qemu can't load is no use to anyone
+                self.close()
+                log.warning("Qemu could not restore {}, booting instead: {}".format(entry, e))
+                self.snapshot_cache.remove(os.path.basename(entry))
+                return self.connect()
+            if self.snapshot_cache:
+                self.close()
+                raise CommandFailed(cmd, "Qemu QMP monitor: {}".format(e), -1)
+            log.warning("Qemu has no QMP monitor, powering off will stop qemu: {}".format(e))
+            self.qmp = None
+
+        if self.system.SUDO_set != 1 or self.system.LOGIN_set != 1 or self.system.PS1_set != 1:
+          self.util.setup_term(self.system, self.pty, None, self.system.block_setup_term)
+
+        # Wait a moment for isalive() to read a correct value and then check
+        # if the command has already exited. If it has then QEMU has most
+        # likely encountered an error and there's no point proceeding.
+        time.sleep(0.2)
+        if not self.pty.isalive():
+            raise CommandFailed(cmd, self.pty.read(), self.pty.status)
+        return self.pty
+
+    def qemu_command(self, pnor):
         cmd = ("%s" % (self.qemu_binary)
                + " -machine powernv -m 4G"
                + " -nographic -nodefaults"
            )
-        if self.pnor:
-            cmd = cmd + " -drive file={},format=raw,if=mtd".format(self.pnor)
+        if pnor:
+            cmd = cmd + " -drive file={},format=raw,if=mtd".format(pnor)
         if self.skiboot:
             cmd = cmd + " -bios %s" % (self.skiboot)
         if self.kernel:
@@ -143,8 +249,12 @@ class QemuConsole():
 
         if self.hda is not None:
             # Put the disk on the first PHB
+            drive = "file={},id=disk01,if=none".format(self.hda)
+            if self.hda_base:
+                # keep the overlay thin
+                drive = drive + ",format=qcow2,discard=unmap"
             cmd = (cmd
-                    + " -drive file={},id=disk01,if=none".format(self.hda)
+                    + " -drive " + drive
                     + " -device virtio-blk-pci,drive=disk01,id=virtio01,bus=pcie.0,addr=0"
                 )
         if self.cdrom is not None:
@@ -159,29 +269,175 @@ class QemuConsole():
         cmd = cmd + " -nic user,model=virtio-net-pci"
         cmd = cmd + " -device ipmi-bmc-sim,id=bmc0,frudatafile=" + fru_path + " -device isa-ipmi-bt,bmc=bmc0,irq=10"
         cmd = cmd + " -serial none -device isa-serial,chardev=s1 -chardev stdio,id=s1,signal=off"
-        print(cmd)
+        return cmd
+
+    def snapshot_usable(self):
+        '''
+        Whether hda (if any) is still as fresh as every run starts it, so
+        a snapshot's view of it is right
+        '''
+        if self.hda is None:
+            return True
+        if self.hda_fresh is None:
+            return False
         try:
-          self.pty = OPexpect.spawn(cmd,logfile=self.logfile)
-        except Exception as e:
-          self.state = ConsoleState.DISCONNECTED
-          raise CommandFailed('OPexpect.spawn',
-                  'OPexpect.spawn encountered a problem: ' + str(e), -1)
+            st = os.stat(self.hda)
+        except OSError:
+            return False
+        return (st.st_size, st.st_mtime) == self.hda_fresh
+
+    def snapshot_key(self, cmd):
+        return self.snapshot_cache.key(cmd, self.snapshot_inputs(), scratch=[self.hda])
+
+    def snapshot_inputs(self):
+        return {"qemu": self.qemu_binary, "skiboot": self.skiboot, "kernel": self.kernel,
+                "initramfs": self.initramfs, "pnor": self.pnor, "cdrom": self.cdrom,
+                "base": self.hda_base}
+
+    def save_snapshot(self):
+        '''
+        Save this qemu, which is at the petitboot shell, to the snapshot
+        cache unless it was restored from there (or already saved).
+
+        The prompt is put back to what petitboot's shell starts with, for
+        the system to find and set its own on the restored ones.
+
+        :returns: the entry saved, or None
+        '''
+        if not self.snapshot_cache or not self.qmp or self.restored or self.saved:
+            return None
+        if not self.snapshot_usable():
+            log.debug("Qemu not saving a snapshot, {} has been written to".format(self.hda))
+            return None
+        seconds = time.time() - self.connect_time
+        self.pty.sendline("PS1='/ ''# '")
+        self.pty.expect_exact("/ # ", timeout=10)
+        vmstate = os.path.join(self.run_dir, "vmstate")
+        start = time.time()
+        try:
+            self.qmp.execute("stop")
+            self.qmp.migrate("exec:cat > " + pipes.quote(vmstate))
+            key = self.snapshot_key(self.qemu_command(self.pnor))
+            entry = self.snapshot_cache.store(key, vmstate, self.pnor,
+                                              self.snapshot_inputs(), seconds=seconds)
+            log.info("Qemu saved the petitboot shell {:.1f}s into boot in {:.1f}s"
+                     .format(seconds, time.time() - start))
+        except (CommandFailed, IOError, OSError) as e:
+            log.warning("Qemu could not save a snapshot: {}".format(e))
+            entry = None
+        finally:
+            self.saved = True
+            try:
+                self.qmp.execute("cont")
+            except CommandFailed as e:
+                log.warning("Qemu would not continue after the snapshot: {}".format(e))
+        return entry
+
+    def qmp_execute(self, command, **arguments):
+        '''
+        Run a QMP command on this qemu, see `OpTestQemuSnapshot.QMPMonitor`
+        '''
+        if self.state != ConsoleState.CONNECTED or self.qmp is None:
+            raise CommandFailed(command, "Qemu isn't running with a QMP monitor", -1)
+        return self.qmp.execute(command, **arguments)
+
+    def query_status(self):
+        '''
+        "running", "paused" etc, or "off" when there's no qemu
+        '''
+        if self.state != ConsoleState.CONNECTED:
+            return "off"
+        return self.qmp_execute("query-status")["status"]
+
+    def pause(self):
+        self.qmp_execute("stop")
+
+    def resume(self):
+        self.qmp_execute("cont")
+
+    def system_reset(self):
+        '''
+        Reset the machine, as the reset button would, without restarting qemu
+        '''
+        self.drain()
+        self.qmp_execute("system_reset")
+        if self.query_status() != "running":
+            self.resume()
+        self.paused = False
+        self.util.clear_state(self)
 
-        self.state = ConsoleState.CONNECTED
-        self.pty.setwinsize(1000,1000)
-        if self.delaybeforesend:
-          self.pty.delaybeforesend = self.delaybeforesend
+    def system_powerdown(self):
+        '''
+        Ask the guest to power down, as the power button would
+        '''
+        self.qmp_execute("system_powerdown")
+
+    def device_add(self, driver, id, **properties):
+        '''
+        Hot plug a device, e.g. device_add("virtio-blk-pci", "hp0",
+        drive="disk02", bus="pcie.2")
+        '''
+        properties.update(driver=driver, id=id)
+        return self.qmp_execute("device_add", **properties)
+
+    def device_del(self, id, timeout=60):
+        '''
+        Hot unplug a device and wait for the guest to let it go
+        '''
+        self.qmp_execute("device_del", id=id)
+        self.qmp.wait_for_event("DEVICE_DELETED", timeout=timeout, device=id)
+
+    def drain(self):
+        '''
+        Throw away console output so far, so nothing from before a reset
+        is taken for what came after
+        '''
+        if self.state != ConsoleState.CONNECTED:
+            return
+        try:
+            while True:
+                self.pty.read_nonblocking(size=65536, timeout=0)
+        except (pexpect.TIMEOUT, pexpect.EOF):
+            pass
+        self.pty.buffer = self.pty.string_type()
 
-        if self.system.SUDO_set != 1 or self.system.LOGIN_set != 1 or self.system.PS1_set != 1:
-          self.util.setup_term(self.system, self.pty, None, self.system.block_setup_term)
+    def power_off(self):
+        '''
+        With fast_power, pause qemu (for power_on to reset), otherwise
+        terminate it
+        '''
+        if self.fast_power and self.state == ConsoleState.CONNECTED and self.qmp:
+            try:
+                self.pause()
+                self.paused = True
+                self.util.clear_state(self)
+                log.debug("Qemu power off -> PAUSED")
+                return
+            except CommandFailed as e:
+                log.warning("Qemu would not pause, stopping it: {}".format(e))
+        self.close()
 
-        # Wait a moment for isalive() to read a correct value and then check
-        # if the command has already exited. If it has then QEMU has most
-        # likely encountered an error and there's no point proceeding.
-        time.sleep(0.2)
-        if not self.pty.isalive():
-            raise CommandFailed(cmd, self.pty.read(), self.pty.status)
-        return self.pty
+    def power_on(self):
+        '''
+        Reset a paused (powered off) qemu or start one, a restored
+        snapshot being quicker than either
+        '''
+        if self.state == ConsoleState.CONNECTED and self.paused:
+            restore = (self.snapshot_restore and self.snapshot_cache and
+                       self.snapshot_usable() and
+                       self.snapshot_cache.lookup(self.snapshot_key(self.qemu_command(self.pnor))))
+            if not restore:
+                try:
+                    self.system_reset()
+                    self.saved = self.restored = False
+                    self.snapshot_restore = False
+                    self.connect_time = time.time()
+                    log.debug("Qemu power on -> RESET")
+                    return self.pty
+                except CommandFailed as e:
+                    log.warning("Qemu would not reset, restarting it: {}".format(e))
+            self.close()
+        return self.connect()
 
     def get_console(self):
         if self.state == ConsoleState.DISCONNECTED:
@@ -210,12 +466,27 @@ class QemuIPMI():
         self.console = console
 
     def ipmi_power_off(self):
-        """For Qemu, this just kills the simulator"""
-        self.console.close()
+        """For Qemu, this just kills (or with fast_power pauses) the simulator"""
+        self.console.power_off()
 
     def ipmi_wait_for_standby_state(self, i_timeout=10):
-        """For Qemu, we just kill the simulator"""
-        self.console.close()
+        """For Qemu, we just kill (or with fast_power pause) the simulator"""
+        self.console.power_off()
+
+    def ipmi_power_on(self):
+        self.console.power_on()
+
+    def ipmi_power_reset(self):
+        """Reset the machine in place, over QMP"""
+        self.console.system_reset()
+
+    def ipmi_power_soft(self):
+        """The power button, the guest shuts down"""
+        self.console.system_powerdown()
+
+    def ipmi_power_cycle(self):
+        self.console.power_off()
+        self.console.power_on()
 
     def ipmi_set_boot_to_petitboot(self):
         return 0
@@ -239,7 +510,14 @@ class OpTestQemu():
         # need the conf object to properly bind opened object
         # we need to be able to cleanup/close the temp file in signal handler
         self.conf = conf
+        base_image = getattr(self.conf.args, "qemu_base_image", None)
+        # blank or a new overlay, unless a kept overlay from the pool
+        hda_fresh = True
         if self.conf.args.qemu_scratch_disk and self.conf.args.qemu_scratch_disk.strip():
+            if base_image:
+                log.warning("OpTestQemu using qemu_scratch_disk={}, not an overlay"
+                            " of base_image={}".format(self.conf.args.qemu_scratch_disk, base_image))
+                base_image = None
             try:
                 # starts as name string
                 log.debug("OpTestQemu opening file={}"
@@ -251,6 +529,24 @@ class OpTestQemu():
                 log.error("OpTestQemu encountered a problem "
                           "opening file={} Exception={}"
                     .format(self.conf.args.qemu_scratch_disk, e))
+        elif base_image:
+            # a thin overlay of the base, see OpTestQemuDisk
+            try:
+                if self.conf.args.qemu_overlay_pool:
+                    self.conf.args.qemu_scratch_disk = OverlayPool(
+                        self.conf.args.qemu_overlay_pool, base_image,
+                        keep=self.conf.args.qemu_overlay_keep).acquire()
+                    hda_fresh = not self.conf.args.qemu_overlay_keep
+                else:
+                    self.conf.args.qemu_scratch_disk = \
+                        tempfile.NamedTemporaryFile(suffix=".qcow2", delete=True)
+                    create_overlay(base_image, self.conf.args.qemu_scratch_disk.name)
+            except Exception as e:
+                log.error("OpTestQemu encountered a problem making an overlay"
+                          " of base_image={} with qemu-img, check that you have"
+                          " qemu-utils installed first and then retry."
+                          .format(base_image))
+                raise e
         else:
             # update with new object to close in cleanup
             self.conf.args.qemu_scratch_disk = \
@@ -267,6 +563,11 @@ class OpTestQemu():
                           " and then retry.")
                 raise e
 
+        snapshot_cache = None
+        if getattr(self.conf.args, "qemu_snapshot_cache", None):
+            snapshot_cache = QemuSnapshotCache(self.conf.args.qemu_snapshot_cache,
+                max_bytes=int(self.conf.args.qemu_snapshot_cache_size * 1024 ** 3))
+
         atexit.register(self.__del__)
         self.console = QemuConsole(qemu_binary=qemu_binary,
                                    pnor=pnor,
@@ -275,7 +576,11 @@ class OpTestQemu():
                                    initramfs=initramfs,
                                    logfile=logfile,
                                    hda=self.conf.args.qemu_scratch_disk.name,
-                                   cdrom=cdrom)
+                                   hda_base=base_image,
+                                   cdrom=cdrom,
+                                   snapshot_cache=snapshot_cache,
+                                   hda_fresh=hda_fresh,
+                                   fast_power=getattr(self.conf.args, "qemu_fast_power", False))
         self.ipmi = QemuIPMI(self.console)
         self.system = None
 
@@ -307,10 +612,10 @@ class OpTestQemu():
         return self.ipmi
 
     def power_off(self):
-        self.console.close()
+        self.console.power_off()
 
     def power_on(self):
-        self.console.connect()
+        self.console.power_on()
 
     def get_rest_api(self):
         return None
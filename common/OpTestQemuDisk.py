@@ -0,0 +1,166 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+'''
+Qemu scratch disk overlays
+--------------------------
+
+With ``--qemu-base-image`` the qemu scratch disk is a thin qcow2 overlay
+(``qemu-img create -b``) on a read-only base image, e.g. a disk
+`testcases.InstallHostOS` installed once with ``--qemu-scratch-disk``,
+instead of an empty disk. Tests that need the host OS boot it from
+there rather than installing it again. Guest writes only go to the
+overlay, which qemu keeps thin with ``discard=unmap``.
+
+By default each run's overlay is a temporary file, thrown away at the
+end. With ``--qemu-overlay-pool DIR`` overlays are kept in DIR: a run
+takes one no other run holds (as `OpTestShard` shards run at once, say)
+and puts it back when done, where it's discarded, reset to the bare
+base, unless ``--qemu-overlay-keep`` carries the guest's writes over to
+the next run. An overlay of another base, or of one that was changed
+since, is always reset.
+'''
+
+import os
+import errno
+import fcntl
+import json
+import subprocess
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+
+def image_info(path):
+    return json.loads(subprocess.check_output(["qemu-img", "info", "--output=json", path]))
+
+
+def create_overlay(base, path, base_format=None):
+    '''
+    Make path a qcow2 overlay of base (as an absolute path, so the
+    overlay can be anywhere)
+    '''
+    base = os.path.abspath(base)
+    if base_format is None:
+        base_format = image_info(base)["format"]
+    subprocess.check_call(["qemu-img", "create", "-q", "-f", "qcow2",
+                           "-b", base, "-F", base_format, path])
+
+
+class Overlay(object):
+    '''
+    An overlay from a pool, as the scratch disk file OpTestQemu closes
+    when it's done: closing returns it to the pool
+    '''
+    def __init__(self, name, pool, lock):
+        self.name = name
+        self.pool = pool
+        self.lock = lock
+
+    def close(self):
+        if self.lock:
+            self.pool.release(self)
+
+
+class OverlayPool(object):
+    '''
+    Overlays of base in directory, see the module documentation.
+
+    :param keep: released overlays keep the guest's writes
+    '''
+    def __init__(self, directory, base, keep=False):
+        self.directory = os.path.expanduser(directory)
+        self.base = os.path.abspath(base)
+        self.keep = keep
+        self.base_format = None
+        try:
+            os.makedirs(self.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def path(self, i, suffix=".qcow2"):
+        return os.path.join(self.directory, "overlay-{}{}".format(i, suffix))
+
+    def info(self, path, info=None):
+        '''
+        Read (or write) what the overlay at path was made from
+        '''
+        name = path[:-len(".qcow2")] + ".json"
+        if info is not None:
+            with open(name, 'w') as f:
+                json.dump(info, f)
+            return info
+        try:
+            with open(name) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def fresh(self, path):
+        '''
+        Whether the overlay at path is of this pool's base, as it is now,
+        and (unless the pool keeps writes) unused since it was made
+        '''
+        info = self.info(path)
+        st = os.stat(self.base)
+        return (os.path.exists(path) and info.get('base') == self.base
+                and info.get('size') == st.st_size and info.get('mtime') == st.st_mtime
+                and (self.keep or not info.get('used')))
+
+    def reset(self, path):
+        if self.base_format is None:
+            self.base_format = image_info(self.base)["format"]
+        if os.path.exists(path):
+            os.remove(path)
+        create_overlay(self.base, path, self.base_format)
+        st = os.stat(self.base)
+        self.info(path, {'base': self.base, 'size': st.st_size, 'mtime': st.st_mtime})
+
+    def acquire(self):
+        '''
+        An Overlay nobody else holds, made or reset as needed
+        '''
+        i = 0
+        while True:
+            lock = open(self.path(i, ".lock"), 'a')
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                lock.close()
+                i += 1
+                continue
+            path = self.path(i)
+            if not self.fresh(path):
+                log.debug("OverlayPool resetting {} on {}".format(path, self.base))
+                self.reset(path)
+            # so a run that dies holding it doesn't pass its writes on
+            info = self.info(path)
+            info['used'] = True
+            self.info(path, info)
+            log.debug("OverlayPool using {}".format(path))
+            return Overlay(path, self, lock)
+
+    def release(self, overlay):
+        if not self.keep:
+            # discard what the guest wrote
+            self.reset(overlay.name)
+        overlay.lock.close()
+        overlay.lock = None
@@ -0,0 +1,380 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+'''
+Qemu snapshot cache
+-------------------
+
+Booting ``qemu -machine powernv`` from skiboot to the petitboot shell
+takes most of a qemu run. With ``--qemu-snapshot-cache`` the
+`OpTestQemu.QemuConsole` saves the machine once it first reaches the
+petitboot shell and later runs with the same qemu binary, skiboot,
+kernel, initramfs, PNOR (and qemu command line) start from there.
+The guest's view of the scratch disk is in the snapshot too, so one is
+only saved or restored while that disk is blank or a new overlay of the
+base, with nothing written to it yet.
+
+The snapshot is the migration stream qemu writes when asked over its
+`QMPMonitor` socket, plus a copy of the PNOR as it was at that moment.
+Internal snapshots (``savevm``/``-loadvm``) would need every drive to be
+qcow2, the PNOR is raw, so restoring is ``-incoming "exec:cat vmstate"``.
+
+Entries are keyed by the sha256 of the inputs and the shape of the
+command line. The hashes are kept in the cache's ``hashes.json`` by path,
+size and mtime, so a multi-GB ``--qemu-base-image`` is read once rather
+than on every run. An entry for the same input paths with any other key is
+stale (a new skiboot was built, say) and is dropped when a new one is
+saved, then the least recently used ones go until the cache fits in
+``max_bytes``. A run hard links the files it restores from into its
+own directory, so eviction never pulls them from under it.
+'''
+
+import os
+import errno
+import hashlib
+import json
+import shutil
+import socket
+import tempfile
+import time
+from distutils.spawn import find_executable
+
+from common.Exceptions import CommandFailed
+import OpTestFileIndex
+from OpTestFileIndex import JSONIndex, file_hash
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+# source id : sha256, so each input is looked up once per process
+hashes = {}
+
+
+class QMPMonitor(object):
+    '''
+    A client for qemu's QMP monitor on a unix socket (qemu started with
+    ``-qmp unix:path,server,nowait``)
+
+    :param timeout: how long to wait for qemu to create the socket
+    :param alive: callable, stop waiting when it says qemu is gone
+    '''
+    def __init__(self, path, timeout=30, alive=None):
+        self.path = path
+        self.events = []
+        deadline = time.time() + timeout
+        while True:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                self.sock.connect(path)
+                break
+            except socket.error as e:
+                self.sock.close()
+                if (e.errno not in [errno.ENOENT, errno.ECONNREFUSED] or time.time() > deadline
+                        or (alive and not alive())):
+                    raise CommandFailed("QMP connect", "{}: {}".format(path, e), -1)
+                time.sleep(0.1)
+        self.timeout = timeout
+        self.sock.settimeout(timeout)
+        self.f = self.sock.makefile('r')
+        greeting = self.read()
+        if "QMP" not in greeting:
+            raise CommandFailed("QMP connect", "Not a QMP greeting: {}".format(greeting), -1)
+        self.execute("qmp_capabilities")
+
+    def read(self):
+        try:
+            line = self.f.readline()
+        except socket.error as e:
+            raise CommandFailed("QMP", "QMP monitor read failed: {}".format(e), -1)
+        if not line:
+            raise CommandFailed("QMP", "QMP monitor closed", -1)
+        return json.loads(line)
+
+    def execute(self, command, **arguments):
+        '''
+        Run a QMP command, events that arrive meanwhile are kept in
+        self.events.
+
+        :returns: the "return" value
+        :raises: CommandFailed with the error description
+        '''
+        message = {"execute": command}
+        if arguments:
+            message["arguments"] = arguments
+        try:
+            self.sock.sendall(json.dumps(message) + "\n")
+        except socket.error as e:
+            raise CommandFailed(command, "QMP monitor write failed: {}".format(e), -1)
+        while True:
+            response = self.read()
+            if "event" in response:
+                self.events.append(response)
+                continue
+            if "error" in response:
+                raise CommandFailed(command, response["error"].get("desc", response["error"]), -1)
+            return response.get("return")
+
+    def wait_for_event(self, event, timeout=30, **data):
+        '''
+        The first event (already received or not) named event whose data
+        has the given values, removing it (and those before it) from
+        self.events
+        '''
+        deadline = time.time() + timeout
+        while True:
+            for i, e in enumerate(self.events):
+                if e.get("event") == event and all(e.get("data", {}).get(k) == v for k, v in data.items()):
+                    del self.events[:i + 1]
+                    return e
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise CommandFailed(event, "No {} event {} in {}s".format(event, data, timeout), -1)
+            self.sock.settimeout(remaining)
+            try:
+                self.events.append(self.read())
+            except CommandFailed:
+                if time.time() < deadline:
+                    raise
+            finally:
+                self.sock.settimeout(self.timeout)
+
+    def wait_for_status(self, statuses, timeout=300):
+        '''
+        Poll query-status until the VM is in one of statuses (e.g.
+        "running" once an incoming migration has been loaded)
+        '''
+        deadline = time.time() + timeout
+        while True:
+            status = self.execute("query-status")["status"]
+            if status in statuses:
+                return status
+            if status in ["internal-error", "shutdown", "guest-panicked"] or time.time() > deadline:
+                raise CommandFailed("query-status", "VM is {}, waited for {}".format(status, statuses), -1)
+            time.sleep(0.05)
+
+    def migrate(self, uri, timeout=600):
+        '''
+        Migrate (save) the VM to uri and wait for it to complete
+
+        :returns: query-migrate's final answer
+        '''
+        self.execute("migrate", uri=uri)
+        deadline = time.time() + timeout
+        while True:
+            info = self.execute("query-migrate")
+            if info.get("status") == "completed":
+                return info
+            if info.get("status") in ["failed", "cancelled"] or time.time() > deadline:
+                raise CommandFailed("migrate", "Migration to {} {}: {}"
+                                    .format(uri, info.get("status"), info.get("error-desc", "")), -1)
+            time.sleep(0.05)
+
+    def close(self):
+        try:
+            self.f.close()
+            self.sock.close()
+        except socket.error:
+            pass
+
+
+class QemuSnapshotCache(object):
+    '''
+    Saved qemu machines at the petitboot shell, see the module
+    documentation.
+
+    :param cache_dir: defaults to ~/.cache/op-test/qemu
+    :param max_bytes: size the entries are trimmed to
+    '''
+    def __init__(self, cache_dir=None, max_bytes=10 * 1024 ** 3):
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.expanduser("~"), ".cache",
+                                     "op-test", "qemu")
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_bytes = max_bytes
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        self.hashes = JSONIndex(os.path.join(self.cache_dir, "hashes.json"))
+
+    def entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def file_hash(self, path):
+        '''
+        sha256 of the file at path, only read when hashes.json has none
+        for it as it is now
+        '''
+        source_id = OpTestFileIndex.source_id(path)
+        if source_id not in hashes:
+            digest = self.hashes.load().get(source_id)
+            if digest is None:
+                start = time.time()
+                digest = file_hash(path)
+                log.debug("QemuSnapshotCache hashed {} in {:.1f}s"
+                          .format(path, time.time() - start))
+                name = source_id.rsplit(":", 2)[0]
+
+                def add(index):
+                    # earlier versions of the file are of no more use
+                    for old in [s for s in index if s.rsplit(":", 2)[0] == name]:
+                        del index[old]
+                    index[source_id] = digest
+                self.hashes.update(add)
+            hashes[source_id] = digest
+        return hashes[source_id]
+
+    def key(self, cmd, inputs, scratch=()):
+        '''
+        The key for a qemu command line
+
+        :param inputs: name : path of the files the machine is built from,
+                       hashed, None for those not given
+        :param scratch: paths (a fresh scratch disk) that only matter by
+                        their place on the command line
+        '''
+        digest = hashlib.sha256()
+        for name, path in sorted(inputs.items()):
+            if not path:
+                continue
+            if name == "qemu" and not os.path.isfile(path):
+                path = find_executable(path) or path
+            if os.path.isfile(path):
+                digest.update("{}={}\n".format(name, self.file_hash(path)))
+                cmd = cmd.replace(inputs[name], "{" + name + "}")
+            else:
+                digest.update("{}:{}\n".format(name, path))
+        for i, path in enumerate(scratch):
+            if path:
+                cmd = cmd.replace(path, "{scratch%d}" % i)
+        digest.update(cmd)
+        return digest.hexdigest()
+
+    def lookup(self, key):
+        '''
+        The entry directory for key, or None, marking it used
+        '''
+        info = os.path.join(self.entry(key), "info.json")
+        if not os.path.isfile(info):
+            return None
+        try:
+            os.utime(info, None)
+        except OSError:
+            return None
+        return self.entry(key)
+
+    def run_dir(self):
+        '''
+        A private directory in the cache for a run's QMP socket, migration
+        stream and restored files, removed by the caller
+        '''
+        return tempfile.mkdtemp(dir=self.cache_dir, prefix=".run-")
+
+    def checkout(self, entry, run_dir):
+        '''
+        Take the (vmstate, pnor) of an entry into run_dir: the vmstate is
+        linked (it is only read), the PNOR is a copy for the guest to write.
+        '''
+        vmstate = os.path.join(run_dir, "vmstate")
+        try:
+            os.link(os.path.join(entry, "vmstate"), vmstate)
+        except OSError:
+            shutil.copyfile(os.path.join(entry, "vmstate"), vmstate)
+        pnor = None
+        if os.path.isfile(os.path.join(entry, "pnor")):
+            pnor = os.path.join(run_dir, "pnor")
+            shutil.copyfile(os.path.join(entry, "pnor"), pnor)
+        return vmstate, pnor
+
+    def store(self, key, vmstate, pnor, inputs, seconds=None):
+        '''
+        Make an entry of a migration stream (moved in) and the PNOR as it
+        was when saved (copied), then evict what's stale or over size.
+
+        :param seconds: how long the cold boot took, for the record
+        '''
+        new = tempfile.mkdtemp(dir=self.cache_dir, prefix=".new-")
+        os.rename(vmstate, os.path.join(new, "vmstate"))
+        if pnor:
+            shutil.copyfile(pnor, os.path.join(new, "pnor"))
+        size = sum(os.path.getsize(os.path.join(new, name)) for name in os.listdir(new))
+        with open(os.path.join(new, "info.json"), 'w') as f:
+            json.dump({'size': size, 'inputs': inputs, 'cold_boot': seconds,
+                       'created': time.time()}, f, sort_keys=True, indent=1)
+        try:
+            os.rename(new, self.entry(key))
+        except OSError:
+            # another run saved this one first
+            shutil.rmtree(new, ignore_errors=True)
+        log.info("QemuSnapshotCache saved {} ({}MB)".format(key, size >> 20))
+        self.evict(keep=key, inputs=inputs)
+        return self.entry(key)
+
+    def entries(self):
+        '''
+        (last used, size, key, inputs) of the entries, least recent first
+        '''
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            info = os.path.join(self.entry(key), "info.json")
+            try:
+                with open(info, 'r') as f:
+                    data = json.load(f)
+                used = os.path.getmtime(info)
+            except (IOError, OSError, ValueError):
+                continue
+            entries.append((used, data.get('size', 0), key, data.get('inputs', {})))
+        return sorted(entries)
+
+    def remove(self, key):
+        # info.json first, a half removed entry is no longer found
+        try:
+            os.remove(os.path.join(self.entry(key), "info.json"))
+        except OSError:
+            pass
+        shutil.rmtree(self.entry(key), ignore_errors=True)
+
+    def evict(self, keep=None, inputs=None, max_age=24 * 3600):
+        '''
+        Remove the entries for inputs (the same paths) other than keep,
+        which are stale, then the least recently used until the cache
+        fits in max_bytes. Directories of runs that died more than
+        max_age ago go too.
+
+        :returns: the size of what's left
+        '''
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith((".run-", ".new-")) and time.time() - os.path.getmtime(path) > max_age:
+                shutil.rmtree(path, ignore_errors=True)
+        entries = self.entries()
+        total = sum(size for used, size, key, i in entries)
+        for used, size, key, i in entries:
+            if key == keep:
+                continue
+            if inputs is not None and i == inputs:
+                log.info("QemuSnapshotCache evicted stale {} ({}MB)".format(key, size >> 20))
+            elif total > self.max_bytes:
+                log.info("QemuSnapshotCache evicted {} ({}MB)".format(key, size >> 20))
+            else:
+                continue
+            self.remove(key)
+            total -= size
+        return total
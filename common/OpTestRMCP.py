@@ -0,0 +1,675 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+'''
+Native IPMI over LAN
+--------------------
+
+`Session` talks IPMI v2.0 (RMCP+) to a BMC over UDP port 623 without
+ipmitool: the RAKP handshake is done once and the session is reused for
+every request until it goes idle for ``idle_timeout`` seconds or stops
+answering, when it is opened again.
+
+Requests return the completion code and response data as bytes
+(`Session.raw`), or raise `CommandFailed` on a non zero completion code
+(`Session.command`). A few commands come parsed into dicts:
+`Session.device_id`, `Session.chassis_status`, `Session.sensor_reading`,
+`Session.sel_info` and `Session.sel_entries`, and a few have methods of
+their own: `Session.chassis_control`, `Session.mc_reset`,
+`Session.set_boot_device`, `Session.dcmi_power_limit` and
+`Session.sel_clear`. There is no SDR repository or sensor name lookup,
+`OpTestIPMI.IPMINative` leaves those to ipmitool.
+
+Cipher suites 1, 2, 15 and 16 only need the standard library, 3 and 17
+(AES-CBC-128 confidentiality, the default where available) need the
+``Crypto`` package from pycryptodome or pycrypto.
+
+`pack`, `unpack` and `SessionKeys` are shared with the BMC side of the
+handshake used by the tests, which also check the client against fixed
+datagrams worked out from the specification.
+'''
+
+import os
+import hmac
+import hashlib
+import select
+import socket
+import struct
+import threading
+import time
+
+try:
+    from Crypto.Cipher import AES
+except ImportError:
+    AES = None
+
+from Exceptions import CommandFailed, BMCDisconnected
+
+import logging
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+RMCP_HEADER = bytearray([0x06, 0x00, 0xff, 0x07])
+AUTHTYPE_RMCPPLUS = 0x06
+
+PAYLOAD_IPMI = 0x00
+PAYLOAD_OPEN_SESSION_REQUEST = 0x10
+PAYLOAD_OPEN_SESSION_RESPONSE = 0x11
+PAYLOAD_RAKP1 = 0x12
+PAYLOAD_RAKP2 = 0x13
+PAYLOAD_RAKP3 = 0x14
+PAYLOAD_RAKP4 = 0x15
+
+NETFN_CHASSIS = 0x00
+NETFN_SENSOR = 0x04
+NETFN_APP = 0x06
+NETFN_STORAGE = 0x0a
+NETFN_GROUP = 0x2c
+
+DCMI_GROUP = 0xdc
+
+BMC_ADDR = 0x20
+CONSOLE_ADDR = 0x81
+
+PRIVILEGE_ADMIN = 0x04
+# RAKP1 role flag, look the user up by name only
+NAME_ONLY_LOOKUP = 0x10
+
+# cipher suite : (authentication, integrity, confidentiality) algorithms
+CIPHER_SUITES = {
+    1 : (1, 0, 0),
+    2 : (1, 1, 0),
+    3 : (1, 1, 1),
+    15 : (3, 0, 0),
+    16 : (3, 4, 0),
+    17 : (3, 4, 1),
+}
+# authentication algorithm : hash
+AUTH_HASHES = {1 : hashlib.sha1, 3 : hashlib.sha256}
+# integrity algorithm : (hash, length of the authcode)
+INTEGRITY_HASHES = {1 : (hashlib.sha1, 12), 4 : (hashlib.sha256, 16)}
+
+CHASSIS_CONTROL = {'off' : 0x00, 'on' : 0x01, 'cycle' : 0x02,
+                   'reset' : 0x03, 'diag' : 0x04, 'soft' : 0x05}
+# boot flags (boot option parameter 5) device selector, as ipmitool's bootdev
+BOOT_DEVICES = {'none' : 0x00, 'pxe' : 0x04, 'disk' : 0x08, 'safe' : 0x0c,
+                'diag' : 0x10, 'cdrom' : 0x14, 'bios' : 0x18, 'floppy' : 0x3c}
+MC_RESET = {'cold' : 0x02, 'warm' : 0x03}
+
+COMPLETION_CODES = {
+    0xc0 : "Node busy",
+    0xc1 : "Invalid command",
+    0xc2 : "Invalid command on LUN",
+    0xc3 : "Timeout",
+    0xc4 : "Out of space",
+    0xc5 : "Reservation cancelled or invalid",
+    0xc6 : "Request data truncated",
+    0xc7 : "Request data length invalid",
+    0xc8 : "Request data field length limit exceeded",
+    0xc9 : "Parameter out of range",
+    0xca : "Cannot return number of requested data bytes",
+    0xcb : "Requested sensor, data, or record not found",
+    0xcc : "Invalid data field in request",
+    0xcd : "Command illegal for specified sensor or record type",
+    0xce : "Command response could not be provided",
+    0xcf : "Cannot execute duplicated request",
+    0xd0 : "SDR Repository in update mode",
+    0xd1 : "Device firmeware in update mode",
+    0xd2 : "BMC initialization in progress",
+    0xd3 : "Destination unavailable",
+    0xd4 : "Insufficient privilege level",
+    0xd5 : "Command not supported in present state",
+    0xd6 : "Cannot execute command, command disabled",
+    0xff : "Unspecified error",
+}
+
+RMCPPLUS_STATUS = {
+    0x01 : "Insufficient resources to create a session",
+    0x02 : "Invalid session ID",
+    0x04 : "Invalid authentication algorithm",
+    0x05 : "Invalid integrity algorithm",
+    0x06 : "No matching authentication payload",
+    0x07 : "No matching integrity payload",
+    0x09 : "Inactive session ID",
+    0x0a : "Invalid role",
+    0x0b : "Unauthorized role or privilege level requested",
+    0x0d : "Unauthorized name",
+    0x0f : "Invalid integrity check value",
+    0x10 : "Invalid confidentiality algorithm",
+    0x11 : "No cipher suite match with proposed security algorithms",
+    0x12 : "Illegal or unrecognized parameter",
+}
+
+
+def completion_string(code):
+    return COMPLETION_CODES.get(code, "Unknown (0x{:02x})".format(code))
+
+
+def checksum(data):
+    return -sum(data) & 0xff
+
+
+def ipmi_message(rs_addr, netfn, rq_addr, seq, cmd, data, lun=0):
+    '''
+    An IPMI message, requests and responses (netfn odd and completion code
+    as the first data byte) alike.
+    '''
+    header = bytearray([rs_addr, (netfn << 2) | lun])
+    body = bytearray([rq_addr, (seq << 2) | lun, cmd]) + bytearray(data)
+    return header + bytearray([checksum(header)]) + body + bytearray([checksum(body)])
+
+
+def parse_ipmi_message(msg):
+    '''
+    (netfn, seq, cmd, data) of an IPMI message
+    '''
+    msg = bytearray(msg)
+    if len(msg) < 7 or checksum(msg[:2]) != msg[2] or checksum(msg[3:-1]) != msg[-1]:
+        raise ValueError("bad IPMI message checksum")
+    return msg[1] >> 2, msg[4] >> 2, msg[5], msg[6:-1]
+
+
+def hmac_digest(key, data, digest):
+    return bytearray(hmac.new(bytes(key), bytes(data), digest).digest())
+
+
+def aes_cbc(key, iv, data, encrypt):
+    if AES is None:
+        raise BMCDisconnected("AES-CBC-128 needs the Crypto (pycryptodome) package")
+    cipher = AES.new(bytes(key), AES.MODE_CBC, bytes(iv))
+    if encrypt:
+        return bytearray(cipher.encrypt(bytes(data)))
+    return bytearray(cipher.decrypt(bytes(data)))
+
+
+def default_cipher_suite():
+    return 3 if AES is not None else 2
+
+
+class SessionKeys(object):
+    '''
+    The algorithms of a cipher suite and, once the RAKP exchange is done,
+    the keys derived from the session integrity key (SIK).
+    '''
+    def __init__(self, cipher_suite):
+        if cipher_suite not in CIPHER_SUITES:
+            raise ValueError("Unsupported cipher suite {}".format(cipher_suite))
+        self.cipher_suite = cipher_suite
+        self.auth, self.integrity, self.confidentiality = CIPHER_SUITES[cipher_suite]
+        self.hash = AUTH_HASHES[self.auth]
+        self.sik = None
+        self.k1 = None
+        self.k2 = None
+
+    def auth_code(self, key, data):
+        return hmac_digest(key, data, self.hash)
+
+    def set_sik(self, sik):
+        self.sik = sik
+        self.k1 = self.auth_code(sik, bytearray([1] * 20))
+        self.k2 = self.auth_code(sik, bytearray([2] * 20))
+
+    def rakp4_length(self):
+        return {hashlib.sha1 : 12, hashlib.sha256 : 16}[self.hash]
+
+    def integrity_code(self, data):
+        digest, length = INTEGRITY_HASHES[self.integrity]
+        return hmac_digest(self.k1, data, digest)[:length]
+
+    def encrypt(self, payload):
+        pad = (16 - (len(payload) + 1) % 16) % 16
+        data = bytearray(payload) + bytearray(range(1, pad + 1)) + bytearray([pad])
+        iv = bytearray(os.urandom(16))
+        return iv + aes_cbc(self.k2[:16], iv, data, True)
+
+    def decrypt(self, payload):
+        if len(payload) < 32 or len(payload) % 16:
+            raise ValueError("bad encrypted payload length {}".format(len(payload)))
+        data = aes_cbc(self.k2[:16], payload[:16], payload[16:], False)
+        return data[:-(data[-1] + 1)]
+
+
+def pack(payload_type, session_id, sequence, payload, keys=None):
+    '''
+    RMCP+ datagram, signed and encrypted as keys says once a session is
+    established (keys.sik set)
+    '''
+    payload = bytearray(payload)
+    secure = keys is not None and keys.sik is not None and session_id != 0
+    if secure and keys.confidentiality:
+        payload = keys.encrypt(payload)
+        payload_type |= 0x80
+    if secure and keys.integrity:
+        payload_type |= 0x40
+    session = bytearray([AUTHTYPE_RMCPPLUS, payload_type]) \
+        + bytearray(struct.pack("<IIH", session_id, sequence, len(payload))) + payload
+    if secure and keys.integrity:
+        pad = (4 - (len(session) + 2) % 4) % 4
+        session += bytearray([0xff] * pad) + bytearray([pad, 0x07])
+        session += keys.integrity_code(session)
+    return bytes(RMCP_HEADER + session)
+
+
+def pack_v15(payload):
+    '''
+    IPMI v1.5 framed datagram outside of a session
+    '''
+    return bytes(RMCP_HEADER + bytearray([0x00]) + bytearray(struct.pack("<II", 0, 0))
+                 + bytearray([len(payload)]) + bytearray(payload))
+
+
+def unpack(datagram, keys=None):
+    '''
+    (payload type, session id, sequence, payload) of a datagram, payload
+    type is None for IPMI v1.5 framing.
+
+    :throws: ValueError for anything malformed or failing the integrity check
+    '''
+    data = bytearray(datagram)
+    if len(data) < 14 or data[:4] != RMCP_HEADER:
+        raise ValueError("not an RMCP IPMI datagram")
+    if data[4] == 0x00:
+        session_id, sequence = struct.unpack("<II", bytes(data[5:13]))
+        length = data[13]
+        return None, session_id, sequence, data[14:14 + length]
+    if data[4] != AUTHTYPE_RMCPPLUS or len(data) < 16:
+        raise ValueError("unsupported authentication type 0x{:02x}".format(data[4]))
+    payload_type = data[5]
+    session_id, sequence, length = struct.unpack("<IIH", bytes(data[6:16]))
+    payload = data[16:16 + length]
+    if len(payload) != length:
+        raise ValueError("truncated payload")
+    if payload_type & 0x40:
+        if keys is None or keys.sik is None or not keys.integrity:
+            raise ValueError("unexpected authenticated payload")
+        end = 16 + length
+        pad = (4 - (end - 4 + 2) % 4) % 4
+        signed = data[4:end + pad + 2]
+        if keys.integrity_code(signed) != data[end + pad + 2:]:
+            raise ValueError("integrity check failed")
+    if payload_type & 0x80:
+        if keys is None or keys.sik is None or not keys.confidentiality:
+            raise ValueError("unexpected encrypted payload")
+        payload = keys.decrypt(payload)
+    return payload_type & 0x3f, session_id, sequence, payload
+
+
+class Session(object):
+    '''
+    An RMCP+ session with a BMC, thread safe and opened on first use.
+
+    :param cipher_suite: 1, 2, 3, 15, 16 or 17, 3 if AES is available,
+                         2 otherwise
+    :param timeout: seconds to wait for each response
+    :param retries: sends of each request before the session is reopened
+    :param idle_timeout: reopen sessions idle for longer (BMCs drop them
+                         after 60 seconds)
+    '''
+    def __init__(self, ip, username, password, port=623, cipher_suite=None,
+                 privilege=PRIVILEGE_ADMIN, timeout=1, retries=3, idle_timeout=50):
+        self.ip = ip
+        self.port = port or 623
+        self.username = bytearray((username or "").encode('ascii'))
+        self.password = bytearray((password or "").encode('ascii'))
+        if cipher_suite is None:
+            cipher_suite = default_cipher_suite()
+        self.cipher_suite = cipher_suite
+        self.privilege = privilege
+        self.timeout = timeout
+        self.retries = retries
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.sock = None
+        self.keys = None
+        self.session_id = 0
+        self.sequence = 0
+        self.rq_seq = 0
+        self.tag = 0
+        self.last_used = 0
+        self.opens = 0
+        self.requests = 0
+
+    def send(self, payload_type, payload):
+        if self.keys is not None and self.keys.sik is not None:
+            self.sequence = (self.sequence + 1) & 0xffffffff
+            datagram = pack(payload_type, self.session_id, self.sequence, payload, self.keys)
+        else:
+            datagram = pack(payload_type, 0, 0, payload)
+        self.sock.send(datagram)
+
+    def receive(self, match, deadline):
+        '''
+        The first payload for which match(payload type, payload) is true
+        before deadline, None if there was none
+        '''
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            readable, _, _ = select.select([self.sock], [], [], remaining)
+            if not readable:
+                return None
+            try:
+                payload_type, session_id, sequence, payload = unpack(self.sock.recv(1024), self.keys)
+            except (ValueError, socket.error) as e:
+                log.debug("RMCP+ {} dropping a datagram, Exception={}".format(self.ip, e))
+                continue
+            if match(payload_type, payload):
+                return payload
+
+    def exchange(self, payload_type, payload, match, v15=False):
+        for attempt in range(self.retries):
+            if v15:
+                self.sock.send(pack_v15(payload))
+            else:
+                self.send(payload_type, payload)
+            response = self.receive(match, time.time() + self.timeout)
+            if response is not None:
+                self.last_used = time.time()
+                return response
+            log.debug("RMCP+ {} no response to payload type 0x{:02x} (try {})"
+                      .format(self.ip, payload_type, attempt + 1))
+        raise BMCDisconnected("RMCP+ {} no response from the BMC".format(self.ip))
+
+    def next_tag(self):
+        self.tag = (self.tag + 1) & 0xff
+        return self.tag
+
+    def handshake(self, payload_type, payload, response_type):
+        tag = payload[0]
+        response = self.exchange(payload_type, payload,
+                                 lambda t, p: t == response_type and len(p) >= 8 and p[0] == tag)
+        if response[1] != 0:
+            raise BMCDisconnected("RMCP+ {} session refused: {}".format(
+                self.ip, RMCPPLUS_STATUS.get(response[1], "status 0x{:02x}".format(response[1]))))
+        return response
+
+    def open(self):
+        '''
+        Run the RMCP+ open session and RAKP exchange, then raise the
+        session to the requested privilege level
+        '''
+        self.close()
+        self.opens += 1
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.connect((socket.gethostbyname(self.ip), self.port))
+        self.keys = SessionKeys(self.cipher_suite)
+        self.session_id = 0
+        self.sequence = 0
+        start = time.time()
+
+        # Get Channel Authentication Capabilities, IPMI v2.0 extended data
+        seq = self.next_rq_seq()
+        self.exchange(PAYLOAD_IPMI, ipmi_message(BMC_ADDR, NETFN_APP, CONSOLE_ADDR, seq, 0x38,
+                                         [0x8e, self.privilege]),
+                      lambda t, p: self.is_response(p, NETFN_APP, seq, 0x38), v15=True)
+
+        console_id = struct.unpack("<I", os.urandom(4))[0] | 1
+        tag = self.next_tag()
+        algorithms = bytearray()
+        for kind, algorithm in enumerate(CIPHER_SUITES[self.cipher_suite]):
+            algorithms += bytearray([kind, 0, 0, 8, algorithm, 0, 0, 0])
+        response = self.handshake(PAYLOAD_OPEN_SESSION_REQUEST,
+            bytearray([tag, self.privilege, 0, 0]) + bytearray(struct.pack("<I", console_id))
+            + algorithms, PAYLOAD_OPEN_SESSION_RESPONSE)
+        bmc_id = struct.unpack("<I", bytes(response[8:12]))[0]
+
+        console_random = bytearray(os.urandom(16))
+        role = self.privilege | NAME_ONLY_LOOKUP
+        user = bytearray([role, len(self.username)]) + self.username
+        tag = self.next_tag()
+        response = self.handshake(PAYLOAD_RAKP1,
+            bytearray([tag, 0, 0, 0]) + bytearray(struct.pack("<I", bmc_id))
+            + console_random + bytearray([role, 0, 0, len(self.username)]) + self.username,
+            PAYLOAD_RAKP2)
+        bmc_random = response[8:24]
+        bmc_guid = response[24:40]
+        ids = bytearray(struct.pack("<II", console_id, bmc_id))
+        if response[40:] != self.keys.auth_code(self.password,
+                ids + console_random + bmc_random + bmc_guid + user):
+            raise BMCDisconnected("RMCP+ {} RAKP2 did not check out, wrong password?".format(self.ip))
+        sik = self.keys.auth_code(self.password, console_random + bmc_random + user)
+
+        tag = self.next_tag()
+        response = self.handshake(PAYLOAD_RAKP3,
+            bytearray([tag, 0, 0, 0]) + bytearray(struct.pack("<I", bmc_id))
+            + self.keys.auth_code(self.password, bmc_random
+                                  + bytearray(struct.pack("<I", console_id)) + user),
+            PAYLOAD_RAKP4)
+        expected = self.keys.auth_code(sik, console_random
+                                       + bytearray(struct.pack("<I", bmc_id)) + bmc_guid)
+        if response[8:] != expected[:self.keys.rakp4_length()]:
+            raise BMCDisconnected("RMCP+ {} RAKP4 did not check out".format(self.ip))
+
+        self.keys.set_sik(sik)
+        self.session_id = bmc_id
+        completion, data = self.transact(NETFN_APP, 0x3b, [self.privilege])
+        if completion != 0:
+            raise BMCDisconnected("RMCP+ {} unable to set the session privilege level: {}"
+                                  .format(self.ip, completion_string(completion)))
+        log.debug("RMCP+ {} session 0x{:08x} open, cipher suite {}, took {:.3f}s"
+                  .format(self.ip, bmc_id, self.cipher_suite, time.time() - start))
+
+    def close(self):
+        if self.sock is None:
+            return
+        if self.keys is not None and self.keys.sik is not None:
+            try:
+                self.send(PAYLOAD_IPMI, ipmi_message(BMC_ADDR, NETFN_APP, CONSOLE_ADDR,
+                    self.next_rq_seq(), 0x3c, struct.pack("<I", self.session_id)))
+            except socket.error as e:
+                log.debug("RMCP+ {} close session Exception={}".format(self.ip, e))
+        self.sock.close()
+        self.sock = None
+        self.keys = None
+
+    def next_rq_seq(self):
+        self.rq_seq = (self.rq_seq + 1) & 0x3f
+        return self.rq_seq
+
+    def is_response(self, payload, netfn, seq, cmd):
+        try:
+            r_netfn, r_seq, r_cmd, data = parse_ipmi_message(payload)
+        except ValueError:
+            return False
+        return r_netfn == netfn | 1 and r_seq == seq and r_cmd == cmd and len(data) >= 1
+
+    def transact(self, netfn, cmd, data):
+        seq = self.next_rq_seq()
+        response = self.exchange(PAYLOAD_IPMI,
+                                 ipmi_message(BMC_ADDR, netfn, CONSOLE_ADDR, seq, cmd, data),
+                                 lambda t, p: t == PAYLOAD_IPMI and self.is_response(p, netfn, seq, cmd))
+        data = parse_ipmi_message(response)[3]
+        return data[0], bytes(data[1:])
+
+    def raw(self, netfn, cmd, data=b'', reopen=True):
+        '''
+        Send a request, returns (completion code, response data). If there
+        is no answer the request is sent again on a new session, unless
+        reopen is False.
+
+        :throws: :class:`common.Exceptions.BMCDisconnected` when the BMC
+                 can't be reached even with a new session
+        '''
+        with self.lock:
+            self.requests += 1
+            if self.sock is not None and time.time() - self.last_used > self.idle_timeout:
+                log.debug("RMCP+ {} session idle, reopening".format(self.ip))
+                self.close()
+            for attempt in range(2):
+                try:
+                    if self.sock is None:
+                        self.open()
+                    return self.transact(netfn, cmd, data)
+                except (BMCDisconnected, socket.error) as e:
+                    log.debug("RMCP+ {} request failed, Exception={}".format(self.ip, e))
+                    self.close()
+                    if attempt or not reopen:
+                        raise BMCDisconnected(str(e))
+
+    def command(self, netfn, cmd, data=b'', reopen=True):
+        '''
+        Response data of a request.
+
+        :throws: :class:`common.Exceptions.CommandFailed` with the completion
+                 code as the exitcode if it is not 0
+        '''
+        completion, response = self.raw(netfn, cmd, data, reopen)
+        if completion != 0:
+            raise CommandFailed("netfn=0x{:x} cmd=0x{:x}".format(netfn, cmd),
+                                completion_string(completion), completion)
+        return response
+
+    def device_id(self):
+        data = bytearray(self.command(NETFN_APP, 0x01))
+        return {
+            'device_id' : data[0],
+            'device_revision' : data[1] & 0x0f,
+            'provides_sdrs' : bool(data[1] & 0x80),
+            'device_available' : not data[2] & 0x80,
+            'firmware_revision' : "{}.{:02x}".format(data[2] & 0x7f, data[3]),
+            'ipmi_version' : "{}.{}".format(data[4] & 0x0f, data[4] >> 4),
+            'additional_support' : data[5],
+            'manufacturer_id' : data[6] | data[7] << 8 | (data[8] & 0x0f) << 16,
+            'product_id' : data[9] | data[10] << 8,
+            'aux_firmware_revision' : list(data[11:15]),
+        }
+
+    def chassis_status(self):
+        data = bytearray(self.command(NETFN_CHASSIS, 0x01))
+        return {
+            'power_on' : bool(data[0] & 0x01),
+            'power_overload' : bool(data[0] & 0x02),
+            'interlock' : bool(data[0] & 0x04),
+            'power_fault' : bool(data[0] & 0x08),
+            'power_control_fault' : bool(data[0] & 0x10),
+            'power_restore_policy' : ["always-off", "previous", "always-on",
+                                      "unknown"][(data[0] >> 5) & 0x03],
+            'last_event' : data[1],
+            'misc' : data[2],
+        }
+
+    def chassis_control(self, action):
+        '''
+        Chassis power control, action is one of off, on, cycle, reset,
+        diag or soft
+        '''
+        self.command(NETFN_CHASSIS, 0x02, [CHASSIS_CONTROL[action]])
+
+    def mc_reset(self, kind):
+        '''
+        Cold or warm reset of the BMC, which drops the session. A cold
+        reset often goes unanswered, that is not an error, and is not
+        sent again.
+        '''
+        try:
+            self.command(NETFN_APP, MC_RESET[kind], reopen=False)
+        except BMCDisconnected:
+            if kind != 'cold':
+                raise
+        with self.lock:
+            self.close()
+
+    def set_boot_device(self, device):
+        '''
+        Boot device override for the next boot, device is one of
+        BOOT_DEVICES. Parameter 5 is written between set in progress and
+        commit write, as ipmitool does, where the BMC supports that.
+        '''
+        try:
+            self.command(NETFN_CHASSIS, 0x08, [0x00, 0x01])
+            in_progress = True
+        except CommandFailed:
+            in_progress = False
+        try:
+            self.command(NETFN_CHASSIS, 0x08, [0x05, 0x80, BOOT_DEVICES[device], 0, 0, 0])
+            if in_progress:
+                self.command(NETFN_CHASSIS, 0x08, [0x00, 0x02])
+        finally:
+            if in_progress:
+                self.raw(NETFN_CHASSIS, 0x08, [0x00, 0x00])
+
+    def dcmi_power_limit(self, activate):
+        '''
+        Activate (True) or deactivate (False) the DCMI power limit
+        '''
+        self.command(NETFN_GROUP, 0x05, [DCMI_GROUP, int(bool(activate)), 0, 0])
+
+    def sensor_reading(self, number):
+        data = bytearray(self.command(NETFN_SENSOR, 0x2d, [number]))
+        states = 0
+        if len(data) > 2:
+            states = data[2] | (data[3] << 8 if len(data) > 3 else 0)
+        return {
+            'reading' : data[0],
+            'scanning' : bool(data[1] & 0x40),
+            'available' : not data[1] & 0x20,
+            'states' : [bit for bit in range(15) if states & (1 << bit)],
+        }
+
+    def sel_info(self):
+        data = bytearray(self.command(NETFN_STORAGE, 0x40))
+        return {
+            'version' : "{}.{}".format(data[0] & 0x0f, data[0] >> 4),
+            'entries' : data[1] | data[2] << 8,
+            'free_space' : data[3] | data[4] << 8,
+            'last_add' : struct.unpack("<I", bytes(data[5:9]))[0],
+            'last_erase' : struct.unpack("<I", bytes(data[9:13]))[0],
+            'overflow' : bool(data[13] & 0x80),
+        }
+
+    def sel_entries(self):
+        '''
+        Every SEL record, system event records are decoded the others
+        are left as bytes under data
+        '''
+        entries = []
+        record_id = 0
+        while record_id != 0xffff:
+            data = bytearray(self.command(NETFN_STORAGE, 0x43,
+                struct.pack("<HHBB", 0, record_id, 0, 0xff)))
+            next_id = data[0] | data[1] << 8
+            record = data[2:]
+            entry = {'record_id' : record[0] | record[1] << 8,
+                     'record_type' : record[2], 'data' : bytes(record[3:])}
+            if record[2] == 0x02:
+                entry.update({
+                    'timestamp' : struct.unpack("<I", bytes(record[3:7]))[0],
+                    'generator_id' : record[7] | record[8] << 8,
+                    'sensor_type' : record[10],
+                    'sensor_number' : record[11],
+                    'event_type' : record[12] & 0x7f,
+                    'asserted' : not record[12] & 0x80,
+                    'event_data' : list(record[13:16]),
+                })
+            entries.append(entry)
+            if next_id == record_id:
+                break
+            record_id = next_id
+        return entries
+
+    def sel_clear(self):
+        '''
+        Reserve the SEL and start erasing it, returns True if the erasure
+        has already completed
+        '''
+        reservation = bytearray(self.command(NETFN_STORAGE, 0x42))
+        data = bytearray(self.command(NETFN_STORAGE, 0x47,
+                                      reservation[:2] + bytearray(b"CLR\xaa")))
+        return data[0] & 0x0f == 0x01
@@ -22,13 +22,19 @@ import sys
 import os
 import time
 import pexpect
+import atexit
+import hashlib
+import shutil
+import subprocess
+import tempfile
+import threading
 
 import logging
 import OpTestLogger
 log = OpTestLogger.optest_logger_glob.get_logger(__name__)
 
 from Exceptions import CommandFailed, SSHSessionDisconnected
-from OpTestUtil import OpTestUtil
+from OpTestUtil import OpTestUtil, setup_term_prompts
 import OpTestSystem
 try:
     from common import OPexpect
@@ -47,10 +53,106 @@ def set_system_to_UNKNOWN_BAD(system):
     system.set_state(OpTestSystem.OpSystemState.UNKNOWN_BAD)
     return s
 
+class SSHControlMasterPool():
+    '''
+    Keeps one OpenSSH ControlMaster connection per (host, username, port)
+    so new OpTestSSH sessions are opened as cheap multiplexed channels on it
+    instead of paying the TCP connect and authentication each time.
+
+    Masters are started on demand and torn down at exit.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.masters = {}
+        self.control_dir = None
+        atexit.register(self.close_all)
+
+    def control_path(self, key):
+        if self.control_dir is None:
+            # unix socket paths are limited to ~108 chars, keep it short
+            self.control_dir = tempfile.mkdtemp(prefix="op-test-ssh-")
+        name = hashlib.md5("{}@{}:{}".format(key[1], key[0], key[2])).hexdigest()[:16]
+        return os.path.join(self.control_dir, name)
+
+    def check_master(self, key, control_path):
+        cmd = ["ssh", "-p", str(key[2]), "-l", key[1],
+               "-o", "ControlPath={}".format(control_path),
+               "-O", "check", key[0]]
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.call(cmd, stdout=devnull, stderr=devnull) == 0
+
+    def get_master(self, ssh_obj, timeout=30):
+        '''
+        Returns the ControlPath of a running master for ssh_obj's
+        (host, username, port), starting one if needed, or None if a master
+        could not be started (callers fall back to a plain connection).
+        '''
+        key = (ssh_obj.host, ssh_obj.username, ssh_obj.port)
+        with self.lock:
+            control_path = self.masters.get(key)
+            if control_path and self.check_master(key, control_path):
+                return control_path
+            control_path = self.control_path(key)
+            if os.path.exists(control_path):
+                # a dead master's socket, ssh won't start a master over it
+                os.remove(control_path)
+            cmd = (["sshpass", "-p", ssh_obj.password,
+                    "ssh", "-p", str(key[2]), "-l", key[1], key[0],
+                    "-o", "PubkeyAuthentication=no",
+                    "-o", "ControlMaster=yes",
+                    "-o", "ControlPath={}".format(control_path),
+                    "-o", "ControlPersist=yes",
+                    "-N", "-f"]
+                   + ssh_obj.host_key_options())
+            log.debug("SSH ControlMaster start for {}@{}:{}".format(key[1], key[0], key[2]))
+            try:
+                with open(os.devnull, 'w') as devnull:
+                    proc = subprocess.Popen(cmd, stdin=devnull, stdout=devnull, stderr=devnull)
+                end_time = time.time() + timeout
+                # -f backgrounds ssh once authenticated, so sshpass exits
+                while proc.poll() is None and time.time() < end_time:
+                    time.sleep(0.1)
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+            except Exception as e:
+                log.debug("SSH ControlMaster failed to start, Exception={}".format(e))
+                return None
+            if not self.check_master(key, control_path):
+                log.warning("SSH ControlMaster unavailable for {}@{}:{}, using"
+                            " a dedicated connection".format(key[1], key[0], key[2]))
+                return None
+            self.masters[key] = control_path
+            return control_path
+
+    def close_master(self, key):
+        control_path = self.masters.pop(key, None)
+        if control_path is None:
+            return
+        cmd = ["ssh", "-p", str(key[2]), "-l", key[1],
+               "-o", "ControlPath={}".format(control_path),
+               "-O", "exit", key[0]]
+        try:
+            with open(os.devnull, 'w') as devnull:
+                subprocess.call(cmd, stdout=devnull, stderr=devnull)
+        except Exception as e:
+            log.debug("SSH ControlMaster exit ignoring Exception={}".format(e))
+
+    def close_all(self):
+        with self.lock:
+            for key in self.masters.keys():
+                self.close_master(key)
+            if self.control_dir:
+                shutil.rmtree(self.control_dir, ignore_errors=True)
+                self.control_dir = None
+
+ssh_pool = SSHControlMasterPool()
+
 class OpTestSSH():
     def __init__(self, host, username, password, logfile=sys.stdout, port=22,
             prompt=None, check_ssh_keys=False, known_hosts_file=None,
-            block_setup_term=None, delaybeforesend=None, use_parent_logger=True):
+            block_setup_term=None, delaybeforesend=None, use_parent_logger=True,
+            single_round_trip=False, use_control_master=False):
         self.state = ConsoleState.DISCONNECTED
         self.host = host
         self.username = username
@@ -76,6 +178,8 @@ class OpTestSSH():
         self.LOGIN_set = -1
         self.SUDO_set = -1
         self.use_parent_logger = use_parent_logger
+        self.single_round_trip = single_round_trip # run_command gets output and exit code in one expect
+        self.use_control_master = use_control_master # multiplex sessions over ssh_pool masters
 
     def set_system(self, system):
         self.system = system
@@ -92,6 +196,12 @@ class OpTestSSH():
     def get_block_setup_term(self):
         return self.block_setup_term
 
+    def set_single_round_trip(self, flag):
+        self.single_round_trip = flag
+
+    def get_single_round_trip(self):
+        return self.single_round_trip
+
     def enable_setup_term_quiet(self):
         self.setup_term_quiet = 1
         self.setup_term_disable = 0
@@ -131,21 +241,26 @@ class OpTestSSH():
         else:
             self.util.clear_state(self) # clear when coming in DISCONNECTED
 
-        cmd = ("sshpass -p %s " % (self.password)
-               + " ssh"
-               + " -p %s" % str(self.port)
-               + " -l %s %s" % (self.username, self.host)
-               + " -o PubkeyAuthentication=no -o afstokenpassing=no"
-               )
+        control_path = None
+        if self.use_control_master:
+            control_path = ssh_pool.get_master(self)
 
-        if not self.check_ssh_keys:
-            cmd = (cmd
-                    + " -q"
-                    + " -o 'UserKnownHostsFile=/dev/null' "
-                    + " -o 'StrictHostKeyChecking=no'"
-                    )
-        elif self.known_hosts_file:
-            cmd = (cmd + " -o UserKnownHostsFile=" + self.known_hosts_file)
+        if control_path:
+            # multiplexed session on the master, already authenticated
+            cmd = ("ssh"
+                   + " -p %s" % str(self.port)
+                   + " -l %s %s" % (self.username, self.host)
+                   + " -o ControlMaster=no -o ControlPath=%s" % control_path
+                   )
+        else:
+            cmd = ("sshpass -p %s " % (self.password)
+                   + " ssh"
+                   + " -p %s" % str(self.port)
+                   + " -l %s %s" % (self.username, self.host)
+                   + " -o PubkeyAuthentication=no -o afstokenpassing=no"
+                   )
+
+        cmd = cmd + " " + " ".join(self.host_key_options())
 
         # For multi threades SSH sessions use individual logger and file handlers per session.
         if logger:
@@ -172,11 +287,52 @@ class OpTestSSH():
         if self.delaybeforesend:
           self.pty.delaybeforesend = self.delaybeforesend
         self.pty.logfile_read = OpTestLogger.FileLikeLogger(self.log)
-        time.sleep(2) # delay here in case messages like afstokenpassing unsupported show up which mess up setup_term
+        self.wait_for_ready() # in case messages like afstokenpassing unsupported show up which mess up setup_term
         self.check_set_term()
         log.debug("CONNECT starts Expect Buffer ID={}".format(hex(id(self.pty))))
         return self.pty
 
+    def host_key_options(self):
+        if not self.check_ssh_keys:
+            return ["-q",
+                    "-o", "UserKnownHostsFile=/dev/null",
+                    "-o", "StrictHostKeyChecking=no"]
+        elif self.known_hosts_file:
+            return ["-o", "UserKnownHostsFile=" + self.known_hosts_file]
+        return []
+
+    def wait_for_ready(self, timeout=None):
+        '''
+        Wait for the remote side's prompt (one setup_term knows), past any
+        motd or afstokenpassing warnings, rather than sleeping, and leave
+        what was read for setup_term to match (and find in before).
+
+        Consoles like port 2200 may print nothing until setup_term pokes
+        them, so they're only waited on for a couple of seconds.
+
+        :returns: the index into setup_term_prompts, or None
+        '''
+        if timeout is None:
+            timeout = 2 if self.port == 2200 else 10
+        rc = self.pty.expect(setup_term_prompts + [pexpect.TIMEOUT, pexpect.EOF], timeout=timeout)
+        if rc == len(setup_term_prompts):
+            # a timeout keeps what was read
+            return None
+        after = self.pty.after if isinstance(self.pty.after, basestring) else ""
+        self.unread(self.pty.before + after)
+        return rc if rc < len(setup_term_prompts) else None
+
+    def unread(self, data):
+        '''
+        Put data back in front of what pty has yet to match
+        '''
+        rest = self.pty.buffer
+        self.pty.buffer = data + rest
+        if hasattr(self.pty, "_before"):
+            # pexpect 4 makes before from this, not the buffer
+            self.pty._before = self.pty.buffer_type()
+            self.pty._before.write(data + rest)
+
     def check_set_term(self):
         if self.block_setup_term is not None:
           setup_term_flag = self.block_setup_term # caller control
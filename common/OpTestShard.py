@@ -0,0 +1,278 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+'''
+Sharded test runs
+-----------------
+
+A qemu (or mambo) system is just a process op-test launches, with its
+own scratch disk, so ``--shards N`` splits the tests to run between N
+op-test processes, each with its own configuration, system and console,
+running side by side.
+
+The tests are split by `TestCase` class, a class's tests staying
+together and in order, round robin over the shards. Each shard is
+``op-test`` again with the same arguments, but its own ``--run`` list,
+``--output`` and ``--suffix`` (``shard-N`` under the run's output
+directory, where its console output goes too). A ``--host-pnor`` is
+copied into each shard's directory and the shard given its copy, as
+qemu attaches the PNOR writable and two can't share one. Once they have
+all finished their xmlrunner reports are merged into one and the result
+(a `ShardResult`) is what the run's exit code is made from. A test a
+shard gave no result for (it died, or couldn't load the test) is an
+error.
+'''
+
+import os
+import shutil
+import subprocess
+import sys
+import time
+import unittest
+import xml.etree.ElementTree as ET
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+# options a shard gets its own value of, and whether they take one
+SHARD_OPTIONS = {"--run": True, "--run-suite": True, "--shards": True,
+                 "-o": True, "--output": True, "-l": True, "--logdir": True,
+                 "--suffix": True, "--qemu-scratch-disk": True, "--host-pnor": True,
+                 "--list-tests": False, "--list-suites": False}
+
+
+def test_ids(suite):
+    '''
+    The ids of the tests in suite, in the order they'd run
+    '''
+    ids = []
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            ids.extend(test_ids(test))
+        else:
+            ids.append(test.id())
+    return ids
+
+
+def shard(ids, shards):
+    '''
+    Split test ids into (at most) shards lists, keeping the tests of a
+    class together and the order within a shard
+    '''
+    groups = []
+    for test_id in ids:
+        cls = test_id.rsplit(".", 1)[0]
+        if groups and groups[-1][0] == cls:
+            groups[-1][1].append(test_id)
+        else:
+            groups.append((cls, [test_id]))
+    result = [[] for i in range(min(shards, len(groups)))]
+    for i, (cls, group) in enumerate(groups):
+        result[i % len(result)].extend(group)
+    return result
+
+
+def option(argv, name):
+    '''
+    The (last) value argv gives option name, or None
+    '''
+    value = None
+    for i, arg in enumerate(argv):
+        if arg == name and i + 1 < len(argv):
+            value = argv[i + 1]
+        elif arg.startswith(name + "="):
+            value = arg.split("=", 1)[1]
+    return value
+
+
+def shard_argv(argv, ids, output, suffix, pnor=None):
+    '''
+    op-test's argv (without the program) for a shard running ids
+
+    :param pnor: the shard's own copy of the --host-pnor
+    '''
+    result = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+            continue
+        name = arg.split("=", 1)[0]
+        if name in SHARD_OPTIONS:
+            skip = SHARD_OPTIONS[name] and "=" not in arg
+            continue
+        result.append(arg)
+    for test_id in ids:
+        result += ["--run", test_id]
+    if pnor:
+        result += ["--host-pnor", pnor]
+    return result + ["--output", output, "--suffix", suffix]
+
+
+def reports(directory):
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        paths.extend(os.path.join(root, f) for f in sorted(files) if f.endswith(".xml"))
+    return paths
+
+
+def merge_reports(paths, dest):
+    '''
+    Write the <testsuite>s of the xmlrunner reports at paths into one
+    <testsuites> report at dest
+
+    :returns: the merged ElementTree root
+    '''
+    root = ET.Element("testsuites")
+    totals = dict.fromkeys(["tests", "failures", "errors", "skipped"], 0)
+    seconds = 0.0
+    for path in paths:
+        try:
+            tree = ET.parse(path).getroot()
+        except (IOError, ET.ParseError) as e:
+            log.warning("Sharded run could not read report {}: {}".format(path, e))
+            continue
+        for testsuite in [tree] if tree.tag == "testsuite" else tree.findall("testsuite"):
+            root.append(testsuite)
+            for name in totals:
+                totals[name] += int(testsuite.get(name, 0))
+            seconds += float(testsuite.get("time", 0))
+    for name, value in totals.items():
+        root.set(name, str(value))
+    root.set("time", "%.3f" % seconds)
+    ET.ElementTree(root).write(dest, encoding="UTF-8")
+    return root
+
+
+class ShardResult(object):
+    '''
+    What op-test needs of a TestResult, from a merged report: errors and
+    failures as (test id, message) lists, like unittest's
+    '''
+    def __init__(self, root, ids, exit_codes=None):
+        self.errors = []
+        self.failures = []
+        self.skipped = []
+        seen = set()
+        for testcase in root.iter("testcase"):
+            test_id = "{}.{}".format(testcase.get("classname"), testcase.get("name"))
+            seen.add(test_id)
+            for tag, results in [("error", self.errors), ("failure", self.failures),
+                                 ("skipped", self.skipped)]:
+                for element in testcase.findall(tag):
+                    results.append((test_id, element.text or element.get("message", "")))
+        missing = 0
+        for i, shard_ids in enumerate(ids):
+            for test_id in shard_ids:
+                if test_id not in seen:
+                    missing += 1
+                    self.errors.append((test_id, "No result from shard {} (exit code {})"
+                                        .format(i, (exit_codes or {}).get(i))))
+        self.testsRun = len(seen) + missing
+
+    def wasSuccessful(self):
+        return not (self.errors or self.failures)
+
+
+def stop(procs, grace=10):
+    '''
+    Terminate the (Popen, console file) procs still running, kill any
+    still there after grace seconds and reap them all
+    '''
+    live = [proc for proc, console in procs if proc.poll() is None]
+    for proc in live:
+        log.warning("Stopping shard process {}".format(proc.pid))
+        try:
+            proc.terminate()
+        except OSError:
+            pass
+    deadline = time.time() + grace
+    while time.time() < deadline and any(proc.poll() is None for proc in live):
+        time.sleep(0.1)
+    for proc in live:
+        if proc.poll() is None:
+            try:
+                proc.kill()
+            except OSError:
+                pass
+        proc.wait()
+    for proc, console in procs:
+        if not console.closed:
+            console.close()
+
+
+def run(suite, output, shards, command=None, argv=None, poll=1):
+    '''
+    Run suite as shards op-test processes
+
+    :param output: the run's output directory, shards go in shard-N
+    :param command: what runs op-test, default this python and op-test
+    :param argv: op-test's arguments, default this one's
+    :returns: ShardResult
+    '''
+    if command is None:
+        command = [sys.executable, sys.argv[0]]
+    if argv is None:
+        argv = sys.argv[1:]
+    ids = shard(test_ids(suite), shards)
+    host_pnor = option(argv, "--host-pnor")
+    procs = []
+    start = time.time()
+    exit_codes = {}
+    try:
+        for i, shard_ids in enumerate(ids):
+            directory = os.path.join(output, "shard-{}".format(i))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            pnor = None
+            if host_pnor:
+                pnor = os.path.join(directory, os.path.basename(host_pnor))
+                shutil.copyfile(host_pnor, pnor)
+            console = open(os.path.join(directory, "console.log"), 'w')
+            cmd = command + shard_argv(argv, shard_ids, directory, "shard-{}".format(i), pnor)
+            log.info("Shard {} runs {} tests: {}".format(i, len(shard_ids), " ".join(shard_ids)))
+            log.debug("Shard {} command {}".format(i, " ".join(cmd)))
+            procs.append((subprocess.Popen(cmd, stdout=console, stderr=subprocess.STDOUT,
+                                           close_fds=True), console))
+        while len(exit_codes) < len(procs):
+            for i, (proc, console) in enumerate(procs):
+                if i not in exit_codes and proc.poll() is not None:
+                    exit_codes[i] = proc.returncode
+                    console.close()
+                    log.info("Shard {} finished with exit code {} after {:.0f}s"
+                             .format(i, proc.returncode, time.time() - start))
+            if len(exit_codes) < len(procs):
+                time.sleep(poll)
+    finally:
+        # interrupted (or a shard failed to start), leave no shard behind
+        stop(procs)
+
+    paths = []
+    for i in range(len(ids)):
+        paths.extend(reports(os.path.join(output, "shard-{}".format(i))))
+    dest = os.path.join(output, "TEST-shards.xml")
+    root = merge_reports(paths, dest)
+    # the merged report is the report, not these as well
+    for path in paths:
+        os.remove(path)
+    result = ShardResult(root, ids, exit_codes)
+    log.info("Sharded run of {} tests in {} shards took {:.0f}s, report {}"
+             .format(sum(len(s) for s in ids), len(ids), time.time() - start, dest))
+    return result
@@ -30,11 +30,13 @@
 #  This class encapsulates all interfaces and classes required to do end to end
 #  automated flashing and testing of OpenPower systems.
 
+import os
 import time
 import subprocess
 import pexpect
 import socket
 import errno
+import threading
 import unittest
 
 import OpTestIPMI # circular dependencies, use package
@@ -44,6 +46,7 @@ from OpTestFSP import OpTestFSP
 from OpTestConstants import OpTestConstants as BMC_CONST
 from OpTestError import OpTestError
 import OpTestHost
+import OpTestTiming
 from OpTestUtil import OpTestUtil
 from OpTestSSH import ConsoleState as SSHConnectionState
 from Exceptions import HostbootShutdown, WaitForIt, RecoverFailed, UnknownStateTransition
@@ -69,6 +72,102 @@ class OpSystemState():
     POWERING_OFF = 7
     UNKNOWN_BAD = 8 # special case, use set_state to place system in hold for later goto
 
+    @classmethod
+    def name(cls, state):
+        for key, value in vars(cls).items():
+            if value == state and not key.startswith('_'):
+                return key
+        return str(state)
+
+class ConsoleWaiter(threading.Thread):
+    '''
+    Reader thread for OpTestSystem.wait_for_it.
+
+    Watches the console until one of expect_seq (after the pexpect TIMEOUT
+    and EOF entries) matches or the deadline passes.  pexpect returns as
+    soon as a pattern arrives, poll only bounds how long we go between
+    checks for a stale buffer: with no new output for stale seconds we
+    reconnect (and optionally refresh/kick the buffer).  On EOF the console
+    is closed and picked up again with get_console.
+
+    Only this thread touches the console until wait() returns, and it has
+    stopped by the time wait() returns or raises (e.g. KeyboardInterrupt),
+    so the caller can drive the console again straight away.
+    '''
+    def __init__(self, console=None, expect_seq=None, deadline=None, poll=5,
+                 stale=60, reconnect=1, refresh=1, buffer_kicker=1):
+        threading.Thread.__init__(self, name="ConsoleWaiter")
+        self.daemon = True
+        self.console = console
+        self.expect_seq = expect_seq
+        self.deadline = deadline
+        self.poll = poll
+        self.stale = stale
+        self.reconnect = reconnect
+        self.refresh = refresh
+        self.buffer_kicker = buffer_kicker
+        self.reconnect_count = 0
+        self.r = None
+        self.error = None
+        self.done = threading.Event()
+        self.stop = threading.Event()
+
+    def run(self):
+        try:
+            previous_before = None
+            last_output = time.time()
+            while not self.stop.is_set() and time.time() < self.deadline:
+                sys_pty = self.console.get_console() # preemptive in case EOF came
+                r = sys_pty.expect(self.expect_seq,
+                        timeout=max(0, min(self.poll, self.deadline - time.time())))
+                if r > 1:
+                    self.r = r
+                    return
+                if r == 1: # EOF
+                    self.console.close()
+                    continue
+                if sys_pty.before != previous_before:
+                    previous_before = sys_pty.before
+                    last_output = time.time()
+                    continue
+                if self.stop.is_set():
+                    return
+                if self.reconnect and (time.time() - last_output >= self.stale):
+                    self.reconnect_count += 1
+                    try:
+                        sys_pty = self.console.connect()
+                        if self.refresh:
+                            sys_pty.sendcontrol('l')
+                        if self.buffer_kicker:
+                            sys_pty.sendline("\r")
+                            sys_pty.expect("\n")
+                    except Exception as e:
+                        log.error(e)
+                    previous_before = None
+                    last_output = time.time()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+    def wait(self):
+        '''
+        Start watching, returns the expect_seq index of the match or None
+        if the deadline passed.  Exceptions from the reader are re-raised.
+        '''
+        self.start()
+        try:
+            # timed waits so the main thread still sees KeyboardInterrupt
+            while not self.done.wait(1):
+                pass
+        finally:
+            # the reader finishes its current expect (at most poll seconds)
+            self.stop.set()
+            self.join()
+        if self.error is not None:
+            raise self.error
+        return self.r
+
 class OpTestSystem(object):
 
     ## Initialize this object
@@ -112,6 +211,14 @@ class OpTestSystem(object):
         self.block_setup_term = 0
         self.stop = 0
         self.ignore = 0
+        self.expect_seq_cache = {} # sorted expect table keys, see expect_seq_for
+        self.state_transitions = [] # (from state, to state, seconds), see goto_state
+        # boot timing events, summarize with common/OpTestTiming.py
+        if getattr(conf, 'logdir', None):
+          self.timing = OpTestTiming.TransitionLog(os.path.join(conf.logdir, "boot-timing.jsonl"))
+        else:
+          self.timing = OpTestTiming.TransitionLog()
+        self.wait_start = None # set in wait_for_it for milestone timing
 
         self.openpower = 'openpower' # string to define petitboot kernel cat /proc/version column 3, change if using debug petitboot kernel
 
@@ -160,9 +267,9 @@ class OpTestSystem(object):
           self.login_reconnect = 1 # NEW ssh triggers default boot cancel, just saying
           self.login_fresh_start = 0
 
-        # watermark is the loop counter (loop_max) used in conjunction with timeout
-        # timeout is the expect timeout for each iteration
-        # watermark will automatically increase in case the loop is too short
+        # watermark (loop_max) times timeout is the wait_for_it deadline in seconds
+        # timeout is also the console poll interval, threshold times timeout the stale buffer interval
+        # watermark will automatically increase in case the deadline is too short
         self.ipl_watermark = 100
         self.ipl_timeout = 4 # needs consideration with petitboot timeout
         self.booting_watermark = 100
@@ -356,6 +463,8 @@ class OpTestSystem(object):
           log.debug("OpTestSystem CURRENT DETECTED STATE: %s" % (self.state))
 
         log.debug("OpTestSystem START STATE: %s (target %s)" % (self.state, state))
+        goto_start = time.time()
+        goto_from = self.state
         never_unknown = False
         while 1:
             if self.stop == 1:
@@ -363,7 +472,10 @@ class OpTestSystem(object):
             self.block_setup_term = 1 # block until we are clear, exceptions can re-enter while booting
             if self.state != OpSystemState.UNKNOWN:
                 never_unknown = True
+            previous = self.state
+            start = time.time()
             self.state = self.stateHandlers[self.state](state)
+            self.record_transition(previous, self.state, time.time() - start)
             # transition from states invalidate the previous PS1 setting, so clear it
             if self.previous_state != self.state:
               self.util.clear_system_state(self)
@@ -371,6 +483,8 @@ class OpTestSystem(object):
               self.previous_state = self.state
             log.debug("OpTestSystem TRANSITIONED TO: %s" % (self.state))
             if self.state == state:
+                self.timing.event('goto', seconds=time.time() - goto_start,
+                    **{'from' : OpSystemState.name(goto_from), 'to' : OpSystemState.name(state)})
                 break;
             if never_unknown and self.state == OpSystemState.UNKNOWN:
                  self.stop = 1
@@ -378,6 +492,18 @@ class OpTestSystem(object):
                          message=("OpTestSystem something set the system to UNKNOWN,"
                            " check the logs for details, we will be stopping the system"))
 
+    def record_transition(self, from_state, to_state, seconds):
+        '''
+        Keep how long each state handler took to move the system on,
+        available as state_transitions for the rest of the run.
+        '''
+        self.state_transitions.append((from_state, to_state, seconds))
+        self.timing.event('transition', seconds=seconds,
+            target=OpSystemState.name(self.target_state),
+            **{'from' : OpSystemState.name(from_state), 'to' : OpSystemState.name(to_state)})
+        log.debug("OpTestSystem TRANSITION {} -> {} took {:.2f} seconds"
+                  .format(from_state, to_state, seconds))
+
     def run_DETECT(self, target_state):
         self.detect_counter += 1
         detect_state = OpSystemState.UNKNOWN
@@ -491,14 +617,39 @@ class OpTestSystem(object):
         else: # TIMEOUT EOF from cat
             return OpSystemState.UNKNOWN
 
+    def expect_seq_for(self, expect_dict):
+        '''
+        pexpect list for wait_for_it, TIMEOUT and EOF followed by the
+        sorted expect_dict keys.  The sorted list is cached by the set of
+        keys, so it is built once per table rather than on every wait,
+        and a table that gains or swaps a key gets a new one.
+        '''
+        key_set = frozenset(expect_dict)
+        keys = self.expect_seq_cache.get(key_set)
+        if keys is None:
+            keys = sorted(key_set)
+            self.expect_seq_cache[key_set] = keys
+        return [pexpect.TIMEOUT, pexpect.EOF] + keys
+
     def wait_for_it(self, **kwargs):
+        '''
+        Wait for one of the expect_dict keys on the console.
+
+        A ConsoleWaiter reader thread watches the console continuously and
+        we wake as soon as any key (target or crash pattern) shows up,
+        the overall wait is bounded by a deadline of loop_max * timeout
+        seconds.  Without new console output for threshold * timeout
+        seconds the waiter reconnects (if reconnect is set).
+
+        Returns (index into the sorted expect_dict keys, reconnect count),
+        raises WaitForIt if the deadline passes.
+        '''
         default_vals = {'expect_dict': None, 'refresh': 1, 'buffer_kicker': 1, 'loop_max': 8, 'threshold': 1, 'reconnect': 1, 'fresh_start' : 1, 'last_try': 1, 'timeout': 5}
         for key in default_vals:
           if key not in kwargs.keys():
             kwargs[key] = default_vals[key]
         base_seq = [pexpect.TIMEOUT, pexpect.EOF]
-        expect_seq = list(base_seq) # we want a *copy*
-        expect_seq = expect_seq + list(sorted(kwargs['expect_dict'].keys()))
+        expect_seq = self.expect_seq_for(kwargs['expect_dict'])
         if kwargs['fresh_start']:
           sys_pty = self.console.connect() # new connect gets new pexpect buffer, stale buffer from power off can linger
         else:
@@ -506,65 +657,60 @@ class OpTestSystem(object):
         # we do not perform buffer_kicker here since it can cause changes to things like the petitboot menu and default boot
         if kwargs['refresh']:
           sys_pty.sendcontrol('l')
-        previous_before = 'emptyfirst'
-        x = 1
+        start = self.wait_start = time.time()
+        deadline = start + kwargs['loop_max'] * kwargs['timeout']
         reconnect_count = 0
-        timeout_count = 1
-        while (x <= kwargs['loop_max']):
-            sys_pty = self.console.get_console() # preemptive in case EOF came
-            r = sys_pty.expect(expect_seq, kwargs['timeout'])
-            # if we have a stale buffer and we are still timing out
-            if (previous_before == sys_pty.before) and ((r + 1) in range(len(base_seq))):
-              timeout_count += 1
-              # only attempt reconnect if we've timed out per threshold
-              if (timeout_count % kwargs['threshold'] == 0):
-                if kwargs['reconnect']:
-                  reconnect_count += 1
-                  try:
-                    sys_pty = self.console.connect()
-                  except Exception as e:
-                    log.error(e)
-                  if kwargs['refresh']:
-                    sys_pty.sendcontrol('l')
-                  if kwargs['buffer_kicker']:
-                    sys_pty.sendline("\r")
-                    sys_pty.expect("\n")
-                previous_before = 'emptyagain'
-            else:
-              previous_before = sys_pty.before
-              timeout_count = 1
-
+        log.debug("\n *** WaitForIt CURRENT STATE \"{:02}\" TARGET STATE \"{:02}\"\n"
+                  " *** WaitForIt working on transition, deadline \"{}\" seconds"
+                  " - Stale buffer reconnect after \"{}\" seconds\n"
+                  " *** WaitForIt variables \"{}\"\n"
+                  " *** WaitForIt Refresh=\"{}\" Buffer Kicker=\"{}\" Reconnect=\"{}\" - Kill Cord=\"{:02}\"\n"
+                  .format(self.state, self.target_state,
+                  kwargs['loop_max'] * kwargs['timeout'], kwargs['threshold'] * kwargs['timeout'],
+                  expect_seq[len(base_seq):], kwargs['refresh'], kwargs['buffer_kicker'],
+                  kwargs['reconnect'], self.kill_cord))
+        while time.time() < deadline:
+            waiter = ConsoleWaiter(console=self.console, expect_seq=expect_seq,
+                                   deadline=deadline, poll=kwargs['timeout'],
+                                   stale=kwargs['threshold'] * kwargs['timeout'],
+                                   reconnect=kwargs['reconnect'], refresh=kwargs['refresh'],
+                                   buffer_kicker=kwargs['buffer_kicker'])
+            r = waiter.wait()
+            reconnect_count += waiter.reconnect_count
+            if r is None:
+              break
+            # callbacks run here, not in the reader thread, they drive the console themselves
             working_r = self.check_it(my_r=r, check_base_seq=base_seq, check_expect_seq=expect_seq, check_expect_dict=kwargs['expect_dict'])
             # if we found a hit on the callers string return it, otherwise keep looking
             if working_r != -1:
+              self.milestone(expect_seq[r])
+              log.debug("WaitForIt found \"{}\" after {:.2f} seconds, reconnects={}"
+                  .format(expect_seq[r], time.time() - start, reconnect_count))
               return working_r, reconnect_count
-            else:
-              x += 1
-              log.debug("\n *** WaitForIt CURRENT STATE \"{:02}\" TARGET STATE \"{:02}\"\n"
-                      " *** WaitForIt working on transition\n"
-                      " *** Expect Buffer ID={}\n"
-                      " *** Current loop iteration \"{:02}\"             - Reconnect attempts \"{:02}\" - loop_max \"{:02}\"\n"
-                      " *** WaitForIt timeout interval \"{:02}\" seconds - Stale buffer check every \"{:02}\" times\n"
-                      " *** WaitForIt variables \"{}\"\n"
-                      " *** WaitForIt Refresh=\"{}\" Buffer Kicker=\"{}\" - Kill Cord=\"{:02}\"\n".format(self.state, self.target_state,
-                      hex(id(sys_pty)), x, reconnect_count, kwargs['loop_max'], kwargs['timeout'], kwargs['threshold'],
-                      sorted(kwargs['expect_dict'].keys()), kwargs['refresh'], kwargs['buffer_kicker'], self.kill_cord))
-            if (x >= kwargs['loop_max']):
-              if kwargs['last_try']:
-                sys_pty = self.console.connect()
-                sys_pty.sendcontrol('l')
-                sys_pty.sendline("\r")
-                r = sys_pty.expect(expect_seq, kwargs['timeout'])
-                try:
-                  last_try_r = self.check_it(my_r=r, check_base_seq=base_seq, check_expect_seq=expect_seq,
-                                               check_expect_dict=kwargs['expect_dict'])
-                  if last_try_r != -1:
-                    return last_try_r, reconnect_count
-                  else:
-                    raise WaitForIt(expect_dict=kwargs['expect_dict'], reconnect_count=reconnect_count)
-                except Exception as e:
-                  raise e
-              raise WaitForIt(expect_dict=kwargs['expect_dict'], reconnect_count=reconnect_count)
+        if kwargs['last_try']:
+          sys_pty = self.console.connect()
+          sys_pty.sendcontrol('l')
+          sys_pty.sendline("\r")
+          r = sys_pty.expect(expect_seq, kwargs['timeout'])
+          last_try_r = self.check_it(my_r=r, check_base_seq=base_seq, check_expect_seq=expect_seq,
+                                     check_expect_dict=kwargs['expect_dict'])
+          if last_try_r != -1:
+            self.milestone(expect_seq[r])
+            return last_try_r, reconnect_count
+        raise WaitForIt(expect_dict=kwargs['expect_dict'], reconnect_count=reconnect_count)
+
+    def wait_seconds(self):
+        if self.wait_start is None:
+          return None
+        return time.time() - self.wait_start
+
+    def milestone(self, pattern):
+        '''
+        Record that wait_for_it saw pattern, seconds into the wait
+        '''
+        self.timing.event('milestone', state=OpSystemState.name(self.state),
+            target=OpSystemState.name(self.target_state),
+            pattern=pattern, seconds=self.wait_seconds())
 
     def check_it(self, **kwargs):
         default_vals = {'my_r': None, 'check_base_seq': None, 'check_expect_seq': None, 'check_expect_dict': None}
@@ -579,6 +725,10 @@ class OpTestSystem(object):
         if (check_r + 1) in range(len(check_base_seq) + 1, len(check_expect_seq) + 1):
           # if there is a handler callback
           if check_expect_dict[check_expect_seq[check_r]]:
+            self.timing.event('callback', state=OpSystemState.name(self.state),
+                target=OpSystemState.name(self.target_state),
+                callback=check_expect_dict[check_expect_seq[check_r]].__name__,
+                pattern=check_expect_seq[check_r], seconds=self.wait_seconds())
             try:
               # this calls the handler callback, mostly intended for raising exceptions
               check_expect_dict[check_expect_seq[check_r]](my_r=check_r, value=check_expect_seq[check_r])
@@ -1413,8 +1563,18 @@ class OpTestQemuSystem(OpTestSystem):
         return 0
 
     def sys_power_on(self):
+        # a saved petitboot shell is as good as booting to one
+        self.console.snapshot_restore = self.target_state in [OpSystemState.PETITBOOT,
+                                                              OpSystemState.PETITBOOT_SHELL]
         self.bmc.power_on()
 
+    def petitboot_exit_to_shell(self):
+        super(OpTestQemuSystem, self).petitboot_exit_to_shell()
+        if self.console.save_snapshot():
+            # the prompt went back to petitboot's own for the snapshot
+            self.util.clear_state(self)
+            self.get_petitboot_prompt()
+
     def get_my_ip_from_host_perspective(self):
         return "10.0.2.2"
 
@@ -0,0 +1,163 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+'''
+Boot transition timing
+----------------------
+
+`OpTestSystem` records a timestamped event for every state machine
+transition (``goto_state`` and the ``run_*`` handlers) and for the
+milestones `wait_for_it` sees on the console (e.g. ``Petitboot`` or
+``login:`` showing up, or a callback like ``hostboot_callback`` firing).
+Events are appended, one JSON object per line, to ``boot-timing.jsonl``
+in the log directory.
+
+The summarizer collects the ``seconds`` of each kind of event across all
+the iterations (and files) given and prints percentile tables::
+
+    python -m common.OpTestTiming test-reports/*/boot-timing.jsonl
+'''
+
+import sys
+import json
+import time
+import threading
+
+import logging
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+PERCENTILES = [50, 90, 99]
+
+
+class TransitionLog(object):
+    '''
+    Thread safe JSONL event writer, every event gets a ``time`` stamp.
+    With no path the events are only kept in memory (``events``).
+    '''
+    def __init__(self, path=None):
+        self.path = path
+        self.events = []
+        self.lock = threading.Lock()
+
+    def event(self, kind, **fields):
+        fields['event'] = kind
+        fields['time'] = time.time()
+        with self.lock:
+            self.events.append(fields)
+            if self.path is None:
+                return fields
+            try:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps(fields, sort_keys=True) + "\n")
+            except IOError as e:
+                log.warning("Unable to write boot timing to {}, Exception={}"
+                            .format(self.path, e))
+                self.path = None
+        return fields
+
+    def summary(self):
+        return summary_table(summarize(self.events))
+
+
+def load(paths):
+    '''
+    Events from the JSONL files, lines that do not parse are skipped.
+    '''
+    events = []
+    for path in paths:
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    log.debug("Skipping bad line in {}: {}".format(path, line))
+    return events
+
+
+def event_key(event):
+    '''
+    What an event is grouped by in the summary.
+    '''
+    if event.get('event') == 'goto':
+        return "goto {} -> {}".format(event.get('from'), event.get('to'))
+    if event.get('event') == 'transition':
+        return "{} -> {}".format(event.get('from'), event.get('to'))
+    if event.get('event') == 'milestone':
+        return "{} saw \"{}\"".format(event.get('state'), event.get('pattern'))
+    if event.get('event') == 'callback':
+        return "{} {}".format(event.get('state'), event.get('callback'))
+    if event.get('event') == 'install':
+        return "install {}".format(event.get('step'))
+    return event.get('event')
+
+
+def percentile(values, pct):
+    '''
+    Linear interpolation between closest ranks, values must be sorted.
+    '''
+    if len(values) == 1:
+        return values[0]
+    rank = (len(values) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def summarize(events, percentiles=PERCENTILES):
+    '''
+    Returns a list of (key, count, min, [percentiles], max) for each kind
+    of event carrying ``seconds``, in order of first appearance.
+    '''
+    seconds = {}
+    order = []
+    for event in events:
+        if event.get('seconds') is None:
+            continue
+        key = event_key(event)
+        if key not in seconds:
+            seconds[key] = []
+            order.append(key)
+        seconds[key].append(float(event['seconds']))
+    rows = []
+    for key in order:
+        values = sorted(seconds[key])
+        rows.append((key, len(values), values[0],
+                     [percentile(values, pct) for pct in percentiles],
+                     values[-1]))
+    return rows
+
+
+def summary_table(rows, percentiles=PERCENTILES):
+    width = max([len("transition")] + [len(row[0]) for row in rows])
+    lines = ["{:<{w}} {:>6} {:>9} {} {:>9}".format("transition", "count", "min(s)",
+                 " ".join("{:>9}".format("p{}(s)".format(pct)) for pct in percentiles),
+                 "max(s)", w=width)]
+    for key, count, low, pcts, high in rows:
+        lines.append("{:<{w}} {:>6} {:>9.2f} {} {:>9.2f}".format(key, count, low,
+                         " ".join("{:>9.2f}".format(value) for value in pcts),
+                         high, w=width))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print "usage: {} boot-timing.jsonl [...]".format(sys.argv[0])
+        sys.exit(1)
+    print summary_table(summarize(load(sys.argv[1:])))
@@ -33,12 +33,15 @@ import string
 import subprocess
 import random
 import re
+import threading
+import Queue
 import telnetlib
 import socket
 import select
 import time
 import pty
 import pexpect
+import tempfile
 import commands
 import requests
 import traceback
@@ -51,6 +54,7 @@ import json
 
 from OpTestConstants import OpTestConstants as BMC_CONST
 from OpTestError import OpTestError
+import OpTestPing
 from Exceptions import CommandFailed, RecoverFailed, ConsoleSettings
 from Exceptions import HostLocker, AES, ParameterCheck, HTTPCheck, UnexpectedCase
 
@@ -61,10 +65,21 @@ log = OpTestLogger.optest_logger_glob.get_logger(__name__)
 sudo_responses = ["not in the sudoers",
                   "incorrect password"]
 
+# what setup_term looks for first: a login, a shell prompt or Petitboot
+setup_term_prompts = ['login: $', ".*#$", ".*# $", ".*\$", "~>", 'Petitboot']
+
+# starts the line before each file in OpTestUtil.read_files output
+READ_FILES_MARKER = "@@op-test-file@@"
+
+# longest mambo_run_commands batch sent as a console line (the tty's
+# canonical input is 4095), longer ones are sourced from a script
+MAMBO_LINE_MAX = 4000
+
 class OpTestUtil():
 
     def __init__(self, conf=None):
         self.conf = conf
+        self.ping_prober = None # see prober()
 
     def setup(self, config='HostLocker'):
         # we need this called AFTER the proper configuration values have been seeded
@@ -272,10 +287,12 @@ class OpTestUtil():
 
         if self.conf.util_server is not None:
           # AES and Hostlocker skip logout
+          self.conf.util_server.dump_stats()
           log.debug("Closing util_server")
           self.conf.util_server.close()
 
         if self.conf.util_bmc_server is not None:
+          self.conf.util_bmc_server.dump_stats()
           log.debug("Logging out of util_bmc_server")
           self.conf.util_bmc_server.logout()
           log.debug("Closing util_bmc_server")
@@ -827,36 +844,35 @@ class OpTestUtil():
     # @return   BMC_CONST.PING_SUCCESS when PASSED or
     #           raise OpTestError when FAILED
     #
+    def prober(self):
+        '''
+        Shared in-process OpTestPing.Prober, created on first use
+        '''
+        if self.ping_prober is None:
+            self.ping_prober = OpTestPing.Prober()
+        return self.ping_prober
+
     def PingFunc(self, i_ip, i_try=1, totalSleepTime=BMC_CONST.HOST_BRINGUP_TIME):
         if i_ip == None:
             raise ParameterCheck(message="PingFunc has i_ip set to 'None', "
                 "check your configuration and setup")
-        sleepTime = 0;
-        while(i_try != 0):
-            p1 = subprocess.Popen(["ping", "-c 2", str(i_ip)],
-                                  stdin=subprocess.PIPE,
-                                  stdout=subprocess.PIPE)
-            stdout_value, stderr_value = p1.communicate()
-
-            if(stdout_value.__contains__("2 received")):
-                log.debug(i_ip + " is pinging")
+        # like "ping -c 2", two answers in a row, for up to i_try * totalSleepTime seconds
+        start = time.time()
+        deadline = start + i_try * totalSleepTime
+        while True:
+            remaining = deadline - time.time()
+            reached = self.prober().wait_until_up(i_ip, min(remaining, 10), stable=2)
+            if i_ip in reached:
+                log.debug("{} is pinging, took {:.2f} seconds"
+                          .format(i_ip, time.time() - start))
                 return BMC_CONST.PING_SUCCESS
-
-            else:
-                # need to print message otherwise no interactive feedback
-                # and user left guessing something is not happening
-                log.info("PingFunc is not pinging '{}', waited {} of {}, {} "
-                         "more loop cycles remaining, you may start to check "
-                         "your configuration for bmc_ip or host_ip"
-                         .format(i_ip, sleepTime, totalSleepTime, i_try))
-                log.debug("%s is not pinging (Waited %d of %d, %d more "
-                          "loop cycles remaining)" % (i_ip, sleepTime,
-                          totalSleepTime, i_try))
-                time.sleep(1)
-                sleepTime += 1
-                if (sleepTime == totalSleepTime):
-                    i_try -= 1
-                    sleepTime = 0
+            if time.time() >= deadline:
+                break
+            # need to print message otherwise no interactive feedback
+            # and user left guessing something is not happening
+            log.info("PingFunc is not pinging '{}', waited {:.0f} of {} seconds, "
+                     "you may start to check your configuration for bmc_ip or host_ip"
+                     .format(i_ip, time.time() - start, i_try * totalSleepTime))
 
         log.error("'{}' is not pinging and we tried many times, "
                   "check your configuration and setup.".format(i_ip))
@@ -890,19 +906,13 @@ class OpTestUtil():
         subprocess.check_output(arglist)
 
     # It waits for a ping to fail, Ex: After a BMC/FSP reboot
-    def ping_fail_check(self, i_ip):
-        cmd = "ping -c 1 " + i_ip + " 1> /dev/null; echo $?"
-        count = 0
-        while count < 500:
-            output = commands.getstatusoutput(cmd)
-            if output[1] != '0':
-                log.debug("IP %s Comes down" % i_ip)
-                break
-            count = count + 1
-            time.sleep(2)
-        else:
+    def ping_fail_check(self, i_ip, timeout=1000):
+        # three missed probes in a row, one lost echo is not a reboot
+        reached = self.prober().wait_until_down(i_ip, timeout, stable=3)
+        if i_ip not in reached:
             log.debug("IP %s keeps on pinging up" % i_ip)
             return False
+        log.debug("IP {} Comes down after {:.2f} seconds".format(i_ip, reached[i_ip]))
         return True
 
     def build_prompt(self, prompt=None):
@@ -1246,7 +1256,7 @@ class OpTestUtil():
         if system_obj.state == 3: # OpSystemState.PETITBOOT
             return
 
-        rc = pty.expect(['login: $', ".*#$", ".*# $", ".*\$", "~>", 'Petitboot', pexpect.TIMEOUT, pexpect.EOF], timeout=10)
+        rc = pty.expect(setup_term_prompts + [pexpect.TIMEOUT, pexpect.EOF], timeout=10)
         if rc == 0:
           track_obj.PS1_set, track_obj.LOGIN_set = self.get_login(system_obj.cv_HOST, term_obj, pty, self.build_prompt(system_obj.prompt))
           track_obj.PS1_set, track_obj.SUDO_set = self.get_sudo(system_obj.cv_HOST, term_obj, pty, self.build_prompt(system_obj.prompt))
@@ -1379,7 +1389,10 @@ class OpTestUtil():
         counter = 0
         while counter <= retry:
           try:
-            output = self.try_command(term_obj, command, timeout)
+            if getattr(term_obj, 'single_round_trip', False):
+              output = self.try_command_single_trip(term_obj, command, timeout)
+            else:
+              output = self.try_command(term_obj, command, timeout)
             return output
           except CommandFailed as cf:
             log.debug("CommandFailed cf={}".format(cf))
@@ -1393,6 +1406,50 @@ class OpTestUtil():
               log.info("\n \nOpTestSystem detected a command issue, we will retry the command,"
                     " this will be retry \"{:02}\" of a total of \"{:02}\"\n \n".format(counter, retry))
 
+    def read_files_command(self, patterns):
+        '''
+        A command printing each file matching the patterns (paths or shell
+        globs) after a READ_FILES_MARKER line with its path, in one go.
+        Plain sh and busybox will do, and it always exits 0.
+        '''
+        return ('for f in {}; do [ -f "$f" ] && v=$(cat "$f" 2>/dev/null)'
+                ' && printf "%s %s\\n%s\\n" "{}" "$f" "$v"; done; true'
+                .format(" ".join(patterns), READ_FILES_MARKER))
+
+    def parse_read_files(self, output):
+        '''
+        Turn read_files_command output (a list of lines) into a dict of
+        path : contents, lines of a file joined with "\\n".
+        '''
+        files = {}
+        path = None
+        for line in output:
+            if line.startswith(READ_FILES_MARKER + " "):
+                path = line[len(READ_FILES_MARKER) + 1:]
+                files[path] = []
+            elif path is not None:
+                files[path].append(line)
+        return dict((path, "\n".join(lines)) for path, lines in files.items())
+
+    def read_files(self, term_obj, patterns, timeout=60, retry=0):
+        '''
+        Read many small files (sysfs/procfs attributes) in one command
+        rather than a `cat` each.
+
+        :param term_obj: anything with a run_command, a console or OpTestSSH
+        :param patterns: a path or glob or a list of them, e.g.
+                         "/sys/devices/system/cpu/cpu*/cpufreq/cpuinfo_cur_freq"
+        :returns: dict of path : contents, with no trailing newline. Files
+                  that don't exist or can't be read are left out.
+        '''
+        if isinstance(patterns, basestring):
+            patterns = [patterns]
+        output = term_obj.run_command(self.read_files_command(patterns),
+                                      timeout=timeout, retry=retry)
+        files = self.parse_read_files(output)
+        log.debug("Read {} files for {}".format(len(files), patterns))
+        return files
+
     def try_command(self, term_obj, command, timeout=60):
         running_sudo_s = False
         extra_sudo_output = False
@@ -1450,6 +1507,78 @@ class OpTestUtil():
           raise CommandFailed(command, res, echo_rc)
         return res
 
+    def build_sentinel(self):
+        # unique per command so stale output from a previous command
+        # (or the echo of the wrapped command line itself) cannot match
+        return "OPTEST-END-{:08x}".format(random.getrandbits(32))
+
+    def single_trip_safe(self, command):
+        # Whether try_command_single_trip can append its printf to command:
+        # not when a comment would swallow it, nor when the command goes on
+        # past its line (a trailing |, &&, || or \, a heredoc, several lines).
+        # A "#" or "<<" inside quotes is taken for one too, those commands
+        # just go the classic way.
+        stripped = command.rstrip()
+        if "\n" in stripped or "<<" in stripped:
+          return False
+        if re.search(r"(^|\s)#", stripped):
+          return False
+        return not stripped.endswith(("|", "&&", "\\"))
+
+    def try_command_single_trip(self, term_obj, command, timeout=60):
+        # Same contract as try_command, but the exit code is printed in the
+        # same response as the output so only one expect round trip is needed.
+        # The wrapped command prints a newline, the sentinel and $? after the
+        # command, e.g. "\nOPTEST-END-1a2b3c4d-0\n", the echoed command line
+        # only contains "OPTEST-END-1a2b3c4d $?" so it never matches.
+        # The leading newline guarantees the sentinel starts its own line
+        # and is removed again below so output lists match try_command.
+        if command == 'sudo -s' or not self.single_trip_safe(command):
+          # sudo -s needs the special environment restore handling, the
+          # others would swallow or break the appended printf
+          return self.try_command(term_obj, command, timeout)
+        expect_prompt = self.build_prompt(term_obj.prompt) + "$"
+        sentinel = self.build_sentinel()
+        separator = "; "
+        if command.rstrip().endswith(";") or command.rstrip().endswith("&"):
+          separator = " " # background job or already terminated list
+        wrapped = "{}{}printf '\\n%s-%d\\n' {} $?".format(command.rstrip(), separator, sentinel)
+        # job control notices (e.g. "[1]+  Done") may land on lines of their
+        # own between the sentinel and the prompt
+        done_pattern = re.escape(sentinel) + r"-(\d+)\r*\n(?:.*\r*\n)*?" + expect_prompt
+        pty = term_obj.get_console() # if previous caller environment leaves buffer hung can show up here, e.g. PS2 prompt
+        pty.sendline(wrapped)
+        rc = pty.expect([done_pattern, r"[Pp]assword for", pexpect.TIMEOUT, pexpect.EOF], timeout=timeout)
+        if rc == 0:
+          combo_io = pty.before.replace("\r\r\n","\n")
+          # strip the newline we printed ahead of the sentinel
+          if combo_io.endswith("\r\n"):
+            combo_io = combo_io[:-2]
+          elif combo_io.endswith("\n"):
+            combo_io = combo_io[:-1]
+          output_list = combo_io.splitlines()
+          try:
+            del output_list[:1] # remove command from the list
+          except Exception as e:
+            pass # nothing there
+          echo_rc = int(pty.match.group(1))
+        elif rc == 1:
+          handle_output_list, echo_rc = self.handle_password(term_obj, pty, command)
+          # remove the expect prompt since matched generic #
+          del handle_output_list[-1]
+          # sentinel may have been printed after the password was accepted
+          output_list = [xs for xs in handle_output_list if sentinel not in xs]
+        elif rc == 2: # timeout
+          output_list, echo_rc = self.try_sendcontrol(term_obj, command) # original raw buffer if it holds any clues
+        else:
+          term_obj.close()
+          raise CommandFailed(command, "run_command TIMEOUT or EOF, the command timed out or something,"
+                  " probably a connection issue, retry", -1)
+        res = output_list
+        if echo_rc != 0:
+          raise CommandFailed(command, res, echo_rc)
+        return res
+
     # This command just runs and returns the output & ignores the failure
     # A straight copy of what's in OpTestIPMI
     def run_command_ignore_fail(self, term_obj, command, timeout=60, retry=0):
@@ -1471,6 +1600,74 @@ class OpTestUtil():
           pass # nothing there
         return output_list
 
+    def mambo_run_commands(self, term_obj, commands, timeout=60, script=None):
+        '''
+        Run a list of mysim/TCL commands at the systemsim prompt in one go,
+        rather than a round trip each as mambo_run_command would
+
+        Each command runs (in a TCL catch) between markers that TCL builds
+        with format, so the echoed input never looks like output. Short
+        batches go as a single console line, otherwise (or when script is
+        given) the batch is written to a TCL script that is sourced, the
+        script being kept when it's the caller's path.
+
+        :param commands: list of mysim/TCL commands
+        :param timeout: seconds for the whole batch
+        :param script: path to write the batch's TCL script to
+        :returns: list of output lists, one per command
+        :raises CommandFailed: for the first command that failed, once the
+            whole batch has run
+        '''
+        if not commands:
+            return []
+        lines = []
+        for i, command in enumerate(commands):
+            lines.append('puts [format "%s-%d-" OPTEST_BEGIN {i}]; '
+                         'if {{[catch {{{command}}} r]}} '
+                         '{{puts [format "%s-%d- %s" OPTEST_ERROR {i} $r]}} '
+                         'elseif {{$r ne ""}} {{puts $r}}; '
+                         'puts [format "%s-%d-" OPTEST_END {i}]'.format(i=i, command=command))
+        batch = "; ".join(lines)
+        path = script
+        if path is None and (len(batch) > MAMBO_LINE_MAX or "\n" in batch):
+            fd, path = tempfile.mkstemp(prefix="op-test-mambo-", suffix=".tcl")
+            os.close(fd)
+        if path:
+            with open(path, 'w') as f:
+                f.write("\n".join(lines) + "\n")
+            batch = "source {}".format(path)
+        log.debug("mambo_run_commands {} commands with '{}'".format(len(commands), batch[:200]))
+        pty = term_obj.get_console()
+        try:
+            pty.sendline(batch)
+            end = "OPTEST_END-{}-".format(len(commands) - 1)
+            rc = pty.expect_exact([end, pexpect.TIMEOUT, pexpect.EOF], timeout=timeout)
+            output = pty.before
+            if rc != 0:
+                raise CommandFailed(batch, "Mambo batch did not finish: {}"
+                                    .format(output.replace("\r\r\n", "\n")), -1)
+            pty.expect(["systemsim %", pexpect.TIMEOUT, pexpect.EOF], timeout=10)
+        finally:
+            if path and not script:
+                os.remove(path)
+        output = (output + end).replace("\r\r\n", "\n").replace("\r\n", "\n")
+        results = []
+        failed = None
+        for i, command in enumerate(commands):
+            begin = output.find("OPTEST_BEGIN-{}-\n".format(i))
+            finish = output.find("OPTEST_END-{}-".format(i), begin)
+            if begin < 0 or finish < 0:
+                raise CommandFailed(command, "No framed output in: {}".format(output), -1)
+            result = output[begin + len("OPTEST_BEGIN-{}-\n".format(i)):finish].splitlines()
+            error = "OPTEST_ERROR-{}- ".format(i)
+            for line in result:
+                if line.startswith(error) and failed is None:
+                    failed = (command, line[len(error):])
+            results.append([l for l in result if not l.startswith(error)])
+        if failed:
+            raise CommandFailed(failed[0], failed[1], 1)
+        return results
+
     def mambo_enter(self, term_obj):
         term_obj.get_console().sendcontrol('c')
         rc = term_obj.get_console().expect(["systemsim %", pexpect.TIMEOUT, pexpect.EOF], timeout=10)
@@ -1604,7 +1801,23 @@ class Server(object):
 
     Login is done for the caller, so no need to call login, just
     make the GET/PUT/POST/DELETE call.
+
+    Retries back off exponentially with jitter, starting with a short
+    first retry (backoff_first) so we pick the BMC back up quickly once
+    it is reachable, then backoff_initial growing by backoff_factor up
+    to backoff_max seconds.  Debug logging of responses is limited to
+    log_limit characters.  Latency and retry counters are kept per
+    URI, see get_stats() and dump_stats().
+
+    Independent requests (e.g. one GET per image id) can be issued
+    concurrently with batch(), results come back in call order, and
+    requests turned away together with a 401 share one login.
     '''
+    default_vals = {'cmd' : None, 'uri' : None, 'data' : None,
+                    'json' : None, 'params' : None, 'minutes' : None,
+                    'files' : None, 'stream' : False,
+                    'verify' : False, 'headers' : None}
+
     def __init__(self, url=None,
                  base_url=None,
                  proxy=None,
@@ -1612,7 +1825,15 @@ class Server(object):
                  password=None,
                  verify=False,
                  minutes=3,
-                 timeout=30):
+                 timeout=30,
+                 backoff_first=0.2,
+                 backoff_initial=1,
+                 backoff_factor=2,
+                 backoff_max=10,
+                 backoff_jitter=0.25,
+                 log_limit=1024,
+                 pool_connections=4,
+                 pool_maxsize=16):
         urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
         OpTestLogger.optest_logger_glob.setUpChildLogger("urllib3")
         self.username = username
@@ -1625,7 +1846,29 @@ class Server(object):
         self.xAuthHeader = {}
         self.timeout = timeout
         self.minutes = minutes
-        self.session.mount('https://', HTTPAdapter(max_retries=5))
+        self.backoff_first = backoff_first
+        self.backoff_initial = backoff_initial
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.backoff_jitter = backoff_jitter
+        self.log_limit = log_limit
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+        self.login_lock = threading.Lock()
+        self.login_generation = 0 # bumped by each login, see loop_it
+        self.pool_maxsize = pool_maxsize
+        # keep-alive pool, sized so concurrent callers reuse connections
+        adapter = HTTPAdapter(max_retries=5,
+                              pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', HTTPAdapter(pool_connections=pool_connections,
+                                                 pool_maxsize=pool_maxsize))
+        self.command_dict = { 'get'    : self.session.get,
+                              'put'    : self.session.put,
+                              'post'   : self.session.post,
+                              'delete' : self.session.delete,
+                            }
         # value.max_retries for future debug if needed
 #        for key, value in self.session.adapters.items():
 #            log.debug("max_retries={}".format(value.max_retries))
@@ -1696,6 +1939,7 @@ class Server(object):
                 "credentials are properly setup URL={} username={} "
                 "password={}, Exception={}"
                 .format(self._url(uri), username, password, e))
+        self.login_generation += 1
         return r
 
     def logout(self, uri=None):
@@ -1735,34 +1979,138 @@ class Server(object):
         r = self.loop_it(**kwargs)
         return r
 
+    def backoff(self, attempt, loop_time):
+        '''
+        Seconds to sleep before retry number `attempt` (0 is the first
+        retry), never sleeping past loop_time.
+        '''
+        if attempt == 0:
+            delay = self.backoff_first
+        else:
+            delay = min(self.backoff_max,
+                        self.backoff_initial * self.backoff_factor ** (attempt - 1))
+        delay = delay * random.uniform(1 - self.backoff_jitter, 1 + self.backoff_jitter)
+        return max(0, min(delay, loop_time - time.time()))
+
+    def response_text(self, r, stream=False):
+        '''
+        Bounded r.text for the debug log, streamed responses are left alone
+        so we do not consume the content before the caller gets it.
+        '''
+        if stream:
+            return "<streamed>"
+        text = r.text
+        if len(text) > self.log_limit:
+            return "{}...<{} more characters>".format(text[:self.log_limit],
+                                                     len(text) - self.log_limit)
+        return text
+
+    def record(self, cmd, uri, elapsed, retries, failed=False):
+        with self.stats_lock:
+            stat = self.stats.setdefault((cmd, uri),
+                {'calls' : 0, 'retries' : 0, 'failures' : 0,
+                 'total' : 0.0, 'max' : 0.0})
+            stat['calls'] += 1
+            stat['retries'] += retries
+            stat['total'] += elapsed
+            stat['max'] = max(stat['max'], elapsed)
+            if failed:
+                stat['failures'] += 1
+
+    def get_stats(self):
+        '''
+        Copy of the per (cmd, uri) counters, each a dict of calls, retries,
+        failures and total/max seconds spent (including retries).
+        '''
+        with self.stats_lock:
+            return dict((key, dict(value)) for key, value in self.stats.items())
+
+    def dump_stats(self):
+        stats = self.get_stats()
+        if not stats:
+            return
+        log.debug("Server {} request stats:".format(self.base_url))
+        log.debug("{:>7} {:>7} {:>8} {:>9} {:>9} {}"
+            .format("calls", "retries", "failures", "avg(s)", "max(s)", "request"))
+        for (cmd, uri), stat in sorted(stats.items(),
+                key=lambda item: item[1]['total'], reverse=True):
+            log.debug("{:>7} {:>7} {:>8} {:>9.3f} {:>9.3f} {} {}"
+                .format(stat['calls'], stat['retries'], stat['failures'],
+                 stat['total'] / stat['calls'], stat['max'], cmd.upper(), uri))
+
+    def batch(self, calls, workers=None):
+        '''
+        Issue several requests concurrently over the shared session.
+
+        calls is a list of dicts of the keyword arguments loop_it takes,
+        each with a 'cmd' of get/put/post/delete, e.g.
+        {'cmd' : 'get', 'uri' : '/xyz/openbmc_project/software/1234',
+        'minutes' : 2}.  At most workers (default pool_maxsize)
+        requests are in flight at once.
+
+        Returns a list of (r, exception) tuples in the same order as calls,
+        exception is None when the call returned and r is None when it
+        raised, so one failing request does not lose the others.
+        '''
+        results = [(None, None)] * len(calls)
+        pending = Queue.Queue()
+        for index, call in enumerate(calls):
+            pending.put((index, call))
+
+        def worker():
+            while True:
+                try:
+                    index, call = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    results[index] = (self.loop_it(**dict(call)), None)
+                except Exception as e:
+                    log.debug("batch {} {} Exception={}"
+                        .format(call.get('cmd'), call.get('uri'), e))
+                    results[index] = (None, e)
+
+        if workers is None:
+            workers = self.pool_maxsize
+        threads = [threading.Thread(target=worker)
+                   for i in range(min(workers, len(calls)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
     def loop_it(self, **kwargs):
-        default_vals = {'cmd' : None, 'uri' : None, 'data' : None,
-                        'json' : None, 'params' : None, 'minutes' : None,
-                        'files' : None, 'stream' : False,
-                        'verify' : False, 'headers' : None}
-        for key in default_vals:
-            if key not in kwargs.keys():
-                kwargs[key] = default_vals[key]
-
-        command_dict = { 'get'    : self.session.get,
-                         'put'    : self.session.put,
-                         'post'   : self.session.post,
-                         'delete' : self.session.delete,
-                       }
+        for key in self.default_vals:
+            if key not in kwargs:
+                kwargs[key] = self.default_vals[key]
+
+        request = self.command_dict[kwargs['cmd']]
+        start = time.time()
         if kwargs['minutes'] is not None:
-            loop_time = time.time() + 60*kwargs['minutes']
+            loop_time = start + 60*kwargs['minutes']
         else:
-            loop_time = time.time() + 60*5 # enough time to cycle
+            loop_time = start + 60*5 # enough time to cycle
+        attempt = 0
+        relogged = False
         while True:
+            if attempt and not relogged:
+                time.sleep(self.backoff(attempt - 1, loop_time))
+            relogged = False
             if time.time() > loop_time:
+                self.record(kwargs['cmd'], kwargs['uri'], time.time() - start,
+                            max(attempt - 1, 0), failed=True)
                 raise HTTPCheck(message="HTTP \"{}\" problem, we timed out "
                    "trying URL={} PARAMS={} DATA={} JSON={} Files={}, we "
                    "waited {} minutes, check the debug log for more details"
                      .format(kwargs['cmd'], self._url(kwargs['uri']),
                      kwargs['params'], kwargs['data'], kwargs['json'],
                      kwargs['files'], kwargs['minutes']))
+            attempt += 1
+            generation = self.login_generation
             try:
-                r = command_dict[kwargs['cmd']](self._url(kwargs['uri']),
+                r = request(self._url(kwargs['uri']),
                         params=kwargs['params'],
                         data=kwargs['data'],
                         json=kwargs['json'],
@@ -1775,32 +2123,47 @@ class Server(object):
                 # caller did not want any retry so give them the exception
                 log.debug("loop_it Exception={}".format(e))
                 if kwargs['minutes'] is None:
+                    self.record(kwargs['cmd'], kwargs['uri'], time.time() - start,
+                                attempt - 1, failed=True)
                     raise e
-                time.sleep(5)
                 continue
             if r.status_code == requests.codes.unauthorized: # 401
                 try:
                     log.debug("loop_it unauthorized, trying to login")
-                    self.login()
+                    with self.login_lock:
+                        # concurrent callers share one login, skip it if
+                        # someone logged in since we sent this request
+                        if self.login_generation == generation:
+                            self.login()
+                    # retry straight away with the new session
+                    relogged = True
                     continue
                 except Exception as e:
                     log.debug("Unauthorized login failed, Exception={}".format(e))
                     if kwargs['minutes'] is None:
                         # caller did not want retry so give them the exception
+                        self.record(kwargs['cmd'], kwargs['uri'], time.time() - start,
+                                    attempt - 1, failed=True)
                         raise e
-                    time.sleep(5)
                     continue
             if r.status_code == requests.codes.ok:
-                log.debug("OpTestSystem HTTP r={} r.status_code={} r.text={}"
-                    .format(r, r.status_code, r.text))
+                self.record(kwargs['cmd'], kwargs['uri'], time.time() - start,
+                            attempt - 1)
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("OpTestSystem HTTP r={} r.status_code={} r.text={}"
+                        .format(r, r.status_code,
+                         self.response_text(r, kwargs['stream'])))
                 return r
             else:
                 if kwargs['minutes'] is None:
                     # caller did not want any retry so give them what we have
-                    log.debug("OpTestSystem HTTP (no retry) r={} r.status_code={} r.text={}"
-                        .format(r, r.status_code, r.text))
+                    self.record(kwargs['cmd'], kwargs['uri'], time.time() - start,
+                                attempt - 1, failed=True)
+                    if log.isEnabledFor(logging.DEBUG):
+                        log.debug("OpTestSystem HTTP (no retry) r={} r.status_code={} r.text={}"
+                            .format(r, r.status_code,
+                             self.response_text(r, kwargs['stream'])))
                     return r
-            time.sleep(5)
 
     def close(self):
         self.session.close()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+Boot Timing Report
+------------------
+
+Write boot timing events for a number of simulated boot iterations
+through `OpTestTiming.TransitionLog`, read the JSONL back (from two runs,
+as when summarizing several test-reports directories) and check the
+per-transition percentile table.
+
+Everything is written to and read from a temporary directory.
+'''
+
+import unittest
+import os
+import shutil
+import tempfile
+
+from common import OpTestTiming
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+
+class BootTimingReport(unittest.TestCase):
+    iterations = 100
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-boot-timing-")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def boot(self, timing, i):
+        # IPL takes 100..199 seconds, booting the OS 30..39
+        timing.event('transition', seconds=100 + i,
+                     **{'from' : 'IPLing', 'to' : 'PETITBOOT'})
+        timing.event('milestone', state='IPLing', target='OS',
+                     pattern='Petitboot', seconds=100 + i)
+        timing.event('transition', seconds=30 + i % 10,
+                     **{'from' : 'BOOTING', 'to' : 'OS'})
+
+    def runTest(self):
+        paths = [os.path.join(self.tmpdir, "run{}.jsonl".format(run))
+                 for run in range(2)]
+        for run, path in enumerate(paths):
+            timing = OpTestTiming.TransitionLog(path)
+            timing.event('goto', **{'from' : 'OFF', 'to' : 'OS'}) # no seconds
+            for i in range(run, self.iterations, 2):
+                self.boot(timing, i)
+            self.assertEqual(len(timing.events), 1 + 3 * self.iterations / 2)
+
+        with open(paths[0], 'a') as f:
+            f.write("not json\n")
+        events = OpTestTiming.load(paths)
+        self.assertEqual(len(events), 2 + 3 * self.iterations)
+
+        rows = OpTestTiming.summarize(events)
+        table = OpTestTiming.summary_table(rows)
+        log.info("BootTimingReport\n{}".format(table))
+        self.assertEqual([row[0] for row in rows],
+                         ["IPLing -> PETITBOOT", "IPLing saw \"Petitboot\"",
+                          "BOOTING -> OS"])
+        key, count, low, pcts, high = rows[0]
+        self.assertEqual((count, low, high), (self.iterations, 100, 199))
+        self.assertAlmostEqual(pcts[0], 149.5)
+        self.assertAlmostEqual(pcts[1], 189.1)
+        self.assertAlmostEqual(pcts[2], 198.01)
+        key, count, low, pcts, high = rows[2]
+        self.assertEqual((low, high), (30, 39))
+        self.assertEqual(len(table.splitlines()), 1 + len(rows))
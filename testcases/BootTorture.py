@@ -64,6 +64,11 @@ class BootTorture(unittest.TestCase):
         cls.cv_SYSTEM = cls.conf.system()
         cls.file_lspci = cls.get_lspci_file()
 
+    @classmethod
+    def tearDownClass(cls):
+        log.info("Boot timing over {} iterations:\n{}"
+                 .format(cls.boot_iterations, cls.cv_SYSTEM.timing.summary()))
+
     @classmethod
     def get_lspci_file(cls):
         if cls.conf.lspci_file():
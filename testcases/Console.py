@@ -36,6 +36,7 @@ import OpTestConfiguration
 from common.OpTestSystem import OpSystemState
 from common.Exceptions import CommandFailed
 import common.OpTestMambo as OpTestMambo
+from common import OpTestConsoleIntegrity
 
 import logging
 import OpTestLogger
@@ -106,6 +107,40 @@ class Console32k(Console, unittest.TestCase):
     count = 32
 
 
+class ConsoleStream():
+    size = 1024 * 1024
+
+    def setUp(self):
+        conf = OpTestConfiguration.conf
+        self.cv_BMC = conf.bmc()
+        self.cv_SYSTEM = conf.system()
+        self.util = conf.util
+
+    def runTest(self):
+        self.cv_SYSTEM.goto_state(OpSystemState.PETITBOOT_SHELL)
+        console = self.cv_BMC.get_host_console()
+        verifier, seconds = OpTestConsoleIntegrity.stream_check(console, self.size,
+                                                                self.util.build_prompt())
+        self.assertTrue(verifier.ok(), verifier.report(seconds))
+
+
+class ConsoleStream1M(ConsoleStream, unittest.TestCase):
+    '''
+    hexdump 1MB of a known pattern and check every line of it as it comes
+    in on the console, see `OpTestConsoleIntegrity`. Reports bytes/s and
+    where any bytes were dropped or corrupted.
+    '''
+    size = 1024 * 1024
+
+
+class ConsoleStream64M(ConsoleStream, unittest.TestCase):
+    '''
+    As ConsoleStream1M, with 64MB, for consoles fast enough (e.g. qemu) that
+    they need a lot of data to show up any problem.
+    '''
+    size = 64 * 1024 * 1024
+
+
 class ControlC(unittest.TestCase):
     '''
     Start a process that does a bunch of console output, and then try and
@@ -0,0 +1,215 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+Console Log Throughput
+----------------------
+
+Benchmark, in MB/s, console traffic going through the in-process
+`OpTestLogger.ConsoleLogSink` versus the ``tee | sed | cat -v`` subprocess
+pipeline it replaced, with the echo going to ``/dev/null``.
+
+Data is written in console sized chunks (as `OPexpect.spawn` would) from
+several threads at once, like the SSH torture tests do, and both the log
+file and the escaped echo must come out byte for byte the same as the
+pipeline's. The pipeline needs ``tee``, ``sed`` and ``cat`` on the PATH.
+
+ConsoleLogRotation checks the sink rotates at ``max_bytes`` keeping
+``backup_count`` old logs, never rotates (or truncates) with a
+``backup_count`` of 0, and holds writers back behind a slow echo.
+'''
+
+import unittest
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import subprocess
+
+import OpTestLogger
+
+import logging
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+
+class ConsoleLogThroughput(unittest.TestCase):
+    threads = 8
+    chunk_size = 1024
+    chunks = 2000 # per thread
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-console-log-")
+        rand = random.Random(0)
+        lines = []
+        for i in range(200):
+            line = "[{:12.6f}] console: device {} at 0x{:08x}".format(i / 1000.0, i, i * 4096)
+            if i % 10 == 0:
+                # control characters and escape sequences, like petitboot
+                line += "\x1b[1;1H\x1b[2J" + chr(rand.randint(0x80, 0xff))
+            lines.append(line + "\r\n")
+        self.data = "".join(lines)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def chunks_for(self, n):
+        # each thread writes whole lines so the results compare however
+        # the threads interleave
+        chunks = [""]
+        for line in self.data.replace("console:", "console{}:".format(n)).splitlines(True):
+            if len(chunks[-1]) + len(line) > self.chunk_size:
+                chunks.append("")
+            chunks[-1] += line
+        return chunks
+
+    def feed(self, write, lock=None):
+        def worker(n):
+            chunks = self.chunks_for(n)
+            for i in range(self.chunks):
+                chunk = chunks[i % len(chunks)]
+                if lock:
+                    with lock:
+                        write(chunk)
+                else:
+                    write(chunk)
+        workers = [threading.Thread(target=worker, args=(n,))
+                   for n in range(self.threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+
+    def run_pipeline(self, logfile, echofile):
+        with open(echofile, 'w') as echo:
+            proc = subprocess.Popen("tee {} | sed -u -e 's/\\r$//g'|cat -v".format(logfile),
+                                    stdin=subprocess.PIPE, stdout=echo,
+                                    shell=True)
+            # a pipe isn't safe to share without a lock
+            lock = threading.Lock()
+            start = time.time()
+            self.feed(lambda d: (proc.stdin.write(d), proc.stdin.flush()), lock)
+            proc.stdin.close()
+            proc.wait()
+            return time.time() - start
+
+    def run_sink(self, logfile, echofile):
+        with open(echofile, 'w') as echo:
+            start = time.time()
+            sink = OpTestLogger.ConsoleLogSink(logfile, echo=echo)
+            self.feed(lambda d: (sink.write(d), sink.flush()))
+            sink.close()
+            return time.time() - start
+
+    def lines(self, filename):
+        # threads interleave differently on each run, compare the content
+        with open(filename) as f:
+            return sorted(f.read().split("\n"))
+
+    def runTest(self):
+        total = 0
+        for n in range(self.threads):
+            chunks = self.chunks_for(n)
+            total += sum(len(chunks[i % len(chunks)]) for i in range(self.chunks))
+
+        files = dict((k, os.path.join(self.tmpdir, k))
+                     for k in ("pipeline.log", "pipeline.out", "sink.log", "sink.out"))
+        pipeline_time = self.run_pipeline(files["pipeline.log"], files["pipeline.out"])
+        sink_time = self.run_sink(files["sink.log"], files["sink.out"])
+
+        log.info("ConsoleLogThroughput {:.1f} MB from {} threads pipeline={:.2f} MB/s"
+                 " sink={:.2f} MB/s speedup={:.2f}x"
+                 .format(total / 1e6, self.threads,
+                         total / pipeline_time / 1e6,
+                         total / sink_time / 1e6,
+                         pipeline_time / sink_time))
+        self.assertEqual(os.path.getsize(files["sink.log"]), total)
+        self.assertEqual(self.lines(files["pipeline.log"]), self.lines(files["sink.log"]),
+                         "Log file differs from the tee pipeline")
+        self.assertEqual(self.lines(files["pipeline.out"]), self.lines(files["sink.out"]),
+                         "Echo differs from the sed | cat -v pipeline")
+
+
+class SlowEcho(object):
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.data = []
+
+    def write(self, data):
+        time.sleep(self.seconds)
+        self.data.append(data)
+
+    def flush(self):
+        pass
+
+
+class ConsoleLogRotation(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-console-log-")
+        self.logfile = os.path.join(self.tmpdir, "console.log")
+        self.chunks = ["{:04d}".format(i) * 250 for i in range(40)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def write_all(self, sink):
+        for chunk in self.chunks:
+            sink.write(chunk)
+            # one chunk at a time to the writer, so rotation is per chunk
+            sink.sync()
+        sink.close()
+
+    def read(self, name):
+        with open(os.path.join(self.tmpdir, name)) as f:
+            return f.read()
+
+    def test_rotate(self):
+        self.write_all(OpTestLogger.ConsoleLogSink(self.logfile, max_bytes=5000, backup_count=3))
+        self.assertEqual(sorted(os.listdir(self.tmpdir)),
+                         ["console.log", "console.log.1", "console.log.2", "console.log.3"])
+        # five 1000 byte chunks a file, the oldest beyond .3 gone
+        kept = "".join(self.read(name) for name in
+                       ["console.log.3", "console.log.2", "console.log.1", "console.log"])
+        self.assertEqual(kept, "".join(self.chunks[-20:]))
+        self.assertEqual(len(self.read("console.log")), 5000)
+
+    def test_no_backups(self):
+        # like RotatingFileHandler, no backups means never roll over
+        with open(self.logfile, 'w') as f:
+            f.write("from before\n")
+        self.write_all(OpTestLogger.ConsoleLogSink(self.logfile, max_bytes=5000, backup_count=0))
+        self.assertEqual(os.listdir(self.tmpdir), ["console.log"])
+        self.assertEqual(self.read("console.log"), "from before\n" + "".join(self.chunks))
+
+    def test_slow_echo(self):
+        echo = SlowEcho(0.01)
+        sink = OpTestLogger.ConsoleLogSink(self.logfile, echo=echo)
+        sink.max_pending = 3000
+        backlog = []
+        for chunk in self.chunks:
+            sink.write(chunk)
+            sink.flush()
+            backlog.append(sink.queued - sink.written)
+        sink.close()
+        log.info("ConsoleLogRotation slow echo backlog at most {} bytes".format(max(backlog)))
+        self.assertLessEqual(max(backlog), sink.max_pending + len(self.chunks[0]))
+        self.assertEqual("".join(echo.data), "".join(self.chunks))
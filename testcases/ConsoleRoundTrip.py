@@ -0,0 +1,188 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+'''
+Console Round Trip
+------------------
+
+Micro-benchmark of `run_command` on the system console, comparing the
+classic mode (command, then a separate ``echo $?``) against the single
+round trip mode (see ``--single-round-trip``) where output, sentinel and
+exit code all come back in one response.
+
+Also checks that both modes give identical output and `CommandFailed`
+results, so the faster mode can be trusted as a drop-in replacement.
+
+ConsoleRoundTripShell makes the same comparison against a local ``sh``
+for the commands the appended sentinel could trip over: a background
+job whose "Done" notice comes before the prompt, a trailing comment, a
+heredoc and commands left open by a trailing ``|``, ``&&`` or ``\``.
+'''
+
+import unittest
+import os
+import time
+import pexpect
+
+import OpTestConfiguration
+from common.OpTestSystem import OpSystemState
+from common.Exceptions import CommandFailed
+from common.OpTestUtil import OpTestUtil
+
+import logging
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+
+class ConsoleRoundTrip(unittest.TestCase):
+    iterations = 50
+    commands = ["true",
+                "echo hello",
+                "printf no-newline",
+                "seq 1 20",
+                "false",
+                "ls /does/not/exist"]
+
+    def setUp(self):
+        conf = OpTestConfiguration.conf
+        self.cv_BMC = conf.bmc()
+        self.cv_SYSTEM = conf.system()
+
+    def run_all(self, console):
+        results = []
+        for cmd in self.commands:
+            try:
+                results.append((cmd, 0, console.run_command(cmd)))
+            except CommandFailed as cf:
+                results.append((cmd, cf.exitcode, cf.output))
+        return results
+
+    def commands_per_second(self, console):
+        start = time.time()
+        for i in range(self.iterations):
+            console.run_command("true")
+        return self.iterations / (time.time() - start)
+
+    def runTest(self):
+        self.cv_SYSTEM.goto_state(OpSystemState.PETITBOOT_SHELL)
+        console = self.cv_BMC.get_host_console()
+        if not hasattr(console, 'set_single_round_trip'):
+            raise unittest.SkipTest("Console does not support single round trip mode")
+        saved = console.get_single_round_trip()
+        try:
+            console.set_single_round_trip(False)
+            classic_results = self.run_all(console)
+            classic_rate = self.commands_per_second(console)
+            console.set_single_round_trip(True)
+            single_results = self.run_all(console)
+            single_rate = self.commands_per_second(console)
+        finally:
+            console.set_single_round_trip(saved)
+
+        log.info("ConsoleRoundTrip classic={:.2f} cmds/sec single round trip={:.2f}"
+                 " cmds/sec speedup={:.2f}x over {} commands"
+                 .format(classic_rate, single_rate,
+                         single_rate / classic_rate, self.iterations))
+        self.assertEqual(classic_results, single_results,
+                         "Single round trip results differ from classic mode"
+                         " classic={} single={}"
+                         .format(classic_results, single_results))
+
+
+class ShellConsole(object):
+    '''
+    A local shell at the [console-expect]# prompt, enough of a console
+    for OpTestUtil.try_command and try_command_single_trip
+    '''
+    prompt = r"\[console-expect\]#"
+
+    def __init__(self):
+        env = dict(os.environ)
+        env["PS1"] = "[console-expect]#"
+        self.pty = pexpect.spawn("/bin/sh", env=env)
+        self.pty.expect_exact("[console-expect]#")
+
+    def get_console(self):
+        return self.pty
+
+    def close(self):
+        self.pty.close(force=True)
+
+
+class ConsoleRoundTripShell(unittest.TestCase):
+    # seconds for the commands that never finish, either mode times out
+    # and recovers with a control-C
+    open_timeout = 2
+
+    def run_both(self, command, timeout=10, before=None):
+        '''
+        (exit code, output) of command run classic and single round trip,
+        each in a new shell that first runs before
+        '''
+        util = OpTestUtil()
+        results = []
+        for run in [util.try_command, util.try_command_single_trip]:
+            console = ShellConsole()
+            try:
+                if before:
+                    util.try_command(console, before)
+                start = time.time()
+                try:
+                    result = (0, run(console, command, timeout))
+                except CommandFailed as cf:
+                    result = (cf.exitcode, cf.output)
+                results.append((result, time.time() - start))
+            finally:
+                console.close()
+        return results
+
+    def test_background_job(self):
+        # the job's "[1] + Done" notice lands between the sentinel and
+        # the prompt, which is no reason to wait out the timeout
+        (classic, t), (single, seconds) = self.run_both("sleep 1; echo done", before="sleep 0.2 &")
+        self.assertEqual(single, (0, ["done"]))
+        self.assertLess(seconds, 5)
+
+    def test_safe_to_suffix(self):
+        (classic, t), (single, t) = self.run_both("echo one; echo two")
+        self.assertEqual(classic, single)
+        (classic, t), (single, t) = self.run_both("ls /does/not/exist")
+        self.assertEqual(classic[0], single[0])
+        self.assertNotEqual(single[0], 0)
+
+    def test_comment(self):
+        (classic, t), (single, seconds) = self.run_both("echo hello # and a comment")
+        self.assertEqual(single, (0, ["hello"]))
+        self.assertEqual(classic, single)
+        self.assertLess(seconds, 5)
+
+    def test_heredoc(self):
+        (classic, t), (single, seconds) = self.run_both("cat <<EOF\nhello\nEOF")
+        self.assertEqual(single[0], 0)
+        self.assertIn("hello", single[1])
+        self.assertEqual(classic, single)
+        self.assertLess(seconds, 5)
+
+    def test_open_commands(self):
+        for command in ["echo hello |", "true &&", "echo hello \\"]:
+            (classic, t), (single, seconds) = self.run_both(command, timeout=self.open_timeout)
+            # the same failure either way, not one mode hanging on the other's
+            self.assertEqual(classic[0], single[0], command)
+            self.assertNotEqual(single[0], 0, command)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+Console Stream Integrity
+------------------------
+
+Exercise `OpTestConsoleIntegrity` (behind the ``ConsoleStream`` tests in
+`testcases.Console`) against a local shell standing in for the host
+console, with ``hexdump -C -v`` done by a small python filter that can
+drop a line or flip a byte, like a lossy console would.
+
+The target side commands run as they would on petitboot, the dump is
+checked as it streams through the pty, and a verifier only run is timed
+on 128MB of dump to show it keeps nothing but a line.
+
+The stand-in console is ``/bin/sh``, with ``cat`` and ``head`` for the
+target side commands.
+'''
+
+import unittest
+import os
+import sys
+import time
+
+import pexpect
+
+from common import OpTestConsoleIntegrity
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+PROMPT = "[console-expect]#"
+
+# hexdump -C -v, FAULT="drop:<offset>" leaves out a line, "flip:<offset>" a bit
+HEXDUMP = r'''
+import os, sys
+from common.OpTestConsoleIntegrity import dump_line
+fault = os.environ.get("FAULT", "none:-1").split(":")
+fault_at = int(fault[1])
+offset = 0
+out = []
+while True:
+    data = sys.stdin.read(16)
+    if not data:
+        break
+    if fault[0] == "flip" and offset <= fault_at < offset + 16:
+        i = fault_at - offset
+        data = data[:i] + chr(ord(data[i]) ^ 0x10) + data[i + 1:]
+    if not (fault[0] == "drop" and offset <= fault_at < offset + 16):
+        out.append("%08x" % offset + dump_line(offset, data) + "\n")
+    offset += len(data)
+    if len(out) == 1024:
+        sys.stdout.write("".join(out))
+        out = []
+out.append("%08x\n" % offset)
+sys.stdout.write("".join(out))
+'''
+
+
+class StandInConsole(object):
+    def __init__(self, fault=None):
+        env = dict(os.environ)
+        env["PS1"] = PROMPT
+        env["PYTHONPATH"] = os.path.join(os.path.dirname(__file__), "..")
+        if fault:
+            env["FAULT"] = fault
+        self.pty = pexpect.spawn("/bin/sh", env=env)
+        self.pty.setecho(False)
+        self.pty.expect_exact(PROMPT)
+        self.pty.sendline("hexdump() { %s -c '%s'; }" % (sys.executable, HEXDUMP.replace("'", "'\\''")))
+        self.pty.expect_exact(PROMPT)
+
+    def run_command(self, command, timeout=60, retry=0):
+        self.pty.sendline(command)
+        self.pty.expect_exact(PROMPT, timeout=timeout)
+        return [line for line in self.pty.before.replace("\r", "").split("\n") if line]
+
+    def get_console(self):
+        return self.pty
+
+    def close(self):
+        self.pty.close(force=True)
+
+
+class ConsoleStreamIntegrity(unittest.TestCase):
+    size = 4 * 1024 * 1024
+    fault = None
+
+    def setUp(self):
+        self.console = StandInConsole(self.fault)
+
+    def tearDown(self):
+        self.console.close()
+        if os.path.exists(OpTestConsoleIntegrity.PATTERN_FILE):
+            os.remove(OpTestConsoleIntegrity.PATTERN_FILE)
+
+    def check(self, verifier):
+        self.assertTrue(verifier.ok())
+        self.assertEqual(verifier.verified, self.size)
+
+    def runTest(self):
+        verifier, seconds = OpTestConsoleIntegrity.stream_check(self.console, self.size,
+                                                                "\[console-expect\]#")
+        log.info("ConsoleStreamIntegrity {}".format(verifier.report(seconds)))
+        self.check(verifier)
+        # and the console is left at a prompt
+        self.assertEqual(self.console.run_command("echo still here"), ["still here"])
+
+
+class ConsoleStreamDrop(ConsoleStreamIntegrity):
+    '''
+    A missing line is dropped bytes, where it was
+    '''
+    fault = "drop:100000"
+
+    def check(self, verifier):
+        self.assertFalse(verifier.ok())
+        self.assertEqual((verifier.dropped, verifier.first_dropped), (16, 100000 / 16 * 16))
+        self.assertEqual((verifier.corrupted, verifier.first_corrupt), (0, None))
+        self.assertEqual(verifier.end, self.size)
+
+
+class ConsoleStreamFlip(ConsoleStreamIntegrity):
+    '''
+    A flipped bit is one corrupted byte, at the offset it was in
+    '''
+    fault = "flip:123457"
+
+    def check(self, verifier):
+        self.assertFalse(verifier.ok())
+        self.assertEqual((verifier.corrupted, verifier.first_corrupt), (1, 123457))
+        self.assertEqual((verifier.dropped, verifier.bad_lines), (0, 1))
+        self.assertEqual(verifier.verified, self.size - 1)
+
+
+class HexdumpVerifierScale(unittest.TestCase):
+    '''
+    128MB of dump through the verifier alone, it must keep
+    no more than a partial line however it's fed.
+    '''
+    size = 128 * 1024 * 1024
+
+    def runTest(self):
+        bodies = [OpTestConsoleIntegrity.dump_line(n * 16, OpTestConsoleIntegrity.pattern(n * 16, 16))
+                  for n in range(OpTestConsoleIntegrity.PRIME)]
+        verifier = OpTestConsoleIntegrity.HexdumpVerifier(self.size)
+        offset = 0
+        start = time.time()
+        while offset < self.size:
+            chunk = "".join("%08x%s\r\n" % (o, bodies[(o / 16) % len(bodies)])
+                            for o in range(offset, min(offset + 64 * 1024, self.size), 16))
+            # uneven pieces, split mid line
+            verifier.feed(chunk[:1000])
+            verifier.feed(chunk[1000:])
+            self.assertLess(len(verifier.partial), 100)
+            offset = min(offset + 64 * 1024, self.size)
+        verifier.feed("%08x\r\n%s" % (offset, PROMPT))
+        seconds = time.time() - start
+        log.info("HexdumpVerifierScale {}".format(verifier.report(seconds)))
+        self.assertTrue(verifier.ok(), verifier.report(seconds))
+        self.assertEqual(verifier.trailer, PROMPT)
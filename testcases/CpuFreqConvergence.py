@@ -0,0 +1,149 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+CPU Frequency Convergence
+-------------------------
+
+`testcases.OpTestEM.OpTestEM.sample_cpus` sets a frequency and samples
+every CPU in one loop on the target, giving how long each CPU took to
+get there (`testcases.OpTestEM.CpuSamples`).
+
+On the `testcases.SysfsSnapshot` stand-in, a thread plays the cpufreq
+driver: each CPU's ``cpuinfo_cur_freq`` follows its ``scaling_setspeed``
+after a delay of 0 to 210ms depending on the CPU, or never for a stuck
+one. A DVFS sweep is checked to take a command per frequency and report
+the spread of delays, and a stuck CPU to be named.
+'''
+
+import unittest
+import os
+import threading
+import time
+
+from testcases.SysfsSnapshot import StandInSysfs, NR_CPUS
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+
+class StandInCpufreq(threading.Thread):
+    def __init__(self, cpu_dir, delays):
+        super(StandInCpufreq, self).__init__()
+        self.daemon = True
+        self.cpu_dir = cpu_dir
+        self.delays = delays
+        self.stop = threading.Event()
+
+    def read(self, cpu, name):
+        with open(os.path.join(self.cpu_dir, "cpu%d" % cpu, "cpufreq", name)) as f:
+            return f.read().strip()
+
+    def run(self):
+        requested = {}
+        while not self.stop.is_set():
+            now = time.time()
+            for cpu, delay in self.delays.items():
+                setspeed = self.read(cpu, "scaling_setspeed")
+                if requested.get(cpu, (None,))[0] != setspeed:
+                    requested[cpu] = (setspeed, now)
+                if delay is None or now - requested[cpu][1] < delay:
+                    continue
+                if self.read(cpu, "cpuinfo_cur_freq") != setspeed:
+                    # in one go, as sysfs reads are, never an empty file
+                    path = os.path.join(self.cpu_dir, "cpu%d" % cpu, "cpufreq", "cpuinfo_cur_freq")
+                    with open(path + ".new", 'w') as f:
+                        f.write(setspeed + "\n")
+                    os.rename(path + ".new", path)
+            time.sleep(0.002)
+
+
+class CpuFreqConvergence(StandInSysfs, unittest.TestCase):
+    stuck = []
+
+    def setUp(self):
+        super(CpuFreqConvergence, self).setUp()
+        delays = dict((cpu, (cpu % 8) * 0.03) for cpu in range(NR_CPUS))
+        for cpu in self.stuck:
+            delays[cpu] = None
+        self.cpufreq = StandInCpufreq(self.cpu, delays)
+        self.cpufreq.start()
+
+    def tearDown(self):
+        self.cpufreq.stop.set()
+        self.cpufreq.join()
+        super(CpuFreqConvergence, self).tearDown()
+
+    def runTest(self):
+        result = self.dvfs_sweep(["3800000", "3300000"], samples=200, interval=0.02)
+        log.info("CpuFreqConvergence {}".format(result))
+        self.assertEqual(len(self.c.commands), 2)
+        for freq, distribution in result.items():
+            self.assertEqual((distribution['cpus'], distribution['converged']), (NR_CPUS, NR_CPUS))
+            # the 210ms spread of delays shows, give or take uptime's 10ms
+            # and the stand-in's polling. min itself isn't bounded: it is
+            # when the first sample after CPU0's change ran, which on a
+            # busy machine is whenever the shell loop and the stand-in's
+            # pass over every CPU got to run
+            self.assertGreater(distribution['max'] - distribution['min'], 0.1)
+            self.assertGreater(distribution['max'], 0.18)
+            self.assertLessEqual(distribution['median'], distribution['p90'])
+
+        # already there, a single sample does
+        samples = self.sample_cpus(until="3300000")
+        self.assertEqual(len(samples.samples), 1)
+        self.assertEqual(dict(samples.final()), {"3300000": NR_CPUS})
+
+        # within 1% of one of a list, on CPU0; with the driver stopped, so
+        # what's written here stays
+        self.cpufreq.stop.set()
+        self.cpufreq.join()
+        for cpu in range(NR_CPUS):
+            self.write("cpu%d/cpufreq/cpuinfo_cur_freq" % cpu, "3290000")
+        self.write("cpu5/cpufreq/cpuinfo_cur_freq", "2000000")
+        commands = len(self.c.commands)
+        self.verify_cpu_freq_almost(["3800000", "3300000"])
+        with self.assertRaises(AssertionError):
+            self.verify_cpu_freq_almost("3800000")
+        self.assertEqual(len(self.c.commands), commands + 2)
+        # or on every CPU, when asked
+        with self.assertRaises(AssertionError):
+            self.verify_cpu_freq_almost(["3800000", "3300000"], all_cpus=True)
+        self.write("cpu5/cpufreq/cpuinfo_cur_freq", "3300000")
+        self.verify_cpu_freq_almost(["3800000", "3300000"], all_cpus=True)
+
+
+class CpuFreqConvergenceStuck(CpuFreqConvergence):
+    '''
+    A CPU that never changes frequency fails the sweep by name, after
+    all the samples.
+    '''
+    stuck = [100]
+
+    def runTest(self):
+        with self.assertRaises(AssertionError) as e:
+            self.dvfs_sweep(["3800000"], samples=20, interval=0.02)
+        self.assertIn("on CPUs [100]: ['2166000']", str(e.exception))
+        samples = self.sample_cpus(samples=5, interval=0.01)
+        convergence = samples.convergence(["3800000"])
+        self.assertEqual(samples.unconverged(convergence), [100])
+        self.assertEqual(samples.distribution(convergence)['converged'], NR_CPUS - 1)
+        self.assertEqual(dict(samples.final()), {"3800000": NR_CPUS - 1, "2166000": 1})
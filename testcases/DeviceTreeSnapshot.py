@@ -0,0 +1,205 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+Device Tree Snapshot
+--------------------
+
+`testcases.DeviceTreeValidation` reads the device tree from an
+`OpTestDeviceTree` snapshot, taken in one command per boot, rather than
+a command per property.
+
+A local shell stands in for the target with a POWER9 like
+``/proc/device-tree`` (power-mgt, firmware versions) in a temporary
+directory. The validations are run on the snapshot, the values checked
+against the ``hexdump`` a property at a time reads, and a target that
+can't make a snapshot to fall back to those.
+
+The local shell needs ``tar``, ``gzip`` and ``base64`` for the snapshot;
+without ``hexdump`` the property reads fall back to ``od``.
+'''
+
+import unittest
+import os
+import shutil
+import struct
+import tempfile
+
+import pexpect
+
+from common import OpTestDeviceTree
+from common.Exceptions import CommandFailed
+from testcases import DeviceTreeValidation
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+PROMPT = "[console-expect]#"
+
+# the hexdump formats dt_prop_read_u{32,64}_arr use, from od, where there's
+# no hexdump
+HEXDUMP = ("command -v hexdump >/dev/null || hexdump() { case \"$3\" in "
+           "1/4*) od -An -v -tx4 -w4 \"$4\" | tr -d ' ' ;; "
+           "*) od -An -v -tx4 -w8 \"$4\" | tr -d ' ' ;; esac; }")
+
+DT = {"ibm,opal/power-mgt/ibm,cpu-idle-state-names": "stop0_lite\0stop1_lite\0stop2\0",
+      "ibm,opal/power-mgt/ibm,cpu-idle-state-flags": struct.pack(">3I", 0x100000, 0x100000, 0x101000),
+      "ibm,opal/power-mgt/ibm,cpu-idle-state-latencies-ns": struct.pack(">3I", 1000, 4000, 20000),
+      "ibm,opal/power-mgt/ibm,cpu-idle-state-residency-ns": struct.pack(">3I", 10000, 40000, 200000),
+      "ibm,opal/power-mgt/ibm,cpu-idle-state-psscr": struct.pack(">3Q", 0x300330, 0x300331, 0x300332),
+      "ibm,opal/power-mgt/ibm,cpu-idle-state-psscr-mask": struct.pack(">3Q", 0xf, 0xf, 0x3003ff),
+      "ibm,opal/power-mgt/ibm,pstate-ids": struct.pack(">10I", *range(10)),
+      "ibm,opal/power-mgt/ibm,pstate-min": struct.pack(">I", 9),
+      "ibm,opal/power-mgt/ibm,pstate-max": struct.pack(">I", 0),
+      "ibm,opal/power-mgt/ibm,pstate-nominal": struct.pack(">I", 2),
+      "ibm,opal/power-mgt/ibm,pstate-turbo": struct.pack(">I", 1),
+      "ibm,opal/power-mgt/ibm,pstate-ultra-turbo": struct.pack(">I", 0),
+      "ibm,opal/power-mgt/ibm,pstate-frequencies-mhz": struct.pack(">10I", *range(3800, 2800, -100)),
+      "ibm,opal/power-mgt/name": "power-mgt\0",
+      "ibm,opal/sensors/name": "sensors\0",
+      "ibm,opal/compatible": "ibm,opal-v3\0",
+      "ibm,opal/odd": "\x01\x02\x03\x04\x05",
+      "ibm,firmware-versions/version": "witherspoon-v2.1\0",
+      "ibm,firmware-versions/skiboot": "v6.1\0",
+      "cpus/name": "cpus\0"}
+
+
+class StandInConsole(object):
+    '''
+    A shell whose /proc/device-tree is under root, counting commands
+    '''
+    def __init__(self, root, init=None):
+        self.root = root
+        self.commands = []
+        env = dict(os.environ)
+        env["PS1"] = PROMPT
+        self.pty = pexpect.spawn("/bin/sh", env=env)
+        self.pty.setecho(False)
+        self.pty.expect_exact(PROMPT)
+        for command in [HEXDUMP] + ([init] if init else []):
+            self.pty.sendline(command)
+            self.pty.expect_exact(PROMPT)
+
+    def run_command(self, command, timeout=60, retry=0):
+        self.commands.append(command)
+        self.pty.sendline(command.replace("/proc/device-tree", self.root))
+        self.pty.expect_exact(PROMPT, timeout=timeout)
+        return self.pty.before.replace("\r", "").split("\n")[:-1]
+
+    def close(self):
+        self.pty.close(force=True)
+
+
+class StandInHost(object):
+    def host_get_proc_gen(self, console=0):
+        return "POWER9"
+
+
+class DeviceTreeSnapshot(DeviceTreeValidation.DeviceTreeValidation):
+    init = None
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-dt-")
+        for name, value in DT.items():
+            path = os.path.join(self.tmpdir, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as f:
+                f.write(value)
+        self.c = StandInConsole(self.tmpdir, self.init)
+        self.cv_HOST = StandInHost()
+        self.bmc_type = "OpenBMC"
+        self.node = "/proc/device-tree/ibm,opal/"
+        OpTestDeviceTree.snapshots.clear()
+
+    def tearDown(self):
+        self.c.close()
+        shutil.rmtree(self.tmpdir)
+        OpTestDeviceTree.snapshots.clear()
+
+    def validate(self):
+        self.validate_idle_state_properties()
+        self.validate_pstate_properties()
+        self.validate_firmware_version()
+        return (self.dt_prop_read_str_arr("ibm,opal/power-mgt/ibm,cpu-idle-state-names"),
+                self.dt_prop_read_u32_arr("ibm,opal/power-mgt/ibm,pstate-frequencies-mhz"),
+                self.dt_prop_read_u32_arr("/ibm,opal/power-mgt/ibm,pstate-turbo"),
+                self.dt_prop_read_u64_arr("ibm,opal/power-mgt/ibm,cpu-idle-state-psscr-mask"))
+
+    def runTest(self):
+        names, freqs, turbo, masks = self.validate()
+        # the boot_id and the snapshot, that's all
+        self.assertEqual(len(self.c.commands), 2)
+        self.assertEqual(names, ["stop0_lite", "stop1_lite", "stop2"])
+        self.assertEqual(turbo, ["00000001"])
+        self.assertEqual(masks, ["000000000000000f", "000000000000000f", "00000000003003ff"])
+
+        # typed accessors
+        dt = self.dt_snapshot()
+        self.assertEqual(dt.u32_arr("ibm,opal/power-mgt/ibm,pstate-frequencies-mhz"),
+                         range(3800, 2800, -100))
+        self.assertEqual(dt.u32("/proc/device-tree/ibm,opal/power-mgt/ibm,pstate-nominal"), 2)
+        self.assertFalse(dt.covers("cpus/name"))
+        self.assertFalse(dt.has("ibm,opal/power-mgt/ibm,nothing"))
+
+        # the same values as a property at a time, which a new boot
+        # (another boot_id) doesn't get from the snapshot either
+        self.assertEqual(len(OpTestDeviceTree.snapshots), 1)
+        self.dt_cache = (self.c, None)
+        commands = len(self.c.commands)
+        self.assertEqual(self.dt_prop_read_u32_arr("ibm,opal/power-mgt/ibm,pstate-frequencies-mhz"),
+                         freqs)
+        self.assertEqual(self.dt_prop_read_u64_arr("ibm,opal/power-mgt/ibm,cpu-idle-state-psscr-mask"),
+                         masks)
+        self.assertEqual(len(self.c.commands), commands + 2)
+
+        # nodes for check_dt_matches, keyed as find prints them
+        self.dt_cache = None
+        props = self.dt_node_props()
+        self.assertEqual(sorted(props), ["/proc/device-tree/ibm,opal/",
+                                         "/proc/device-tree/ibm,opal/power-mgt",
+                                         "/proc/device-tree/ibm,opal/sensors"])
+        self.assertEqual(props["/proc/device-tree/ibm,opal/"],
+                         ['compatible: "ibm,opal-v3"', "odd: 01020304 05"])
+        self.assertIn("ibm,pstate-max: 00000000", props["/proc/device-tree/ibm,opal/power-mgt"])
+        # still the one snapshot of this boot
+        self.assertEqual(len(OpTestDeviceTree.snapshots), 1)
+
+        # a missing property is CommandFailed, as it was
+        with self.assertRaises(CommandFailed):
+            self.dt_prop_read_u32_arr("ibm,opal/power-mgt/ibm,nothing")
+
+
+class DeviceTreeSnapshotFallback(DeviceTreeSnapshot):
+    '''
+    Without base64 there's no snapshot, each property is read on its own
+    '''
+    init = "base64() { return 127; }"
+
+    def runTest(self):
+        self.assertIsNone(self.dt_snapshot())
+        # the one failed snapshot is not retried for every property
+        self.assertEqual(self.dt_prop_read_u32_arr("ibm,opal/power-mgt/ibm,pstate-turbo"),
+                         ["00000001"])
+        self.assertEqual(self.dt_prop_read_u64_arr("ibm,opal/power-mgt/ibm,cpu-idle-state-psscr"),
+                         ["0000000000300330", "0000000000300331", "0000000000300332"])
+        self.assertEqual(len(self.c.commands), 2 + 2)
+        self.assertEqual(OpTestDeviceTree.snapshots, {})
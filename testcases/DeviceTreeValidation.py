@@ -42,6 +42,7 @@ from common.OpTestError import OpTestError
 from common.OpTestSystem import OpSystemState
 from common.OpTestConstants import OpTestConstants as BMC_CONST
 import common.OpTestQemu as OpTestQemu
+from common import OpTestDeviceTree
 import logging
 import OpTestLogger
 log = OpTestLogger.optest_logger_glob.get_logger(__name__)
@@ -49,6 +50,10 @@ log = OpTestLogger.optest_logger_glob.get_logger(__name__)
 MAX_PSTATES = 256
 CPUIDLE_STATE_MAX = 10
 
+# What's snapshot (once a boot) for the dt_prop_read_* and the checks,
+# anything else is read a property at a time
+DT_SNAPSHOT_PATHS = ("ibm,opal", "ibm,firmware-versions")
+
 # We use some globals to keep state between IPLs
 # Which means we can save an IPL in running full test suite
 prop_val_pair_skiroot = {}
@@ -97,7 +102,33 @@ class DeviceTreeValidation(unittest.TestCase):
     def swap64(self, i):
         return struct.unpack("<Q", struct.pack(">Q", i))[0]
 
+    def dt_snapshot(self):
+        '''
+        The OpTestDeviceTree.DeviceTree (of DT_SNAPSHOT_PATHS) of where
+        self.c is, None if it can't be had
+        '''
+        cached = getattr(self, 'dt_cache', None)
+        if cached is None or cached[0] is not self.c:
+            self.dt_cache = (self.c, OpTestDeviceTree.snapshot(self.c, DT_SNAPSHOT_PATHS))
+        return self.dt_cache[1]
+
+    def dt_snapshot_prop(self, prop):
+        '''
+        The snapshot if prop is in what it covers, raising CommandFailed
+        as reading it would if it's not there, None if we have to read it
+        '''
+        dt = self.dt_snapshot()
+        if dt is None or not dt.covers(prop):
+            return None
+        if not dt.has(prop):
+            raise CommandFailed("lsprop /proc/device-tree/%s" % prop,
+                                ["No such property in the device tree snapshot"], 1)
+        return dt
+
     def dt_prop_read_str_arr(self, prop):
+        dt = self.dt_snapshot_prop(prop)
+        if dt is not None:
+            return dt.str_arr(prop)
         res = self.c.run_command("lsprop /proc/device-tree/%s" % prop)
         if "bytes total" in "".join(res):
             res = res[1:-1]
@@ -110,6 +141,9 @@ class DeviceTreeValidation(unittest.TestCase):
         return list
 
     def dt_prop_read_u32_arr(self, prop):
+        dt = self.dt_snapshot_prop(prop)
+        if dt is not None:
+            return ["{:08x}".format(v) for v in dt.u32_arr(prop)]
         res = self.c.run_command("hexdump -v -e \'1/4 \"%%08x\" \"\\n\"\'  "
                                  "/proc/device-tree/%s" % prop)
         list = []
@@ -119,11 +153,17 @@ class DeviceTreeValidation(unittest.TestCase):
         return list
 
     def dt_prop_read_u64_arr(self, prop):
+        dt = self.dt_snapshot_prop(prop)
+        if dt is not None:
+            return ["{:016x}".format(v) for v in dt.u64_arr(prop)]
         res = self.c.run_command("hexdump -v -e \'2/4 \"%%08x\" \"\\n\"\'  "
                                  "/proc/device-tree/%s" % prop)
         list = []
         for line in res:
-            val = ("{:016x}".format(self.swap64(int(line, 16))))
+            # hexdump gives two 32 bit words, each in (little endian)
+            # host order, swap64 of the lot would swap the words too
+            val = ("{:08x}{:08x}".format(self.swap32(int(line[:8], 16)),
+                                         self.swap32(int(line[8:16], 16))))
             list.append(val)
         return list
 
@@ -246,13 +286,20 @@ class DeviceTreeValidation(unittest.TestCase):
 
         if self.cv_HOST.host_get_proc_gen() not in ["POWER8", "POWER8E"]:
             try:
-                self.c.run_command("ls --color=never %s/version" % fw_node)
                 version = self.dt_prop_read_str_arr("ibm,firmware-versions/version")
                 if not version:
                     raise OpTestError("DT: Firmware version property is empty")
             except CommandFailed:
                 raise OpTestError("DT: Firmware version property is missing")
 
+        dt = self.dt_snapshot()
+        if dt is not None:
+            for node in dt.children(fw_node):
+                for prop, value in dt.props(node).items():
+                    if not value:
+                        raise OpTestError("DT: Firmware component (%s/%s) is empty" % (node, prop))
+            return
+
         props = self.c.run_command("find %s -type f" % fw_node)
         for prop in props:
             val = self.c.run_command("lsprop %s" % prop)
@@ -393,6 +440,28 @@ class DeviceTreeValidation(unittest.TestCase):
             else:
                 log.debug("DT Diff success")
 
+    def dt_node_props(self):
+        '''
+        A list of property lines for self.node and every node below it,
+        keyed by their /proc/device-tree path, for check_dt_matches.
+        Lines from a snapshot only compare with lines from a snapshot, as
+        skiroot and the host both have tar, gzip and base64 they match.
+        '''
+        dt = self.dt_snapshot()
+        if dt is None:
+            props = self.c.run_command("find %s -type d" % self.node)
+            # Not all distros consistently output lsprop (-R) so make it consistent
+            # Otherwise we get mismatches which get flagged as failures
+            # https://github.com/ibm-power-utilities/powerpc-utils
+            return dict((prop, self.c.run_command("lsprop -R %s" % prop)) for prop in props)
+        result = {}
+        for node in dt.children(self.node):
+            # keyed as find would print them
+            path = self.node if node == OpTestDeviceTree.node_path(self.node) \
+                else OpTestDeviceTree.PROC_DT + node
+            result[path] = dt.lines(node)
+        return result
+
     def runTest(self):
         self.skipTest("Not meant to be run directly. "
                       "Run skiroot/host variants")
@@ -419,12 +488,7 @@ class DeviceTreeValidationSkiroot(DeviceTreeValidation):
 
         # Validate ibm,opal node DT content at skiroot against host
         # We can extend for other nodes as well, which are suspicieous.
-        props = self.c.run_command("find %s -type d" % self.node)
-        for prop in props:
-            # Not all distros consistently output lsprop (-R) so make it consistent
-            # Otherwise we get mismatches which get flagged as failures
-            # https://github.com/ibm-power-utilities/powerpc-utils
-            prop_val_pair_skiroot[prop] = self.c.run_command("lsprop -R %s" % prop)
+        prop_val_pair_skiroot.update(self.dt_node_props())
 
         self.check_dt_matches()
 
@@ -444,11 +508,6 @@ class DeviceTreeValidationHost(DeviceTreeValidation):
         self.validate_pstate_properties()
         self.validate_firmware_version()
 
-        props = self.c.run_command("find %s -type d" % self.node)
-        for prop in props:
-            # Not all distros consistently output lsprop (-R) so make it consistent
-            # Otherwise we get mismatches which get flagged as failures
-            # https://github.com/ibm-power-utilities/powerpc-utils
-            prop_val_pair_host[prop] = self.c.run_command("lsprop -R %s" % prop)
+        prop_val_pair_host.update(self.dt_node_props())
 
         self.check_dt_matches()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+'''
+Install Hosts
+-------------
+
+Installs the OS of ``--os-repo`` or ``--os-cdrom`` on the host and on the
+hosts of the ``--install-hosts`` configuration files all at once, with
+`OpTestInstallUtil.InstallOrchestrator`: the install files are extracted
+once and one web server gives each host its own kickstart (or preseed).
+
+Each of those files is an op-test configuration file, as for ``-c``, for
+one more machine: its BMC, ``--host-ip``/``--host-user``/``--host-password``
+and the ``--host-{name,mac,gateway,submask,dns}`` and
+``--host-scratch-disk`` install options. The OS and the ISO cache are
+this run's.
+'''
+
+import unittest
+import os
+
+import OpTestConfiguration
+from common.OpTestSystem import OpSystemState
+from common import OpTestInstallUtil
+
+import logging
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+
+class InstallHosts(unittest.TestCase):
+    '''
+    :param parallel: how many hosts to install at a time, all by default
+    '''
+    parallel = None
+
+    def setUp(self):
+        self.conf = OpTestConfiguration.conf
+        if not (self.conf.args.os_repo or self.conf.args.os_cdrom):
+            self.fail("Provide installation media for installation with --os-repo or --os-cdrom")
+        media = (self.conf.args.os_repo or self.conf.args.os_cdrom).lower()
+        self.distro = "rhel"
+        for distro in ["ubuntu", "hostos"]:
+            if distro in media:
+                self.distro = distro
+        install_hosts = self.conf.args.install_hosts
+        if isinstance(install_hosts, basestring):
+            # from a configuration file
+            install_hosts = install_hosts.split()
+        self.confs = [self.conf] + [self.host_conf(f) for f in install_hosts]
+        names = [conf.args.host_name or conf.args.host_ip for conf in self.confs]
+        if len(set(names)) != len(names):
+            self.fail("Give each host its own --host-name, not {}".format(" ".join(names)))
+        for conf in self.confs:
+            args = conf.args
+            if not (args.host_ip and args.host_gateway and args.host_dns
+                    and args.host_submask and args.host_mac):
+                self.fail("Provide host network details for {} refer, --host-{{ip,gateway,dns,submask,mac}}"
+                          .format(args.host_name or args.host_ip))
+            if not (args.host_user and args.host_password):
+                self.fail("Provide host user details for {} refer, --host-{{user,password}}"
+                          .format(args.host_name or args.host_ip))
+            if not conf.host().get_scratch_disk():
+                self.fail("Provide proper host disk to install on {} refer, --host-scratch-disk"
+                          .format(args.host_name or args.host_ip))
+
+    def host_conf(self, config_file):
+        '''
+        The OpTestConfiguration of one of the --install-hosts, logging
+        under this run's output directory
+        '''
+        conf = OpTestConfiguration.OpTestConfiguration()
+        conf.parse_args(["-c", config_file, "--output", self.conf.output,
+                         "--suffix", os.path.splitext(os.path.basename(config_file))[0]])
+        conf.objs()
+        return conf
+
+    def runTest(self):
+        if self.conf.args.no_os_reinstall:
+            self.skipTest("--no-os-reinstall set, not trying to run install OS test")
+        base_path = os.path.join(self.conf.basedir, "osimages", self.distro)
+        boot_path, vmlinux, initrd, ks = OpTestInstallUtil.INSTALL_FILES[self.distro]
+
+        # every host needs its network up in petitboot, and this one finds our address
+        my_ip = None
+        for conf in reversed(self.confs):
+            conf.system().goto_state(OpSystemState.PETITBOOT_SHELL)
+            my_ip = OpTestInstallUtil.InstallUtil(base_path=base_path, vmlinux=vmlinux,
+                                                  initrd=initrd, ks=ks, boot_path=boot_path,
+                                                  conf=conf).get_server_ip()
+        if not my_ip:
+            self.fail("Unable to get the ip from host")
+
+        orchestrator = OpTestInstallUtil.InstallOrchestrator(
+            base_path, vmlinux, initrd, ks, boot_path, repo=self.conf.args.os_repo,
+            cdrom=self.conf.args.os_cdrom)
+        for conf in self.confs:
+            orchestrator.add_target(OpTestInstallUtil.InstallTarget.from_conf(conf))
+        orchestrator.run(my_ip, parallel=self.parallel)
+        log.info("InstallHosts\n{}".format(orchestrator.report()))
+        self.assertEqual(orchestrator.failed(), [],
+                         "Install failed on {}\n{}".format(", ".join(orchestrator.failed()),
+                                                           orchestrator.report()))
@@ -0,0 +1,273 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+Install Orchestrator
+--------------------
+
+`OpTestInstallUtil.InstallOrchestrator` installs a number of systems at
+once from one set of extracted install files and one web server, each
+host getting its own kickstart.
+
+Here the systems are stand-ins: their petitboot shell really wgets the
+vmlinux and initrd from the server and their "installer" fetches its
+kickstart and prints the RHEL installer milestones, taking a second or
+so. The kickstarts are checked to carry each host's disk and password,
+the installs to have overlapped and a stand-in that never finishes
+installing to be reported without holding up the others.
+
+The web server listens on a free port on all interfaces.
+'''
+
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+import time
+import urllib2
+
+import pexpect
+
+from common import OpTestInstallUtil
+from common.OpTestSystem import OpSystemState
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+# argv: kernel args, where to save the kickstart, seconds per milestone, finish
+INSTALLER = r'''
+import sys, time, urllib2
+sys.stdin.readline()
+print "Starting new kernel"
+url = [a for a in sys.argv[1].split() if a.startswith("inst.ks=")][0][len("inst.ks="):]
+with open(sys.argv[2], "w") as f:
+    f.write(urllib2.urlopen(url).read())
+for milestone in ["Starting installer",
+                  "Starting package installation process",
+                  "Performing post-installation setup tasks"]:
+    time.sleep(float(sys.argv[3]))
+    print milestone
+if sys.argv[4] == "yes":
+    print "Running post-installation scripts"
+    print "reboot: Restarting system"
+sys.stdin.readline()
+'''
+
+
+class StandInConsole(object):
+    def __init__(self, system):
+        self.system = system
+        self.pty = None
+
+    def run_command(self, command, timeout=60, retry=0):
+        self.system.commands.append(command)
+        if command.startswith("wget "):
+            url = command.split()[1]
+            data = urllib2.urlopen(url, timeout=timeout).read()
+            self.system.downloads[url.split('/')[-1]] = data
+        elif command.startswith("kexec "):
+            self.system.kernel_args = command.split('"')[1]
+        elif command.startswith("blkid "):
+            return ['/dev/sda2: UUID="{}-uuid"'.format(self.system.name)]
+        return []
+
+    def get_console(self):
+        if self.pty is None:
+            self.pty = pexpect.spawn(sys.executable,
+                                     ["-u", "-c", INSTALLER, self.system.kernel_args,
+                                      self.system.ks_path, str(self.system.pace),
+                                      "yes" if self.system.finish else "no"])
+        return self.pty
+
+    def close(self):
+        if self.pty is not None:
+            self.pty.close(force=True)
+
+
+class StandInSystem(object):
+    def __init__(self, name, ks_path, pace, finish=True):
+        self.name = name
+        self.ks_path = ks_path
+        self.pace = pace
+        self.finish = finish
+        self.commands = []
+        self.downloads = {}
+        self.states = []
+        self.kernel_args = None
+        self.console = StandInConsole(self)
+
+    def goto_state(self, state):
+        self.states.append(state)
+
+    def set_state(self, state):
+        self.states.append(state)
+
+    def sys_set_bootdev_no_override(self):
+        pass
+
+
+class InstallOrchestrator(unittest.TestCase):
+    hosts = 4
+    pace = 0.3
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-install-orchestrator-")
+        self.base_path = os.path.join(self.tmpdir, "osimages", "rhel")
+        os.makedirs(self.base_path)
+        shutil.copy(os.path.join(os.path.dirname(__file__), "..", "osimages", "rhel", "rhel.ks"),
+                    self.base_path)
+        self.repo = os.path.join(self.tmpdir, "repo")
+        os.makedirs(os.path.join(self.repo, "ppc", "ppc64"))
+        self.files = {"vmlinuz": os.urandom(256 * 1024), "initrd.img": os.urandom(1024 * 1024)}
+        for name, data in self.files.items():
+            with open(os.path.join(self.repo, "ppc", "ppc64", name), 'wb') as f:
+                f.write(data)
+        self.globals = (OpTestInstallUtil.BASE_PATH, OpTestInstallUtil.VMLINUX,
+                        OpTestInstallUtil.INITRD, OpTestInstallUtil.KS,
+                        OpTestInstallUtil.BOOTPATH)
+        self.systems = []
+
+    def tearDown(self):
+        for system in self.systems:
+            system.console.close()
+        shutil.rmtree(self.tmpdir)
+
+    def orchestrator(self):
+        return OpTestInstallUtil.InstallOrchestrator(self.base_path, "vmlinuz", "initrd.img",
+                                                     "rhel.ks", "ppc/ppc64", repo=self.repo,
+                                                     settle=0)
+
+    def target(self, orchestrator, i, finish=True):
+        name = "host{}".format(i)
+        system = StandInSystem(name, os.path.join(self.tmpdir, name + ".ks"),
+                               self.pace, finish)
+        self.systems.append(system)
+        orchestrator.add_target(OpTestInstallUtil.InstallTarget(
+            name, system, "10.0.0.{}".format(10 + i), "00:11:22:33:44:{:02x}".format(i),
+            "10.0.0.1", "255.255.255.0", "10.0.0.2", "/dev/sd{}".format("abcdefgh"[i]),
+            password="secret{}".format(i)))
+        return system
+
+    def runTest(self):
+        orchestrator = self.orchestrator()
+        for i in range(self.hosts):
+            self.target(orchestrator, i)
+        start = time.time()
+        results = orchestrator.run("127.0.0.1")
+        elapsed = time.time() - start
+        log.info("InstallOrchestrator {} hosts in {:.2f}s\n{}"
+                 .format(self.hosts, elapsed, orchestrator.report()))
+
+        self.assertEqual(orchestrator.failed(), [])
+        serial = 0
+        for i, system in enumerate(self.systems):
+            result = results[system.name]
+            self.assertEqual(result['state'], "installed")
+            self.assertEqual([step for step, seconds in result['steps']],
+                             ["petitboot", "download", "kexec", "installer",
+                              "bootable", "os"])
+            serial += result['seconds']
+            self.assertEqual(system.downloads, self.files)
+            self.assertIn("inst.ks=http://127.0.0.1:{}/ks/{}/rhel.ks"
+                          .format(orchestrator.port, system.name), system.kernel_args)
+            self.assertIn("ip=10.0.0.{}::".format(10 + i), system.kernel_args)
+            with open(system.ks_path) as f:
+                ks = f.read()
+            self.assertIn("url --url={} ".format(self.repo), ks)
+            self.assertIn("rootpw --plaintext secret{}\n".format(i), ks)
+            self.assertIn("ignoredisk --only-use=/dev/sd{}\n".format("abcdefgh"[i]), ks)
+            self.assertIn("nvram --update-config petitboot,bootdevs=uuid:{}-uuid"
+                          .format(system.name), system.commands)
+            self.assertEqual(system.states[-2:], [OpSystemState.OFF, OpSystemState.OS])
+        # the installs overlapped rather than ran one after the other
+        self.assertLess(elapsed, serial * 0.6)
+        # the server is gone, and InstallUtil's globals were left alone
+        self.assertIsNone(orchestrator.server)
+        self.assertEqual((OpTestInstallUtil.BASE_PATH, OpTestInstallUtil.VMLINUX,
+                          OpTestInstallUtil.INITRD, OpTestInstallUtil.KS,
+                          OpTestInstallUtil.BOOTPATH), self.globals)
+
+
+class InstallOrchestratorStuck(InstallOrchestrator):
+    '''
+    One stand-in's installer never finishes, the others still install
+    and the stuck one is reported as failed at its last milestone.
+    '''
+    hosts = 3
+
+    def runTest(self):
+        orchestrator = self.orchestrator()
+        for i in range(self.hosts):
+            self.target(orchestrator, i)
+        stuck = self.target(orchestrator, self.hosts, finish=False)
+        # the installer timeout is 3000s, keep the wait for it short
+        original = stuck.console.get_console
+
+        def get_console():
+            pty = original()
+            pty.timeout = 5
+            expect = pty.expect
+            pty.expect = lambda pattern, timeout=-1: expect(pattern, timeout=min(timeout, 5))
+            return pty
+        stuck.console.get_console = get_console
+        results = orchestrator.run("127.0.0.1", parallel=2)
+        log.info("InstallOrchestratorStuck\n{}".format(orchestrator.report()))
+
+        self.assertEqual(orchestrator.failed(), [stuck.name])
+        self.assertEqual(results[stuck.name]['state'],
+                         "Performing post-installation setup tasks")
+        self.assertIsInstance(results[stuck.name]['error'], pexpect.TIMEOUT)
+        self.assertIn("FAILED in Performing post-installation setup tasks",
+                      orchestrator.report())
+        for system in self.systems[:-1]:
+            self.assertEqual(results[system.name]['state'], "installed")
+
+
+class InstallKernelArgs(unittest.TestCase):
+    '''
+    The installer command lines InstallOrchestrator and the Install
+    testcases share
+    '''
+    def runTest(self):
+        network = ("00:11:22:33:44:55", "10.0.0.10", "10.0.0.1", "255.255.255.0",
+                   "10.0.0.2", "host0")
+        self.assertEqual(OpTestInstallUtil.kernel_args("rhel", "http://10.0.0.3:80/rhel.ks",
+                                                       *network),
+                         "ifname=net0:00:11:22:33:44:55 ip=10.0.0.10::10.0.0.1:255.255.255.0:"
+                         "host0:net0:none nameserver=10.0.0.2 inst.ks=http://10.0.0.3:80/rhel.ks")
+        ubuntu = OpTestInstallUtil.kernel_args("ubuntu", "http://10.0.0.3:80/preseed.cfg",
+                                               *network, disk="/dev/sda",
+                                               proxy="http://proxy:3128")
+        self.assertTrue(ubuntu.startswith("auto console=hvc0 "))
+        for arg in ["netcfg/get_hostname=host0", "partman-auto/disk=/dev/sda",
+                    "url=http://10.0.0.3:80/preseed.cfg", "netcfg/get_ipaddress=10.0.0.10",
+                    "mirror/http/proxy=http://proxy:3128",
+                    "netcfg/choose_interface=00:11:22:33:44:55",
+                    "BOOTIF=01-00-11-22-33-44-55"]:
+            self.assertIn(arg, ubuntu.split())
+        # no mac (qemu) and no dns
+        ubuntu = OpTestInstallUtil.kernel_args("ubuntu", "http://10.0.0.3:80/preseed.cfg",
+                                               None, "10.0.0.10", "", "", "", "ubuntu",
+                                               disk="/dev/vda")
+        self.assertTrue(ubuntu.endswith(" netcfg/choose_interface=auto"))
+        self.assertNotIn("netcfg/disable_autoconfig=true", ubuntu)
+        self.assertNotIn("BOOTIF", ubuntu)
@@ -90,13 +90,13 @@ class InstallRhel(unittest.TestCase):
 
         if "qemu" not in self.bmc_type:
             ks_url = 'http://%s:%s/%s' % (my_ip, port, ks)
-            kernel_args = "ifname=net0:%s ip=%s::%s:%s:%s:net0:none nameserver=%s inst.ks=%s" % (self.conf.args.host_mac,
-                                                                                                 self.cv_HOST.ip,
-                                                                                                 self.conf.args.host_gateway,
-                                                                                                 self.conf.args.host_submask,
-                                                                                                 self.conf.args.host_name,
-                                                                                                 self.conf.args.host_dns,
-                                                                                                 ks_url)
+            kernel_args = OpTestInstallUtil.kernel_args("rhel", ks_url,
+                                                        self.conf.args.host_mac,
+                                                        self.cv_HOST.ip,
+                                                        self.conf.args.host_gateway,
+                                                        self.conf.args.host_submask,
+                                                        self.conf.args.host_dns,
+                                                        self.conf.args.host_name)
             self.c = self.cv_SYSTEM.console
             cmd = "[ -f %s ]&& rm -f %s;[ -f %s ] && rm -f %s;true" % (vmlinux,
                                                                        vmlinux,
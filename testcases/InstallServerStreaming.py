@@ -0,0 +1,170 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+Install Server Streaming
+------------------------
+
+The `OpTestInstallUtil` web server streams vmlinux, initrd and repo files
+rather than reading them into memory, answers HEAD and byte Range
+requests, and saves uploads to disk as they arrive.
+
+A number of local clients download a large "initrd" concurrently (the
+throughput is logged), partial and HEAD requests are checked, and a
+gcov style upload (LF line endings, no usable Content-Length) is
+compared with what was sent.
+'''
+
+import unittest
+import hashlib
+import httplib
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+from common import OpTestInstallUtil
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+
+class InstallServerStreaming(unittest.TestCase):
+    size = 64 * 1024 * 1024
+    clients = 8
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-install-server-")
+        os.makedirs(os.path.join(self.tmpdir, "repo", "Packages"))
+        self.saved = (OpTestInstallUtil.BASE_PATH, OpTestInstallUtil.VMLINUX,
+                      OpTestInstallUtil.INITRD)
+        OpTestInstallUtil.BASE_PATH = self.tmpdir
+        OpTestInstallUtil.VMLINUX = "vmlinux"
+        OpTestInstallUtil.INITRD = "initrd.img"
+        self.initrd = os.path.join(self.tmpdir, "initrd.img")
+        block = os.urandom(1024 * 1024)
+        digest = hashlib.md5()
+        with open(self.initrd, 'wb') as f:
+            for i in range(self.size / len(block)):
+                f.write(block)
+                digest.update(block)
+        self.digest = digest.hexdigest()
+        with open(os.path.join(self.tmpdir, "repo", "Packages", "a.rpm"), 'wb') as f:
+            f.write("0123456789" * 10)
+        self.server = OpTestInstallUtil.ThreadedHTTPServer(("127.0.0.1", 0),
+                                                          OpTestInstallUtil.ThreadedHTTPHandler)
+        self.port = self.server.server_address[1]
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        (OpTestInstallUtil.BASE_PATH, OpTestInstallUtil.VMLINUX,
+         OpTestInstallUtil.INITRD) = self.saved
+        shutil.rmtree(self.tmpdir)
+
+    def request(self, method, path, headers={}):
+        conn = httplib.HTTPConnection("127.0.0.1", self.port)
+        conn.request(method, path, headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+        conn.close()
+        return response, body
+
+    def download(self, results, i):
+        conn = httplib.HTTPConnection("127.0.0.1", self.port)
+        conn.request("GET", "/initrd.img")
+        response = conn.getresponse()
+        digest = hashlib.md5()
+        while True:
+            chunk = response.read(1024 * 1024)
+            if not chunk:
+                break
+            digest.update(chunk)
+        conn.close()
+        results[i] = digest.hexdigest()
+
+    def runTest(self):
+        results = {}
+        threads = [threading.Thread(target=self.download, args=(results, i))
+                   for i in range(self.clients)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - start
+        log.info("InstallServerStreaming {} concurrent {}MB downloads in {:.2f}s ({:.0f}MB/s)"
+                 .format(self.clients, self.size >> 20, elapsed,
+                         self.clients * (self.size >> 20) / elapsed))
+        self.assertEqual(results.values(), [self.digest] * self.clients)
+
+        response, body = self.request("HEAD", "/initrd.img")
+        self.assertEqual((response.status, body), (200, ""))
+        self.assertEqual(response.getheader("Content-Length"), str(self.size))
+        self.assertEqual(response.getheader("Accept-Ranges"), "bytes")
+
+        with open(self.initrd, 'rb') as f:
+            f.seek(1000)
+            expected = f.read(24)
+        response, body = self.request("GET", "/initrd.img", {"Range" : "bytes=1000-1023"})
+        self.assertEqual(response.status, 206)
+        self.assertEqual(response.getheader("Content-Range"),
+                         "bytes 1000-1023/{}".format(self.size))
+        self.assertEqual(body, expected)
+
+        response, body = self.request("GET", "/repo/Packages/a.rpm", {"Range" : "bytes=-5"})
+        self.assertEqual((response.status, body), (206, "56789"))
+        response, body = self.request("GET", "/repo/Packages/a.rpm", {"Range" : "bytes=100-"})
+        self.assertEqual(response.status, 416)
+        response, body = self.request("GET", "/repo/Packages/a.rpm")
+        self.assertEqual((response.status, len(body)), (200, 100))
+        response, body = self.request("GET", "/nothing")
+        self.assertEqual(response.status, 404)
+
+        # like gcov.py: echo line endings and a nonsense Content-length
+        payload = os.urandom(3 * 1024 * 1024) + "\r\nends with a newline\n"
+        boundary = "OhGoodnessWhyDoIHaveToDoThis"
+        body = ("--{0}\n"
+                "Content-Disposition: form-data; name=\"file\"; filename=\"gcov\"\n"
+                "Content-Type: application/octet-stream\n\n"
+                "{1}\n--{0}--\n").format(boundary, payload)
+        sock = socket.create_connection(("127.0.0.1", self.port))
+        sock.sendall("POST /upload/gcov HTTP/1.1\n"
+                     "Content-length: 12345 /sys/firmware/opal/exports/gcov\n"
+                     "Content-Type: multipart/form-data; boundary={}\n\n".format(boundary))
+        sock.sendall(body)
+        reply = ""
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                break
+            reply += data
+        sock.close()
+        self.assertTrue(reply.endswith("Success"))
+        saved = os.path.join(self.tmpdir, "gcov-saved")
+        self.assertTrue(OpTestInstallUtil.save_uploaded_file("gcov", saved))
+        with open(saved, 'rb') as f:
+            self.assertEqual(f.read(), payload)
@@ -124,34 +124,19 @@ class InstallUbuntu(unittest.TestCase):
         if "qemu" not in self.bmc_type and not self.conf.args.os_repo:
             repo = 'http://%s:%s/repo' % (my_ip, port)
 
-        kernel_args = (' auto console=hvc0 '
-                       'interface=auto '
-                       'localechooser/languagelist=en '
-                       'debian-installer/country=US '
-                       'debian-installer/locale=en_US '
-                       'console-setup/ask_detect=false '
-                       'console-setup/layoutcode=us '
-                       'netcfg/get_hostname=ubuntu '
-                       'netcfg/get_domain=example.com '
-                       'netcfg/link_wait_timeout=60 '
-                       'partman-auto/disk=%s '
-                       'locale=en_US '
-                       'url=http://%s:%s/preseed.cfg' % (self.cv_HOST.get_scratch_disk(),
-                                                         my_ip, port))
-
-        if not self.conf.args.host_dns in [None, ""]:
-            kernel_args = kernel_args + ' netcfg/disable_autoconfig=true '
-            kernel_args = kernel_args + 'netcfg/get_nameservers=%s ' % self.conf.args.host_dns
-            kernel_args = kernel_args + 'netcfg/get_ipaddress=%s ' % self.cv_HOST.ip
-            kernel_args = kernel_args + 'netcfg/get_netmask=%s ' % self.conf.args.host_submask
-            kernel_args = kernel_args + 'netcfg/get_gateway=%s ' % self.conf.args.host_gateway
-
-        if not self.conf.args.proxy in [None, ""]:
-            kernel_args = kernel_args + 'mirror/http/proxy={} '.format(self.conf.args.proxy)
+        # qemu boots the cdrom from the petitboot menu, the installer picks the interface
+        mac = None if "qemu" in self.bmc_type else self.conf.args.host_mac
+        kernel_args = OpTestInstallUtil.kernel_args("ubuntu",
+                                                    'http://%s:%s/preseed.cfg' % (my_ip, port),
+                                                    mac, self.cv_HOST.ip,
+                                                    self.conf.args.host_gateway,
+                                                    self.conf.args.host_submask,
+                                                    self.conf.args.host_dns, "ubuntu",
+                                                    disk=self.cv_HOST.get_scratch_disk(),
+                                                    proxy=self.conf.args.proxy)
 
         self.c = self.cv_SYSTEM.console
         if "qemu" in self.bmc_type:
-            kernel_args = kernel_args + ' netcfg/choose_interface=auto '
             # For Qemu, we boot from CDROM, so let's use petitboot!
             self.select_petitboot_item('Install Ubuntu Server')
             raw_pty = self.c.get_console()
@@ -162,14 +147,11 @@ class InstallUbuntu(unittest.TestCase):
             raw_pty.send('\t\t\t\t')  # FIXME :)
             raw_pty.send('\b\b\b\b')  # remove ' ---'
             raw_pty.send('\b\b\b\b\b')  # remove 'quiet'
-            raw_pty.send(kernel_args)
+            raw_pty.send(' ' + kernel_args)
             raw_pty.send('\t')
             raw_pty.sendline('')
             raw_pty.sendline('')
         else:
-            kernel_args = kernel_args + ' netcfg/choose_interface=%s BOOTIF=01-%s' % (self.conf.args.host_mac,
-                                                                                      '-'.join(self.conf.args.host_mac.split(':')))
-
             cmd = "[ -f %s ]&& rm -f %s;[ -f %s ] && rm -f %s;true" % (vmlinux,
                                                                        vmlinux,
                                                                        initrd,
@@ -0,0 +1,497 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+IPMI Native
+-----------
+
+The native IPMI backend (``--ipmi-backend native``): `OpTestRMCP.Session`
+and `IPMINative` in front of `IPMITool`.
+
+IpmiNativeSession runs against a stand-in BMC answering RMCP+ on a local
+UDP port: the session is opened once and reused, reopened when the BMC
+forgets it, a wrong password is refused, power, raw, sel clear, mc reset,
+bootdev and dcmi power activate read like ipmitool's output and anything
+else goes to ipmitool. Cipher suites 3 and 17 are skipped without the
+Crypto package.
+
+That stand-in shares `pack`, `unpack` and `SessionKeys` with the client,
+so IpmiNativeVectors also plays fixed datagrams at the client: the
+capabilities, open session and RAKP 1-4 messages and an authenticated
+(cipher suite 2) and an authenticated and encrypted (cipher suite 17)
+Set Session Privilege Level request and response. These were worked out
+by hand from the message layouts and key derivation of the IPMI v2.0
+specification (sections 13.17 to 13.32) for fixed session IDs, randoms,
+GUID and IV, with HMAC from hashlib and AES-CBC from openssl.
+
+IpmiNativeBench compares 'chassis power status' latency of the ipmitool
+and native backends against the OpenIPMI ``ipmi_sim`` BMC simulator, it
+is skipped if ``ipmi_sim`` or ``ipmitool`` are not installed.
+'''
+
+import unittest
+import binascii
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import time
+import pexpect
+
+from common import OpTestRMCP
+from common.OpTestRMCP import pack, pack_v15, unpack, ipmi_message, parse_ipmi_message
+from common.OpTestIPMI import IPMITool, IPMINative
+from common.Exceptions import BMCDisconnected, CommandFailed
+from testcases.IpmiPersistentSession import LAN_CONF, EMU_CMDS, which
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+GUID = bytearray(range(16))
+
+
+class StandInBMC(object):
+    '''
+    The BMC side of RMCP+ for one user, with chassis power and a couple
+    of commands. Clearing sessions plays a BMC reboot.
+    '''
+    def __init__(self, username="admin", password="0penBmc"):
+        self.username = bytearray(username.encode('ascii'))
+        self.password = bytearray(password.encode('ascii'))
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        self.pending = {}
+        self.sessions = {}
+        self.power_on = False
+        self.boot_device = None
+        self.power_limit_active = False
+        self.resets = []
+        self.handshakes = 0
+        self.requests = 0
+        self.closed = 0
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.sock.close()
+
+    def serve(self):
+        while True:
+            try:
+                datagram, peer = self.sock.recvfrom(1024)
+            except socket.error:
+                return
+            try:
+                self.handle(datagram, peer)
+            except (ValueError, socket.error) as e:
+                log.debug("StandInBMC dropping a datagram, Exception={}".format(e))
+
+    def reply(self, peer, payload_type, session, payload):
+        if session is None:
+            datagram = pack(payload_type, 0, 0, payload)
+        else:
+            session['sequence'] += 1
+            datagram = pack(payload_type, session['console_id'], session['sequence'],
+                            payload, session['keys'])
+        self.sock.sendto(datagram, peer)
+
+    def handle(self, datagram, peer):
+        data = bytearray(datagram)
+        if data[4] == 0x00:
+            payload_type, session_id, sequence, payload = unpack(datagram)
+            netfn, seq, cmd, body = parse_ipmi_message(payload)
+            if cmd == 0x38:
+                self.sock.sendto(pack_v15(ipmi_message(0x81, netfn | 1, 0x20, seq, cmd,
+                                 [0, 1, 0x80, 0x04, 0x02, 0, 0, 0, 0])), peer)
+            return
+        session_id = struct.unpack("<I", bytes(data[6:10]))[0]
+        if session_id:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return
+            payload_type, _, _, payload = unpack(datagram, session['keys'])
+            self.command(peer, session, session_id, payload)
+            return
+        payload_type, _, _, p = unpack(datagram)
+        if payload_type == OpTestRMCP.PAYLOAD_OPEN_SESSION_REQUEST:
+            algorithms = (p[12], p[20], p[28])
+            suites = [s for s, a in OpTestRMCP.CIPHER_SUITES.items() if a == algorithms]
+            bmc_id = struct.unpack("<I", os.urandom(4))[0] | 1
+            self.pending[bmc_id] = {'console_id' : p[4:8],
+                                    'keys' : OpTestRMCP.SessionKeys(suites[0]),
+                                    'sequence' : 0}
+            self.reply(peer, OpTestRMCP.PAYLOAD_OPEN_SESSION_RESPONSE, None,
+                       bytearray([p[0], 0, p[1], 0]) + p[4:8]
+                       + bytearray(struct.pack("<I", bmc_id)) + p[8:32])
+        elif payload_type == OpTestRMCP.PAYLOAD_RAKP1:
+            bmc_id = struct.unpack("<I", bytes(p[4:8]))[0]
+            session = self.pending[bmc_id]
+            keys = session['keys']
+            session['console_random'] = p[8:24]
+            session['bmc_random'] = bytearray(os.urandom(16))
+            session['user'] = p[24:25] + p[27:]
+            if p[28:] != self.username:
+                self.reply(peer, OpTestRMCP.PAYLOAD_RAKP2, None,
+                           bytearray([p[0], 0x0d, 0, 0]) + session['console_id'])
+                return
+            self.reply(peer, OpTestRMCP.PAYLOAD_RAKP2, None,
+                bytearray([p[0], 0, 0, 0]) + session['console_id'] + session['bmc_random']
+                + GUID + keys.auth_code(self.password, session['console_id'] + p[4:8]
+                                        + session['console_random'] + session['bmc_random']
+                                        + GUID + session['user']))
+        elif payload_type == OpTestRMCP.PAYLOAD_RAKP3:
+            bmc_id = struct.unpack("<I", bytes(p[4:8]))[0]
+            session = self.pending.pop(bmc_id)
+            keys = session['keys']
+            if p[8:] != keys.auth_code(self.password, session['bmc_random']
+                                       + session['console_id'] + session['user']):
+                self.reply(peer, OpTestRMCP.PAYLOAD_RAKP4, None,
+                           bytearray([p[0], 0x0f, 0, 0]) + session['console_id'])
+                return
+            sik = keys.auth_code(self.password, session['console_random']
+                                 + session['bmc_random'] + session['user'])
+            self.reply(peer, OpTestRMCP.PAYLOAD_RAKP4, None,
+                bytearray([p[0], 0, 0, 0]) + session['console_id']
+                + keys.auth_code(sik, session['console_random'] + p[4:8]
+                                 + GUID)[:keys.rakp4_length()])
+            keys.set_sik(sik)
+            session['console_id'] = struct.unpack("<I", bytes(session['console_id']))[0]
+            self.sessions[bmc_id] = session
+            self.handshakes += 1
+
+    def command(self, peer, session, session_id, payload):
+        netfn, seq, cmd, body = parse_ipmi_message(payload)
+        self.requests += 1
+        response = [0xc1]
+        if (netfn, cmd) == (OpTestRMCP.NETFN_APP, 0x3b):
+            response = [0, body[0]]
+        elif (netfn, cmd) == (OpTestRMCP.NETFN_APP, 0x3c):
+            self.sessions.pop(session_id, None)
+            self.closed += 1
+            response = [0]
+        elif (netfn, cmd) == (OpTestRMCP.NETFN_APP, 0x01):
+            response = [0, 0x20, 0x81, 0x02, 0x13, 0x02, 0xbf, 0x41, 0xa7, 0x00,
+                        0x4f, 0x42, 0, 0, 0, 1]
+        elif (netfn, cmd) == (OpTestRMCP.NETFN_CHASSIS, 0x01):
+            response = [0, 0x41 if self.power_on else 0x40, 0, 0]
+        elif (netfn, cmd) == (OpTestRMCP.NETFN_CHASSIS, 0x02):
+            self.power_on = body[0] in [0x01, 0x02, 0x03]
+            response = [0]
+        elif (netfn, cmd) == (OpTestRMCP.NETFN_CHASSIS, 0x08):
+            if body[0] == 0x05:
+                self.boot_device = body[2]
+            response = [0]
+        elif netfn == OpTestRMCP.NETFN_APP and cmd in [0x02, 0x03]:
+            self.resets.append(cmd)
+            if cmd == 0x02:
+                # a cold reset doesn't answer, and forgets the sessions
+                self.sessions.clear()
+                return
+            response = [0]
+        elif (netfn, cmd) == (OpTestRMCP.NETFN_GROUP, 0x05):
+            self.power_limit_active = bool(body[1])
+            response = [0, OpTestRMCP.DCMI_GROUP]
+        elif (netfn, cmd) == (OpTestRMCP.NETFN_STORAGE, 0x42):
+            response = [0, 0x34, 0x12]
+        elif (netfn, cmd) == (OpTestRMCP.NETFN_STORAGE, 0x47):
+            response = [0, 1] if body[:6] == bytearray(b"\x34\x12CLR\xaa") else [0xc5]
+        elif (netfn, cmd) == (0x3a, 0x02):
+            # a long OEM reply
+            response = [0] + list(range(20))
+        self.reply(peer, OpTestRMCP.PAYLOAD_IPMI, session,
+                   ipmi_message(0x81, netfn | 1, 0x20, seq, cmd, response))
+
+
+class IpmiNativeSession(unittest.TestCase):
+
+    def setUp(self):
+        self.bmc = StandInBMC()
+
+    def tearDown(self):
+        self.bmc.stop()
+
+    def native(self, cipher_suite, password="0penBmc"):
+        ipmitool = IPMITool(binary="echo", ip="127.0.0.1", port=self.bmc.port,
+                            username="admin", password=password)
+        native = IPMINative(ipmitool, cipher_suite=cipher_suite)
+        native.session.timeout = 0.2
+        return native
+
+    def check_suite(self, cipher_suite):
+        if OpTestRMCP.CIPHER_SUITES[cipher_suite][2] and OpTestRMCP.AES is None:
+            log.info("IpmiNativeSession skipping cipher suite {}, no Crypto package"
+                     .format(cipher_suite))
+            return
+        native = self.native(cipher_suite)
+        handshakes = self.bmc.handshakes
+        self.assertEqual(native.run("chassis power status"), "Chassis Power is off\n")
+        self.assertEqual(native.run("power on"), "Chassis Power Control: Up/On\n")
+        self.assertEqual(native.run("power status"), "Chassis Power is on\n")
+        self.assertEqual(native.run("raw 0x3a 0x02"),
+                         " 00 01 02 03 04 05 06 07 08 09 0a 0b 0c 0d 0e 0f\n 10 11 12 13\n")
+        self.assertEqual(native.run("raw 0x3a 0x03 0x01"),
+                         "Unable to send RAW command (channel=0x0 netfn=0x3a lun=0x0"
+                         " cmd=0x3 rsp=0xc1): Invalid command\n")
+        with self.assertRaises(CommandFailed) as cm:
+            native.session.command(0x3a, 0x03)
+        self.assertEqual(cm.exception.exitcode, 0xc1)
+        self.assertEqual(native.run("chassis bootdev bios"), "Set Boot Device to bios\n")
+        self.assertEqual(self.bmc.boot_device, 0x18)
+        self.assertEqual(native.run("dcmi power activate"),
+                         "\n    Power limit successfully activated\n")
+        self.assertTrue(self.bmc.power_limit_active)
+        self.assertEqual(native.run("sel clear"),
+                         "Clearing SEL.  Please allow a few seconds to erase.\n")
+        device = native.session.device_id()
+        self.assertEqual((device['firmware_revision'], device['manufacturer_id'],
+                          device['product_id']), ("2.13", 42817, 0x424f))
+        self.assertEqual(self.bmc.handshakes, handshakes + 1)
+
+        # the BMC reboots and forgets the session, it is opened again
+        self.bmc.sessions.clear()
+        self.assertEqual(native.run("power off"), "Chassis Power Control: Down/Off\n")
+        self.assertEqual(self.bmc.handshakes, handshakes + 2)
+        self.assertEqual(native.session.opens, 2)
+
+        # resets take the session with them, a cold one goes unanswered
+        self.assertEqual(native.run("mc reset warm"), "Sent warm reset command to MC\n")
+        self.assertEqual(native.run(" mc reset cold"), "Sent cold reset command to MC\n")
+        self.assertEqual(self.bmc.resets[-2:], [0x03, 0x02])
+        self.assertEqual(native.run("power status"), "Chassis Power is off\n")
+        self.assertEqual(self.bmc.handshakes, handshakes + 4)
+
+        # other commands, and shell syntax, go to ipmitool (echo here)
+        self.assertIn("sel elist", native.run("sel elist"))
+        self.assertIn("power status", native.run("power status; echo $?"))
+        native.close()
+        deadline = time.time() + 1
+        while self.bmc.sessions and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.bmc.sessions, {})
+
+    def runTest(self):
+        for cipher_suite in [1, 2, 3, 15, 16, 17]:
+            self.check_suite(cipher_suite)
+        native = self.native(2, password="wrong")
+        with self.assertRaises(BMCDisconnected):
+            native.session.chassis_status()
+        self.assertEqual(native.run("power status"), "Unable to get Chassis Power Status\n")
+
+        native = self.native(2)
+        calls = 200
+        start = time.time()
+        for i in range(calls):
+            native.run("power status")
+        elapsed = time.time() - start
+        log.info("IpmiNativeSession {} x 'power status' in {:.3f}s ({:.0f}/s)"
+                 .format(calls, elapsed, calls / elapsed))
+        self.assertEqual(native.session.opens, 1)
+        native.close()
+
+
+# (name, hex) of the datagrams for cipher suites 2 and 17, console session
+# ID 0x0a0b0c0d, BMC session ID 0x01020304, console random 0x10..0x1f,
+# BMC random 0x20..0x2f, GUID 0x30..0x3f, user admin/0penBmc at
+# administrator privilege (by name), and for suite 17 an IV of 0x40..0x4f
+VECTORS = {
+    2 : [
+        ("capabilities request", "0600ff07000000000000000000092018c88104388e04b1"),
+        ("capabilities response", "0600ff0700000000000000000010811c632004380001800402000000001d"),
+        ("open session request", "0600ff07061000000000000000002000010400000d0c0b0a0000000801"
+                                 "00000001000008010000000200000800000000"),
+        ("open session response", "0600ff07061100000000000000002400010004000d0c0b0a0403020100"
+                                  "0000080100000001000008010000000200000800000000"),
+        ("RAKP1", "0600ff070612000000000000000021000200000004030201101112131415161718191a1b"
+                  "1c1d1e1f1400000561646d696e"),
+        ("RAKP2", "0600ff07061300000000000000003c00020000000d0c0b0a202122232425262728292a2b"
+                  "2c2d2e2f303132333435363738393a3b3c3d3e3f3ec70cd913043721f6e427e2ac55d4e7"
+                  "32551472"),
+        ("RAKP3", "0600ff07061400000000000000001c0003000000040302018a9ad83ed8f11f78d7d6a454"
+                  "be3f2dba889b6c12"),
+        ("RAKP4", "0600ff07061500000000000000001400030000000d0c0b0a8752254f64947911938fa2b2"),
+        ("set privilege request", "0600ff070640040302010100000008002018c881083b0438ffff0207"
+                                  "9b2c26b53f456b2db462ff98"),
+        ("set privilege response", "0600ff0706400d0c0b0a010000000900811c6320083b000499ff0107"
+                                   "80baa5b17a16c9cca1b09533"),
+    ],
+    17 : [
+        ("capabilities request", "0600ff07000000000000000000092018c88104388e04b1"),
+        ("capabilities response", "0600ff0700000000000000000010811c632004380001800402000000001d"),
+        ("open session request", "0600ff07061000000000000000002000010400000d0c0b0a0000000803"
+                                 "00000001000008040000000200000801000000"),
+        ("open session response", "0600ff07061100000000000000002400010004000d0c0b0a0403020100"
+                                  "0000080300000001000008040000000200000801000000"),
+        ("RAKP1", "0600ff070612000000000000000021000200000004030201101112131415161718191a1b"
+                  "1c1d1e1f1400000561646d696e"),
+        ("RAKP2", "0600ff07061300000000000000004800020000000d0c0b0a202122232425262728292a2b"
+                  "2c2d2e2f303132333435363738393a3b3c3d3e3f8c9fe96f9c87bc2ae59fb9ae0c9e31cc"
+                  "44298fcc305c5e13460bd8e659940fe0"),
+        ("RAKP3", "0600ff070614000000000000000028000300000004030201eb0f7189e0b73052f9db329c"
+                  "171a99c9b69347f7f066448320246b306d7ff940"),
+        ("RAKP4", "0600ff07061500000000000000001800030000000d0c0b0aa074dee886323ddc19a26998"
+                  "fb5a99a4"),
+        ("set privilege request", "0600ff0706c004030201010000002000404142434445464748494a4b"
+                                  "4c4d4e4ffe2c373cb2bd2070e9d8a5127093bf39ffff020755778a32"
+                                  "0fa618a1f0d9a40ebf593b68"),
+        ("set privilege response", "0600ff0706c00d0c0b0a010000002000404142434445464748494a4b"
+                                   "4c4d4e4fa6ba3361821bf22de228cec1a1d42113ffff02078536b3ae"
+                                   "980e9a30c2dbe96e72077805"),
+    ],
+}
+# (SIK, K1, K2)
+VECTOR_KEYS = {
+    2 : ("28d5b4e19e2462abf5b960bfebf441f694a786f2",
+         "062558eb7560581de4d2898d58dbb927e5b3a739",
+         "1b6ad1cc86ab22d4c6ab8f0cdae6ad8b55045ef2"),
+    17 : ("d23ef5e1e2f68d6b9346f8ba46ce38e3467229572b274dce6d3a4f4e535a60be",
+          "d0bfe1e1ec8a6b2d7fe5eb503dfaa417969cd78ac67bcdd89519345bee180a2c",
+          "22141b77e4ef4eb60c4e1cf074e28bb5d7bce0b7332991cec05069d2aec48eff"),
+}
+# what os.urandom gives the client: console session ID, console random, IV
+VECTOR_RANDOM = ["0d0c0b0a", "101112131415161718191a1b1c1d1e1f",
+                 "404142434445464748494a4b4c4d4e4f"]
+
+
+class ScriptedBMC(object):
+    '''
+    Answers each datagram with the next reply of a fixed script, whatever
+    it was, and keeps what it was sent
+    '''
+    def __init__(self, replies):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        self.replies = list(replies)
+        self.received = []
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                datagram, peer = self.sock.recvfrom(1024)
+            except socket.error:
+                return
+            self.received.append(datagram)
+            if self.replies:
+                self.sock.sendto(self.replies.pop(0), peer)
+
+    def stop(self):
+        self.sock.close()
+
+
+class IpmiNativeVectors(unittest.TestCase):
+
+    def setUp(self):
+        self.urandom = OpTestRMCP.os.urandom
+        randoms = [bytes(bytearray.fromhex(r)) for r in VECTOR_RANDOM]
+        OpTestRMCP.os.urandom = lambda n: randoms.pop(0) if randoms else self.urandom(n)
+
+    def tearDown(self):
+        OpTestRMCP.os.urandom = self.urandom
+
+    def check_suite(self, cipher_suite):
+        vectors = [(name, bytes(bytearray.fromhex(v))) for name, v in VECTORS[cipher_suite]]
+        requests, responses = vectors[0::2], vectors[1::2]
+        bmc = ScriptedBMC([v for name, v in responses])
+        try:
+            session = OpTestRMCP.Session("127.0.0.1", "admin", "0penBmc", port=bmc.port,
+                                         cipher_suite=cipher_suite, timeout=0.5, retries=1)
+            session.open()
+            self.assertEqual(session.session_id, 0x01020304)
+            self.assertEqual([binascii.hexlify(k) for k in
+                              [session.keys.sik, session.keys.k1, session.keys.k2]],
+                             list(VECTOR_KEYS[cipher_suite]))
+            session.close()
+        finally:
+            bmc.stop()
+        for (name, expected), sent in zip(requests, bmc.received):
+            self.assertEqual(binascii.hexlify(sent), binascii.hexlify(expected),
+                             "cipher suite {} {}".format(cipher_suite, name))
+        # and the close session request after them
+        self.assertEqual(len(bmc.received), len(requests) + 1)
+
+        # the authenticated response, tampered with, is dropped
+        keys = OpTestRMCP.SessionKeys(cipher_suite)
+        keys.set_sik(bytearray.fromhex(VECTOR_KEYS[cipher_suite][0]))
+        response = bytearray(responses[-1][1])
+        self.assertEqual(unpack(bytes(response), keys)[3],
+                         ipmi_message(0x81, 0x07, 0x20, 2, 0x3b, [0, 4]))
+        response[20] ^= 0x01
+        with self.assertRaises(ValueError):
+            unpack(bytes(response), keys)
+
+    def test_suite_2(self):
+        self.check_suite(2)
+
+    def test_suite_17(self):
+        if OpTestRMCP.AES is None:
+            self.skipTest("Cipher suite 17 needs the Crypto package")
+        self.check_suite(17)
+
+
+class IpmiNativeBench(unittest.TestCase):
+    calls = 50
+    port = 9624
+
+    def setUp(self):
+        if which("ipmi_sim") is None or which("ipmitool") is None:
+            raise unittest.SkipTest("ipmi_sim and ipmitool are needed for the benchmark")
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-ipmi-sim-")
+        lan_conf = os.path.join(self.tmpdir, "lan.conf")
+        emu_cmds = os.path.join(self.tmpdir, "emu.cmds")
+        with open(lan_conf, 'w') as f:
+            f.write(LAN_CONF % {'port' : self.port})
+        with open(emu_cmds, 'w') as f:
+            f.write(EMU_CMDS)
+        self.sim = pexpect.spawn("ipmi_sim", ["-c", lan_conf, "-f", emu_cmds,
+                                              "-s", self.tmpdir, "-n"])
+        time.sleep(1)
+
+    def tearDown(self):
+        self.sim.close(force=True)
+        shutil.rmtree(self.tmpdir)
+
+    def bench(self, ipmitool):
+        start = time.time()
+        outputs = [ipmitool.run("chassis power status") for i in range(self.calls)]
+        return time.time() - start, outputs
+
+    def runTest(self):
+        fork = IPMITool(ip="127.0.0.1", port=self.port,
+                        username="admin", password="0penBmc")
+        native = IPMINative(fork)
+        try:
+            fork_time, fork_outputs = self.bench(fork)
+            native_time, native_outputs = self.bench(native)
+        finally:
+            native.close()
+        log.info("IpmiNativeBench {} x 'chassis power status': ipmitool {:.2f}s ({:.1f}/s),"
+                 " native {:.2f}s ({:.1f}/s)"
+                 .format(self.calls, fork_time, self.calls / fork_time,
+                         native_time, self.calls / native_time))
+        self.assertEqual(native_outputs, fork_outputs)
+        self.assertLess(native_time, fork_time)
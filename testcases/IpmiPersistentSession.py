@@ -0,0 +1,194 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+IPMI Persistent Session
+-----------------------
+
+`IPMITool` in persistent mode (``--ipmi-persistent-session``) runs
+commands through one long lived ``ipmitool shell``.
+
+IpmiShellFraming checks the output framing, the fall back to forking for
+shell syntax and the respawn of a dead shell against a stand-in ipmitool
+script.
+
+IpmiSessionBench compares the per-call fork path with the persistent
+session against the OpenIPMI ``ipmi_sim`` BMC simulator, it is skipped
+if ``ipmi_sim`` or ``ipmitool`` are not installed.
+'''
+
+import unittest
+import os
+import shutil
+import stat
+import subprocess
+import tempfile
+import time
+import pexpect
+
+from common.OpTestIPMI import IPMITool
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+FAKE_IPMITOOL = '''#!/bin/sh
+while true; do
+  case "$1" in
+    -H|-I|-U|-P|-p) shift 2;;
+    *) break;;
+  esac
+done
+answer() {
+  case "$1" in
+    "chassis status") echo "System Power         : on";;
+    "die once") [ -e %(marker)s ] || { touch %(marker)s; exit 1; }; echo "survived";;
+    *) echo "ran: $1";;
+  esac
+}
+if [ "$1" = "shell" ]; then
+  echo "spawn" >> %(spawns)s
+  printf 'ipmitool> '
+  while read line; do answer "$line"; printf 'ipmitool> '; done
+else
+  echo "fork" >> %(spawns)s
+  answer "$*"
+fi
+'''
+
+LAN_CONF = '''name "op-test"
+set_working_mc 0x20
+  startlan 1
+    addr 127.0.0.1 %(port)d
+    priv_limit admin
+    allowed_auths_callback none md2 md5 straight
+    allowed_auths_user none md2 md5 straight
+    allowed_auths_operator none md2 md5 straight
+    allowed_auths_admin none md2 md5 straight
+    guid a123456789abcdefa123456789abcdef
+  endlan
+  user 2 true "admin" "0penBmc" admin 10 none md2 md5 straight
+'''
+
+EMU_CMDS = '''mc_setbmc 0x20
+mc_add 0x20 0 no-device-sdrs 0x23 9 8 0x9f 0x1291 0xf02 persist_sdr
+mc_enable 0x20
+'''
+
+
+def which(binary):
+    for path in os.environ.get("PATH", "").split(os.pathsep):
+        if os.access(os.path.join(path, binary), os.X_OK):
+            return os.path.join(path, binary)
+    return None
+
+
+class IpmiShellFraming(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-ipmi-shell-")
+        self.spawns = os.path.join(self.tmpdir, "spawns")
+        binary = os.path.join(self.tmpdir, "ipmitool")
+        with open(binary, 'w') as f:
+            f.write(FAKE_IPMITOOL % {'marker' : os.path.join(self.tmpdir, "marker"),
+                                     'spawns' : self.spawns})
+        os.chmod(binary, stat.S_IRWXU)
+        self.ipmitool = IPMITool(binary=binary, ip="127.0.0.1",
+                                 username="admin", password="0penBmc",
+                                 persistent=True)
+
+    def tearDown(self):
+        self.ipmitool.close()
+        shutil.rmtree(self.tmpdir)
+
+    def started(self):
+        with open(self.spawns) as f:
+            return f.read().split()
+
+    def runTest(self):
+        for i in range(20):
+            self.assertEqual(self.ipmitool.run("chassis status").strip(),
+                             "System Power         : on")
+        self.assertEqual(self.ipmitool.run("sel list 5").strip(), "ran: sel list 5")
+        self.assertEqual(self.started(), ["spawn"])
+
+        # shell syntax still forks, through /bin/sh
+        output = self.ipmitool.run("chassis status; echo $?")
+        self.assertEqual(output.split(), ["System", "Power", ":", "on", "0"])
+        self.assertEqual(self.started(), ["spawn", "fork"])
+
+        # the shell dies under us, it is respawned and the command retried
+        self.assertEqual(self.ipmitool.run("die once").strip(), "survived")
+        self.assertEqual(self.started(), ["spawn", "fork", "spawn"])
+        self.assertEqual(self.ipmitool.shell.spawns, 2)
+
+        # non persistent mode forks every time, with the same output
+        self.ipmitool.set_persistent(False)
+        self.assertEqual(self.ipmitool.run("chassis status").strip(),
+                         "System Power         : on")
+        self.assertEqual(self.started()[-1], "fork")
+
+
+class IpmiSessionBench(unittest.TestCase):
+    calls = 50
+    port = 9623
+
+    def setUp(self):
+        if which("ipmi_sim") is None or which("ipmitool") is None:
+            raise unittest.SkipTest("ipmi_sim and ipmitool are needed for the benchmark")
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-ipmi-sim-")
+        lan_conf = os.path.join(self.tmpdir, "lan.conf")
+        emu_cmds = os.path.join(self.tmpdir, "emu.cmds")
+        with open(lan_conf, 'w') as f:
+            f.write(LAN_CONF % {'port' : self.port})
+        with open(emu_cmds, 'w') as f:
+            f.write(EMU_CMDS)
+        self.sim = pexpect.spawn("ipmi_sim", ["-c", lan_conf, "-f", emu_cmds,
+                                              "-s", self.tmpdir, "-n"])
+        time.sleep(1)
+
+    def tearDown(self):
+        self.sim.close(force=True)
+        shutil.rmtree(self.tmpdir)
+
+    def bench(self, ipmitool):
+        start = time.time()
+        outputs = [ipmitool.run("mc info") for i in range(self.calls)]
+        return time.time() - start, outputs
+
+    def runTest(self):
+        fork = IPMITool(ip="127.0.0.1", port=self.port,
+                        username="admin", password="0penBmc")
+        persistent = IPMITool(ip="127.0.0.1", port=self.port,
+                              username="admin", password="0penBmc",
+                              persistent=True)
+        try:
+            fork_time, fork_outputs = self.bench(fork)
+            persistent_time, persistent_outputs = self.bench(persistent)
+        finally:
+            persistent.close()
+        log.info("IpmiSessionBench {} x 'mc info': fork {:.2f}s ({:.1f}/s),"
+                 " persistent session {:.2f}s ({:.1f}/s)"
+                 .format(self.calls, fork_time, self.calls / fork_time,
+                         persistent_time, self.calls / persistent_time))
+        self.assertIn("Device ID", fork_outputs[0])
+        self.assertEqual([o.split() for o in persistent_outputs],
+                         [o.split() for o in fork_outputs])
+        self.assertLess(persistent_time, fork_time)
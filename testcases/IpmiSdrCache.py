@@ -0,0 +1,167 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+IPMI SDR Cache
+--------------
+
+`OpTestIPMI.get_sensor` and the IPL/OS boot sensor polling read single
+sensors against an on disk copy of the SDR (`SDRCache`), dumped once per
+BMC firmware level.
+
+This runs against a stand-in ipmitool script which logs every
+invocation: the SDR is dumped once, kept across instances, dumped again
+for a new firmware level or after `OpTestIPMI.sdr_invalidate`, and
+``ipl_wait_for_working_state_v1`` polls with single sensor reads.
+
+The SDR cache lives in a temporary directory, not the user's.
+'''
+
+import unittest
+import os
+import shutil
+import stat
+import tempfile
+
+from common.OpTestIPMI import OpTestIPMI
+from common.OpTestConstants import OpTestConstants as BMC_CONST
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+FAKE_IPMITOOL = '''#!/bin/sh
+sdr=""
+while true; do
+  case "$1" in
+    -H|-I|-U|-P|-p) shift 2;;
+    -S) sdr="$2"; shift 2;;
+    *) break;;
+  esac
+done
+echo "$sdr $*" >> %(calls)s
+case "$*" in
+  "mc info")
+    echo "Device ID                 : 32"
+    echo "Firmware Revision         : $(cat %(version)s)"
+    echo "Manufacturer ID           : 42817"
+    echo "Product ID                : 16975 (0x424f)"
+    echo "Aux Firmware Rev Info     : "
+    echo "    0x00"
+    echo "    0x01";;
+  "sdr dump "*) echo "SDR" > "$3"; echo "Dumping Sensor Data Repository to '$3'";;
+  "sdr get Host Status")
+    [ -n "$sdr" ] && [ ! -e "$sdr" ] && { echo "Unable to open SDR for reading"; exit 1; }
+    echo "Sensor ID              : Host Status (0x52)"
+    echo " Entity ID             : 23.1 (System Chassis)"
+    echo " Sensor Type (Discrete): System ACPI Power State (0x22)"
+    echo " Sensor Reading        : 0h"
+    echo " Event Message Control : Per-threshold"
+    echo " States Asserted       : System ACPI Power State"
+    if [ "$(cat %(polls)s)" -gt 0 ]; then
+      echo $(($(cat %(polls)s) - 1)) > %(polls)s
+      echo "                         [S5/G2: soft-off]"
+    else
+      echo "                         [S0/G0: working]"
+    fi;;
+  *) echo "Unable to find sensor id '$3'"; exit 1;;
+esac
+'''
+
+
+class IpmiSdrCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-sdr-cache-")
+        self.paths = dict((name, os.path.join(self.tmpdir, name))
+                          for name in ["calls", "version", "polls"])
+        self.binary = os.path.join(self.tmpdir, "ipmitool")
+        with open(self.binary, 'w') as f:
+            f.write(FAKE_IPMITOOL % self.paths)
+        os.chmod(self.binary, stat.S_IRWXU)
+        self.set("version", "2.13")
+        self.set("polls", "0")
+        self.cache_dir = os.path.join(self.tmpdir, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def set(self, name, value):
+        with open(self.paths[name], 'w') as f:
+            f.write(value + "\n")
+
+    def ipmi(self):
+        ipmi = OpTestIPMI("127.0.0.1", "admin", "0penBmc")
+        ipmi.ipmitool.binary = self.binary
+        ipmi.sdr.cache_dir = self.cache_dir
+        return ipmi
+
+    def calls(self):
+        with open(self.paths["calls"]) as f:
+            calls = [line.split(" ", 1) for line in f.read().splitlines()]
+        os.remove(self.paths["calls"])
+        return [(bool(sdr), cmd) for sdr, cmd in calls]
+
+    def runTest(self):
+        ipmi = self.ipmi()
+        sensor = ipmi.get_sensor("Host Status")
+        self.assertEqual(sensor['name'], "Host Status")
+        self.assertEqual(sensor['number'], 0x52)
+        self.assertEqual(sensor['type'], "System ACPI Power State")
+        self.assertEqual(sensor['reading'], "0h")
+        self.assertEqual(sensor['states'], ["S0/G0: working"])
+        self.assertIsNone(ipmi.get_sensor("No Such Sensor"))
+        for i in range(5):
+            ipmi.get_sensor("Host Status")
+        calls = self.calls()
+        self.assertEqual(calls[0], (False, "mc info"))
+        self.assertTrue(calls[1][1].startswith("sdr dump "))
+        self.assertEqual(calls[2:], [(True, "sdr get Host Status"),
+                                     (True, "sdr get No Such Sensor")]
+                                    + [(True, "sdr get Host Status")] * 5)
+
+        # a new run on the same firmware finds the SDR on disk
+        ipmi = self.ipmi()
+        self.set("polls", "1")
+        self.assertEqual(ipmi.ipmi_ipl_wait_for_working_state_v1(), BMC_CONST.FW_SUCCESS)
+        self.assertEqual(self.calls(), [(False, "mc info")]
+                                       + [(True, "sdr get Host Status")] * 2)
+
+        # new firmware level, new dump
+        self.set("version", "2.14")
+        ipmi = self.ipmi()
+        ipmi.get_sensor("Host Status")
+        calls = self.calls()
+        self.assertEqual([cmd.split()[:2] for sdr, cmd in calls],
+                         [["mc", "info"], ["sdr", "dump"], ["sdr", "get"]])
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+        # flashing throws it away, the next read dumps it again
+        ipmi.sdr_invalidate()
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        ipmi.get_sensor("Host Status")
+        self.assertEqual(len(self.calls()), 3)
+
+        # no firmware level, no caching, ipmitool walks the SDR itself
+        os.remove(self.paths["version"])
+        ipmi = self.ipmi()
+        self.assertEqual(ipmi.get_sensor("Host Status")['states'], ["S0/G0: working"])
+        self.assertEqual(self.calls(), [(False, "mc info"),
+                                        (False, "sdr get Host Status")])
@@ -0,0 +1,451 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+ISO Cache
+---------
+
+`OpTestInstallUtil.setup_repo` extracts ``--os-cdrom`` images with
+`OpTestISO` rather than loop mounting them. Small Rock Ridge images are
+built here, set up as a repo (from a path and from a URL) and checked
+to be extracted once, by one of several concurrent users, and evicted
+least recently used first, but never while held. Concurrent updates to
+the cache's index are checked to all be kept, and an entry's record to
+be written before its directory appears.
+
+Where ``xorriso``, ``mkisofs`` or ``genisoimage`` is installed, images
+it makes are checked to extract as the tree they were made from:
+Joliet names, Rock Ridge symlinks, modes, names long enough to continue
+(CE) outside their record, relocated deep directories, and files over
+4GiB in several extents.
+'''
+
+import unittest
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import subprocess
+from distutils.spawn import find_executable
+
+from common import OpTestInstallUtil
+from common import OpTestISO
+from common import OpTestFileIndex
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+SECTOR = OpTestISO.SECTOR
+
+
+def both(fmt, value):
+    # ISO9660 "both byte orders" fields
+    return struct.pack("<" + fmt, value) + struct.pack(">" + fmt, value)
+
+
+def make_iso(path, files):
+    '''
+    Write a minimal ISO9660 image with Rock Ridge names, files is
+    {"dir/name": contents}, a directory sector holds all its records.
+    '''
+    tree = {"": {}}
+    for name in sorted(files):
+        parts = name.split('/')
+        for i in range(1, len(parts)):
+            directory = '/'.join(parts[:i])
+            if directory not in tree:
+                tree[directory] = {}
+                tree['/'.join(parts[:i - 1])][parts[i - 1]] = None
+        tree['/'.join(parts[:-1])][parts[-1]] = name
+    extents = {}
+    next_sector = 18
+    for directory in sorted(tree):
+        extents[directory] = next_sector
+        next_sector += 1
+    file_extents = {}
+    for name in sorted(files):
+        file_extents[name] = next_sector
+        next_sector += max(1, (len(files[name]) + SECTOR - 1) / SECTOR)
+
+    def record(extent, size, is_dir, iso_name, su):
+        name_len = len(iso_name)
+        pad = "\x00" if name_len % 2 == 0 else ""
+        length = 33 + name_len + len(pad) + len(su)
+        length += length % 2
+        data = (chr(length) + "\x00" + both("I", extent) + both("I", size) +
+                "\x00" * 7 + chr(0x02 if is_dir else 0) + "\x00\x00" + both("H", 1) +
+                chr(name_len) + iso_name + pad + su)
+        return data + "\x00" * (length - len(data))
+
+    def nm(name):
+        return "NM" + chr(5 + len(name)) + "\x01\x00" + name
+
+    image = ["\x00" * SECTOR * next_sector]
+    image = bytearray(image[0])
+
+    def put(sector, data):
+        image[sector * SECTOR:sector * SECTOR + len(data)] = data
+
+    for directory in sorted(tree):
+        parent = directory.rsplit('/', 1)[0] if '/' in directory else ""
+        su = "SP\x07\x01\xbe\xef\x00" if directory == "" else ""
+        data = record(extents[directory], SECTOR, True, "\x00", su)
+        data += record(extents[parent], SECTOR, True, "\x01", "")
+        for i, child in enumerate(sorted(tree[directory])):
+            full = os.path.join(directory, child) if directory else child
+            if tree[directory][child] is None:
+                data += record(extents[full], SECTOR, True, "D%04d" % i, nm(child))
+            else:
+                data += record(file_extents[full], len(files[full]), False,
+                               "F%04d.;1" % i, nm(child))
+        assert len(data) <= SECTOR
+        put(extents[directory], data)
+    for name in files:
+        put(file_extents[name], files[name])
+    pvd = ("\x01CD001\x01\x00" + " " * 32 + "OPTEST".ljust(32) + "\x00" * 8 +
+           both("I", next_sector) + "\x00" * 32 + both("H", 1) + both("H", 1) +
+           both("H", SECTOR))
+    pvd = pvd.ljust(156, "\x00") + record(extents[""], SECTOR, True, "\x00", "")
+    put(16, pvd)
+    put(17, "\xffCD001\x01")
+    with open(path, 'wb') as f:
+        f.write(image)
+
+
+class IsoCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-iso-cache-")
+        self.cache_dir = os.path.join(self.tmpdir, "cache")
+        self.files = {"ppc/ppc64/vmlinuz": os.urandom(300 * 1024),
+                      "ppc/ppc64/initrd.img": os.urandom(700 * 1024 + 17),
+                      "repodata/repomd.xml": "<repomd/>\n",
+                      "Packages/kernel-tools-4.14.0-49.el7a.ppc64le.rpm": os.urandom(5000),
+                      "empty": ""}
+        self.iso = os.path.join(self.tmpdir, "media.iso")
+        make_iso(self.iso, self.files)
+        self.saved = (OpTestInstallUtil.BASE_PATH, OpTestInstallUtil.VMLINUX,
+                      OpTestInstallUtil.INITRD, OpTestInstallUtil.BOOTPATH,
+                      OpTestInstallUtil.ISO_CACHE)
+        OpTestInstallUtil.BASE_PATH = os.path.join(self.tmpdir, "osimages", "rhel")
+        OpTestInstallUtil.VMLINUX = "vmlinuz"
+        OpTestInstallUtil.INITRD = "initrd.img"
+        OpTestInstallUtil.BOOTPATH = "ppc/ppc64"
+        OpTestInstallUtil.ISO_CACHE = OpTestISO.ISOCache(self.cache_dir)
+        self.extractions = []
+        self.original_extract = OpTestISO.ISOCache.extract
+
+        def extract(cache, image, key):
+            self.extractions.append(key)
+            # long enough for concurrent users to pile up on the lock
+            time.sleep(0.2)
+            return self.original_extract(cache, image, key)
+        OpTestISO.ISOCache.extract = extract
+
+    def tearDown(self):
+        OpTestISO.ISOCache.extract = self.original_extract
+        OpTestInstallUtil.ISO_CACHE.release()
+        (OpTestInstallUtil.BASE_PATH, OpTestInstallUtil.VMLINUX,
+         OpTestInstallUtil.INITRD, OpTestInstallUtil.BOOTPATH,
+         OpTestInstallUtil.ISO_CACHE) = self.saved
+        shutil.rmtree(self.tmpdir)
+
+    def check_tree(self, path, files):
+        found = {}
+        for root, dirs, names in os.walk(path):
+            for name in names:
+                with open(os.path.join(root, name), 'rb') as f:
+                    found[os.path.relpath(os.path.join(root, name), path)] = f.read()
+        self.assertEqual(found, files)
+
+    def runTest(self):
+        start = time.time()
+        repo = OpTestInstallUtil.setup_repo(self.iso)
+        first = time.time() - start
+        self.assertEqual(repo, os.path.abspath(os.path.join(OpTestInstallUtil.BASE_PATH, "repo")))
+        self.check_tree(repo, self.files)
+        self.assertTrue(OpTestInstallUtil.extract_install_files(repo))
+        with open(os.path.join(OpTestInstallUtil.BASE_PATH, "initrd.img"), 'rb') as f:
+            self.assertEqual(f.read(), self.files["ppc/ppc64/initrd.img"])
+
+        # again, from the index without hashing or extracting
+        start = time.time()
+        self.assertEqual(OpTestInstallUtil.setup_repo(self.iso), repo)
+        again = time.time() - start
+        log.info("IsoCache first setup_repo {:.3f}s, cached {:.3f}s".format(first, again))
+        self.assertEqual(len(self.extractions), 1)
+        self.check_tree(repo, self.files)
+
+        # the same image somewhere else, as a URL, is hashed but not extracted
+        copy = os.path.join(self.tmpdir, "copy.iso")
+        shutil.copy(self.iso, copy)
+        self.assertEqual(OpTestISO.ISOCache(self.cache_dir).get("file://" + copy),
+                         os.path.realpath(repo))
+        self.assertEqual(len(self.extractions), 1)
+
+        # not an image at all
+        with open(os.path.join(self.tmpdir, "junk.iso"), 'wb') as f:
+            f.write(os.urandom(40 * SECTOR))
+        self.assertEqual(OpTestInstallUtil.setup_repo(os.path.join(self.tmpdir, "junk.iso")), "")
+
+
+class IsoCacheConcurrent(IsoCache):
+    '''
+    Several users (separate ISOCache objects, as separate op-test runs
+    would have) asking for the same new image get one extraction.
+    '''
+    users = 6
+
+    def runTest(self):
+        results = {}
+
+        def get(i):
+            results[i] = OpTestISO.ISOCache(self.cache_dir).get(self.iso)
+        threads = [threading.Thread(target=get, args=(i,)) for i in range(self.users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.extractions), 1)
+        self.assertEqual(len(set(results.values())), 1)
+        self.check_tree(results[0], self.files)
+
+
+class IsoCacheIndex(IsoCache):
+    '''
+    Runs remembering and forgetting images at the same time lose none of
+    each other's index updates.
+    '''
+    users = 6
+    images = 20
+
+    def runTest(self):
+        os.makedirs(self.cache_dir)
+
+        def remember(i):
+            cache = OpTestISO.ISOCache(self.cache_dir)
+            for j in range(self.images):
+                cache.remember("user{}:image{}".format(i, j), "key{}".format(j % 2))
+        threads = [threading.Thread(target=remember, args=(i,)) for i in range(self.users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        index = OpTestISO.ISOCache(self.cache_dir).index.load()
+        self.assertEqual(len(index), self.users * self.images)
+
+        threads = [threading.Thread(target=OpTestISO.ISOCache(self.cache_dir).forget,
+                                    args=("key{}".format(i),)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(OpTestISO.ISOCache(self.cache_dir).index.load(), {})
+
+
+class IsoCacheExtract(IsoCache):
+    '''
+    An entry's .json is there before its directory, so an entry is never
+    left unaccounted for (and never evicted), and a failed extraction
+    leaves neither behind.
+    '''
+    def runTest(self):
+        cache = OpTestISO.ISOCache(self.cache_dir)
+        key = OpTestFileIndex.file_hash(self.iso)
+        renamed = []
+        original_rename = os.rename
+
+        def rename(src, dst):
+            if dst == cache.entry(key):
+                renamed.append(os.path.exists(cache.entry(key, ".json")))
+            original_rename(src, dst)
+        os.rename = rename
+        try:
+            cache.get(self.iso)
+        finally:
+            os.rename = original_rename
+        self.assertEqual(renamed, [True])
+        self.assertEqual([k for used, size, k in cache.entries()], [key])
+        cache.release()
+
+        junk = os.path.join(self.tmpdir, "junk.iso")
+        with open(junk, 'wb') as f:
+            f.write(os.urandom(40 * SECTOR))
+        self.assertRaises(OpTestISO.ISOError, cache.get, junk)
+        self.assertEqual([k for used, size, k in cache.entries()], [key])
+        self.assertEqual([name for name in os.listdir(self.cache_dir)
+                          if name.startswith(".extract-")], [])
+
+
+class IsoCacheEviction(IsoCache):
+    '''
+    Over max_bytes the least recently used image goes, unless it is held.
+    '''
+    def runTest(self):
+        isos = []
+        for i in range(3):
+            path = os.path.join(self.tmpdir, "media{}.iso".format(i))
+            make_iso(path, {"data": os.urandom(100 * 1024)})
+            isos.append(path)
+        size = 100 * 1024
+        a = OpTestISO.ISOCache(self.cache_dir, max_bytes=2 * size)
+        b = OpTestISO.ISOCache(self.cache_dir, max_bytes=2 * size)
+        first = a.get(isos[0])
+        time.sleep(0.01)
+        b.get(isos[1])
+        b.release()
+        time.sleep(0.01)
+        # over the limit, but isos[0] (least recent) is held by a, so isos[1] goes
+        third = b.get(isos[2])
+        self.assertTrue(os.path.isdir(first))
+        self.assertTrue(os.path.isdir(third))
+        self.assertEqual(len(b.entries()), 2)
+        b.release()
+        # isos[0] is still held: using it again keeps it, isos[2] goes when
+        # isos[1] comes back
+        a.get(isos[0])
+        time.sleep(0.01)
+        b.get(isos[1])
+        self.assertFalse(os.path.isdir(third))
+        self.assertTrue(os.path.isdir(first))
+        a.release()
+        b.release()
+        # nothing held, the least recent (isos[0]) goes for isos[2]
+        time.sleep(0.01)
+        b.get(isos[2])
+        self.assertFalse(os.path.isdir(first))
+        self.assertEqual(len(b.entries()), 2)
+        self.assertEqual(len(self.extractions), 5)
+
+
+class IsoCacheTools(unittest.TestCase):
+    '''
+    Images from the real tools rather than make_iso, skipped without one
+    '''
+    def setUp(self):
+        for tool in ["xorriso", "mkisofs", "genisoimage"]:
+            self.tool = find_executable(tool)
+            if self.tool:
+                break
+        else:
+            self.skipTest("No xorriso, mkisofs or genisoimage")
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-iso-tools-")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make(self, tree, *options):
+        iso = os.path.join(self.tmpdir, "media.iso")
+        command = [self.tool]
+        if os.path.basename(self.tool) == "xorriso":
+            command += ["-as", "mkisofs"]
+        try:
+            subprocess.check_output(command + ["-quiet", "-iso-level", "3"] + list(options) +
+                                    ["-o", iso, tree], stderr=subprocess.STDOUT)
+        except subprocess.CalledProcessError as e:
+            self.fail("{} failed: {}".format(self.tool, e.output))
+        return iso
+
+    def extract(self, iso):
+        dest = os.path.join(self.tmpdir, "out")
+        os.mkdir(dest)
+        image = OpTestISO.ISO9660(iso)
+        try:
+            image.extract(dest)
+        finally:
+            image.close()
+        return dest
+
+    def test_rock_ridge(self):
+        tree = os.path.join(self.tmpdir, "tree")
+        deep = os.path.join(tree, *["level{}".format(i) for i in range(10)])
+        os.makedirs(deep)
+        long_name = "n" * 200
+        files = {"hello.txt": "hello\n", long_name: "long\n",
+                 os.path.relpath(os.path.join(deep, "deep.txt"), tree): "deep\n"}
+        for name, contents in files.items():
+            with open(os.path.join(tree, name), 'w') as f:
+                f.write(contents)
+        os.chmod(os.path.join(tree, "hello.txt"), 0o755)
+        os.chmod(os.path.join(tree, long_name), 0o600)
+        os.symlink("hello.txt", os.path.join(tree, "link"))
+        os.symlink("../hello.txt", os.path.join(deep, "up"))
+        os.symlink("/etc/hostname", os.path.join(tree, "absolute"))
+        options = ["-R"]
+        if os.path.basename(self.tool) == "xorriso":
+            # xorriso only relocates deep directories when asked to
+            options += ["-rr_reloc_dir", "rr_moved"]
+        out = self.extract(self.make(tree, *options))
+
+        for name, contents in files.items():
+            with open(os.path.join(out, name)) as f:
+                self.assertEqual(f.read(), contents)
+        self.assertEqual(os.stat(os.path.join(out, "hello.txt")).st_mode & 0o777, 0o755)
+        self.assertEqual(os.stat(os.path.join(out, long_name)).st_mode & 0o777, 0o600)
+        self.assertEqual(os.readlink(os.path.join(out, "link")), "hello.txt")
+        self.assertEqual(os.readlink(os.path.join(out, "absolute")), "/etc/hostname")
+        up = os.path.join(out, os.path.relpath(deep, tree), "up")
+        self.assertEqual(os.readlink(up), "../hello.txt")
+        with open(up) as f:
+            self.assertEqual(f.read(), "hello\n")
+
+    def test_joliet(self):
+        tree = os.path.join(self.tmpdir, "tree")
+        os.makedirs(os.path.join(tree, "Sub Dir"))
+        files = {"Mixed Case Name.txt": "joliet\n",
+                 os.path.join("Sub Dir", "repomd.xml"): "<repomd/>\n"}
+        for name, contents in files.items():
+            with open(os.path.join(tree, name), 'w') as f:
+                f.write(contents)
+        out = self.extract(self.make(tree, "-J"))
+        found = {}
+        for root, dirs, names in os.walk(out):
+            for name in names:
+                with open(os.path.join(root, name)) as f:
+                    found[os.path.relpath(os.path.join(root, name), out)] = f.read()
+        self.assertEqual(found, files)
+
+    def test_multi_extent(self):
+        if os.path.basename(self.tool) == "genisoimage":
+            self.skipTest("genisoimage can't write files over 4GiB")
+        size = 4 * 1024 ** 3 + 5 * SECTOR
+        stat = os.statvfs(self.tmpdir)
+        if stat.f_bavail * stat.f_frsize < size + 1024 ** 3:
+            self.skipTest("No room in {} for a {} byte image".format(self.tmpdir, size))
+        tree = os.path.join(self.tmpdir, "tree")
+        os.mkdir(tree)
+        with open(os.path.join(tree, "big"), 'wb') as f:
+            # sparse, but for the end we look for in the image
+            f.seek(size - 4)
+            f.write("tail")
+        image = OpTestISO.ISO9660(self.make(tree, "-R"))
+        try:
+            walked = [entry for entry in image.walk() if entry[1] == "file"]
+            self.assertEqual([entry[0] for entry in walked], ["big"])
+            records = walked[0][2]
+            self.assertGreater(len(records), 1)
+            self.assertEqual(sum(record['size'] for record in records), size)
+            last = records[-1]
+            self.assertEqual(image.read_at(last['extent'] * image.block_size +
+                                           last['size'] - 4, 4), "tail")
+        finally:
+            image.close()
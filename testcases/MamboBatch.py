@@ -0,0 +1,235 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+Mambo Batch
+-----------
+
+`OpTestMambo.MamboConsole.mambo_batch` runs a list of mysim/TCL commands
+in one switch to the simulator and back, rather than a round trip each
+with ``mambo_run_command`` (`testcases.OpTestMamboSim` shows both).
+
+A python script stands in for mambo: a ``# `` prompt for the target OS,
+control-C for a ``systemsim %`` prompt (a while in coming, as a loaded
+simulator's is) whose lines go to a real ``tclsh`` with a few ``mysim``
+commands, and ``mysim go`` back, typing what was queued with ``mysim
+console create input``. Batches are checked to come back a list of
+outputs per command, as one console line or a sourced script, to report
+the command that failed and to take one prompt where the same commands
+one at a time take one each.
+
+Skipped without a ``tclsh`` to run the TCL in.
+'''
+
+import unittest
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import time
+from distutils.spawn import find_executable
+
+import OpTestConfiguration
+from common.OpTestMambo import MamboConsole
+from testcases.StandIn import StandInSystem
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+PROMPT_SECONDS = 0.2
+
+STAND_IN_MYSIM = r'''
+set queued {}
+proc mysim {args} {
+    global queued
+    switch -- [lindex $args 0] {
+        go {
+            puts "\x01GO"
+            foreach q $queued { puts "\x01IN $q" }
+            set queued {}
+        }
+        of { return "/ {\n  compatible \"ibm,powernv\"\n}" }
+        console { lappend queued [lindex $args end] }
+        default { error "mysim: unknown command [lindex $args 0]" }
+    }
+    return ""
+}
+proc version {args} { return "mambo stand-in 1.0" }
+fconfigure stdout -buffering line
+set buf ""
+while {[gets stdin line] >= 0} {
+    append buf $line "\n"
+    if {![info complete $buf]} continue
+    if {[catch {uplevel #0 $buf} r]} { puts $r } elseif {$r ne ""} { puts $r }
+    set buf ""
+    puts "\x01DONE"
+}
+'''
+
+STAND_IN_MAMBO = r'''#!{python}
+import os, subprocess, sys, termios, time
+# control-C is ours to read, not a signal, and we echo as mambo does
+attrs = termios.tcgetattr(0)
+attrs[3] &= ~(termios.ISIG | termios.ICANON | termios.ECHO)
+attrs[6][termios.VMIN] = 1
+attrs[6][termios.VTIME] = 0
+termios.tcsetattr(0, termios.TCSANOW, attrs)
+tcl = subprocess.Popen(["tclsh", {mysim!r}], stdin=subprocess.PIPE,
+                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+write = lambda data: os.write(1, data)
+
+def target(line):
+    if line.startswith("echo "):
+        write(line[len("echo "):] + "\n")
+    write("# ")
+
+def simulator(line):
+    with open({log!r}, "a") as f:
+        f.write(line + "\n")
+    tcl.stdin.write(line + "\n")
+    tcl.stdin.flush()
+    go, queued = False, []
+    for out in iter(tcl.stdout.readline, ""):
+        if out == "\x01DONE\n":
+            break
+        elif out == "\x01GO\n":
+            go = True
+        elif out.startswith("\x01IN "):
+            queued.append(out[len("\x01IN "):].rstrip("\n"))
+        else:
+            write(out)
+    if go:
+        write("# ")
+        for q in queued:
+            write(q + "\n")
+            target(q)
+        return target
+    time.sleep({delay})
+    write("systemsim % ")
+    return simulator
+
+mode = target
+write("# ")
+line = ""
+while True:
+    data = os.read(0, 4096)
+    if not data:
+        break
+    for c in data:
+        if c == "\x03" and mode == target:
+            write("\nsystemsim % ")
+            mode, line = simulator, ""
+        elif c in "\r\n":
+            write("\n")
+            mode = mode(line) or mode
+            line = ""
+        else:
+            write(c)
+            line += c
+'''
+
+
+class MamboBatch(unittest.TestCase):
+    commands = ["version list", "mysim of print", "set x 5", "expr {$x * 2}",
+                "mysim console create input in string \"echo hello\"",
+                "set y {a b c}", "llength $y", "string toupper mambo"]
+
+    def setUp(self):
+        if not find_executable("tclsh"):
+            self.skipTest("No tclsh")
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-mambo-batch-")
+        self.log = os.path.join(self.tmpdir, "systemsim.log")
+        mysim = os.path.join(self.tmpdir, "mysim.tcl")
+        with open(mysim, 'w') as f:
+            f.write(STAND_IN_MYSIM)
+        self.mambo = os.path.join(self.tmpdir, "systemsim")
+        with open(self.mambo, 'w') as f:
+            f.write(STAND_IN_MAMBO.format(python=sys.executable, mysim=mysim, log=self.log,
+                                          delay=PROMPT_SECONDS))
+        os.chmod(self.mambo, stat.S_IRWXU)
+        self.run_script = os.path.join(self.tmpdir, "skiboot.tcl")
+        with open(self.run_script, 'w') as f:
+            f.write("")
+        self.console = MamboConsole(mambo_binary=self.mambo,
+                                    mambo_initial_run_script=self.run_script,
+                                    prompt="# ", logfile=None)
+        self.console.set_system(StandInSystem())
+        self.pty = self.console.connect()
+        self.pty.expect_exact("# ", timeout=10)
+
+    def tearDown(self):
+        self.console.close()
+        shutil.rmtree(self.tmpdir)
+
+    def lines_sent(self):
+        with open(self.log) as f:
+            return len(f.readlines())
+
+    def test_batch(self):
+        outputs = self.console.mambo_batch(self.commands, timeout=10)
+        self.assertEqual(outputs, [["mambo stand-in 1.0"],
+                                   ["/ {", "  compatible \"ibm,powernv\"", "}"],
+                                   ["5"], ["10"], [], ["a b c"], ["3"], ["MAMBO"]])
+        # one line for the lot and mysim go
+        self.assertEqual(self.lines_sent(), 2)
+        # what was queued runs on the target once back
+        self.pty.expect_exact("hello", timeout=10)
+
+        # a multi-line command goes in a script, gone afterwards
+        outputs = self.console.mambo_batch(["puts \"two\nlines\"", "set x"], timeout=10)
+        self.assertEqual(outputs, [["two", "lines"], ["5"]])
+        self.assertEqual(self.lines_sent(), 4)
+        self.assertEqual([n for n in os.listdir(tempfile.gettempdir())
+                          if n.startswith("op-test-mambo-") and n.endswith(".tcl")], [])
+
+        # or one the caller asked for, kept
+        script = os.path.join(self.tmpdir, "batch.tcl")
+        self.assertEqual(self.console.mambo_batch(["version list"], script=script),
+                         [["mambo stand-in 1.0"]])
+        with open(script) as f:
+            self.assertIn("catch {version list}", f.read())
+
+    def test_failure(self):
+        with self.assertRaises(Exception) as cm:
+            self.console.mambo_batch(["set y 1", "mysim bogus", "set y 2"], timeout=10)
+        self.assertEqual(type(cm.exception).__name__, "CommandFailed")
+        self.assertEqual(cm.exception.command, "mysim bogus")
+        self.assertIn("unknown command bogus", cm.exception.output)
+        # the rest of the batch ran, and we're back on the target
+        self.assertEqual(self.console.mambo_batch(["set y"]), [["2"]])
+
+    def test_round_trips(self):
+        start = time.time()
+        self.console.mambo_enter()
+        singly = [self.console.mambo_run_command(c, timeout=10) for c in self.commands]
+        self.console.mambo_exit()
+        self.pty.expect_exact("hello", timeout=10)
+        one_at_a_time = time.time() - start
+        self.assertEqual(singly[3], ["10"])
+
+        start = time.time()
+        outputs = self.console.mambo_batch(self.commands, timeout=10)
+        batched = time.time() - start
+        self.assertEqual(outputs[3], ["10"])
+        log.info("MamboBatch {} mysim commands: one at a time {:.2f}s, batched {:.2f}s"
+                 .format(len(self.commands), one_at_a_time, batched))
+        self.assertLess(batched, one_at_a_time / 2)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+'''
+OPexpect Replay
+---------------
+
+Replay recorded console logs through `OPexpect.spawn.expect` and through the
+previous implementation (failure patterns prepended to every call and
+rescanned by pexpect over the whole buffer) and compare throughput.
+
+Both paths must see the same sequence of matches and failure exceptions.
+
+Set ``OP_TEST_REPLAY_LOGS`` to a colon separated list of console logs
+(e.g. the ``*.log`` files left in the op-test output directory), otherwise a
+synthetic boot log is generated.
+'''
+
+import unittest
+import os
+import time
+import tempfile
+import pexpect
+
+from common import OPexpect
+
+import logging
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+
+class LegacySpawn(pexpect.spawn):
+    '''
+    The OPexpect.spawn.expect pattern handling before the combined scanner,
+    without the failure classification (we only care about scan cost).
+    '''
+    def expect(self, pattern, timeout=-1, searchwindowsize=-1):
+        patterns = list(OPexpect.op_patterns) # we want a *copy*
+        if isinstance(pattern, list):
+            patterns = patterns + pattern
+        else:
+            patterns.append(pattern)
+        r = super(LegacySpawn, self).expect(patterns,
+                                            timeout=timeout,
+                                            searchwindowsize=searchwindowsize)
+        if r < len(OPexpect.op_patterns):
+            raise Exception("failure pattern {}".format(r))
+        return r - len(OPexpect.op_patterns)
+
+
+class OpExpectReplay(unittest.TestCase):
+    synthetic_lines = 60000
+    # roughly what OpTestSystem.wait_for_it looks for while booting
+    boot_patterns = ['Petitboot', '/ #', 'shutdown requested', 'x=exit',
+                     'login: ', 'mon> ', 'dracut:/#',
+                     'System shutting down with error status', 'Aborting!']
+
+    def setUp(self):
+        self.tmpfile = None
+        replay = os.environ.get("OP_TEST_REPLAY_LOGS")
+        if replay:
+            self.logs = [x for x in replay.split(":") if x]
+        else:
+            self.tmpfile = tempfile.NamedTemporaryFile(suffix=".log")
+            for i in range(self.synthetic_lines):
+                self.tmpfile.write("[{:12.6f}] synthetic: probing device {}"
+                                   " at address 0x{:08x}\n"
+                                   .format(i / 1000.0, i % 97, i * 4096))
+                if i % 5000 == 4999:
+                    self.tmpfile.write("\nlocalhost login: \n")
+            self.tmpfile.flush()
+            self.logs = [self.tmpfile.name]
+
+    def tearDown(self):
+        if self.tmpfile:
+            self.tmpfile.close()
+
+    def replay(self, spawn_class, logfile):
+        child = spawn_class("cat {}".format(logfile), maxread=8000)
+        child.setwinsize(1000, 1000)
+        results = []
+        while True:
+            try:
+                r = child.expect(self.boot_patterns + [pexpect.EOF],
+                                 timeout=60)
+            except Exception as e:
+                # failure patterns, both implementations raise
+                results.append("failure")
+                continue
+            if r == len(self.boot_patterns):
+                break
+            results.append(r)
+        child.close()
+        return results
+
+    def runTest(self):
+        for logfile in self.logs:
+            size = os.path.getsize(logfile)
+            start = time.time()
+            legacy_results = self.replay(LegacySpawn, logfile)
+            legacy_time = time.time() - start
+            start = time.time()
+            new_results = self.replay(OPexpect.spawn, logfile)
+            new_time = time.time() - start
+            log.info("OpExpectReplay {} ({} bytes) legacy={:.2f} MB/s"
+                     " scanner={:.2f} MB/s speedup={:.2f}x"
+                     .format(logfile, size,
+                             size / legacy_time / 1e6,
+                             size / new_time / 1e6,
+                             legacy_time / new_time))
+            self.assertEqual(legacy_results, new_results,
+                             "Replay of {} matched differently, legacy={}"
+                             " scanner={}"
+                             .format(logfile, legacy_results, new_results))
@@ -41,6 +41,8 @@ import subprocess
 import re
 import random
 import decimal
+import math
+import collections
 
 import unittest
 
@@ -55,12 +57,101 @@ import logging
 import OpTestLogger
 log = OpTestLogger.optest_logger_glob.get_logger(__name__)
 
+# starts each sample in OpTestEM.sample_cpus output
+SAMPLE_MARKER = "@@op-test-sample@@"
+
+
+class CpuSamples(object):
+    '''
+    A sysfs attribute of every CPU sampled over time on the target, see
+    OpTestEM.sample_cpus.
+
+    samples is a list of (seconds since the setting, {cpu : value}), time
+    comes from /proc/uptime so is only good to 10ms.
+    '''
+    def __init__(self, attribute, samples):
+        self.attribute = attribute
+        self.samples = samples
+
+    @property
+    def cpus(self):
+        cpus = set()
+        for t, values in self.samples:
+            cpus.update(values)
+        return sorted(cpus)
+
+    def last(self, cpu):
+        for t, values in reversed(self.samples):
+            if cpu in values:
+                return values[cpu]
+
+    def final(self):
+        '''
+        How many CPUs read each value in the last sample
+        '''
+        return collections.Counter(self.samples[-1][1].values()) if self.samples else {}
+
+    def convergence(self, targets, tolerance=0):
+        '''
+        When each CPU got to (within tolerance, a fraction, of) one of the
+        targets and stayed there to the end.
+
+        :returns: dict of cpu : seconds, None if it never settled
+        '''
+        targets = [int(t) for t in targets]
+
+        def ok(value):
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                return False
+            return any(abs(value - t) <= t * tolerance for t in targets)
+
+        result = {}
+        for cpu in self.cpus:
+            settled = None
+            for t, values in self.samples:
+                if ok(values.get(cpu)):
+                    if settled is None:
+                        settled = t
+                else:
+                    settled = None
+            result[cpu] = settled
+        return result
+
+    def unconverged(self, convergence):
+        return sorted(cpu for cpu, t in convergence.items() if t is None)
+
+    def distribution(self, convergence):
+        '''
+        min, median, 90th percentile and max convergence time (seconds)
+        '''
+        times = sorted(t for t in convergence.values() if t is not None)
+        result = {'cpus': len(convergence), 'converged': len(times)}
+        if times:
+            def percentile(q):
+                return times[max(0, int(math.ceil(q * len(times))) - 1)]
+            result.update({'min': times[0], 'median': percentile(0.5),
+                           'p90': percentile(0.9), 'max': times[-1]})
+        return result
+
+    def report(self, convergence):
+        d = self.distribution(convergence)
+        if not d['converged']:
+            return "{} of {} CPUs converged in {} samples, final {}".format(
+                d['converged'], d['cpus'], len(self.samples), dict(self.final()))
+        return ("{converged} of {cpus} CPUs converged in {samples} samples, min {min:.2f}s"
+                " median {median:.2f}s p90 {p90:.2f}s max {max:.2f}s, final {final}"
+                .format(samples=len(self.samples), final=dict(self.final()), **d))
+
+
 class OpTestEM():
     def setUp(self):
         conf = OpTestConfiguration.conf
         self.cv_HOST = conf.host()
         self.cv_IPMI = conf.ipmi()
         self.cv_SYSTEM = conf.system()
+        self.util = conf.util
         self.ppc64cpu_freq_re = re.compile(r"([a-z]+):\s+([\d.]+)")
         self.c = None # use this for tearDown
 
@@ -81,31 +172,42 @@ class OpTestEM():
           return
 
         cpu_num = self.get_first_available_cpu()
-        # Check cpufreq driver enabled
-        cpufreq = False
-        try:
-            self.c.run_command("ls --color=never /sys/devices/system/cpu/cpu%s/cpufreq/" % cpu_num)
-            cpufreq = True
-        except CommandFailed:
-            pass
+        # Check cpufreq and cpuidle drivers enabled, in one go
+        files = self.read_sysfs("/sys/devices/system/cpu/cpu%s/cpufreq/scaling_governor" % cpu_num,
+                                "/sys/devices/system/cpu/cpu%s/cpuidle/state*/disable" % cpu_num)
+        cpufreq = any("/cpufreq/" in path for path in files)
+        cpuidle = any("/cpuidle/" in path for path in files)
         # return back to sane cpu governor
         if cpufreq:
             self.set_cpu_gov("powersave")
 
-        # Check cpuidle driver enabled
-        cpuidle = False
-        try:
-            self.c.run_command("ls --color=never /sys/devices/system/cpu/cpu%s/cpuidle/" % cpu_num)
-            cpuidle = True
-        except CommandFailed:
-            pass
-
         if not cpuidle:
             return
         # and then re-enable all idle states
-        idle_states = self.get_idle_states()
-        for i in idle_states:
-            self.enable_idle_state(i)
+        self.c.run_command("for i in /sys/devices/system/cpu/cpu*/cpuidle/state*/disable; do echo 0 > $i; done")
+
+    def read_sysfs(self, *patterns):
+        '''
+        Read all the files matching the patterns in one command, see
+        OpTestUtil.read_files. Returns a dict of path : contents.
+        '''
+        return self.util.read_files(self.c, list(patterns))
+
+    def get_cpu_files(self, *attributes):
+        '''
+        Read attributes (e.g. "cpufreq/cpuinfo_cur_freq", globs work) of
+        every CPU that has them, in one command.
+
+        :returns: dict of (cpu number, attribute) : contents
+        '''
+        files = self.read_sysfs(*["/sys/devices/system/cpu/cpu*/" + a for a in attributes])
+        result = {}
+        for path, value in files.items():
+            parts = path.split('/')
+            if not re.match(r"cpu\d+$", parts[5]):
+                continue
+            result[(int(parts[5][3:]), '/'.join(parts[6:]))] = value
+        return result
 
     def get_idle_states(self):
         return self.c.run_command("find /sys/devices/system/cpu/cpu*/cpuidle/state* -type d | cut -d'/' -f8 | sort -u | sed -e 's/^state//'")
@@ -127,12 +229,81 @@ class OpTestEM():
         log.debug(freq_list)
         return freq_list
 
+    def set_cpu_freq_command(self, i_freq):
+        return "for i in /sys/devices/system/cpu/cpu*/cpufreq/scaling_setspeed; do echo %s > $i; done" % i_freq
+
     def set_cpu_freq(self, i_freq):
         '''
         Run a command on the host to set CPU frequency on all CPUs.
         '''
-        l_cmd = "for i in /sys/devices/system/cpu/cpu*/cpufreq/scaling_setspeed; do echo %s > $i; done" % i_freq
-        self.c.run_command(l_cmd)
+        self.c.run_command(self.set_cpu_freq_command(i_freq))
+
+    def sample_cpus(self, attribute="cpufreq/cpuinfo_cur_freq", setting=None,
+                    samples=20, interval=0.05, until=None, cpus="*"):
+        '''
+        Run setting (a command, e.g. from set_cpu_freq_command) then read
+        attribute of every CPU samples times, interval seconds apart, all
+        in one loop on the target.
+
+        :param until: stop sampling early once every CPU reads this
+        :param cpus: glob of the CPU numbers to sample, "0" for just cpu0
+        :returns: CpuSamples, times from just before the setting
+        '''
+        path = "/sys/devices/system/cpu/cpu%s/%s" % (cpus, attribute)
+        loop = ['read t x < /proc/uptime', 'echo "%s $t $t0"' % SAMPLE_MARKER,
+                's=$(grep -H . %s)' % path, 'echo "$s"']
+        if until is not None:
+            # on the sample just printed, not a later read
+            loop.append("echo \"$s\" | grep -qv ':%s$' || break" % until)
+        loop += ['n=$((n+1))', '[ $n -lt %d ] && sleep %s' % (samples, interval)]
+        l_cmd = "; ".join(['read t0 x < /proc/uptime'] + ([setting] if setting else []) +
+                          ['n=0', 'while [ $n -lt %d ]; do %s; done' % (samples, "; ".join(loop)),
+                           'true'])
+        output = self.c.run_command(l_cmd, timeout=60 + int(samples * (interval + 1)))
+
+        value_re = re.compile(r".*/cpu(\d+)/%s:(.*)$" % re.escape(attribute))
+        result = []
+        for line in output:
+            if line.startswith(SAMPLE_MARKER + " "):
+                t, t0 = line.split()[1:3]
+                result.append((float(t) - float(t0), {}))
+                continue
+            m = value_re.match(line)
+            if m and result:
+                result[-1][1][int(m.group(1))] = m.group(2).strip()
+        samples = CpuSamples(attribute, result)
+        log.debug("Sampled %s on %d CPUs %d times" % (attribute, len(samples.cpus), len(result)))
+        return samples
+
+    def verify_cpu_freq_converged(self, freqs, samples, tolerance=0):
+        '''
+        Every CPU in samples settled on one of freqs, returns the
+        convergence (cpu : seconds)
+        '''
+        self.assertTrue(samples.cpus, "No CPU has %s" % samples.attribute)
+        convergence = samples.convergence(freqs, tolerance)
+        log.debug("CPU frequency %s: %s" % (freqs, samples.report(convergence)))
+        wrong = samples.unconverged(convergence)
+        self.assertEqual(wrong, [],
+                         "CPU frequency not changed to %s on CPUs %s: %s"
+                         % (" or ".join(str(f) for f in freqs), wrong, [samples.last(cpu) for cpu in wrong]))
+        return convergence
+
+    def dvfs_sweep(self, freq_list, samples=20, interval=0.05):
+        '''
+        Set each frequency on all CPUs and sample them until they all
+        get there, a command per frequency.
+
+        :returns: dict of freq : CpuSamples.distribution of convergence times
+        '''
+        result = {}
+        for i_freq in freq_list:
+            cpu_samples = self.sample_cpus(setting=self.set_cpu_freq_command(i_freq),
+                                           samples=samples, interval=interval, until=i_freq)
+            convergence = self.verify_cpu_freq_converged([i_freq], cpu_samples)
+            result[i_freq] = cpu_samples.distribution(convergence)
+        log.debug("DVFS sweep convergence: %s" % result)
+        return result
 
     def verify_cpu_freq(self, i_freq, and_measure=True):
         '''
@@ -141,19 +312,11 @@ class OpTestEM():
 
         When measuring CPU frequency, we allow a bit of error in measurement.
         '''
-        l_cmd = "cat /sys/devices/system/cpu/cpu0/cpufreq/cpuinfo_cur_freq"
-        cur_freq = self.c.run_command(l_cmd)
-        if not cur_freq[0] == i_freq:
-            # (According to Vaidy) it may take milliseconds to have the
-            # request for a frequency change to come into effect.
-            # So, if we happen to be *really* quick checking the result,
-            # we may have checked before it has taken effect. So, we
-            # sleep for a (short) amount of time and retry.
-            time.sleep(0.2)
-            cur_freq = self.c.run_command(l_cmd)
-
-        self.assertEqual(cur_freq[0], i_freq,
-                         "CPU frequency not changed to %s" % i_freq)
+        # (According to Vaidy) it may take milliseconds to have the
+        # request for a frequency change to come into effect.
+        # So we sample all CPUs for a while (in one command), stopping
+        # as soon as they all have it.
+        self.verify_cpu_freq_converged([i_freq], self.sample_cpus(until=i_freq))
         if not and_measure:
             return
         frequency_output = self.c.run_command("ppc64_cpu --frequency")
@@ -176,45 +339,38 @@ class OpTestEM():
                                msg="Set and measured CPU frequency differ too greatly")
 
 
-    def verify_cpu_freq_almost(self, i_freq):
-        '''
-        This function verifies CPU frequency against a single or list of frequency's provided
+    def verify_cpu_freq_almost(self, i_freq, all_cpus=False):
         '''
-        l_cmd = "cat /sys/devices/system/cpu/cpu0/cpufreq/cpuinfo_cur_freq"
-        cur_freq = self.c.run_command(l_cmd)
+        This function verifies CPU frequency against a single or list of frequency's provided,
+        within 1%. By default on CPU0, given 0.2s to get to a single frequency.
 
-        if not type(i_freq) is list:
-            if not cur_freq[0] == i_freq:
-                time.sleep(0.2)
-                cur_freq = self.c.run_command(l_cmd)
-
-            if int(cur_freq[0]) == int(i_freq):
-                return
-
-        achieved = False
+        :param all_cpus: on every CPU, and staying there over half a second
+                         of samples
+        '''
         if not type(i_freq) is list:
             freq_list = [i_freq]
         else:
             freq_list = i_freq
 
-        for freq in freq_list:
-            delta = int(freq) / (100)
-            try:
-                self.assertAlmostEqual(int(cur_freq[0]), int(freq), delta=delta,
-                                       msg="CPU frequency not changed to %s" % i_freq)
-                achieved = True
-                break
-            except AssertionError:
-                pass
+        if all_cpus:
+            self.verify_cpu_freq_converged(freq_list, self.sample_cpus(samples=10), tolerance=0.01)
+            return
+        if len(freq_list) == 1:
+            samples = self.sample_cpus(cpus="0", samples=2, interval=0.2, until=freq_list[0])
+        else:
+            samples = self.sample_cpus(cpus="0", samples=1)
+        # only the last reading counts
+        samples.samples = samples.samples[-1:]
+        self.verify_cpu_freq_converged(freq_list, samples, tolerance=0.01)
 
-        self.assertTrue(achieved, "CPU failed to achieve any one of the frequency in %s" % freq_list)
+    def set_cpu_gov_command(self, i_gov):
+        return "for i in /sys/devices/system/cpu/cpu*/cpufreq/scaling_governor; do echo %s > $i; done" % i_gov
 
     def set_cpu_gov(self, i_gov):
         '''
         Sets the CPU governor for all CPUs.
         '''
-        l_cmd = "for i in /sys/devices/system/cpu/cpu*/cpufreq/scaling_governor; do echo %s > $i; done" % i_gov
-        self.c.run_command(l_cmd)
+        self.c.run_command(self.set_cpu_gov_command(i_gov))
 
     def verify_cpu_gov(self, i_gov):
         '''
@@ -253,21 +409,43 @@ class OpTestEM():
         except CommandFailed:
             self.c.run_command(sysfs_cmd)
 
+    def verify_idle_state(self, i_idle, value):
+        attribute = "cpuidle/state%s/disable" % i_idle
+        cur_value = self.get_cpu_files(attribute)
+        self.assertTrue(cur_value, "No CPU has %s" % attribute)
+        return sorted(cpu for (cpu, a), v in cur_value.items() if v != value)
+
     def verify_enable_idle_state(self, i_idle):
         '''
-        Verify CPU idle state (on CPU0) is enabled (by reading sysfs).
+        Verify CPU idle state (on all CPUs) is enabled (by reading sysfs).
         '''
-        l_cmd = "cat /sys/devices/system/cpu/cpu0/cpuidle/state%s/disable" % i_idle
-        cur_value = self.c.run_command(l_cmd)
-        self.assertEqual(cur_value[0], "0", "CPU state%s not enabled" % i_idle)
+        wrong = self.verify_idle_state(i_idle, "0")
+        self.assertEqual(wrong, [], "CPU state%s not enabled on CPUs %s" % (i_idle, wrong))
 
     def verify_disable_idle_state(self, i_idle):
         '''
-        Verify CPU idle state (on CPU0) is *disabled* (by reading sysfs).
+        Verify CPU idle state (on all CPUs) is *disabled* (by reading sysfs).
+        '''
+        wrong = self.verify_idle_state(i_idle, "1")
+        self.assertEqual(wrong, [], "CPU state%s not disabled on CPUs %s" % (i_idle, wrong))
+
+    def get_idle_counters(self, idle_states):
+        '''
+        usage and time of the idle states on every CPU, in one read.
+
+        :returns: dict of state : {cpu : (usage, time)}
         '''
-        l_cmd = "cat /sys/devices/system/cpu/cpu0/cpuidle/state%s/disable" % i_idle
-        cur_value = self.c.run_command(l_cmd)
-        self.assertEqual(cur_value[0], "1", "CPU state%s not disabled" % i_idle)
+        files = self.get_cpu_files(*["cpuidle/state%s/%s" % (i, a)
+                                     for i in idle_states for a in ("usage", "time")])
+        counters = dict((i, {}) for i in idle_states)
+        for (cpu, attribute), value in files.items():
+            if not attribute.endswith("/usage"):
+                continue
+            state = attribute.split('/')[1][len("state"):]
+            time_value = files.get((cpu, "cpuidle/state%s/time" % state))
+            if state in counters and time_value is not None:
+                counters[state][cpu] = (int(value), int(time_value))
+        return counters
 
     def get_pstate_limits(self):
         '''
@@ -275,11 +453,14 @@ class OpTestEM():
         '''
         cpu_num = self.get_first_available_cpu()
 
+        path = "/sys/devices/system/cpu/cpu%s/cpufreq/" % cpu_num
+        names = ["cpuinfo_min_freq", "cpuinfo_max_freq", "cpuinfo_nominal_freq"]
+        files = self.read_sysfs(*[path + n for n in names])
         # Check cpufreq driver enabled
-        self.c.run_command("ls --color=never /sys/devices/system/cpu/cpu%s/cpufreq/" % cpu_num)
-        pstate_min = self.c.run_command("cat /sys/devices/system/cpu/cpu%s/cpufreq/cpuinfo_min_freq" % cpu_num)[0]
-        pstate_max = self.c.run_command("cat /sys/devices/system/cpu/cpu%s/cpufreq/cpuinfo_max_freq" % cpu_num)[0]
-        pstate_nom = self.c.run_command("cat /sys/devices/system/cpu/cpu%s/cpufreq/cpuinfo_nominal_freq" % cpu_num)[0]
+        if len(files) != len(names):
+            raise CommandFailed("read " + path + "cpuinfo_*_freq",
+                                ["{}: {}".format(p, v) for p, v in files.items()], 1)
+        pstate_min, pstate_max, pstate_nom = [files[path + n] for n in names]
         return pstate_min, pstate_max, pstate_nom
 
     def get_list_of_governors(self):
@@ -352,9 +533,7 @@ class cpu_freq_states_host(OpTestEM, unittest.TestCase):
         # Set the cpu governer to userspace
         self.set_cpu_gov("userspace")
         self.verify_cpu_gov("userspace")
-        for i_freq in freq_list:
-            self.set_cpu_freq(i_freq)
-            self.verify_cpu_freq(i_freq, False)
+        self.dvfs_sweep(freq_list)
         for i in range(1, self.NR_FREQUENCIES_VERIFIED):
             i_freq = random.choice(freq_list)
             self.set_cpu_freq(i_freq)
@@ -391,12 +570,13 @@ class cpu_freq_gov_host(OpTestEM, DeviceTreeValidation, unittest.TestCase):
             log.debug("No WoF frequencies")
             freq_list = [pstate_max]
         else:
+            path = "/sys/devices/system/cpu/cpu%s/cpufreq/" % cpu_num
+            files = self.read_sysfs(path + "scaling_boost_frequencies",
+                                    path + "scaling_available_frequencies")
             # Add boost frequencies
-            l_res = self.c.run_command("cat /sys/devices/system/cpu/cpu%s/cpufreq/scaling_boost_frequencies" % cpu_num)
-            freq_list = l_res[0].split(' ')[:-1] # remove empty entry at end
+            freq_list = files[path + "scaling_boost_frequencies"].split()
             # Add turbo frequency
-            l_res = self.c.run_command("cat /sys/devices/system/cpu/cpu%s/cpufreq/scaling_available_frequencies" % cpu_num)
-            fre_list = l_res[0].split(' ')[:-1]
+            fre_list = files[path + "scaling_available_frequencies"].split()
             freq_list.append(max(fre_list))
 
         # performance(Pstate_max),
@@ -453,12 +633,12 @@ class cpu_boost_freqs_host(OpTestEM, DeviceTreeValidation, unittest.TestCase):
             self.enable_idle_state(i)
 
         # Get available cpu boost frequencies
-        try:
-            l_res = self.c.run_command("cat /sys/devices/system/cpu/cpu%s/cpufreq/scaling_boost_frequencies" % cpu_num)
-        except CommandFailed:
+        path = "/sys/devices/system/cpu/cpu%s/cpufreq/scaling_boost_frequencies" % cpu_num
+        l_res = self.read_sysfs(path)
+        if path not in l_res:
             self.assertTrue(False, "No scaling_boost_frequencies file got created")
 
-        freq_list = l_res[0].split(' ')[:-1] # remove empty entry at end
+        freq_list = l_res[path].split()
         log.debug("Boost frequencies: {}".format(freq_list))
 
         # Boost frequencies will achieve only when cpufreq governor is performance
@@ -559,11 +739,12 @@ class cpu_idle_states_host(OpTestEM, unittest.TestCase):
         # in runtime idle states (idle_state_names)
         idle_states = self.get_idle_states()
         log.debug("Discovered idle states: {}".format(repr(idle_states)))
-        names = self.c.run_command("cat /sys/devices/system/cpu/cpu0/cpuidle/state*/name")
-        names = [[a] for a in names]
+        names = self.read_sysfs("/sys/devices/system/cpu/cpu%s/cpuidle/state*/name" % cpu_num)
         idle_state_names = {}
-        for i in range(len(idle_states)):
-            idle_state_names[idle_states[i]] = names[i]
+        for path, name in names.items():
+            idle_state_names[path.split('/')[-2][len("state"):]] = name
+        for i in idle_states:
+            idle_state_names.setdefault(i, "state%s" % i)
 
         # We first disable everything
         for i in idle_states:
@@ -572,17 +753,9 @@ class cpu_idle_states_host(OpTestEM, unittest.TestCase):
 
         # With all idle disabled, gather current usage and total time spent in idle 
         # state (as a baseline)
-        before_usage = {}
-        before_time = {}
-        for i in idle_states:
-            before_usage[i] = self.c.run_command("cat /sys/devices/system/cpu/cpu*/cpuidle/state%s/usage" % (i))
-            before_usage[i] = [int(a) for a in before_usage[i]]
-            before_time[i] = self.c.run_command("cat /sys/devices/system/cpu/cpu*/cpuidle/state%s/time" % (i))
-            before_time[i] = [int(a) for a in before_time[i]]
+        before = self.get_idle_counters(idle_states)
 
         # Enable one idle state, check residency, disable and repeat.
-        after_usage = {}
-        after_time = {}
         for i in idle_states:
             success = 0
             total = 0
@@ -591,19 +764,21 @@ class cpu_idle_states_host(OpTestEM, unittest.TestCase):
 
             self.c.run_command(workload)
 
-            after_usage[i] = self.c.run_command("cat /sys/devices/system/cpu/cpu*/cpuidle/state%s/usage" % i)
-            after_usage[i] = [int(a) for a in after_usage[i]]
-            after_time[i] = self.c.run_command("cat /sys/devices/system/cpu/cpu*/cpuidle/state%s/time" % i)
-            after_time[i] = [int(a) for a in after_time[i]]
-            for c in range(nrcpus):
-                log.debug("# CPU %d entered idle state %s %u times" % (c, idle_state_names[i], after_usage[i][c] - before_usage[i][c]))
-                log.debug("# CPU %d entered idle state %s for %u microseconds" % (c, idle_state_names[i], after_time[i][c] - before_time[i][c]))
-                if after_usage[i][c] > before_usage[i][c]:
+            after = self.get_idle_counters([i])
+            for c in sorted(after[i]):
+                if c not in before[i]:
+                    continue
+                after_usage, after_time = after[i][c]
+                before_usage, before_time = before[i][c]
+                log.debug("# CPU %d entered idle state %s %u times" % (c, idle_state_names[i], after_usage - before_usage))
+                log.debug("# CPU %d entered idle state %s for %u microseconds" % (c, idle_state_names[i], after_time - before_time))
+                if after_usage > before_usage:
                     success += 0.5
-                if after_time[i][c] > before_time[i][c]:
+                if after_time > before_time:
                     success += 0.5
                 total += 1
             log.debug("CPUs entered idle state %s for %d/%d of the times" % (idle_state_names[i], success, total))
+            self.assertGreater(total, 0, "No CPU has idle state %s counters" % idle_state_names[i])
             self.assertGreater(success/total, 0.95, "CPUs entered idle state %s for %d/%d of the times" % (idle_state_names[i], success, total))
             self.disable_idle_state(i)
 
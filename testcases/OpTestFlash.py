@@ -580,6 +580,7 @@ class InbandHpmFLASH(OpTestFlashBase):
         self.cv_SYSTEM.sys_sdr_clear()
         self.validate_side_activated()
         self.cv_HOST.host_code_update(self.hpm_path, str(BMC_CONST.BMC_FWANDPNOR_IMAGE_UPDATE))
+        self.cv_IPMI.sdr_invalidate()
         self.cv_SYSTEM.goto_state(OpSystemState.OFF)
         self.cv_SYSTEM.goto_state(OpSystemState.OS)
         self.validate_side_activated()
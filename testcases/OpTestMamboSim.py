@@ -102,35 +102,17 @@ class OpTestMamboSim(unittest.TestCase):
         lsprop_output = self.c.run_command('lsprop /sys/firmware/devicetree/base/ibm,opal/firmware')
         cmdline_output = self.c.run_command('cat /proc/cmdline')
 
-        # exit target OS and enter mambo
-        self.c.mambo_enter()
-
         mambo_command_2 = "ls --color=never -l /"
         mambo_command_3 = "nvram --partitions"
         mambo_command_4 = "cat /proc/powerpc/eeh"
         mambo_command_5 = "cat /proc/cmdline"
         mambo_command_6 = "cat /sys/devices/system/cpu/present"
         mambo_command_7 = "cat /proc/version"
-        # mysim command 2
-        self.c.mambo_run_command("mysim console create input in string \"{}\"".format(mambo_command_2))
-
-        # mysim command 3
-        self.c.mambo_run_command("mysim console create input in string \"{}\"".format(mambo_command_3))
-
-        # mysim command 4
-        self.c.mambo_run_command("mysim console create input in string \"{}\"".format(mambo_command_4))
-
-        # mysim command 5
-        self.c.mambo_run_command("mysim console create input in string \"{}\"".format(mambo_command_5))
-
-        # mysim command 6
-        self.c.mambo_run_command("mysim console create input in string \"{}\"".format(mambo_command_6))
-
-        # mysim command 7
-        self.c.mambo_run_command("mysim console create input in string \"{}\"".format(mambo_command_7))
-
-        # return to target OS
-        self.c.mambo_exit()
+        # mysim commands 2 to 7, queued in one enter/exit of mambo
+        # rather than a round trip to the systemsim prompt each
+        self.c.mambo_batch(["mysim console create input in string \"{}\"".format(command)
+                            for command in [mambo_command_2, mambo_command_3, mambo_command_4,
+                                            mambo_command_5, mambo_command_6, mambo_command_7]])
 
         rc = self.pty.expect([self.prompt, pexpect.TIMEOUT, pexpect.EOF], timeout=10)
         log.debug("mambo command 2 '{}'".format(mambo_command_2))
@@ -157,25 +139,18 @@ class OpTestMamboSim(unittest.TestCase):
         for i in self.pty.before.replace("\r\r\n", "\n").splitlines():
             log.debug("mambo command 7 before=\"{}\"".format(i))
 
-        # exit target OS and enter mambo
-        self.c.mambo_enter()
-
-        # mysim command 8
-        self.c.mambo_run_command("mysim console create input in string \"echo 'hello world command 8'\"")
-
-        # mambo commands
-        version_list = self.c.mambo_run_command("version list")
-        log.debug("version list={}".format(version_list))
-        define_list = self.c.mambo_run_command("define list") # list machines available
-        log.debug("define list ={}".format(define_list))
-        display_configures = self.c.mambo_run_command("display configures") # all active configuration objects and machines
-        log.debug("display configures={}".format(display_configures))
-
-        # return to target OS
-        # queued_echo_output will NOT contain the command 8 echo of 'hello world command 8'
-        # when returning to the target OS the pexpect buffer is awaiting retrieval, "expecting"
-        queued_echo_output = self.c.mambo_exit()
-        log.debug("mambo_exit command 8 queued_echo_output={}".format(queued_echo_output))
+        # mysim command 8 and mambo commands, one enter/exit for the lot
+        # each command's output in its own list
+        batch = ["mysim console create input in string \"echo 'hello world command 8'\"",
+                 "version list",
+                 "define list", # list machines available
+                 "display configures"] # all active configuration objects and machines
+        outputs = self.c.mambo_batch(batch)
+        for command, output in zip(batch[1:], outputs[1:]):
+            log.debug("{}={}".format(command, output))
+
+        # back on the target OS, the command 8 echo of 'hello world command 8'
+        # is in the pexpect buffer awaiting retrieval, "expecting"
         rc = self.pty.expect([self.prompt, pexpect.TIMEOUT, pexpect.EOF], timeout=10)
         # now retrieve the echo output which sat awaiting
         log.debug("delayed queued_echo_output=\"{}\"".format(self.pty.before))
@@ -63,6 +63,7 @@ class OpTestOCCBase(testcases.OpTestEM.OpTestEM):
         self.cv_SYSTEM = conf.system()
         self.cv_HOST = conf.host()
         self.cv_FSP = conf.bmc()
+        self.util = conf.util
         self.platform = conf.platform()
         self.bmc_type = conf.args.bmc_type
         self.rest = conf.system().rest
@@ -126,9 +127,20 @@ class OpTestOCCBase(testcases.OpTestEM.OpTestEM):
             return BMC_CONST.FW_FAILED
 
     def get_cpu_freq(self):
-        l_cmd = "cat /sys/devices/system/cpu/cpu0/cpufreq/cpuinfo_cur_freq"
-        cur_freq = self.c.run_command(l_cmd)
-        return cur_freq[0].strip()
+        '''
+        Frequency of the first CPU, the others are read (in the same
+        command) and logged if they differ from it.
+        '''
+        cur_freq = self.get_cpu_files("cpufreq/cpuinfo_cur_freq")
+        if not cur_freq:
+            raise CommandFailed("read cpuinfo_cur_freq", [], 1)
+        freqs = dict((cpu, f.strip()) for (cpu, a), f in cur_freq.items())
+        first = freqs[min(freqs)]
+        others = dict((cpu, f) for cpu, f in freqs.items() if f != first)
+        if others:
+            log.debug("CPU frequencies differing from cpu{} ({}): {}"
+                      .format(min(freqs), first, others))
+        return first
 
     def dvfs_test(self):
         freq_list = self.get_list_of_cpu_freq()
@@ -38,6 +38,7 @@ This class will test the functionality of following drivers
 import time
 import subprocess
 import re
+import os
 
 import unittest
 
@@ -116,5 +117,20 @@ class OpTestSensors(unittest.TestCase):
         except CommandFailed as c:
             self.assertEqual(c.exitcode, 0, str(c))
 
+        # And what the sensors are reading from, all of hwmon in one go
+        files = self.cv_HOST.host_read_files(["/sys/class/hwmon/hwmon*/name",
+                                              "/sys/class/hwmon/hwmon*/*_input",
+                                              "/sys/class/hwmon/hwmon*/*_label"])
+        inputs = sorted(path for path in files if path.endswith("_input"))
+        self.assertTrue(inputs, "No hwmon sensor readings in sysfs")
+        for path in inputs:
+            label = files.get(path[:-len("_input")] + "_label", "")
+            device = files.get(os.path.join(os.path.dirname(path), "name"), "")
+            log.debug("{} {} {}: {}".format(device, os.path.basename(path), label, files[path]))
+            try:
+                int(files[path])
+            except ValueError:
+                self.assertTrue(False, "Bad hwmon reading {}: {}".format(path, files[path]))
+
         log.debug("Completed OpTestSensors test")
         return
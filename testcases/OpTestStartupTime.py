@@ -0,0 +1,96 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+'''
+op-test Startup Time
+--------------------
+
+Benchmark how long `op-test` itself takes to start for ``--list-suites``,
+``--list-tests`` and a single ``--run testcases.HelloWorld``, now that suites
+are built and testcases modules imported on demand.
+
+For reference it also times importing every testcases module up front,
+which is what every invocation used to pay. Each timing is a fresh
+``op-test`` process, so the figures include the interpreter's start.
+'''
+
+import unittest
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+import OpTestConfiguration
+
+import logging
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+
+class OpTestStartupTime(unittest.TestCase):
+    iterations = 3
+    invocations = [["--list-suites"],
+                   ["--list-tests"],
+                   ["--run", "testcases.HelloWorld"]]
+
+    def setUp(self):
+        conf = OpTestConfiguration.conf
+        self.basedir = os.path.abspath(conf.basedir)
+        self.output = tempfile.mkdtemp(prefix="op-test-startup-")
+
+    def tearDown(self):
+        shutil.rmtree(self.output, ignore_errors=True)
+
+    def best_time(self, cmd):
+        best = None
+        with open(os.devnull, 'w') as devnull:
+            for i in range(self.iterations):
+                start = time.time()
+                rc = subprocess.call(cmd, cwd=self.basedir,
+                                     stdout=devnull, stderr=devnull)
+                elapsed = time.time() - start
+                self.assertEqual(rc, 0, "'{}' exited with {}"
+                                 .format(" ".join(cmd), rc))
+                if best is None or elapsed < best:
+                    best = elapsed
+        return best
+
+    def runTest(self):
+        op_test = [sys.executable, os.path.join(self.basedir, "op-test"),
+                   "--bmc-type", "AMI", "--quiet", "-o", self.output]
+        for args in self.invocations:
+            best = self.best_time(op_test + args)
+            log.info("OpTestStartupTime op-test {} best of {} = {:.3f}s"
+                     .format(" ".join(args), self.iterations, best))
+
+        modules = [f[:-3] for f in os.listdir(os.path.join(self.basedir, "testcases"))
+                   if f.endswith(".py") and f != "__init__.py"]
+        eager = ("import OpTestConfiguration\n"
+                 "OpTestConfiguration.conf = OpTestConfiguration.OpTestConfiguration()\n"
+                 "import importlib\n"
+                 "for m in {!r}:\n"
+                 "    importlib.import_module('testcases.' + m)\n"
+                 .format(sorted(modules)))
+        best = self.best_time([sys.executable, "-c", eager])
+        log.info("OpTestStartupTime importing all {} testcases modules"
+                 " best of {} = {:.3f}s"
+                 .format(len(modules), self.iterations, best))
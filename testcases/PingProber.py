@@ -0,0 +1,162 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+Ping Prober
+-----------
+
+Exercise the in-process `OpTestPing.Prober` behind `OpTestUtil.PingFunc`
+and `OpTestUtil.ping_fail_check`: localhost answers (over ICMP if this
+user may open an ICMP socket, TCP otherwise), and a local TCP listener
+standing in for a rebooting BMC is seen going down and coming back up
+with sub-second resolution, next to an address that stays up.
+`ping_fail_check` only counts an address as down after several missed
+probes in a row, not on one lost echo.
+
+The time of a ``ping -c 1`` fork is logged for comparison.
+'''
+
+import unittest
+import socket
+import subprocess
+import threading
+import time
+
+from common.OpTestPing import Prober
+from common.OpTestUtil import OpTestUtil
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+
+class Listener(object):
+    def __init__(self, ip, port=0):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((ip, port))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+        self.thread = threading.Thread(target=self.accept)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def accept(self):
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except socket.error:
+                return
+            conn.close()
+
+    def close(self):
+        self.sock.shutdown(socket.SHUT_RDWR)
+        self.sock.close()
+
+
+class PingProber(unittest.TestCase):
+
+    def runTest(self):
+        prober = Prober()
+        start = time.time()
+        self.assertTrue(prober.probe("127.0.0.1"))
+        log.info("PingProber localhost probe took {:.4f}s".format(time.time() - start))
+        try:
+            start = time.time()
+            subprocess.call(["ping", "-c", "1", "127.0.0.1"],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            log.info("PingProber 'ping -c 1' fork took {:.4f}s".format(time.time() - start))
+        except OSError:
+            log.info("PingProber no ping binary to compare with")
+
+        self.assertEqual(sorted(prober.wait_until_up(["127.0.0.1", "localhost"], 5, stable=2).keys()),
+                         ["127.0.0.1", "localhost"])
+
+        # a BMC only reachable on its listener (refused means down here)
+        # next to a host on another loopback address that stays up
+        bmc = Listener("127.0.0.1")
+        host = Listener("127.0.0.2", bmc.port)
+        tcp = Prober(ports=[bmc.port], icmp=False, refused_is_up=False)
+        self.assertEqual(tcp.probe_all(["127.0.0.1", "127.0.0.2"]),
+                         {"127.0.0.1" : True, "127.0.0.2" : True})
+
+        def reboot():
+            time.sleep(1)
+            bmc.close()
+            self.went_down = time.time()
+        rebooter = threading.Thread(target=reboot)
+        rebooter.start()
+        start = time.time()
+        reached = tcp.wait_until_down(["127.0.0.1", "127.0.0.2"], 3)
+        rebooter.join()
+        noticed = start + reached.get("127.0.0.1", 3) - self.went_down
+        log.info("PingProber saw the BMC go down {:.2f}s after it did".format(noticed))
+        self.assertEqual(reached.keys(), ["127.0.0.1"])
+        self.assertLess(noticed, 1)
+
+        # still down, the timeout is honoured
+        start = time.time()
+        self.assertEqual(tcp.wait_until_up("127.0.0.1", 0.5), {})
+        self.assertLess(time.time() - start, 1.5)
+
+        # comes back on the same port
+        def boot():
+            time.sleep(1)
+            self.bmc = Listener("127.0.0.1", bmc.port)
+            self.came_up = time.time()
+        booter = threading.Thread(target=boot)
+        booter.start()
+        start = time.time()
+        reached = tcp.wait_until_up(["127.0.0.1", "127.0.0.2"], 10)
+        booter.join()
+        noticed = start + reached.get("127.0.0.1", 10) - self.came_up
+        log.info("PingProber saw the BMC come back {:.2f}s after it did".format(noticed))
+        self.assertEqual(sorted(reached.keys()), ["127.0.0.1", "127.0.0.2"])
+        self.assertLess(noticed, 1)
+        self.bmc.close()
+        host.close()
+
+
+class ScriptedProber(Prober):
+    '''
+    Answers from a list of results, then keeps answering then
+    '''
+    def __init__(self, answers, then):
+        Prober.__init__(self, icmp=False)
+        self.answers = list(answers)
+        self.then = then
+
+    def probe(self, ip, timeout=None):
+        if self.answers:
+            return self.answers.pop(0)
+        return self.then
+
+
+class PingFailCheck(unittest.TestCase):
+
+    def runTest(self):
+        util = OpTestUtil()
+        # a lost echo or two between answers is not the BMC going down
+        util.ping_prober = ScriptedProber([True, False, True, False, False, True], True)
+        self.assertFalse(util.ping_fail_check("bmc", timeout=2))
+        # down for good once three in a row go unanswered
+        util.ping_prober = ScriptedProber([True, False, True], False)
+        self.assertTrue(util.ping_fail_check("bmc", timeout=5))
+        self.assertEqual(util.ping_prober.answers, [])
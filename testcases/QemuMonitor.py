@@ -0,0 +1,247 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+Qemu Monitor
+------------
+
+`OpTestQemu.QemuConsole` drives qemu over its QMP monitor: reset, power
+down, pause and device hot plug, and (with ``--qemu-fast-power``) power
+cycles without starting qemu again.
+
+A python script stands in for qemu: it takes a moment to start (before
+its ``-qmp`` socket is there) and then to "boot" to a ``/ #`` prompt,
+again on ``system_reset``, and sends the events qemu would for
+``system_powerdown`` and ``device_del``. Power cycles by reset are
+timed against ones that start qemu again, and checked to come up on a
+new boot of the same process.
+
+No qemu is needed, or a ppc64 host: the stand-in is started as
+``qemu-system-ppc64`` from a temporary directory.
+'''
+
+import unittest
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import time
+import pexpect
+
+import OpTestConfiguration
+from common.OpTestQemu import QemuConsole, QemuIPMI
+from common.Exceptions import CommandFailed
+from testcases.StandIn import StandInSystem, StandInConf
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+START_SECONDS = 0.5
+BOOT_SECONDS = 0.5
+
+STAND_IN_QEMU = r'''#!{python}
+import json, os, socket, sys, threading, time
+args = sys.argv[1:]
+qmp_path = args[args.index("-qmp") + 1].split(":", 1)[1].split(",")[0]
+state = {{"status": "running", "boots": 0, "devices": []}}
+out = threading.Lock()
+
+def write(data):
+    with out:
+        sys.stdout.write(data)
+        sys.stdout.flush()
+
+def boot():
+    time.sleep({boot})
+    state["boots"] += 1
+    write("Petitboot\n/ # ")
+
+def serve(conn):
+    f = conn.makefile()
+    send = lambda msg: conn.sendall(json.dumps(msg) + "\n")
+    send({{"QMP": {{"version": {{}}, "capabilities": []}}}})
+    for line in iter(f.readline, ""):
+        cmd = json.loads(line)
+        name, arguments = cmd["execute"], cmd.get("arguments", {{}})
+        ret = {{}}
+        if name == "query-status":
+            ret = {{"status": state["status"], "running": state["status"] == "running"}}
+        elif name == "stop":
+            state["status"] = "paused"
+        elif name == "cont":
+            state["status"] = "running"
+        elif name == "system_reset":
+            send({{"event": "RESET", "data": {{"guest": False}}}})
+            threading.Thread(target=boot).start()
+        elif name == "system_powerdown":
+            send({{"return": {{}}}})
+            send({{"event": "POWERDOWN"}})
+            send({{"event": "SHUTDOWN", "data": {{"guest": True}}}})
+            os._exit(0)
+        elif name == "device_add":
+            state["devices"].append(arguments["id"])
+        elif name == "device_del":
+            state["devices"].remove(arguments["id"])
+            send({{"return": {{}}}})
+            time.sleep(0.1)
+            send({{"event": "DEVICE_DELETED", "data": {{"device": arguments["id"]}}}})
+            continue
+        elif name != "qmp_capabilities":
+            send({{"error": {{"class": "CommandNotFound", "desc": name}}}})
+            continue
+        send({{"return": ret}})
+
+def qmp():
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.bind(qmp_path)
+    s.listen(1)
+    while True:
+        serve(s.accept()[0])
+
+time.sleep({start})
+t = threading.Thread(target=qmp)
+t.daemon = True
+t.start()
+boot()
+for line in iter(sys.stdin.readline, ""):
+    if line.strip() == "boots":
+        write("boots=%d pid=%d devices=%s\n" % (state["boots"], os.getpid(),
+                                               ",".join(state["devices"])))
+    write("/ # ")
+'''
+
+
+class QemuMonitor(unittest.TestCase):
+    '''
+    :param cycles: how many power cycles of each kind to time
+    '''
+    cycles = 3
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-qemu-monitor-")
+        self.qemu = os.path.join(self.tmpdir, "qemu-system-ppc64")
+        with open(self.qemu, 'w') as f:
+            f.write(STAND_IN_QEMU.format(python=sys.executable, start=START_SECONDS,
+                                         boot=BOOT_SECONDS))
+        os.chmod(self.qemu, stat.S_IRWXU)
+        self.pnor = os.path.join(self.tmpdir, "witherspoon.pnor")
+        with open(self.pnor, 'w') as f:
+            f.write("\0" * 4096)
+        self.conf = getattr(OpTestConfiguration, "conf", None)
+        OpTestConfiguration.conf = StandInConf(self.tmpdir)
+
+    def tearDown(self):
+        OpTestConfiguration.conf = self.conf
+        shutil.rmtree(self.tmpdir)
+
+    def console(self, fast_power):
+        console = QemuConsole(qemu_binary=self.qemu, pnor=self.pnor, skiboot="skiboot.lid",
+                              logfile=None, fast_power=fast_power)
+        console.set_system(StandInSystem())
+        return console
+
+    def shell(self, console):
+        console.pty.expect_exact("/ # ", timeout=(START_SECONDS + BOOT_SECONDS) * 10)
+
+    def boots(self, console):
+        console.pty.sendline("boots")
+        console.pty.expect(r"boots=(\d+) pid=(\d+) devices=(\S*)", timeout=5)
+        boots, pid, devices = console.pty.match.groups()
+        self.shell(console)
+        return int(boots), int(pid), devices
+
+    def power_cycles(self, console):
+        '''
+        Seconds from power on to the shell, for each of self.cycles power
+        cycles
+        '''
+        ipmi = QemuIPMI(console)
+        seconds = []
+        for i in range(self.cycles):
+            ipmi.ipmi_power_off()
+            start = time.time()
+            ipmi.ipmi_power_on()
+            self.shell(console)
+            seconds.append(time.time() - start)
+        return seconds
+
+    def test_power_cycle(self):
+        console = self.console(fast_power=True)
+        console.power_on()
+        self.shell(console)
+        boots, pid, devices = self.boots(console)
+        self.assertEqual(boots, 1)
+
+        console.power_off()
+        self.assertEqual(console.query_status(), "paused")
+        reset = self.power_cycles(console)
+        # the same qemu, booted again
+        self.assertEqual(self.boots(console)[:2], (self.cycles + 1, pid))
+        self.assertEqual(console.query_status(), "running")
+        run_dir = console.run_dir
+        console.close()
+        self.assertFalse(os.path.exists(run_dir))
+        self.assertEqual(console.query_status(), "off")
+
+        slow = self.console(fast_power=False)
+        slow.power_on()
+        self.shell(slow)
+        relaunch = self.power_cycles(slow)
+        # a new qemu each time
+        boots, slow_pid, devices = self.boots(slow)
+        self.assertEqual(boots, 1)
+        self.assertNotEqual(slow_pid, pid)
+        slow.close()
+
+        log.info("QemuMonitor power on to the shell: reset {}, relaunch {}"
+                 .format(" ".join("{:.2f}s".format(s) for s in reset),
+                         " ".join("{:.2f}s".format(s) for s in relaunch)))
+        self.assertLess(max(reset), min(relaunch))
+        self.assertLess(max(reset), START_SECONDS + BOOT_SECONDS)
+
+    def test_monitor(self):
+        console = self.console(fast_power=False)
+        ipmi = QemuIPMI(console)
+        with self.assertRaises(CommandFailed):
+            console.system_reset()
+        console.power_on()
+        self.shell(console)
+
+        console.device_add("virtio-blk-pci", "hp0", drive="disk02")
+        self.assertEqual(self.boots(console)[2], "hp0")
+        console.device_del("hp0", timeout=5)
+        self.assertEqual(self.boots(console)[2], "")
+        with self.assertRaises(CommandFailed):
+            console.qmp_execute("no-such-command")
+
+        # the reset button: the same qemu boots again
+        boots, pid, devices = self.boots(console)
+        ipmi.ipmi_power_reset()
+        self.shell(console)
+        self.assertEqual(self.boots(console)[:2], (boots + 1, pid))
+
+        # the power button: the guest shuts qemu down
+        ipmi.ipmi_power_soft()
+        console.qmp.wait_for_event("SHUTDOWN", timeout=5)
+        console.pty.expect(pexpect.EOF, timeout=5)
+        console.close()
+        self.assertEqual(console.query_status(), "off")
@@ -0,0 +1,170 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+Qemu Overlay
+------------
+
+`OpTestQemu` makes its scratch disk a copy on write overlay of
+``--qemu-base-image``, on its own or from an `OpTestQemuDisk.OverlayPool`.
+
+A python script on the PATH stands in for ``qemu-img``, logging what it
+is asked and writing a line naming the backing file as the "overlay".
+Pooled overlays are checked to go to one holder at a time, to be reset
+when given back (or, when kept, to keep what was written), when the base
+changes and after a run that died holding one; and the qemu command
+line to use the overlay.
+'''
+
+import unittest
+import os
+import shutil
+import stat
+import sys
+import tempfile
+
+import OpTestConfiguration
+from common.OpTestQemu import OpTestQemu
+from common.OpTestQemuDisk import OverlayPool
+from testcases.StandIn import StandInConf
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+STAND_IN_QEMU_IMG = r'''#!{python}
+import json, sys
+args = sys.argv[1:]
+with open({log!r}, "a") as f:
+    f.write(" ".join(args) + "\n")
+if args[0] == "info":
+    print(json.dumps({{"format": "qcow2" if args[-1].endswith(".qcow2") else "raw",
+                      "filename": args[-1]}}))
+elif args[0] == "create":
+    with open(args[-1], "w") as f:
+        f.write("overlay of %s (%s)\n" % (args[args.index("-b") + 1], args[args.index("-F") + 1]))
+'''
+
+
+class QemuOverlay(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-qemu-overlay-")
+        self.log = os.path.join(self.tmpdir, "qemu-img.log")
+        os.mkdir(os.path.join(self.tmpdir, "bin"))
+        qemu_img = os.path.join(self.tmpdir, "bin", "qemu-img")
+        with open(qemu_img, 'w') as f:
+            f.write(STAND_IN_QEMU_IMG.format(python=sys.executable, log=self.log))
+        os.chmod(qemu_img, stat.S_IRWXU)
+        self.path = os.environ["PATH"]
+        os.environ["PATH"] = os.path.dirname(qemu_img) + os.pathsep + self.path
+        self.base = os.path.join(self.tmpdir, "installed.qcow2")
+        with open(self.base, 'w') as f:
+            f.write("an installed OS")
+        self.pool = os.path.join(self.tmpdir, "pool")
+        self.conf = getattr(OpTestConfiguration, "conf", None)
+
+    def tearDown(self):
+        os.environ["PATH"] = self.path
+        OpTestConfiguration.conf = self.conf
+        shutil.rmtree(self.tmpdir)
+
+    def creates(self):
+        with open(self.log) as f:
+            return len([l for l in f if l.startswith("create")])
+
+    def read(self, overlay):
+        with open(overlay.name) as f:
+            return f.read()
+
+    def write(self, overlay, data):
+        with open(overlay.name, 'a') as f:
+            f.write(data)
+
+    def test_pool(self):
+        pool = OverlayPool(self.pool, self.base)
+        a = pool.acquire()
+        b = OverlayPool(self.pool, self.base).acquire()
+        self.assertEqual([os.path.basename(o.name) for o in [a, b]],
+                         ["overlay-0.qcow2", "overlay-1.qcow2"])
+        self.assertEqual(self.read(a), "overlay of {} (qcow2)\n".format(self.base))
+        self.assertEqual(self.creates(), 2)
+
+        # given back it's discarded, so the next one needn't be
+        self.write(a, "guest writes")
+        a.close()
+        a.close()
+        self.assertEqual(self.creates(), 3)
+        a = pool.acquire()
+        self.assertEqual(os.path.basename(a.name), "overlay-0.qcow2")
+        self.assertNotIn("guest writes", self.read(a))
+        self.assertEqual(self.creates(), 3)
+
+        # b's run died with it, what it wrote goes
+        self.write(b, "guest writes")
+        b.lock.close()
+        b = pool.acquire()
+        self.assertEqual(os.path.basename(b.name), "overlay-1.qcow2")
+        self.assertNotIn("guest writes", self.read(b))
+        a.close()
+        b.close()
+
+        # a kept pool carries writes over, until the base changes
+        kept = OverlayPool(self.pool, self.base, keep=True)
+        a = kept.acquire()
+        self.write(a, "guest writes")
+        a.close()
+        a = kept.acquire()
+        self.assertIn("guest writes", self.read(a))
+        a.close()
+        os.utime(self.base, (1, 1))
+        a = kept.acquire()
+        self.assertNotIn("guest writes", self.read(a))
+        a.close()
+
+    def test_qemu(self):
+        OpTestConfiguration.conf = StandInConf(self.tmpdir)
+        conf = StandInConf(self.tmpdir, qemu_base_image=self.base, qemu_overlay_pool=self.pool)
+        qemu = OpTestQemu(conf=conf, qemu_binary="qemu-system-ppc64")
+        overlay = qemu.console.hda
+        self.assertEqual(overlay, os.path.join(self.pool, "overlay-0.qcow2"))
+        cmd = qemu.console.qemu_command(None)
+        self.assertIn(" -drive file={},id=disk01,if=none,format=qcow2,discard=unmap ".format(overlay),
+                      cmd)
+        qemu.__del__()
+        self.assertIsNone(conf.args.qemu_scratch_disk)
+        # back in the pool, for the next run
+        self.assertEqual(OverlayPool(self.pool, self.base).acquire().name, overlay)
+
+        # a temporary one without a pool, gone with the run
+        conf = StandInConf(self.tmpdir, qemu_base_image=self.base)
+        qemu = OpTestQemu(conf=conf, qemu_binary="qemu-system-ppc64")
+        overlay = qemu.console.hda
+        with open(overlay) as f:
+            self.assertEqual(f.read(), "overlay of {} (qcow2)\n".format(self.base))
+        qemu.__del__()
+        self.assertFalse(os.path.exists(overlay))
+
+        # a scratch disk of its own wins over the base, no overlay
+        disk = os.path.join(self.tmpdir, "disk.qcow2")
+        conf = StandInConf(self.tmpdir, qemu_base_image=self.base, qemu_scratch_disk=disk)
+        qemu = OpTestQemu(conf=conf, qemu_binary="qemu-system-ppc64")
+        self.assertEqual(qemu.console.hda, disk)
+        self.assertNotIn("discard=unmap", qemu.console.qemu_command(None))
+        qemu.__del__()
@@ -0,0 +1,375 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+Qemu Snapshot
+-------------
+
+`OpTestQemu.QemuConsole` saves qemu at the petitboot shell into an
+`OpTestQemuSnapshot.QemuSnapshotCache` and starts later runs from there.
+
+A python script stands in for qemu: it takes a couple of seconds to
+"boot" to a ``/ #`` prompt (writing to the PNOR on the way), answers
+QMP on the ``-qmp`` socket, writes its state to the ``migrate`` URI and
+reads it back from ``-incoming``. A cold boot is saved and then
+restored, with the time to the shell of each; a changed kernel is a new
+entry and the old one stale, a snapshot the "qemu" can't load is
+dropped for a cold boot, and the cache is trimmed to size. With a
+scratch disk, snapshots are only saved and restored while the disk is
+as fresh as every run starts it. Inputs are
+checked to be hashed once per cache rather than once per run.
+'''
+
+import unittest
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import time
+
+import OpTestConfiguration
+from common.OpTestQemu import QemuConsole
+from common import OpTestFileIndex, OpTestQemuSnapshot
+from common.OpTestQemuSnapshot import QemuSnapshotCache, QMPMonitor
+from common.Exceptions import CommandFailed
+from testcases.StandIn import StandInSystem, StandInConf
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+BOOT_SECONDS = 2
+
+STAND_IN_QEMU = r'''#!{python}
+import json, os, shlex, socket, subprocess, sys, threading, time
+args = sys.argv[1:]
+opt = lambda name: args[args.index(name) + 1] if name in args else None
+qmp_path = opt("-qmp").split(":", 1)[1].split(",")[0]
+pnor = [a for a in args if a.endswith("if=mtd")][0].split(",")[0][len("file="):]
+state = {{"status": "running", "prompt": "/ # ", "boots": 0}}
+incoming = opt("-incoming")
+if incoming:
+    state["status"] = "inmigrate"
+
+def serve(conn):
+    f = conn.makefile()
+    conn.sendall(json.dumps({{"QMP": {{"version": {{}}, "capabilities": []}}}}) + "\n")
+    for line in iter(f.readline, ""):
+        cmd = json.loads(line)
+        name, arguments = cmd["execute"], cmd.get("arguments", {{}})
+        ret = {{}}
+        if name == "query-status":
+            ret = {{"status": state["status"], "running": state["status"] == "running"}}
+        elif name == "stop":
+            state["status"] = "paused"
+        elif name == "cont":
+            state["status"] = "running"
+        elif name == "migrate":
+            p = subprocess.Popen(arguments["uri"][len("exec:"):], shell=True, stdin=subprocess.PIPE)
+            p.communicate(json.dumps(state))
+            state["migrated"] = p.returncode
+        elif name == "query-migrate":
+            ret = {{"status": "completed" if state.get("migrated") == 0 else "failed"}}
+        elif name != "qmp_capabilities":
+            conn.sendall(json.dumps({{"error": {{"class": "CommandNotFound", "desc": name}}}}) + "\n")
+            continue
+        conn.sendall(json.dumps({{"return": ret}}) + "\n")
+
+def qmp():
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.bind(qmp_path)
+    s.listen(1)
+    while True:
+        serve(s.accept()[0])
+
+t = threading.Thread(target=qmp)
+t.daemon = True
+t.start()
+if incoming:
+    time.sleep(0.2)
+    try:
+        saved = json.loads(subprocess.check_output(incoming[len("exec:"):], shell=True))
+    except ValueError:
+        sys.stderr.write("qemu: load of migration failed\n")
+        os._exit(1)
+    saved["status"] = "running"
+    state.update(saved)
+else:
+    time.sleep({boot})
+    with open(pnor, "r+") as f:
+        f.write("nvram")
+    state["boots"] += 1
+    sys.stdout.write("Petitboot\n" + state["prompt"])
+    sys.stdout.flush()
+for line in iter(sys.stdin.readline, ""):
+    if line.startswith("PS1="):
+        state["prompt"] = shlex.split(line)[0][len("PS1="):]
+    elif line.strip() == "boots":
+        sys.stdout.write("boots=%d\n" % state["boots"])
+    sys.stdout.write(state["prompt"])
+    sys.stdout.flush()
+'''
+
+
+class QemuSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-qemu-snapshot-")
+        self.qemu = self.file("qemu-system-ppc64", STAND_IN_QEMU.format(python=sys.executable,
+                                                                         boot=BOOT_SECONDS))
+        os.chmod(self.qemu, stat.S_IRWXU)
+        self.pnor = self.file("witherspoon.pnor", "\0" * 4096)
+        self.skiboot = self.file("skiboot.lid", "skiboot")
+        self.kernel = self.file("zImage.epapr", "kernel")
+        self.cache = QemuSnapshotCache(os.path.join(self.tmpdir, "cache"))
+        self.conf = getattr(OpTestConfiguration, "conf", None)
+        OpTestConfiguration.conf = StandInConf(self.tmpdir)
+
+    def tearDown(self):
+        OpTestConfiguration.conf = self.conf
+        shutil.rmtree(self.tmpdir)
+
+    def file(self, name, contents):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f:
+            f.write(contents)
+        return path
+
+    def console(self):
+        console = QemuConsole(qemu_binary=self.qemu, pnor=self.pnor,
+                              skiboot=self.skiboot, kernel=self.kernel,
+                              logfile=None, snapshot_cache=self.cache)
+        console.set_system(StandInSystem())
+        return console
+
+    def boot(self, console, restore=True):
+        '''
+        Seconds from power on to the shell prompt
+        '''
+        start = time.time()
+        console.snapshot_restore = restore
+        pty = console.connect()
+        if console.restored:
+            # as wait_for_it kicks the console
+            pty.sendline()
+        pty.expect_exact("/ # ", timeout=BOOT_SECONDS * 5)
+        return time.time() - start
+
+    def boots(self, console):
+        console.pty.sendline("boots")
+        console.pty.expect(r"boots=(\d+)", timeout=5)
+        return int(console.pty.match.group(1))
+
+    def runTest(self):
+        console = self.console()
+        cold = self.boot(console)
+        self.assertFalse(console.restored)
+        entry = console.save_snapshot()
+        self.assertTrue(entry)
+        # once per boot
+        self.assertIsNone(console.save_snapshot())
+        self.assertEqual(sorted(os.listdir(entry)), ["info.json", "pnor", "vmstate"])
+        with open(os.path.join(entry, "pnor")) as f:
+            self.assertTrue(f.read().startswith("nvram"))
+        # saving left it running
+        self.assertEqual(console.qmp.execute("query-status")["status"], "running")
+        self.assertEqual(self.boots(console), 1)
+        console.close()
+        self.assertEqual(self.cache.entries()[0][2], os.path.basename(entry))
+
+        restored = self.boot(console)
+        self.assertTrue(console.restored)
+        # the machine that booted, not another boot
+        self.assertEqual(self.boots(console), 1)
+        self.assertIsNone(console.save_snapshot())
+        console.close()
+        log.info("QemuSnapshot time to the shell: cold {:.2f}s, restored {:.2f}s"
+                 .format(cold, restored))
+        self.assertGreater(cold, BOOT_SECONDS)
+        self.assertLess(restored, cold / 2)
+        # the run's own directory is gone with it
+        self.assertEqual([n for n in os.listdir(self.cache.cache_dir) if n.startswith(".")], [])
+
+        # only when the system asks for it
+        self.boot(console, restore=False)
+        self.assertFalse(console.restored)
+        console.close()
+
+        # a new kernel boots and replaces the stale entry
+        self.file("zImage.epapr", "another kernel")
+        self.boot(console)
+        self.assertFalse(console.restored)
+        new = console.save_snapshot()
+        console.close()
+        self.assertNotEqual(new, entry)
+        self.assertFalse(os.path.exists(entry))
+        self.assertEqual([e[2] for e in self.cache.entries()], [os.path.basename(new)])
+
+        # a snapshot that won't load is dropped for a cold boot
+        with open(os.path.join(new, "vmstate"), 'w') as f:
+            f.write("garbage")
+        self.boot(console)
+        self.assertFalse(console.restored)
+        self.assertFalse(os.path.exists(new))
+        console.close()
+
+
+class QemuSnapshotScratch(QemuSnapshot):
+    '''
+    A snapshot has the guest's view of the scratch disk at the petitboot
+    shell, it is no good once the disk has been written to.
+    '''
+    def console(self, fresh=True):
+        console = QemuConsole(qemu_binary=self.qemu, pnor=self.pnor,
+                              skiboot=self.skiboot, kernel=self.kernel,
+                              logfile=None, snapshot_cache=self.cache,
+                              hda=self.scratch, hda_fresh=fresh)
+        console.set_system(StandInSystem())
+        return console
+
+    def runTest(self):
+        self.scratch = self.file("scratch.qcow2", "blank")
+        # a kept overlay, say: neither saved nor restored
+        console = self.console(fresh=False)
+        self.boot(console)
+        self.assertIsNone(console.save_snapshot())
+        console.close()
+        self.assertEqual(self.cache.entries(), [])
+
+        console = self.console()
+        self.boot(console)
+        entry = console.save_snapshot()
+        self.assertTrue(entry)
+        console.close()
+        # nothing written to the disk yet, so still good for this run
+        self.boot(console)
+        self.assertTrue(console.restored)
+        console.close()
+
+        # an OS installed to it, say
+        with open(self.scratch, 'a') as f:
+            f.write(" installed")
+        self.boot(console)
+        self.assertFalse(console.restored)
+        self.assertIsNone(console.save_snapshot())
+        console.close()
+
+        # the next run, on a fresh disk, restores
+        self.scratch = self.file("scratch.qcow2", "blank")
+        console = self.console()
+        self.boot(console)
+        self.assertTrue(console.restored)
+        console.close()
+        self.assertEqual([e[2] for e in self.cache.entries()], [os.path.basename(entry)])
+
+
+class QemuSnapshotEviction(unittest.TestCase):
+    '''
+    Least recently used entries go once the cache is over size, the one
+    being stored and ones just used stay.
+    '''
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-qemu-snapshot-")
+        self.cache = QemuSnapshotCache(self.tmpdir, max_bytes=3 * 1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def store(self, name):
+        run_dir = self.cache.run_dir()
+        vmstate = os.path.join(run_dir, "vmstate")
+        with open(vmstate, 'w') as f:
+            f.write("x" * 1000)
+        entry = self.cache.store(name, vmstate, None, {"kernel": name})
+        shutil.rmtree(run_dir)
+        return entry
+
+    def runTest(self):
+        for i, name in enumerate(["a", "b", "c"]):
+            self.store(name)
+            os.utime(os.path.join(self.cache.entry(name), "info.json"), (i, i))
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ["a", "b", "c"])
+        # a is used, so b goes
+        self.assertTrue(self.cache.lookup("a"))
+        self.store("d")
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ["a", "c", "d"])
+        self.assertIsNone(self.cache.lookup("b"))
+
+        # keys are the inputs and the command line, not where scratch is
+        inputs = {"kernel": os.path.join(self.tmpdir, "a", "info.json"), "initramfs": None}
+        key = self.cache.key("qemu -kernel {} -drive /tmp/1".format(inputs["kernel"]), inputs,
+                             scratch=["/tmp/1"])
+        self.assertEqual(key, self.cache.key("qemu -kernel {} -drive /tmp/2".format(inputs["kernel"]),
+                                             inputs, scratch=["/tmp/2"]))
+        self.assertNotEqual(key, self.cache.key("qemu -m 8G -kernel {}".format(inputs["kernel"]),
+                                                inputs))
+
+        # QMP needs a qemu
+        with self.assertRaises(CommandFailed):
+            QMPMonitor(os.path.join(self.tmpdir, "nothing.sock"), timeout=0.2)
+
+
+class QemuSnapshotHashes(unittest.TestCase):
+    '''
+    An input (the multi-GB base image, say) is hashed once per cache, not
+    once per run, and again when it changes.
+    '''
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-qemu-snapshot-")
+        self.base = os.path.join(self.tmpdir, "base.qcow2")
+        with open(self.base, 'w') as f:
+            f.write("base image")
+        self.hashed = []
+        self.file_hash = OpTestQemuSnapshot.file_hash
+
+        def file_hash(path):
+            self.hashed.append(path)
+            return self.file_hash(path)
+        OpTestQemuSnapshot.file_hash = file_hash
+        self.memo = dict(OpTestQemuSnapshot.hashes)
+
+    def tearDown(self):
+        OpTestQemuSnapshot.file_hash = self.file_hash
+        OpTestQemuSnapshot.hashes.clear()
+        OpTestQemuSnapshot.hashes.update(self.memo)
+        shutil.rmtree(self.tmpdir)
+
+    def key(self):
+        # a new run: a new process, so nothing hashed in memory yet
+        OpTestQemuSnapshot.hashes.clear()
+        cache = QemuSnapshotCache(os.path.join(self.tmpdir, "cache"))
+        return cache.key("qemu -drive file=overlay", {"base": self.base})
+
+    def runTest(self):
+        key = self.key()
+        self.assertEqual(self.key(), key)
+        self.assertEqual(self.hashed, [self.base])
+        # touched, hashed again to the same key
+        os.utime(self.base, (1, 1))
+        self.assertEqual(self.key(), key)
+        self.assertEqual(len(self.hashed), 2)
+        with open(self.base, 'w') as f:
+            f.write("another base image")
+        self.assertNotEqual(self.key(), key)
+        self.assertEqual(len(self.hashed), 3)
+        # only the base as it is now is remembered
+        cache = QemuSnapshotCache(os.path.join(self.tmpdir, "cache"))
+        self.assertEqual(cache.hashes.load().keys(),
+                         [OpTestFileIndex.source_id(self.base)])
@@ -0,0 +1,92 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+'''
+Qemu Snapshot Boot
+------------------
+
+Time to the petitboot shell under qemu, cold and restored from the
+``--qemu-snapshot-cache``. Run with ``--bmc-type qemu`` and a cache
+directory, e.g. ::
+
+    ./op-test --bmc-type qemu --qemu-snapshot-cache ~/.cache/op-test/qemu \\
+              --host-pnor ... --flash-skiboot ... --flash-kernel ... \\
+              --run testcases.QemuSnapshotBoot
+'''
+
+import unittest
+import time
+
+import OpTestConfiguration
+from common.OpTestSystem import OpSystemState
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+
+class QemuSnapshotBoot(unittest.TestCase):
+    '''
+    Boots cold (dropping any snapshot of this setup first) and then from
+    the snapshot that boot saved, comparing the time to the shell.
+
+    :param restores: how many restored boots to time
+    '''
+    restores = 3
+
+    def setUp(self):
+        conf = OpTestConfiguration.conf
+        self.cv_SYSTEM = conf.system()
+        if conf.args.bmc_type not in ['qemu']:
+            self.skipTest("Qemu only")
+        self.console = self.cv_SYSTEM.console
+        if not self.console.snapshot_cache:
+            self.skipTest("No --qemu-snapshot-cache")
+
+    def time_to_shell(self):
+        self.cv_SYSTEM.goto_state(OpSystemState.OFF)
+        start = time.time()
+        self.cv_SYSTEM.goto_state(OpSystemState.PETITBOOT_SHELL)
+        return time.time() - start
+
+    def runTest(self):
+        cache = self.console.snapshot_cache
+        inputs = self.console.snapshot_inputs()
+        for used, size, key, i in cache.entries():
+            if i == inputs:
+                cache.remove(key)
+
+        cold = self.time_to_shell()
+        self.assertFalse(self.console.restored)
+        self.assertTrue(self.console.saved)
+        self.assertTrue([e for e in cache.entries() if e[3] == inputs],
+                        "Nothing was saved from the cold boot")
+
+        restored = []
+        for i in range(self.restores):
+            restored.append(self.time_to_shell())
+            self.assertTrue(self.console.restored, "Qemu booted rather than restoring")
+            # and the shell works
+            self.cv_SYSTEM.console.run_command("uname -a")
+
+        log.info("QemuSnapshotBoot time to the petitboot shell: cold {:.1f}s, "
+                 "restored {} (best {:.1f}s, {:.0f}x)"
+                 .format(cold, " ".join("{:.1f}s".format(r) for r in restored),
+                         min(restored), cold / max(min(restored), 0.001)))
+        self.assertLess(max(restored), cold)
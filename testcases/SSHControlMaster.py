@@ -0,0 +1,249 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+SSH Control Master
+------------------
+
+`OpTestSSH` sessions with ``--ssh-control-master`` open channels on an
+`OpTestSSH.SSHControlMasterPool` master rather than logging in each time,
+and wait for the remote prompt rather than sleeping before setup_term.
+
+Python scripts on the PATH stand in for ``sshpass`` (checking the
+password) and ``ssh``: as a master (``ControlMaster=yes -N -f``, refused
+for a host named nomux) it backgrounds itself listening on the
+``ControlPath``, answering ``-O check`` and ``-O exit``; as a session it logs whether it went through a
+master and then prints its banner in bursts a while apart before a
+``$`` prompt. Sessions are checked to share one master per (host, user,
+port), to get a new master when one has died, to fall back to a
+dedicated connection when no master will start, to pass the host key
+options, and to be ready at the prompt with the whole banner in
+``before``.
+'''
+
+import unittest
+import os
+import shutil
+import signal
+import stat
+import sys
+import tempfile
+import time
+
+from common.OpTestSSH import OpTestSSH, ssh_pool
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+PASSWORD = "passw0rd"
+BANNER_GAP = 0.5
+
+STAND_IN_SSHPASS = r'''#!{python}
+import os, sys
+args = sys.argv[1:]
+if args[1] != {password!r}:
+    sys.stderr.write("Permission denied, please try again.\n")
+    sys.exit(5)
+os.execvp(args[2], args[2:])
+'''
+
+STAND_IN_SSH = r'''#!{python}
+import os, socket, sys, time
+args = sys.argv[1:]
+opts, rest, i = {{}}, [], 0
+while i < len(args):
+    if args[i] == "-o":
+        name, value = args[i + 1].split("=", 1)
+        opts[name] = value
+        i += 2
+    elif args[i] in ("-p", "-l", "-O"):
+        opts[args[i]] = args[i + 1]
+        i += 2
+    else:
+        if not args[i].startswith("-"):
+            rest.append(args[i])
+        i += 1
+host = rest[0]
+path = opts.get("ControlPath")
+
+def log(what):
+    with open({log!r}, "a") as f:
+        f.write("%s %s@%s:%s %s\n" % (what, opts.get("-l"), host, opts.get("-p"), " ".join(args)))
+
+def ask(request):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.connect(path)
+    s.sendall(request + "\n")
+    reply = s.makefile().readline()
+    s.close()
+    return reply
+
+if "-O" in opts:
+    try:
+        ask(opts["-O"])
+    except socket.error:
+        sys.exit(255)
+    sys.exit(0)
+
+if opts.get("ControlMaster") == "yes":
+    if host == "nomux":
+        sys.stderr.write("session multiplexing not permitted\n")
+        sys.exit(255)
+    if os.path.exists(path):
+        # as ssh does, no master over an existing socket
+        sys.stderr.write("ControlSocket %s already exists, disabling multiplexing\n" % path)
+        sys.exit(0)
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.bind(path)
+    s.listen(5)
+    if os.fork():
+        # -f, backgrounded once authenticated
+        os._exit(0)
+    os.setsid()
+    log("master pid=%d" % os.getpid())
+    while True:
+        conn = s.accept()[0]
+        request = conn.makefile().readline().strip()
+        conn.sendall("ok\n")
+        conn.close()
+        if request == "exit":
+            log("exited pid=%d" % os.getpid())
+            os.remove(path)
+            os._exit(0)
+
+if path and opts.get("ControlMaster") == "no":
+    try:
+        ask("session")
+    except socket.error:
+        sys.stderr.write("Control socket connect(%s): Connection refused\n" % path)
+        sys.exit(255)
+    log("session via master")
+else:
+    log("session direct")
+for part in ["Last login: today from op-test\n", "Welcome to the stand-in host\n"]:
+    sys.stdout.write(part)
+    sys.stdout.flush()
+    time.sleep({gap})
+sys.stdout.write("[%s ~]$ " % opts.get("-l"))
+sys.stdout.flush()
+for line in iter(sys.stdin.readline, ""):
+    sys.stdout.write("[%s ~]$ " % opts.get("-l"))
+    sys.stdout.flush()
+'''
+
+
+class SSHControlMaster(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-ssh-")
+        self.log = os.path.join(self.tmpdir, "ssh.log")
+        os.mkdir(os.path.join(self.tmpdir, "bin"))
+        for name, script in [("sshpass", STAND_IN_SSHPASS), ("ssh", STAND_IN_SSH)]:
+            path = os.path.join(self.tmpdir, "bin", name)
+            with open(path, 'w') as f:
+                f.write(script.format(python=sys.executable, password=PASSWORD,
+                                      log=self.log, gap=BANNER_GAP))
+            os.chmod(path, stat.S_IRWXU)
+        self.path = os.environ["PATH"]
+        os.environ["PATH"] = os.path.join(self.tmpdir, "bin") + os.pathsep + self.path
+        self.sessions = []
+
+    def tearDown(self):
+        for ssh in self.sessions:
+            ssh.pty.close(force=True)
+        ssh_pool.close_all()
+        for pid in self.masters():
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+        os.environ["PATH"] = self.path
+        shutil.rmtree(self.tmpdir)
+
+    def logged(self, what):
+        if not os.path.exists(self.log):
+            return []
+        with open(self.log) as f:
+            return [l.split() for l in f if l.startswith(what)]
+
+    def masters(self):
+        return [int(l[1][len("pid="):]) for l in self.logged("master")]
+
+    def connect(self, host="host1", username="root", port=22, **kwargs):
+        ssh = OpTestSSH(host, username, PASSWORD, logfile=None, port=port,
+                        block_setup_term=1, use_control_master=True, **kwargs)
+        ssh.connect()
+        self.sessions.append(ssh)
+        return ssh
+
+    def test_pool(self):
+        for i in range(3):
+            self.connect()
+        self.connect(port=2222)
+        self.connect(username="admin")
+        self.connect(host="host2")
+        # a master each for the four (host, user, port)
+        self.assertEqual([l[2] for l in self.logged("master")],
+                         ["root@host1:22", "root@host1:2222", "admin@host1:22", "root@host2:22"])
+        self.assertEqual(len(self.logged("session via master")), 6)
+        self.assertEqual(self.logged("session direct"), [])
+
+        # a dead master is replaced, not its socket's path given up on
+        os.kill(self.masters()[0], signal.SIGKILL)
+        time.sleep(0.2)
+        self.connect()
+        self.assertEqual(len(self.masters()), 5)
+        self.assertEqual(self.logged("master")[-1][2], "root@host1:22")
+        self.assertEqual(len(self.logged("session via master")), 7)
+
+        # and when no master will start, a connection of its own
+        self.connect(host="nomux")
+        self.assertEqual(len(self.masters()), 5)
+        self.assertEqual(self.logged("session direct")[0][2], "root@nomux:22")
+
+        # the live masters are told to exit at the end
+        ssh_pool.close_all()
+        self.assertEqual(sorted(l[1] for l in self.logged("exited")),
+                         sorted("pid={}".format(pid) for pid in self.masters()[1:]))
+
+    def test_host_key_options(self):
+        self.connect()
+        self.connect(host="host2", check_ssh_keys=True, known_hosts_file="/etc/op-test/known_hosts")
+        master, checked = self.logged("master")
+        self.assertIn("StrictHostKeyChecking=no", master)
+        self.assertIn("UserKnownHostsFile=/dev/null", master)
+        self.assertIn("UserKnownHostsFile=/etc/op-test/known_hosts", checked)
+        self.assertNotIn("StrictHostKeyChecking=no", checked)
+        first, second = self.logged("session via master")
+        self.assertIn("StrictHostKeyChecking=no", first)
+        self.assertIn("UserKnownHostsFile=/etc/op-test/known_hosts", second)
+
+    def test_ready(self):
+        start = time.time()
+        ssh = self.connect()
+        seconds = time.time() - start
+        # the banner's gaps didn't end the wait early
+        self.assertGreater(seconds, 2 * BANNER_GAP)
+        self.assertIn("$", ssh.pty.buffer)
+        # and what the wait read is still there for setup_term, in before
+        ssh.pty.expect_exact("]$ ", timeout=0.1)
+        self.assertIn("Last login: today from op-test", ssh.pty.before)
+        self.assertIn("Welcome to the stand-in host", ssh.pty.before)
+        log.info("SSHControlMaster ready at the prompt after {:.2f}s".format(seconds))
@@ -0,0 +1,285 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+Server Retry
+------------
+
+Exercise `OpTestUtil.Server` against a local HTTP stand-in for the OpenBMC
+REST API: login on 401, exponential backoff through 503s and a simulated
+BMC reboot (the server goes away and comes back on the same port),
+no-retry callers, bounded response logging, keep-alive connection reuse,
+the per-URI latency/retry counters and concurrent batch() requests, which
+log in once between them.
+
+The simulated BMC reboot alone takes three seconds.
+'''
+
+import unittest
+import json
+import socket
+import threading
+import time
+import BaseHTTPServer
+import SocketServer
+
+from common.OpTestUtil import Server
+from common.Exceptions import HTTPCheck
+
+import logging
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+STATE_URI = "/xyz/openbmc_project/state/bmc0/attr/CurrentBMCState"
+ENUMERATE_URI = "/xyz/openbmc_project/sensors/enumerate"
+FLAKY_URI = "/xyz/openbmc_project/software/enumerate"
+IMAGE_URI = "/xyz/openbmc_project/software/"
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections.add(self.connection)
+            self.server.client_ports.add(self.client_address[1])
+
+    def finish(self):
+        with self.server.lock:
+            self.server.connections.discard(self.connection)
+        BaseHTTPServer.BaseHTTPRequestHandler.finish(self)
+
+    def log_message(self, format, *args):
+        log.debug("StandIn " + format % args)
+
+    def reply(self, code, body, headers={}):
+        data = json.dumps(body)
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        if self.path == "/login":
+            with self.server.lock:
+                self.server.logins += 1
+            self.reply(200, {"status" : "ok", "data" : "User 'root' logged in"},
+                       {"Set-Cookie" : "SESSION=standin; Path=/"})
+        elif self.path == "/logout":
+            self.reply(200, {"status" : "ok"})
+        else:
+            self.reply(404, {"status" : "error"})
+
+    def do_GET(self):
+        if "SESSION=standin" not in self.headers.get("Cookie", ""):
+            self.reply(401, {"status" : "error", "message" : "401 Unauthorized"})
+            return
+        if self.path == STATE_URI:
+            self.reply(200, {"status" : "ok",
+                "data" : "xyz.openbmc_project.State.BMC.BMCState.Ready"})
+        elif self.path == ENUMERATE_URI:
+            self.reply(200, {"status" : "ok",
+                "data" : dict(("/xyz/openbmc_project/sensors/temperature/t{}".format(i),
+                               {"Value" : i, "Unit" : "DegreesC"})
+                              for i in range(2000))})
+        elif self.path == FLAKY_URI:
+            with self.server.lock:
+                self.server.flaky -= 1
+                flaky = self.server.flaky
+            if flaky >= 0:
+                self.reply(503, {"status" : "error"})
+            else:
+                self.reply(200, {"status" : "ok", "data" : {}})
+        elif self.path.startswith(IMAGE_URI):
+            # each image lookup is slow, like a busy BMC
+            time.sleep(self.server.image_delay)
+            self.reply(200, {"status" : "ok",
+                "data" : {"Purpose" : "xyz.openbmc_project.Software.Version.VersionPurpose.Host",
+                          "Version" : self.path[len(IMAGE_URI):]}})
+        else:
+            self.reply(404, {"status" : "error"})
+
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", port), StandInHandler)
+        self.lock = threading.Lock()
+        self.connections = set()
+        self.client_ports = set()
+        self.logins = 0
+        self.flaky = 0
+        self.image_delay = 0.5
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        # a rebooting BMC drops the keep-alive connections too
+        with self.lock:
+            for conn in self.connections:
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+
+
+class ServerRetry(unittest.TestCase):
+    reboot_seconds = 3
+
+    def setUp(self):
+        self.standin = StandInServer()
+        self.port = self.standin.server_address[1]
+        self.server = Server(url="http://127.0.0.1:{}".format(self.port),
+                             username="root", password="0penBmc",
+                             minutes=1, timeout=5)
+
+    def tearDown(self):
+        self.server.close()
+        self.standin.stop()
+
+    def runTest(self):
+        # first call gets a 401, logs in and retries straight away
+        r = self.server.get(uri=STATE_URI, minutes=1)
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(self.server.get_stats()[('get', STATE_URI)]['retries'], 1)
+
+        # keep-alive, lots of calls but only the pool's worth of connections
+        for i in range(50):
+            self.server.get(uri=STATE_URI, minutes=1)
+        log.info("ServerRetry 51 calls used {} connections"
+                 .format(len(self.standin.client_ports)))
+        self.assertLessEqual(len(self.standin.client_ports), 2)
+
+        # large responses are not logged in full
+        r = self.server.get(uri=ENUMERATE_URI, minutes=1)
+        self.assertGreater(len(r.text), 100 * self.server.log_limit)
+        self.assertLess(len(self.server.response_text(r)), self.server.log_limit + 64)
+
+        # a no-retry caller gets the 503 back
+        self.standin.flaky = 1
+        r = self.server.get(uri=FLAKY_URI, minutes=None)
+        self.assertEqual(r.status_code, 503)
+
+        # retry callers back off through the 503s
+        self.standin.flaky = 3
+        start = time.time()
+        r = self.server.get(uri=FLAKY_URI, minutes=1)
+        elapsed = time.time() - start
+        self.assertEqual(r.status_code, 200)
+        log.info("ServerRetry 3 x 503 took {:.2f}s (flat 5s sleeps took 15s)"
+                 .format(elapsed))
+        self.assertLess(elapsed, 15)
+
+        # the BMC reboots: connections refused until it comes back
+        self.standin.stop()
+        def reboot():
+            time.sleep(self.reboot_seconds)
+            self.standin = StandInServer(self.port)
+            self.back_up = time.time()
+        rebooter = threading.Thread(target=reboot)
+        rebooter.start()
+        start = time.time()
+        r = self.server.get(uri=STATE_URI, minutes=1)
+        done = time.time()
+        rebooter.join()
+        self.assertEqual(r.status_code, 200)
+        log.info("ServerRetry BMC down {}s, request took {:.2f}s, {:.2f}s after"
+                 " the BMC was back".format(self.reboot_seconds, done - start,
+                                            done - self.back_up))
+        self.assertLess(done - self.back_up,
+                        self.server.backoff_max * (1 + self.server.backoff_jitter))
+
+        # time out when the BMC never answers properly
+        self.standin.flaky = 1000
+        self.assertRaises(HTTPCheck, self.server.get, uri=FLAKY_URI, minutes=0.1)
+
+        stats = self.server.get_stats()
+        self.server.dump_stats()
+        flaky = stats[('get', FLAKY_URI)]
+        self.assertEqual(flaky['calls'], 3)
+        self.assertEqual(flaky['failures'], 2)
+        self.assertGreaterEqual(flaky['retries'], 3)
+        self.assertEqual(stats[('get', STATE_URI)]['calls'], 52)
+        self.assertGreater(stats[('get', STATE_URI)]['retries'], 1)
+
+
+class ServerBatch(unittest.TestCase):
+    images = 16
+
+    def setUp(self):
+        self.standin = StandInServer()
+        self.server = Server(url="http://127.0.0.1:{}".format(
+                                 self.standin.server_address[1]),
+                             username="root", password="0penBmc",
+                             minutes=1, timeout=5)
+
+    def tearDown(self):
+        self.server.close()
+        self.standin.stop()
+
+    def runTest(self):
+        ids = ["{:08x}".format(i) for i in range(self.images)]
+        calls = [{'cmd' : 'get', 'uri' : IMAGE_URI + id, 'minutes' : 1}
+                 for id in ids]
+
+        start = time.time()
+        for call in calls[:4]:
+            self.server.loop_it(**dict(call))
+        sequential = (time.time() - start) * self.images / 4
+
+        # not logged in yet: the batch's 401s share one login
+        self.server.session.cookies.clear()
+        self.standin.logins = 0
+        start = time.time()
+        results = self.server.batch(calls)
+        elapsed = time.time() - start
+        log.info("ServerBatch {} image lookups took {:.2f}s, sequential"
+                 " would take ~{:.2f}s".format(self.images, elapsed, sequential))
+        self.assertEqual([r.json()['data']['Version'] for r, e in results], ids)
+        self.assertEqual([e for r, e in results], [None] * self.images)
+        self.assertEqual(self.standin.logins, 1)
+        self.assertLess(elapsed, sequential / 4)
+
+        # errors are captured per request, the rest still complete in order
+        self.standin.flaky = 1000
+        results = self.server.batch([
+            {'cmd' : 'get', 'uri' : IMAGE_URI + ids[0], 'minutes' : 1},
+            {'cmd' : 'get', 'uri' : FLAKY_URI, 'minutes' : 0.05},
+            {'cmd' : 'get', 'uri' : "/no/such/uri", 'minutes' : None},
+            {'cmd' : 'get', 'uri' : IMAGE_URI + ids[1], 'minutes' : 1},
+            ])
+        self.assertEqual(results[0][0].json()['data']['Version'], ids[0])
+        self.assertIsNone(results[1][0])
+        self.assertIsInstance(results[1][1], HTTPCheck)
+        self.assertEqual(results[2][0].status_code, 404)
+        self.assertIsNone(results[2][1])
+        self.assertEqual(results[3][0].json()['data']['Version'], ids[1])
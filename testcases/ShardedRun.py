@@ -0,0 +1,230 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+Sharded Run
+-----------
+
+`OpTestShard` splits a suite between op-test processes and merges their
+reports.
+
+A python script stands in for op-test: it takes a second per test class
+it's given with ``--run`` and writes an xmlrunner style report of them
+to its ``--output``, failing the tests named Fail and dying before it
+reports those named Crash. Eight classes in four shards are checked to
+run side by side, each class in one shard, and the merged report and
+result to have every test, the failure and (as errors) the tests the
+crashed shard never reported. Each shard is checked to be given its
+own copy of the ``--host-pnor``, and an interrupted run to leave no
+shard process behind.
+'''
+
+import unittest
+import errno
+import os
+import signal
+import shutil
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+from common import OpTestShard
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+STAND_IN_OP_TEST = r'''
+import os, sys, time
+args = sys.argv[1:]
+ids = [args[i + 1] for i, a in enumerate(args) if a == "--run"]
+output = os.path.join(args[args.index("--output") + 1],
+                      "test-run-" + args[args.index("--suffix") + 1])
+os.makedirs(output)
+print("shard args " + " ".join(args))
+classes = []
+for test_id in ids:
+    cls, name = test_id.rsplit(".", 1)
+    if cls not in classes:
+        classes.append(cls)
+time.sleep(len(classes))
+for cls in classes:
+    if "Crash" in cls:
+        sys.exit(1)
+    cases = ""
+    for test_id in ids:
+        if test_id.startswith(cls + "."):
+            failure = '<failure message="no">AssertionError: no</failure>' if "Fail" in cls else ""
+            cases += '<testcase classname="%s" name="%s" time="1.0">%s</testcase>' % (
+                cls, test_id.rsplit(".", 1)[1], failure)
+    with open(os.path.join(output, "TEST-%s.xml" % cls), "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<testsuite name="%s" tests="%d" '
+                'failures="%d" errors="0" skipped="0" time="1.0">%s</testsuite>'
+                % (cls, cases.count("<testcase"), cases.count("<failure"), cases))
+'''
+
+
+HANGING_OP_TEST = r'''
+import os, sys, time
+args = sys.argv[1:]
+with open(os.path.join(args[args.index("--output") + 1], "pid"), "w") as f:
+    f.write(str(os.getpid()))
+time.sleep(60)
+'''
+
+
+class StandInTest(object):
+    def __init__(self, test_id):
+        self.test_id = test_id
+
+    def id(self):
+        return self.test_id
+
+    def __call__(self, result):
+        pass
+
+
+class ShardedRun(unittest.TestCase):
+    classes = ["Boot", "Console", "Fail", "IPMI", "NVRAM", "Crash", "PCI", "RTC"]
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-shards-")
+        self.op_test = os.path.join(self.tmpdir, "op-test")
+        with open(self.op_test, 'w') as f:
+            f.write(STAND_IN_OP_TEST)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def suite(self):
+        suite = unittest.TestSuite()
+        for cls in self.classes:
+            inner = unittest.TestSuite()
+            for name in ["test_a", "test_b"]:
+                inner.addTest(StandInTest("testcases.{0}.{0}.{1}".format(cls, name)))
+            suite.addTest(inner)
+        return suite
+
+    def test_shard(self):
+        ids = OpTestShard.test_ids(self.suite())
+        self.assertEqual(len(ids), 16)
+        shards = OpTestShard.shard(ids, 3)
+        self.assertEqual([len(s) for s in shards], [6, 6, 4])
+        self.assertEqual(shards[0][:3], ["testcases.Boot.Boot.test_a", "testcases.Boot.Boot.test_b",
+                                         "testcases.IPMI.IPMI.test_a"])
+        self.assertEqual(len(OpTestShard.shard(ids[:4], 8)), 2)
+
+        # a shard's own PNOR replaces the run's
+        self.assertEqual(OpTestShard.shard_argv(["--host-pnor=/images/witherspoon.pnor", "--quiet"],
+                                                ids[:1], "/out/shard-0", "shard-0",
+                                                pnor="/out/shard-0/witherspoon.pnor"),
+                         ["--quiet", "--run", ids[0],
+                          "--host-pnor", "/out/shard-0/witherspoon.pnor",
+                          "--output", "/out/shard-0", "--suffix", "shard-0"])
+
+        argv = ["--bmc-type", "qemu", "--run-suite", "qemu", "--shards=4", "-o", "/out",
+                "--qemu-scratch-disk", "/dev/sdb", "--suffix", "x", "--quiet"]
+        self.assertEqual(OpTestShard.shard_argv(argv, ids[:2], "/out/shard-0", "shard-0"),
+                         ["--bmc-type", "qemu", "--quiet",
+                          "--run", ids[0], "--run", ids[1],
+                          "--output", "/out/shard-0", "--suffix", "shard-0"])
+
+    def test_run(self):
+        start = time.time()
+        result = OpTestShard.run(self.suite(), self.tmpdir, 4,
+                                 command=[sys.executable, self.op_test],
+                                 argv=["--bmc-type", "qemu", "--run-suite", "qemu", "--shards", "4"],
+                                 poll=0.1)
+        seconds = time.time() - start
+        log.info("ShardedRun 8 one second classes in 4 shards took {:.1f}s".format(seconds))
+        # two classes a shard, not eight one after the other
+        self.assertLess(seconds, 5)
+
+        with open(os.path.join(self.tmpdir, "shard-0", "console.log")) as f:
+            self.assertIn("--run testcases.Boot.Boot.test_a --run testcases.Boot.Boot.test_b "
+                          "--run testcases.NVRAM.NVRAM.test_a", f.read())
+        self.assertEqual(result.testsRun, 16)
+        self.assertEqual(sorted(t for t, message in result.failures),
+                         ["testcases.Fail.Fail.test_a", "testcases.Fail.Fail.test_b"])
+        # shard 1 (Console, Crash) died after reporting Console
+        self.assertEqual(sorted(t for t, message in result.errors),
+                         ["testcases.Crash.Crash.test_a", "testcases.Crash.Crash.test_b"])
+        self.assertIn("No result from shard 1 (exit code 1)", result.errors[0][1])
+        self.assertFalse(result.wasSuccessful())
+
+        # one report of the lot
+        root = ET.parse(os.path.join(self.tmpdir, "TEST-shards.xml")).getroot()
+        self.assertEqual((root.tag, root.get("tests"), root.get("failures")),
+                         ("testsuites", "14", "2"))
+        self.assertEqual(len(root.findall("testsuite")), 7)
+        self.assertEqual(OpTestShard.reports(os.path.join(self.tmpdir, "shard-0")), [])
+
+    def test_pnor(self):
+        '''
+        Each shard gets a PNOR of its own, a copy of the run's
+        '''
+        pnor = os.path.join(self.tmpdir, "witherspoon.pnor")
+        with open(pnor, 'w') as f:
+            f.write("flash")
+        self.classes = ["Boot", "NVRAM", "PNOR"]
+        output = os.path.join(self.tmpdir, "out")
+        OpTestShard.run(self.suite(), output, 3, command=[sys.executable, self.op_test],
+                        argv=["--bmc-type", "qemu", "--host-pnor", pnor, "--shards", "3"],
+                        poll=0.1)
+        pnors = []
+        for i in range(3):
+            with open(os.path.join(output, "shard-{}".format(i), "console.log")) as f:
+                args = f.read().split()
+            shard_pnor = args[args.index("--host-pnor") + 1]
+            self.assertEqual(os.path.dirname(shard_pnor), os.path.join(output, "shard-{}".format(i)))
+            with open(shard_pnor) as f:
+                self.assertEqual(f.read(), "flash")
+            pnors.append(shard_pnor)
+        self.assertNotIn(pnor, pnors)
+        self.assertEqual(len(set(pnors)), 3)
+
+    def test_interrupt(self):
+        '''
+        A KeyboardInterrupt in the wait stops and reaps every shard
+        '''
+        with open(self.op_test, 'w') as f:
+            f.write(HANGING_OP_TEST)
+        self.classes = ["Boot", "NVRAM"]
+
+        def interrupt(signum, frame):
+            raise KeyboardInterrupt()
+        previous = signal.signal(signal.SIGALRM, interrupt)
+        try:
+            signal.alarm(2)
+            with self.assertRaises(KeyboardInterrupt):
+                OpTestShard.run(self.suite(), self.tmpdir, 2,
+                                command=[sys.executable, self.op_test],
+                                argv=["--bmc-type", "qemu"], poll=0.1)
+        finally:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, previous)
+        for i in range(2):
+            with open(os.path.join(self.tmpdir, "shard-{}".format(i), "pid")) as f:
+                pid = int(f.read())
+            # reaped, not just signalled: no zombie left either
+            with self.assertRaises(OSError) as cm:
+                os.kill(pid, 0)
+            self.assertEqual(cm.exception.errno, errno.ESRCH)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+
+'''
+Stand Ins
+---------
+
+Stand ins for the system and configuration that console and qemu tests
+run against in place of a real machine and an op-test command line.
+Not a test itself.
+'''
+
+import argparse
+
+
+class StandInSystem(object):
+    '''
+    Just enough of `OpTestSystem.OpTestSystem` for a console to connect:
+    no terminal setup, and no prompt, login or sudo state.
+    '''
+    block_setup_term = 1
+    PS1_set = LOGIN_set = SUDO_set = -1
+
+
+class StandInConf(object):
+    '''
+    Just enough of `OpTestConfiguration.OpTestConfiguration`: a basedir,
+    and the qemu arguments (overridden by args) a `OpTestQemu.OpTestQemu`
+    reads.
+    '''
+    def __init__(self, basedir, **args):
+        self.basedir = basedir
+        self.args = argparse.Namespace(qemu_scratch_disk=None, qemu_base_image=None,
+                                       qemu_overlay_pool=None, qemu_overlay_keep=False,
+                                       qemu_snapshot_cache=None)
+        vars(self.args).update(args)
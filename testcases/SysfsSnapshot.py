@@ -0,0 +1,158 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+Sysfs Snapshot
+--------------
+
+`OpTestUtil.read_files` reads many sysfs files in one command, and the
+`testcases.OpTestEM` helpers built on it check every CPU at once.
+
+A local shell stands in for the host, with a copy of
+``/sys/devices/system/cpu`` for a 192 thread POWER9 (cpufreq and three
+cpuidle states per CPU) in a temporary directory. Values, globs and
+missing files are checked along with the number of commands the EM
+checks cost.
+'''
+
+import unittest
+import os
+import shutil
+import tempfile
+
+import pexpect
+
+from common.OpTestUtil import OpTestUtil
+from testcases.OpTestEM import OpTestEM
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+PROMPT = "[console-expect]#"
+NR_CPUS = 192
+IDLE_STATES = ["snooze", "stop0_lite", "stop1_lite"]
+
+
+class StandInConsole(object):
+    '''
+    A shell whose /sys is under root, counting the commands run.
+    '''
+    def __init__(self, root):
+        self.root = root
+        self.commands = []
+        env = dict(os.environ)
+        env["PS1"] = PROMPT
+        self.pty = pexpect.spawn("/bin/sh", env=env)
+        self.pty.setecho(False)
+        self.pty.expect_exact(PROMPT)
+
+    def run_command(self, command, timeout=60, retry=0):
+        self.commands.append(command)
+        self.pty.sendline(command.replace("/sys/", self.root + "/sys/"))
+        self.pty.expect_exact(PROMPT, timeout=timeout)
+        output = self.pty.before.replace("\r", "").replace(self.root + "/sys/", "/sys/")
+        return output.split("\n")[:-1]
+
+    def close(self):
+        self.pty.close(force=True)
+
+
+class StandInSysfs(OpTestEM):
+    '''
+    OpTestEM on a StandInConsole with NR_CPUS CPUs
+    '''
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-sysfs-")
+        self.cpu = os.path.join(self.tmpdir, "sys", "devices", "system", "cpu")
+        self.write("present", "0-%d" % (NR_CPUS - 1))
+        for cpu in range(NR_CPUS):
+            for name, value in [("cpuinfo_cur_freq", "2166000"),
+                                ("cpuinfo_min_freq", "2166000"),
+                                ("cpuinfo_max_freq", "3800000"),
+                                ("cpuinfo_nominal_freq", "3300000"),
+                                ("scaling_governor", "userspace"),
+                                ("scaling_setspeed", "2166000"),
+                                ("scaling_available_frequencies", "3800000 3300000 2166000 ")]:
+                self.write("cpu%d/cpufreq/%s" % (cpu, name), value)
+            for i, name in enumerate(IDLE_STATES):
+                self.write("cpu%d/cpuidle/state%d/name" % (cpu, i), name)
+                self.write("cpu%d/cpuidle/state%d/usage" % (cpu, i), str(cpu * 10 + i))
+                self.write("cpu%d/cpuidle/state%d/time" % (cpu, i), str(cpu * 1000 + i))
+                self.write("cpu%d/cpuidle/state%d/disable" % (cpu, i), "1")
+        self.c = StandInConsole(self.tmpdir)
+        self.util = OpTestUtil()
+        self.test = "skiroot"
+
+    def tearDown(self):
+        self.c.close()
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, value):
+        path = os.path.join(self.cpu, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(value + "\n")
+
+
+class SysfsSnapshot(StandInSysfs, unittest.TestCase):
+    def test_read_files(self):
+        self.write("cpu3/multi", "one\ntwo\n\nfour")
+        self.write("cpu3/empty", "")
+        files = self.util.read_files(self.c, ["/sys/devices/system/cpu/cpu3/cpufreq/*_freq",
+                                              "/sys/devices/system/cpu/cpu3/multi",
+                                              "/sys/devices/system/cpu/cpu3/empty",
+                                              "/sys/devices/system/cpu/cpu3/missing",
+                                              "/sys/devices/system/cpu/cpu*/nothing*"])
+        self.assertEqual(len(self.c.commands), 1)
+        path = "/sys/devices/system/cpu/cpu3/"
+        self.assertEqual(files, {path + "cpufreq/cpuinfo_cur_freq": "2166000",
+                                 path + "cpufreq/cpuinfo_min_freq": "2166000",
+                                 path + "cpufreq/cpuinfo_max_freq": "3800000",
+                                 path + "cpufreq/cpuinfo_nominal_freq": "3300000",
+                                 path + "multi": "one\ntwo\n\nfour",
+                                 path + "empty": ""})
+        # a directory matching a glob is not a file
+        self.assertEqual(self.util.read_files(self.c, "/sys/devices/system/cpu/cpu1*"), {})
+
+    def test_em(self):
+        self.assertEqual(self.get_pstate_limits(), ("2166000", "3800000", "3300000"))
+        self.verify_cpu_freq("2166000", and_measure=False)
+        self.verify_disable_idle_state("1")
+        counters = self.get_idle_counters(["0", "1", "2"])
+        self.assertEqual(len(counters["2"]), NR_CPUS)
+        self.assertEqual(counters["2"][77], (772, 77002))
+        # present, limits, the frequencies, the disables and the counters
+        self.assertEqual(len(self.c.commands), 5)
+        log.info("SysfsSnapshot {} CPUs checked in {} commands".format(NR_CPUS, len(self.c.commands)))
+
+        # one slow CPU is named
+        self.write("cpu77/cpufreq/cpuinfo_cur_freq", "3300000")
+        with self.assertRaises(AssertionError) as e:
+            self.verify_cpu_freq("2166000", and_measure=False)
+        self.assertIn("on CPUs [77]", str(e.exception))
+
+        # tearDown puts back the governor and enables every idle state
+        OpTestEM.tearDown(self)
+        self.assertEqual(self.get_cpu_files("cpufreq/scaling_governor")[(5, "cpufreq/scaling_governor")],
+                         "powersave")
+        for i in range(len(IDLE_STATES)):
+            self.verify_enable_idle_state(str(i))
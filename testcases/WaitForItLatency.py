@@ -0,0 +1,186 @@
+#!/usr/bin/env python2
+# OpenPOWER Automated Test Project
+#
+# Contributors Listed Below - COPYRIGHT 2018
+# [+] International Business Machines Corp.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+
+
+'''
+WaitForIt Latency
+-----------------
+
+Check that the `OpTestSystem.ConsoleWaiter` behind `wait_for_it` wakes up
+as soon as a target (or crash) pattern shows up on the console rather than
+at the end of a poll interval, reconnects a console that has gone quiet
+and gives up at its deadline, and that its sorted pattern list follows
+changes to the table.  When wait() is interrupted the reader thread has
+stopped and leaves the console alone by the time the interrupt reaches the
+caller.
+
+The console is a local shell script standing in for a booting host.
+'''
+
+import unittest
+import os
+import signal
+import shutil
+import tempfile
+import time
+import pexpect
+
+from common.OpTestSystem import ConsoleWaiter, OpTestSystem
+
+import OpTestLogger
+log = OpTestLogger.optest_logger_glob.get_logger(__name__)
+
+EXPECT_SEQ = [pexpect.TIMEOUT, pexpect.EOF, 'Petitboot', 'login: ', 'mon> ']
+
+
+class ScriptConsole(object):
+    '''
+    Just enough of a console for ConsoleWaiter, connect() restarts the script.
+    '''
+    def __init__(self, script):
+        self.script = script
+        self.pty = None
+        self.connects = 0
+        self.touches = 0
+
+    def connect(self):
+        self.close()
+        self.connects += 1
+        self.touches += 1
+        self.pty = pexpect.spawn("sh", ["-c", self.script])
+        return self.pty
+
+    def get_console(self):
+        self.touches += 1
+        if self.pty is None:
+            return self.connect()
+        return self.pty
+
+    def close(self):
+        if self.pty is not None:
+            self.pty.close(force=True)
+            self.pty = None
+
+
+class WaitForItLatency(unittest.TestCase):
+    poll = 5
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="op-test-wait-for-it-")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def wait(self, script, seconds, stale=60, poll=None):
+        console = ScriptConsole(script)
+        console.connect()
+        waiter = ConsoleWaiter(console=console, expect_seq=EXPECT_SEQ,
+                               deadline=time.time() + seconds, poll=poll or self.poll,
+                               stale=stale, refresh=0, buffer_kicker=0)
+        start = time.time()
+        r = waiter.wait()
+        elapsed = time.time() - start
+        console.close()
+        return r, elapsed, waiter, console
+
+    def runTest(self):
+        # target pattern part way through a poll interval
+        r, elapsed, waiter, console = self.wait(
+            "echo IPLing; sleep 2; echo Petitboot; sleep 30", 30)
+        log.info("WaitForItLatency Petitboot at 2s, woke at {:.2f}s"
+                 " (poll interval {}s)".format(elapsed, self.poll))
+        self.assertEqual(EXPECT_SEQ[r], 'Petitboot')
+        self.assertLess(elapsed, 2 + 0.5)
+
+        # crash patterns wake us just the same
+        r, elapsed, waiter, console = self.wait(
+            "sleep 1; printf '0:mon> '; sleep 30", 30)
+        self.assertEqual(EXPECT_SEQ[r], 'mon> ')
+        self.assertLess(elapsed, 1 + 0.5)
+
+        # EOF is not a match, the console is reopened and watched again
+        marker = os.path.join(self.tmpdir, "eof")
+        r, elapsed, waiter, console = self.wait(
+            "if [ -e {0} ]; then echo Petitboot; sleep 30; else touch {0}; fi"
+            .format(marker), 30)
+        self.assertEqual(EXPECT_SEQ[r], 'Petitboot')
+        self.assertGreater(console.connects, 1)
+
+        # a quiet console gets reconnected, deadline still honoured
+        r, elapsed, waiter, console = self.wait(
+            "echo Booting; sleep 30", 4, stale=1, poll=1)
+        log.info("WaitForItLatency quiet console, {} reconnects, gave up"
+                 " after {:.2f}s".format(waiter.reconnect_count, elapsed))
+        self.assertIsNone(r)
+        self.assertGreater(waiter.reconnect_count, 0)
+        self.assertGreater(console.connects, 1)
+        self.assertLess(elapsed, 4 + 0.5)
+
+
+class WaitForItInterrupt(unittest.TestCase):
+    '''
+    A KeyboardInterrupt in wait() stops the reader before it propagates.
+    '''
+    def runTest(self):
+        console = ScriptConsole("echo Booting; sleep 30")
+        console.connect()
+        waiter = ConsoleWaiter(console=console, expect_seq=EXPECT_SEQ,
+                               deadline=time.time() + 30, poll=1, stale=1,
+                               refresh=0, buffer_kicker=0)
+
+        def interrupt(signum, frame):
+            raise KeyboardInterrupt()
+        previous = signal.signal(signal.SIGALRM, interrupt)
+        try:
+            signal.alarm(2)
+            with self.assertRaises(KeyboardInterrupt):
+                waiter.wait()
+        finally:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, previous)
+        try:
+            self.assertFalse(waiter.is_alive())
+            touches = console.touches
+            self.assertGreater(touches, 0)
+            time.sleep(3)
+            self.assertEqual(console.touches, touches)
+        finally:
+            console.close()
+
+
+class ExpectSeqCache(unittest.TestCase):
+    '''
+    wait_for_it's sorted keys are built once per table, and again for a
+    table that gained or swapped a key, not just one that changed size.
+    '''
+    def runTest(self):
+        system = OpTestSystem.__new__(OpTestSystem)
+        system.expect_seq_cache = {}
+        table = {'Petitboot': None, 'login: ': None}
+        seq = system.expect_seq_for(table)
+        self.assertEqual(seq, [pexpect.TIMEOUT, pexpect.EOF, 'Petitboot', 'login: '])
+        # another table with the same keys shares the sorted list
+        self.assertEqual(system.expect_seq_for(dict(table)), seq)
+        self.assertEqual(len(system.expect_seq_cache), 1)
+        del table['login: ']
+        table['mon> '] = None
+        self.assertEqual(system.expect_seq_for(table)[2:], ['Petitboot', 'mon> '])
+        table['login: '] = None
+        self.assertEqual(system.expect_seq_for(table)[2:], ['Petitboot', 'login: ', 'mon> '])
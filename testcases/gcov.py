@@ -103,8 +103,8 @@ class gcov():
         global NR_GCOV_DUMPS
         NR_GCOV_DUMPS = NR_GCOV_DUMPS + 1
         filename = os.path.join(self.gcov_dir,'gcov-saved-{}'.format(NR_GCOV_DUMPS))
-        with open(filename, 'wb') as f:
-            f.write(iutil.get_uploaded_file('gcov'))
+        if not iutil.save_uploaded_file('gcov', filename):
+            self.fail("The host did not upload gcov data")
 
 
 class Skiroot(gcov, unittest.TestCase):